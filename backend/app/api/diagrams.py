@@ -46,7 +46,7 @@ async def create_diagram(request: DiagramRequest):
             "id": "test-diagram-001",
             "type": "experiment_flow",
             "content": test_drawio,
-            "preview_url": "/diagrams/test-diagram-001.png"
+            "preview_url": "/diagrams/test-diagram-001/preview"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -61,7 +61,7 @@ async def get_diagram(diagram_id: str):
         "type": "experiment_flow",
         "created_at": "2023-12-01T12:00:00Z",
         "content": "...",  # drawio内容
-        "preview_url": f"/diagrams/{diagram_id}.png"
+        "preview_url": f"/diagrams/{diagram_id}/preview"
     }
 
 @router.put("/diagrams/{diagram_id}")
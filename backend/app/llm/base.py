@@ -0,0 +1,412 @@
+from abc import ABC
+import asyncio
+import os
+from typing import AsyncGenerator, Awaitable, Optional, Dict, Any, Union
+import httpx
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+from app.llm.rate_limit import ProviderLimiter, Ticket, estimate_tokens
+from app.llm.resilience import (
+    CircuitBreaker, CircuitOpenError, LLMTimeout, ResilienceConfig, backoff_delay, is_failure, is_retryable, retry_after
+)
+
+Messages = Union[str, list[dict[str, str]]]
+
+class LLMResponse(BaseModel):
+    """通用LLM响应模型"""
+    reasoning_content: str = ""
+    answer_content: str = ""
+    is_answering: bool = False
+    usage: Optional[Dict[str, Any]] = None
+
+class LLMDelta(BaseModel):
+    """流式增量模型，只包含本次新增的内容"""
+    reasoning_content: str = ""
+    answer_content: str = ""
+    usage: Optional[Dict[str, Any]] = None
+    # 排队等待限流时的位置（从1开始），轮到后为0
+    queue_position: Optional[int] = None
+
+    @property
+    def is_answering(self) -> bool:
+        return bool(self.answer_content)
+
+class StreamAccumulator:
+    """
+    增量流的终结器
+
+    按块收集增量，结束时一次性拼接出完整的思考过程、回答内容和token用量，
+    避免在每个token上重复拼接整段文本。
+    """
+
+    def __init__(self):
+        self._reasoning: list[str] = []
+        self._answer: list[str] = []
+        self.usage: Optional[Dict[str, Any]] = None
+
+    def add(self, delta: LLMDelta) -> LLMDelta:
+        """记录一个增量并原样返回，便于在迭代中直接使用"""
+        if delta.reasoning_content:
+            self._reasoning.append(delta.reasoning_content)
+        if delta.answer_content:
+            self._answer.append(delta.answer_content)
+        if delta.usage:
+            self.usage = delta.usage
+        return delta
+
+    def finalize(self) -> LLMResponse:
+        """返回完整的响应对象"""
+        return LLMResponse(
+            reasoning_content="".join(self._reasoning),
+            answer_content="".join(self._answer),
+            is_answering=bool(self._answer),
+            usage=self.usage
+        )
+
+class BaseLLM(ABC):
+    """
+    LLM基类，所有模型提供方共用同一套异步接口
+
+    子类只需提供默认的api_key/base_url/model_name，
+    流式与非流式调用均基于AsyncOpenAI实现，不会阻塞事件循环。
+    调用带有连接/首个token/输出间隔超时，尚未开始输出的请求失败后按指数退避重试，
+    提供方熔断或重试用尽时改用fallback模型（见app.llm.resilience）。
+    """
+
+    provider: str = "openai"
+    # 默认连接信息，由子类声明
+    api_key_env: Optional[str] = None
+    base_url_env: Optional[str] = None
+    default_base_url: Optional[str] = None
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model_name: str = "",
+        client: Optional[AsyncOpenAI] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model_name = model_name
+        # 提供方账号共用的限流器和熔断器（见app.llm.registry），为None时不限流、不熔断
+        self.limiter = limiter
+        self.breaker = breaker
+        self.resilience = breaker.config if breaker is not None else ResilienceConfig.for_provider(self.provider)
+        # 熔断或重试用尽时改用的模型，由注册表按配置设置
+        self.fallback: Optional["BaseLLM"] = None
+
+        # 允许注入共享客户端（见app.llm.registry），以复用连接池；重试由本类处理，SDK不再重试
+        self.client = client or AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0
+        )
+
+    @classmethod
+    def resolve_endpoint(
+        cls,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ) -> tuple[Optional[str], Optional[str]]:
+        """解析实际使用的API密钥与基础URL（显式参数优先，其次环境变量和默认地址）"""
+        if not api_key and cls.api_key_env:
+            api_key = os.getenv(cls.api_key_env)
+        if not base_url and cls.base_url_env:
+            base_url = os.getenv(cls.base_url_env)
+        return api_key, base_url or cls.default_base_url
+
+    @staticmethod
+    def _to_messages(messages: Messages) -> list[dict[str, str]]:
+        """将单条提示词统一转换为消息列表"""
+        if isinstance(messages, str):
+            return [{"role": "user", "content": messages}]
+        return messages
+
+    def _enqueue(self, messages: list[dict[str, str]]) -> Optional[Ticket]:
+        """按估算的token数（输入加预计输出）登记到限流队列"""
+        if self.limiter is None:
+            return None
+        prompt = "".join(message.get("content") or "" for message in messages)
+        return self.limiter.enqueue(estimate_tokens(prompt) + self.limiter.limits.output_tokens)
+
+    def _timeout(self) -> httpx.Timeout:
+        config = self.resilience
+        return httpx.Timeout(config.request_timeout or None, connect=config.connect_timeout or None)
+
+    @staticmethod
+    async def _wait(awaitable: Awaitable[Any], timeout: Optional[float], error: LLMTimeout) -> Any:
+        """等待awaitable，超过timeout秒时抛出error（timeout为None时不限制）"""
+        if timeout is None:
+            return await awaitable
+        # 在当前任务中计时，不为每个chunk创建任务，取消也能正常传递
+        try:
+            async with asyncio.timeout(max(timeout, 0)):
+                return await awaitable
+        except TimeoutError:
+            raise error from None
+
+    async def _retry(self, error: Exception, attempt: int) -> bool:
+        """判断第attempt次失败后是否重试，需要重试时先按退避时间等待"""
+        config = self.resilience
+        if attempt >= config.max_retries or not is_retryable(error):
+            return False
+        delay = backoff_delay(config, attempt)
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            # 服务端要求的等待时间超过退避上限时不再重试
+            if server_delay > config.backoff_max:
+                return False
+            delay = max(delay, server_delay)
+        print(f"{self.model_name}请求失败，{delay:.1f}秒后重试:", error)
+        await asyncio.sleep(delay)
+        return True
+
+    def _reroute(self, error: Exception) -> Optional["BaseLLM"]:
+        """熔断或重试用尽时返回改用的模型"""
+        if self.fallback is None or not (isinstance(error, CircuitOpenError) or is_retryable(error)):
+            return None
+        print(f"{self.model_name}不可用，改用{self.fallback.model_name}:", error)
+        return self.fallback
+
+    async def _stream_once(
+        self,
+        messages: list[dict[str, str]],
+        include_usage: bool,
+        ticket: Optional[Ticket]
+    ) -> AsyncGenerator[LLMDelta, None]:
+        """发出一次流式请求，首个token和输出间隔超时时抛出LLMTimeout，结果计入熔断器"""
+        config = self.resilience
+        if self.breaker is not None:
+            self.breaker.before_call()
+        loop = asyncio.get_running_loop()
+        # 首个token的期限从发出请求开始计算，包括等待响应头的时间
+        deadline = loop.time() + config.first_token_timeout if config.first_token_timeout > 0 else None
+        first_token = LLMTimeout("first_token", config.first_token_timeout)
+        idle = LLMTimeout("idle", config.idle_timeout)
+        completion = None
+        try:
+            completion = await self._wait(
+                self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": include_usage} if include_usage else None,
+                    timeout=self._timeout()
+                ),
+                deadline and deadline - loop.time(),
+                first_token
+            )
+            chunks = completion.__aiter__()
+            started = False
+            while True:
+                if started:
+                    timeout, error = config.idle_timeout or None, idle
+                else:
+                    timeout, error = deadline and deadline - loop.time(), first_token
+                try:
+                    chunk = await self._wait(chunks.__anext__(), timeout, error)
+                except StopAsyncIteration:
+                    break
+
+                # 处理token使用情况
+                if not chunk.choices:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage.model_dump()
+                        if ticket is not None:
+                            ticket.settle(usage)
+                        yield LLMDelta(usage=usage)
+                    continue
+
+                delta = chunk.choices[0].delta
+                reasoning = getattr(delta, "reasoning_content", None)
+
+                if reasoning:
+                    started = True
+                    yield LLMDelta(reasoning_content=reasoning)
+                elif delta.content:
+                    started = True
+                    yield LLMDelta(answer_content=delta.content)
+        except Exception as e:
+            if self.breaker is not None and is_failure(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            # 超时或调用方中途放弃时关闭响应，释放连接
+            close = getattr(completion, "close", None)
+            if close is not None:
+                await close()
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    async def stream_deltas(
+        self,
+        messages: Messages,
+        include_usage: bool = False
+    ) -> AsyncGenerator[LLMDelta, None]:
+        """
+        增量模式的异步流式对话
+
+        Args:
+            messages: 消息列表（需包含role和content），也可以直接传入提示词
+            include_usage: 是否包含token使用情况
+
+        Yields:
+            LLMDelta: 仅包含本次新增内容的增量对象，完整结果可通过StreamAccumulator获得；
+                需要排队时先产出只含queue_position的增量
+
+        Raises:
+            LLMTimeout: 首个token或输出间隔超时（开始输出后不再重试）
+            CircuitOpenError: 提供方已熔断且没有可用的fallback模型
+        """
+        async for delta in self._stream_deltas(self._to_messages(messages), include_usage, reroute=True):
+            yield delta
+
+    async def _stream_deltas(
+        self,
+        messages: list[dict[str, str]],
+        include_usage: bool,
+        reroute: bool
+    ) -> AsyncGenerator[LLMDelta, None]:
+        ticket = self._enqueue(messages)
+        fallback = None
+        try:
+            if ticket is not None:
+                async for position in ticket.wait():
+                    yield LLMDelta(queue_position=position)
+                if ticket.position:
+                    yield LLMDelta(queue_position=0)
+
+            attempt = 0
+            started = False
+            while True:
+                try:
+                    async for delta in self._stream_once(messages, include_usage, ticket):
+                        started = started or bool(delta.reasoning_content or delta.answer_content)
+                        yield delta
+                    break
+                except Exception as e:
+                    # 已经输出过的内容无法撤回，开始输出后的错误直接抛出
+                    if started:
+                        raise
+                    if await self._retry(e, attempt):
+                        attempt += 1
+                        continue
+                    fallback = self._reroute(e) if reroute else None
+                    if fallback is None:
+                        raise
+                    break
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+        if fallback is not None:
+            async for delta in fallback._stream_deltas(messages, include_usage, reroute=False):
+                yield delta
+
+    async def stream_chat(
+        self,
+        messages: Messages,
+        include_usage: bool = False
+    ) -> AsyncGenerator[LLMResponse, None]:
+        """
+        异步流式对话（累积模式）
+
+        每次产出截至当前的完整响应，仅为兼容旧调用方保留；
+        新代码请使用stream_deltas，以免每个token都重新序列化全文。
+
+        Args:
+            messages: 消息列表（需包含role和content），也可以直接传入提示词
+            include_usage: 是否包含token使用情况
+
+        Yields:
+            LLMResponse: 包含思考过程和回答内容的响应对象
+        """
+        response = LLMResponse()
+
+        async for delta in self.stream_deltas(messages, include_usage):
+            if delta.usage:
+                response.usage = delta.usage
+            if delta.reasoning_content:
+                response.reasoning_content += delta.reasoning_content
+            if delta.answer_content:
+                response.is_answering = True
+                response.answer_content += delta.answer_content
+            yield response
+
+    async def chat(self, messages: Messages) -> LLMResponse:
+        """
+        异步单次对话
+
+        Args:
+            messages: 消息列表（需包含role和content），也可以直接传入提示词
+
+        Returns:
+            LLMResponse: 包含思考过程和回答内容的响应对象
+
+        Raises:
+            LLMTimeout: 请求超时且重试用尽
+            CircuitOpenError: 提供方已熔断且没有可用的fallback模型
+        """
+        return await self._chat(self._to_messages(messages), reroute=True)
+
+    async def _chat(self, messages: list[dict[str, str]], reroute: bool) -> LLMResponse:
+        config = self.resilience
+        ticket = self._enqueue(messages)
+        try:
+            if ticket is not None:
+                async for _ in ticket.wait():
+                    pass
+            attempt = 0
+            while True:
+                try:
+                    if self.breaker is not None:
+                        self.breaker.before_call()
+                    response = await self._wait(
+                        self.client.chat.completions.create(
+                            model=self.model_name,
+                            messages=messages,
+                            timeout=self._timeout()
+                        ),
+                        config.request_timeout or None,
+                        LLMTimeout("request", config.request_timeout)
+                    )
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    break
+                except Exception as e:
+                    if self.breaker is not None and is_failure(e):
+                        self.breaker.record_failure()
+                    if await self._retry(e, attempt):
+                        attempt += 1
+                        continue
+                    fallback = self._reroute(e) if reroute else None
+                    if fallback is None:
+                        raise
+                    response = None
+                    break
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+        if response is None:
+            return await fallback._chat(messages, reroute=False)
+
+        message = response.choices[0].message
+        result = LLMResponse()
+        result.reasoning_content = getattr(message, "reasoning_content", None) or ""
+        result.answer_content = message.content or ""
+        result.is_answering = True
+
+        if getattr(response, "usage", None):
+            result.usage = response.usage.model_dump()
+            if ticket is not None:
+                ticket.settle(result.usage)
+
+        return result
+
+    async def aclose(self) -> None:
+        """关闭底层HTTP连接池"""
+        await self.client.close()
@@ -1,26 +1,30 @@
-from typing import Generator, Optional, Dict, Any
-import os
-from openai import OpenAI
+from typing import Optional
+from openai import AsyncOpenAI
 from dotenv import load_dotenv, find_dotenv
-from pydantic import BaseModel
+from app.llm.base import BaseLLM, LLMResponse
+from app.llm.rate_limit import ProviderLimiter
+from app.llm.resilience import CircuitBreaker
 
 load_dotenv(find_dotenv())
 
-class DeepseekResponse(BaseModel):
-    """Deepseek响应模型"""
-    reasoning_content: str = ""
-    answer_content: str = ""
-    is_answering: bool = False
-    usage: Optional[Dict[str, Any]] = None
+# 兼容旧名称
+DeepseekResponse = LLMResponse
+
+class DeepseekLLM(BaseLLM):
+    """Deepseek LLM工具类（阿里云百炼DashScope接入）"""
+
+    provider = "dashscope"
+    api_key_env = "DASHSCOPE_API_KEY"
+    base_url_env = "DASHSCOPE_API_BASE"
 
-class DeepseekLLM:
-    """Deepseek LLM工具类"""
-    
     def __init__(
         self,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
-        model_name: str = "deepseek-reasoner"
+        model_name: str = "deepseek-reasoner",
+        client: Optional[AsyncOpenAI] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None
     ):
         """
         初始化Deepseek LLM客户端
@@ -29,98 +33,16 @@ class DeepseekLLM:
             api_key: API密钥，默认从环境变量DASHSCOPE_API_KEY获取
             base_url: API基础URL，默认从环境变量DASHSCOPE_API_BASE获取
             model_name: 模型名称，默认为deepseek-r1
+            client: 共享的AsyncOpenAI客户端，默认新建
+            limiter: 共享的限流器，默认不限流
+            breaker: 共享的熔断器，默认不熔断
         """
-        self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
-        self.base_url = base_url or os.getenv("DASHSCOPE_API_BASE")
-        self.model_name = model_name # "deepseek-r1"
-
-        # self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
-        # self.base_url = base_url or os.getenv("DEEPSEEK_API_BASE")
-        # self.model_name = model_name # "deepseek-r1"
-
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
-    
-    def stream_chat(
-        self,
-        prompt: str,
-        include_usage: bool = False
-    ) -> Generator[DeepseekResponse, None, None]:
-        """
-        流式对话
-        
-        Args:
-            prompt: 用户输入
-            include_usage: 是否包含token使用情况
-            
-        Yields:
-            DeepseekResponse: 包含思考过程和回答内容的响应对象
-        """
-        completion = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            stream=True,
-            stream_options={"include_usage": include_usage} if include_usage else None
+        api_key, base_url = self.resolve_endpoint(api_key, base_url)
+        super().__init__(
+            api_key=api_key,
+            base_url=base_url,
+            model_name=model_name, # "deepseek-r1"
+            client=client,
+            limiter=limiter,
+            breaker=breaker
         )
-
-        response = DeepseekResponse()
-        
-        for chunk in completion:
-            # 处理token使用情况
-            if chunk.choices == []:
-                if hasattr(chunk, 'usage'):
-                    response.usage = chunk.usage.model_dump()
-                yield response
-                continue
-                
-            # 处理思考过程和回答
-            if not hasattr(chunk.choices[0].delta, 'reasoning_content'):
-                continue
-                
-            if (chunk.choices[0].delta.reasoning_content == "" and 
-                chunk.choices[0].delta.content == ""):
-                continue
-                
-            # 开始回答
-            if (chunk.choices[0].delta.reasoning_content == "" and 
-                not response.is_answering):
-                response.is_answering = True
-                
-            # 更新思考内容
-            if chunk.choices[0].delta.reasoning_content != "":
-                response.reasoning_content += chunk.choices[0].delta.reasoning_content
-                
-            # 更新回答内容
-            elif chunk.choices[0].delta.content != "":
-                response.answer_content += chunk.choices[0].delta.content
-                
-            yield response
-
-    def chat(self, prompt: str) -> DeepseekResponse:
-        """
-        单次对话
-        
-        Args:
-            prompt: 用户输入
-            
-        Returns:
-            DeepseekResponse: 包含思考过程和回答内容的响应对象
-        """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            timeout=300.0
-        )
-        
-        result = DeepseekResponse()
-        if hasattr(response.choices[0].message, 'reasoning_content'):
-            result.reasoning_content = response.choices[0].message.reasoning_content
-        result.answer_content = response.choices[0].message.content
-        result.is_answering = True
-        
-        if hasattr(response, 'usage'):
-            result.usage = response.usage.model_dump()
-            
-        return result
\ No newline at end of file
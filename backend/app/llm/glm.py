@@ -1,26 +1,31 @@
 # glm-zero-preview
-from typing import Generator, Optional, Dict, Any
-import os
-from openai import OpenAI
+from typing import Optional
+from openai import AsyncOpenAI
 from dotenv import load_dotenv, find_dotenv
-from pydantic import BaseModel
+from app.llm.base import BaseLLM, LLMResponse
+from app.llm.rate_limit import ProviderLimiter
+from app.llm.resilience import CircuitBreaker
 
 load_dotenv(find_dotenv())
 
-class GLMResponse(BaseModel):
-    """GLM响应模型"""
-    answer_content: str = ""
-    is_answering: bool = False
-    usage: Optional[Dict[str, Any]] = None
+# 兼容旧名称
+GLMResponse = LLMResponse
 
-class GLMLLM:
+class GLMLLM(BaseLLM):
     """GLM大语言模型工具类"""
-    
+
+    provider = "zhipu"
+    api_key_env = "ZHIPUAI_API_KEY"
+    default_base_url = "https://open.bigmodel.cn/api/paas/v4/"
+
     def __init__(
         self,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
-        model_name: str = "glm-4"
+        model_name: str = "glm-4",
+        client: Optional[AsyncOpenAI] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None
     ):
         """
         初始化GLM客户端
@@ -29,87 +34,20 @@ class GLMLLM:
             api_key: API密钥，默认从环境变量ZHIPUAI_API_KEY获取
             base_url: API基础URL，默认https://open.bigmodel.cn/api/paas/v4/
             model_name: 模型名称，默认为glm-4
+            client: 共享的AsyncOpenAI客户端，默认新建
+            limiter: 共享的限流器，默认不限流
+            breaker: 共享的熔断器，默认不熔断
         """
-        self.api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
-        self.base_url = base_url or "https://open.bigmodel.cn/api/paas/v4/"
-        self.model_name = model_name
-        
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
-    
-    def stream_chat(
-        self,
-        messages: list[dict[str, str]],
-        include_usage: bool = False
-    ) -> Generator[GLMResponse, None, None]:
-        """
-        流式对话
-        
-        Args:
-            messages: 消息列表（需包含role和content）
-            include_usage: 是否包含token使用情况
-            
-        Yields:
-            GLMResponse: 包含回答内容的响应对象
-        """
-        completion = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            stream=True,
-            stream_options={"include_usage": include_usage} if include_usage else None
+        api_key, base_url = self.resolve_endpoint(api_key, base_url)
+        super().__init__(
+            api_key=api_key,
+            base_url=base_url,
+            model_name=model_name,
+            client=client,
+            limiter=limiter,
+            breaker=breaker
         )
 
-        response = GLMResponse()
-        
-        for chunk in completion:
-            if chunk.choices == []:
-                if hasattr(chunk, 'usage'):
-                    response.usage = chunk.usage.model_dump()
-                yield response
-                continue
-                
-            delta = chunk.choices[0].delta
-            if not delta.content:
-                continue
-                
-            # 开始回答
-            if not response.is_answering:
-                response.is_answering = True
-                
-            # 更新回答内容
-            response.answer_content += delta.content
-            yield response
-
-    def chat(self, prompt: str) -> GLMResponse:
-        """
-        单次对话
-        
-        Args:
-            messages: 消息列表（需包含role和content）
-            
-        Returns:
-            GLMResponse: 包含回答内容的响应对象
-        """
-        messages = [
-            {"role": "user", "content": prompt}
-        ]
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            timeout=300.0
-        )
-        
-        result = GLMResponse()
-        result.answer_content = response.choices[0].message.content
-        result.is_answering = True
-        
-        if hasattr(response, 'usage'):
-            result.usage = response.usage.model_dump()
-            
-        return result
-
 # client = OpenAI(
 #     api_key="your zhipuai api key",
 #     base_url="https://open.bigmodel.cn/api/paas/v4/"
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+_CJK = re.compile(r"[぀-ヿ㐀-鿿가-힯]")
+
+def _env(name: str, provider: str, default: str) -> str:
+    """按提供方读取配置：LLM_RPM_DEEPSEEK优先于LLM_RPM"""
+    return os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default))
+
+@dataclass
+class RateLimits:
+    """单个提供方账号的限额，0表示不限制"""
+    # 每分钟请求数
+    rpm: float = 0
+    # 每分钟token数（输入加输出，按估算值预占，完成后按实际用量修正）
+    tpm: float = 0
+    # 同时进行的请求数，超出的请求排队
+    max_concurrency: int = 16
+    # 预占token时输出部分的估算值
+    output_tokens: int = 2000
+
+    @classmethod
+    def for_provider(cls, provider: str) -> "RateLimits":
+        """从环境变量读取提供方的限额，如LLM_RPM_DEEPSEEK=60、LLM_TPM_ZHIPU=100000"""
+        return cls(
+            rpm=float(_env("LLM_RPM", provider, "0")),
+            tpm=float(_env("LLM_TPM", provider, "0")),
+            max_concurrency=int(_env("LLM_CONCURRENCY", provider, "16")),
+            output_tokens=int(_env("LLM_OUTPUT_TOKENS", provider, "2000"))
+        )
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩文字约每字0.6个token，其他字符约每4个字符1个token"""
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+class TokenBucket:
+    """
+    令牌桶（每分钟补充rate个，容量为rate）
+
+    reserve允许余额为负：先到的请求先预占，返回需要等待的秒数，后面的请求等待时间依次累加，
+    这样排队顺序就是发出顺序，也不会因为轮询而浪费配额。
+    """
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self._clock = clock
+        self._tokens = rate
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预占amount个令牌（超过容量时按容量计），返回需要等待的秒数"""
+        self._refill()
+        self._tokens -= min(amount, self.rate)
+        return max(0.0, -self._tokens * 60 / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正（正数为补扣，负数为退还）"""
+        self._refill()
+        self._tokens = min(self.rate, self._tokens - amount)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+class Ticket:
+    """一个排队中或正在执行的请求"""
+
+    def __init__(self, limiter: "ProviderLimiter", tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.admitted = False
+        self.released = False
+        self.position = 0
+        self._wakeup = asyncio.Event()
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        等待轮到该请求，排队期间位置变化时产出当前位置（从1开始）
+
+        轮到后按令牌桶预占请求数和token数，需要时等待配额恢复，然后结束迭代。
+        """
+        while not self.admitted:
+            # 先清除再读取位置：消费方处理产出的位置期间发生的唤醒不会丢失
+            self._wakeup.clear()
+            position = self.limiter.position(self)
+            if position != self.position:
+                self.position = position
+                yield position
+            await self._wakeup.wait()
+        delay = self.limiter.reserve(self.tokens)
+        if delay > 0:
+            self.limiter.stats["throttled"] += 1
+            await self.limiter.sleep(delay)
+
+    def settle(self, usage: Optional[Dict[str, Any]]) -> None:
+        """请求完成后按usage中的实际token数修正预占量"""
+        total = (usage or {}).get("total_tokens")
+        if total and self.limiter.tpm is not None:
+            self.limiter.tpm.adjust(total - self.tokens)
+
+    def release(self) -> None:
+        """结束请求（无论是否轮到过），释放并发名额"""
+        if not self.released:
+            self.released = True
+            self.limiter.release(self)
+
+class ProviderLimiter:
+    """
+    单个提供方账号的限流器：请求数和token数两个令牌桶，加上有界并发和先进先出的等待队列
+
+    每次调用先enqueue得到Ticket，在Ticket.wait中排队（期间可向客户端报告排队位置），
+    结束后release。突发请求在本地排队等待配额，而不是在上游返回429。
+    """
+
+    def __init__(
+        self,
+        limits: RateLimits,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep
+    ):
+        self.limits = limits
+        self.sleep = sleep
+        self.rpm = TokenBucket(limits.rpm, clock) if limits.rpm > 0 else None
+        self.tpm = TokenBucket(limits.tpm, clock) if limits.tpm > 0 else None
+        self.active = 0
+        self._queue: Deque[Ticket] = deque()
+        self.stats: Dict[str, int] = {"admitted": 0, "queued": 0, "throttled": 0}
+
+    def enqueue(self, tokens: int) -> Ticket:
+        """登记一个请求，并发名额空闲且前面没有排队的请求时立即轮到"""
+        ticket = Ticket(self, tokens)
+        self._queue.append(ticket)
+        if len(self._queue) > 1 or self.active >= self.limits.max_concurrency:
+            self.stats["queued"] += 1
+        self._admit()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def reserve(self, tokens: int) -> float:
+        delays = [0.0]
+        if self.rpm is not None:
+            delays.append(self.rpm.reserve(1))
+        if self.tpm is not None:
+            delays.append(self.tpm.reserve(tokens))
+        return max(delays)
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self.active -= 1
+        else:
+            self._queue.remove(ticket)
+        self._admit()
+
+    def _admit(self) -> None:
+        while self._queue and self.active < max(self.limits.max_concurrency, 1):
+            ticket = self._queue.popleft()
+            ticket.admitted = True
+            self.active += 1
+            self.stats["admitted"] += 1
+            ticket._wakeup.set()
+        # 排队位置前移，通知剩余的请求
+        for ticket in self._queue:
+            ticket._wakeup.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": len(self._queue),
+            "rpm": self.limits.rpm,
+            "tpm": self.limits.tpm,
+            "max_concurrency": self.limits.max_concurrency,
+            "tpm_available": int(self.tpm.available) if self.tpm is not None else None
+        }
@@ -0,0 +1,203 @@
+import hashlib
+import importlib.util
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Type, Tuple
+import httpx
+from openai import AsyncOpenAI
+from app.llm.base import BaseLLM
+from app.llm.deepseek import DeepseekLLM
+from app.llm.glm import GLMLLM
+from app.llm.rate_limit import ProviderLimiter, RateLimits
+from app.llm.resilience import CircuitBreaker, ResilienceConfig
+
+# HTTP/2需要可选依赖h2（pip install httpx[http2]），未安装时自动退回HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+@dataclass
+class PoolConfig:
+    """连接池配置，默认值可通过环境变量覆盖"""
+    max_connections: int = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+    max_keepalive_connections: int = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+    keepalive_expiry: float = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+    http2: bool = os.getenv("LLM_POOL_HTTP2", "1") == "1"
+
+@dataclass
+class PoolStats:
+    """单个连接池的使用统计"""
+    requests: int = 0
+    responses: int = 0
+    errors: int = 0
+    models: set = field(default_factory=set)
+
+    @property
+    def in_flight(self) -> int:
+        """已发出但尚未收到响应头的请求数"""
+        return self.requests - self.responses
+
+ClientKey = Tuple[str, str, str]
+
+class LLMRegistry:
+    """
+    进程级LLM客户端注册表
+
+    按(provider, base_url, api_key, model)缓存LLM实例；同一提供方、地址和密钥下的
+    所有模型共用一个长连接的AsyncOpenAI客户端，避免每次请求都重新建立连接池和TLS握手。
+    """
+
+    def __init__(self, config: Optional[PoolConfig] = None):
+        self.config = config or PoolConfig()
+        self._clients: Dict[ClientKey, AsyncOpenAI] = {}
+        self._stats: Dict[ClientKey, PoolStats] = {}
+        # 限额按提供方账号（同一提供方、地址和密钥）计算，所有模型共用
+        self._limiters: Dict[ClientKey, ProviderLimiter] = {}
+        # 熔断状态同样按提供方账号共享
+        self._breakers: Dict[ClientKey, CircuitBreaker] = {}
+        self._llms: Dict[Tuple[str, str, str, str], BaseLLM] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def resolve_provider(model_name: str) -> Type[BaseLLM]:
+        """根据模型名称选择对应的提供方"""
+        return DeepseekLLM if model_name.startswith("deepseek") else GLMLLM
+
+    @staticmethod
+    def _fingerprint(api_key: Optional[str]) -> str:
+        """API密钥只以摘要形式出现在缓存键和统计中"""
+        return hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+
+    def get_llm(
+        self,
+        model_name: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ) -> BaseLLM:
+        """
+        获取（或创建）长期复用的LLM实例
+
+        Args:
+            model_name: 模型名称
+            api_key: API密钥，默认使用提供方的环境变量
+            base_url: API基础URL，默认使用提供方的默认地址
+
+        Returns:
+            BaseLLM: 共享连接池的LLM实例
+        """
+        llm_cls = self.resolve_provider(model_name)
+        # 先解析出真实的密钥和地址，再计算缓存键
+        api_key, base_url = llm_cls.resolve_endpoint(api_key, base_url)
+        client_key = (llm_cls.provider, str(base_url), self._fingerprint(api_key))
+        key = client_key + (model_name,)
+
+        cached = self._llms.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        llm = llm_cls(
+            api_key=api_key,
+            base_url=base_url,
+            model_name=model_name,
+            client=self._get_client(client_key, api_key, base_url),
+            limiter=self._limiters[client_key],
+            breaker=self._breakers[client_key]
+        )
+        self._stats[client_key].models.add(model_name)
+        self._llms[key] = llm
+        # 先登记再解析fallback，互为fallback的两个模型不会无限递归
+        fallback_model = llm.resilience.fallback_model
+        if fallback_model and fallback_model != model_name:
+            llm.fallback = self.get_llm(fallback_model)
+        return llm
+
+    def _get_client(self, key: ClientKey, api_key: Optional[str], base_url: Optional[str]) -> AsyncOpenAI:
+        """获取共享的AsyncOpenAI客户端"""
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        stats = PoolStats()
+        resilience = ResilienceConfig.for_provider(key[0])
+
+        async def on_request(request: httpx.Request) -> None:
+            stats.requests += 1
+
+        async def on_response(response: httpx.Response) -> None:
+            stats.responses += 1
+            if response.is_error:
+                stats.errors += 1
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry
+            ),
+            http2=self.config.http2 and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(resilience.request_timeout or None, connect=resilience.connect_timeout or None),
+            event_hooks={"request": [on_request], "response": [on_response]}
+        )
+        # 重试由BaseLLM按ResilienceConfig处理，SDK自带的重试关闭
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        self._clients[key] = client
+        self._stats[key] = stats
+        self._limiters[key] = ProviderLimiter(RateLimits.for_provider(key[0]))
+        self._breakers[key] = CircuitBreaker(key[0], resilience)
+        return client
+
+    @staticmethod
+    def _connection_stats(client: AsyncOpenAI) -> Dict[str, int]:
+        """读取httpcore连接池中的连接状态（依赖内部属性，读取失败时返回空）"""
+        transport = getattr(client._client, "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        if not connections:
+            return {"connections": 0, "idle": 0}
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"connections": len(connections), "idle": idle}
+
+    def stats(self) -> Dict[str, Any]:
+        """返回注册表及各连接池的使用统计"""
+        pools = []
+        for (provider, base_url, fingerprint), client in self._clients.items():
+            stats = self._stats[(provider, base_url, fingerprint)]
+            pools.append({
+                "provider": provider,
+                "base_url": base_url,
+                "key_fingerprint": fingerprint,
+                "models": sorted(stats.models),
+                "requests": stats.requests,
+                "responses": stats.responses,
+                "errors": stats.errors,
+                "in_flight": stats.in_flight,
+                "rate_limit": self._limiters[(provider, base_url, fingerprint)].snapshot(),
+                "circuit": self._breakers[(provider, base_url, fingerprint)].snapshot(),
+                **self._connection_stats(client)
+            })
+        return {
+            "http2": self.config.http2 and HTTP2_AVAILABLE,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "pools": pools
+        }
+
+    async def aclose(self) -> None:
+        """关闭所有连接池，应在应用退出时调用"""
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+        self._stats.clear()
+        self._limiters.clear()
+        self._breakers.clear()
+        self._llms.clear()
+
+# 进程级单例
+llm_registry = LLMRegistry()
+
+def get_llm(model_name: str) -> BaseLLM:
+    """获取共享连接池的LLM实例"""
+    return llm_registry.get_llm(model_name)
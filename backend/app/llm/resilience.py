@@ -0,0 +1,149 @@
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+import openai
+
+def _env(name: str, provider: str, default: str) -> str:
+    """按提供方读取配置：LLM_MAX_RETRIES_DEEPSEEK优先于LLM_MAX_RETRIES"""
+    return os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default))
+
+@dataclass
+class ResilienceConfig:
+    """超时、重试和熔断配置，0表示不限制（超时）或关闭（重试、熔断）"""
+    # 建立连接的超时（秒）
+    connect_timeout: float = 10.0
+    # 从发出请求到收到第一段内容（思考或回答）的超时
+    first_token_timeout: float = 60.0
+    # 流式输出中相邻两段内容之间的超时
+    idle_timeout: float = 30.0
+    # 非流式请求的总超时
+    request_timeout: float = 300.0
+    # 尚未开始输出的请求失败后的最大重试次数
+    max_retries: int = 2
+    # 指数退避的基数和上限（秒），实际等待时间在[0, min(上限, 基数*2^n)]之间随机
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    # 连续失败多少次后熔断
+    failure_threshold: int = 5
+    # 熔断持续时间（秒），之后放行一个试探请求
+    cooldown: float = 30.0
+    # 熔断或重试用尽时改用的模型（其他提供方），为空时直接失败
+    fallback_model: str = ""
+
+    @classmethod
+    def for_provider(cls, provider: str) -> "ResilienceConfig":
+        """从环境变量读取提供方的配置，如LLM_IDLE_TIMEOUT=20、LLM_FALLBACK_MODEL_DEEPSEEK=glm-4-plus"""
+        return cls(
+            connect_timeout=float(_env("LLM_CONNECT_TIMEOUT", provider, "10")),
+            first_token_timeout=float(_env("LLM_FIRST_TOKEN_TIMEOUT", provider, "60")),
+            idle_timeout=float(_env("LLM_IDLE_TIMEOUT", provider, "30")),
+            request_timeout=float(_env("LLM_REQUEST_TIMEOUT", provider, "300")),
+            max_retries=int(_env("LLM_MAX_RETRIES", provider, "2")),
+            backoff_base=float(_env("LLM_BACKOFF_BASE", provider, "0.5")),
+            backoff_max=float(_env("LLM_BACKOFF_MAX", provider, "8")),
+            failure_threshold=int(_env("LLM_BREAKER_FAILURES", provider, "5")),
+            cooldown=float(_env("LLM_BREAKER_COOLDOWN", provider, "30")),
+            fallback_model=_env("LLM_FALLBACK_MODEL", provider, "")
+        )
+
+_TIMEOUT_PHASES = {"first_token": "首个token", "idle": "输出间隔", "request": "请求"}
+
+class LLMTimeout(Exception):
+    """模型调用超时，phase为first_token（迟迟没有开始输出）、idle（输出中途停滞）或request（非流式请求）"""
+
+    def __init__(self, phase: str, seconds: float):
+        super().__init__(f"模型{_TIMEOUT_PHASES[phase]}超时（{seconds:g}秒）")
+        self.phase = phase
+
+class CircuitOpenError(Exception):
+    """提供方已熔断，请求未发出"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider}服务暂时不可用，请{max(int(retry_after), 1)}秒后重试")
+        self.provider = provider
+        self.retry_after = retry_after
+
+def is_retryable(error: BaseException) -> bool:
+    """连接失败、超时、429和5xx可以重试，其他错误（参数错误、鉴权失败等）重试也不会成功"""
+    if isinstance(error, (LLMTimeout, asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def is_failure(error: BaseException) -> bool:
+    """计入熔断的错误：提供方不可用（429属于限流，由限流器处理，不计入）"""
+    return is_retryable(error) and not isinstance(error, openai.RateLimitError)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """读取429/503响应中的Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def backoff_delay(config: ResilienceConfig, attempt: int, rand: Callable[[], float] = random.random) -> float:
+    """第attempt次重试（从0开始）前的等待时间：full jitter指数退避"""
+    return rand() * min(config.backoff_max, config.backoff_base * 2 ** attempt)
+
+class CircuitBreaker:
+    """
+    单个提供方账号的熔断器
+
+    连续failure_threshold次失败后熔断（open），cooldown内的请求直接失败，不再占用连接和worker；
+    冷却结束后进入半开（half_open）状态，只放行一个试探请求，成功则恢复，失败则重新熔断。
+    试探请求被中途放弃时，再过一个cooldown放行下一个。
+    """
+
+    def __init__(self, provider: str, config: ResilienceConfig, clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.config = config
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+        self.stats: Dict[str, int] = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if self._clock() - self.opened_at < self.config.cooldown else "half_open"
+
+    def before_call(self) -> None:
+        """发出请求前调用，熔断中（或已有试探请求在进行）时抛出CircuitOpenError"""
+        state = self.state
+        if state == "closed":
+            return
+        now = self._clock()
+        if state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.config.cooldown):
+            self._probe_at = now
+            return
+        self.stats["rejected"] += 1
+        if state == "open":
+            wait = self.opened_at + self.config.cooldown - now
+        else:
+            wait = self._probe_at + self.config.cooldown - now
+        raise CircuitOpenError(self.provider, wait)
+
+    def record_success(self) -> None:
+        self.stats["successes"] += 1
+        self.failures = 0
+        self.opened_at = None
+        self._probe_at = None
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self.failures += 1
+        # 试探请求失败，或连续失败达到阈值
+        if self.opened_at is not None or (self.config.failure_threshold > 0 and self.failures >= self.config.failure_threshold):
+            if self.opened_at is None:
+                self.stats["opened"] += 1
+            self.opened_at = self._clock()
+            self._probe_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 
 # 导入路由
 from app.router import chat, diagrams, deepseek
+from app.llm.registry import llm_registry
+from app.router.diagrams import draw_service, thumbnails, response_cache, semantic_cache, single_flight
 
 # 加载环境变量
 load_dotenv()
@@ -32,6 +34,36 @@ app.include_router(chat.router, tags=["聊天"])
 app.include_router(diagrams.router, tags=["图表"])
 app.include_router(deepseek.router, tags=["Deepseek"])
 
+@app.on_event("shutdown")
+async def close_llm_clients():
+    """关闭共享的LLM连接池"""
+    await llm_registry.aclose()
+
+@app.on_event("shutdown")
+async def close_storage():
+    """关闭缩略图进程池、生成结果缓存和图表存储"""
+    await thumbnails.aclose()
+    await response_cache.aclose()
+    await draw_service.aclose()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """
+    LLM连接池使用统计
+    """
+    return llm_registry.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    生成结果缓存命中统计（精确缓存，按模型统计的语义缓存命中率和误命中率，以及合并的相同请求数）
+    """
+    return {
+        "exact": response_cache.stats,
+        "semantic": semantic_cache.metrics(),
+        "coalesced": {**single_flight.stats, "in_flight": single_flight.in_flight}
+    }
+
 @app.get("/")
 async def root():
     """
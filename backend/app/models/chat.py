@@ -35,10 +35,18 @@ class DiagramGenerationRequest(BaseModel):
     current_drawio: Optional[str] = None
     stream: bool = False
     model_name: str = "deepseek-reasoner"
+    edit_mode: str = Field(default="patch", description="编辑已有图表的方式：patch（只输出单元操作）或full（输出完整文件）")
+    compact: bool = Field(default=True, description="是否以紧凑表示向模型提供当前图表（共享样式、短id），减少输入token")
+    compress_output: Optional[bool] = Field(default=None, description="是否以drawio压缩格式返回图表，默认与current_drawio一致")
+    reuse_similar: bool = Field(default=True, description="新建图表时是否复用或参考由相似需求生成过的图表")
+    use_cache: bool = Field(default=True, description="是否直接返回相同请求缓存的结果，为false时重新生成（结果仍会写入缓存）")
     
 class DiagramGenerationResponse(BaseModel):
     """图表生成响应模型"""
     analysis: str = Field(..., description="生成过程分析说明")
     content: str = Field(..., description="生成的drawio文件内容")
     diagram_info: Optional[Dict[str, Any]] = Field(default=None, description="存储的图表元数据")
-    success: bool = Field(..., description="是否生成成功") 
\ No newline at end of file
+    success: bool = Field(..., description="是否生成成功")
+    edit_mode: Optional[str] = Field(default=None, description="实际使用的生成方式：patch、full或reuse（直接复用相似需求生成过的图表）")
+    patch: Optional[Dict[str, Any]] = Field(default=None, description="相对当前图表的DiffSync补丁，前端可增量应用")
+    cache: Optional[Dict[str, Any]] = Field(default=None, description="语义缓存命中时为{type, entry_id, similarity}，entry_id可用于报告误命中") 
\ No newline at end of file
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, WebSocket
 from typing import Dict, Any
-from app.llm.deepseek import DeepseekLLM
+from app.llm.registry import get_llm
+from app.llm.base import StreamAccumulator
 from pydantic import BaseModel
 
 router = APIRouter()
-llm = DeepseekLLM()
+llm = get_llm("deepseek-reasoner")
 
 class ChatRequest(BaseModel):
     """聊天请求模型"""
@@ -23,9 +24,18 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_json()
             request = ChatRequest(**data)
             
-            # 流式处理消息
-            for response in llm.stream_chat(request.content, request.include_usage):
-                await websocket.send_json(response.model_dump())
+            # 流式处理消息，只发送增量内容，结束时补发完整结果
+            accumulator = StreamAccumulator()
+            async for delta in llm.stream_deltas(request.content, request.include_usage):
+                accumulator.add(delta)
+                await websocket.send_json({
+                    "type": "delta",
+                    **delta.model_dump(exclude_defaults=True)
+                })
+            await websocket.send_json({
+                "type": "final",
+                **accumulator.finalize().model_dump()
+            })
     except Exception as e:
         await websocket.send_json({
             "status": "error",
@@ -44,5 +54,5 @@ async def chat(request: ChatRequest) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 响应结果
     """
-    response = llm.chat(request.content)
+    response = await llm.chat(request.content)
     return response.model_dump() 
\ No newline at end of file
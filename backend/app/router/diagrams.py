@@ -1,25 +1,237 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import Dict, Any, List, Optional
 from app.models.chat import DiagramRequest, DiagramGenerationRequest, DiagramGenerationResponse
-from app.llm.deepseek import DeepseekLLM
-from app.services.draw_service import DrawService
+from app.services.draw_service import DrawService, VersionConflict
 from app.services.ai_diagram_service import AIDiagramService
-from fastapi.responses import StreamingResponse
+from app.services.response_cache import ResponseCache
+from app.services.semantic_cache import SemanticCache
+from app.services.single_flight import SingleFlight
+from app.services.thumbnails import ThumbnailPipeline
+from app.services.svg_renderer import RENDERER_VERSION
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 import json
-from app.llm.glm import GLMLLM
+from app.llm.registry import get_llm
 
 router = APIRouter()
-deepseek_llm = DeepseekLLM()
+# 进程内共享一个DrawService，生成的图表可以通过/diagrams接口再次读取
 draw_service = DrawService()
+# 图表创建/更新后在后台进程池中生成PNG缩略图
+thumbnails = ThumbnailPipeline(draw_service.previews)
+draw_service.add_listener(thumbnails.on_diagram_event)
+# 生成结果缓存，所有模型共用（缓存键包含模型名）
+response_cache = ResponseCache()
+# 新建图表需求的语义缓存（按模型分别设置阈值和统计）
+semantic_cache = SemanticCache()
+# 同时到达的相同生成请求（如重复点击、多个标签页）共用一次模型调用
+single_flight = SingleFlight()
 
 def get_ai_diagram_service(model_name: str = "deepseek-r1"):
-    """根据模型名称返回对应的服务实例"""
-    llm = DeepseekLLM(model_name=model_name) if model_name.startswith("deepseek") else GLMLLM(model_name=model_name )
+    """根据模型名称返回对应的服务实例（LLM客户端从注册表复用）"""
+    llm = get_llm(model_name)
     return AIDiagramService(
-        draw_service=DrawService(),
-        llm=llm
+        draw_service=draw_service,
+        llm=llm,
+        response_cache=response_cache,
+        semantic_cache=semantic_cache,
+        single_flight=single_flight
     )
 
+def _with_preview_url(diagram: Dict[str, Any]) -> Dict[str, Any]:
+    """附加预览图和缩略图地址（缩略图地址带内容哈希，内容不变时浏览器可长期缓存）"""
+    diagram["preview_url"] = f"/diagrams/{diagram['id']}/preview"
+    diagram["thumbnail_url"] = (
+        f"/diagrams/{diagram['id']}/thumbnail?size={thumbnails.config.sizes[0]}&v={diagram['content_hash']}"
+    )
+    return diagram
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """判断If-None-Match是否包含etag（弱比较）"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+def _diagram_etag(diagram: Dict[str, Any]) -> str:
+    """图表的ETag：内容哈希（元数据只在内容变化时改变）"""
+    return f'"{diagram["content_hash"]}"'
+
+def _expected_hashes(header: Optional[str]) -> Optional[List[str]]:
+    """
+    解析If-Match为内容哈希列表，没有该请求头或为*时返回None（不检查）
+
+    If-Match使用强比较（RFC 9110 13.1.1），弱ETag（W/前缀）不匹配任何内容，
+    只有弱ETag时返回空列表，更新总是被拒绝。
+    """
+    if not header:
+        return None
+    tags = [tag.strip() for tag in header.split(",")]
+    if "*" in tags:
+        return None
+    return [tag.strip('"') for tag in tags if not tag.startswith("W/")]
+
+@router.get("/diagrams")
+async def list_diagrams(type: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    """按更新时间倒序列出图表（不含内容）"""
+    rows = await draw_service.list_diagrams(type, min(max(limit, 1), 200), max(offset, 0))
+    return [_with_preview_url(row) for row in rows]
+
+@router.get("/diagrams/search")
+async def search_diagrams(
+    q: str,
+    type: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    按页面名、单元文字和tooltip全文检索图表
+
+    返回按相关度排序的图表（不含内容），snippet为命中位置附近的文字，命中部分用<mark>标记。
+    （必须在/diagrams/{diagram_id}之前注册，否则search会被当作图表id）
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="缺少检索词")
+    hits = await draw_service.search_diagrams(q, type, min(max(limit, 1), 100), max(offset, 0))
+    return [_with_preview_url(hit) for hit in hits]
+
+@router.post("/diagrams/similar")
+async def find_similar_diagrams(request: DiagramRequest, limit: int = 10, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """查找与给定内容结构相似的已保存图表（不含内容），按相似度从高到低排序"""
+    if request.content is None:
+        raise HTTPException(status_code=400, detail="缺少图表内容")
+    try:
+        hits = await draw_service.find_similar(content=request.content, limit=min(max(limit, 1), 100), threshold=threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"无法解析图表: {e}")
+    return [_with_preview_url(hit) for hit in hits]
+
+@router.post("/diagrams")
+async def create_diagram(request: DiagramRequest, response: Response):
+    """保存图表"""
+    if request.content is None:
+        raise HTTPException(status_code=400, detail="缺少图表内容")
+    diagram = await draw_service.create_diagram(request.type, request.content)
+    response.headers["ETag"] = _diagram_etag(diagram)
+    return _with_preview_url(diagram)
+
+@router.get("/diagrams/{diagram_id}")
+async def get_diagram(request: Request, response: Response, diagram_id: str):
+    """
+    获取图表
+
+    带内容哈希ETag，If-None-Match命中时返回304，轮询的客户端内容不变时不重复传输。
+    """
+    diagram = await draw_service.get_diagram(diagram_id)
+    if diagram is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    headers = {"ETag": _diagram_etag(diagram), "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return _with_preview_url(diagram)
+
+@router.put("/diagrams/{diagram_id}")
+async def update_diagram(request: Request, response: Response, diagram_id: str, body: DiagramRequest):
+    """
+    更新图表内容
+
+    带If-Match时只有当前内容与其中的ETag一致才更新，否则返回412（图表已被其他人修改），
+    客户端应重新读取后再合并修改。
+    """
+    if body.content is None:
+        raise HTTPException(status_code=400, detail="缺少图表内容")
+    try:
+        diagram = await draw_service.update_diagram(
+            diagram_id, body.content, _expected_hashes(request.headers.get("if-match"))
+        )
+    except VersionConflict as e:
+        return JSONResponse(
+            status_code=412,
+            content={"detail": "图表已被修改，请重新获取后再更新"},
+            headers={"ETag": _diagram_etag(e.diagram)}
+        )
+    if diagram is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    response.headers["ETag"] = _diagram_etag(diagram)
+    return _with_preview_url(diagram)
+
+@router.delete("/diagrams/{diagram_id}")
+async def delete_diagram(diagram_id: str):
+    """删除图表"""
+    if not await draw_service.delete_diagram(diagram_id):
+        raise HTTPException(status_code=404, detail="图表不存在")
+    return {"success": True}
+
+@router.get("/diagrams/{diagram_id}/preview")
+async def get_diagram_preview(diagram_id: str, page: int = 0):
+    """获取图表的SVG预览图"""
+    try:
+        svg = await draw_service.get_preview(diagram_id, max(page, 0))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"无法生成预览: {e}")
+    if svg is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    return Response(content=svg, media_type="image/svg+xml")
+
+@router.get("/diagrams/{diagram_id}/thumbnail")
+async def get_diagram_thumbnail(request: Request, diagram_id: str, size: int = 256, v: Optional[str] = None):
+    """
+    获取图表的PNG缩略图
+
+    带ETag，可用If-None-Match协商缓存；v与当前内容哈希一致时返回可长期缓存的响应。
+    """
+    diagram = await draw_service.get_diagram(diagram_id)
+    if diagram is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    if size not in thumbnails.config.sizes:
+        raise HTTPException(status_code=400, detail=f"缩略图尺寸只能是{list(thumbnails.config.sizes)}")
+    content_hash = diagram["content_hash"]
+    headers = {
+        "ETag": f'"{content_hash}-{size}-v{RENDERER_VERSION}"',
+        "Cache-Control": "public, max-age=31536000, immutable" if v == content_hash else "no-cache"
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await thumbnails.get(content_hash, diagram["content"], size)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"无法生成缩略图: {e}")
+    return Response(content=data, media_type="image/png", headers=headers)
+
+@router.get("/diagrams/{diagram_id}/similar")
+async def get_similar_diagrams(diagram_id: str, limit: int = 10, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """查找与指定图表结构相似的其他图表（不含内容），按相似度从高到低排序"""
+    hits = await draw_service.find_similar(diagram_id=diagram_id, limit=min(max(limit, 1), 100), threshold=threshold)
+    if hits is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    return [_with_preview_url(hit) for hit in hits]
+
+@router.get("/diagrams/{diagram_id}/versions")
+async def list_diagram_versions(diagram_id: str) -> List[Dict[str, Any]]:
+    """列出图表的历史版本（不含内容）"""
+    if await draw_service.get_diagram(diagram_id) is None:
+        raise HTTPException(status_code=404, detail="图表不存在")
+    return await draw_service.list_versions(diagram_id)
+
+@router.get("/diagrams/{diagram_id}/versions/{version}")
+async def get_diagram_version(diagram_id: str, version: int):
+    """获取图表的指定历史版本"""
+    result = await draw_service.get_version(diagram_id, version)
+    if result is None:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    return result
+
+@router.get("/diagrams/{diagram_id}/diff")
+async def diff_diagram_versions(
+    diagram_id: str,
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to")
+):
+    """比较两个版本，返回从from到to的DiffSync补丁"""
+    result = await draw_service.diff_versions(diagram_id, from_version, to_version)
+    if result is None:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    return result
+
 @router.post("/generate-diagram")
 async def generate_diagram(
     request: DiagramGenerationRequest,
@@ -30,7 +242,12 @@ async def generate_diagram(
             service.stream_generate_diagram(
                 diagram_type=request.type,
                 user_prompt=request.user_prompt,
-                current_drawio=request.current_drawio
+                current_drawio=request.current_drawio,
+                edit_mode=request.edit_mode,
+                compress_output=request.compress_output,
+                compact=request.compact,
+                reuse_similar=request.reuse_similar,
+                use_cache=request.use_cache
             ),
             media_type="text/event-stream",
             headers={
@@ -48,9 +265,25 @@ async def generate_diagram(
         return await service.generate_diagram(
             diagram_type=request.type,
             user_prompt=request.user_prompt,
-            current_drawio=request.current_drawio
+            current_drawio=request.current_drawio,
+            edit_mode=request.edit_mode,
+            compress_output=request.compress_output,
+            compact=request.compact,
+            reuse_similar=request.reuse_similar,
+            use_cache=request.use_cache
         )
 
+@router.post("/generate-diagram/false-hit/{entry_id}")
+async def report_false_hit(entry_id: str):
+    """
+    报告语义缓存误命中（返回的图表不符合需求）
+
+    entry_id为结果中cache.entry_id，条目会被删除，之后相同的需求重新生成。
+    """
+    if not semantic_cache.report_false_hit(entry_id):
+        raise HTTPException(status_code=404, detail="缓存条目不存在")
+    return {"success": True}
+
 async def stream_generate_diagram(self, diagram_type, user_prompt, current_drawio):
     try:
         full_prompt = self._build_prompt(diagram_type, user_prompt, current_drawio)
@@ -1,13 +1,58 @@
-from typing import Optional, Dict, Any
-from app.llm.deepseek import DeepseekLLM
+import asyncio
+from typing import Optional, Dict, Any, List
+from app.llm.base import BaseLLM
 from app.services.draw_service import DrawService
+from app.services.diagram_patch import PatchError, parse_patch, apply_patch, can_patch
+from app.services.diagram_diff import diff_pages
+from app.services.sse import SSEEncoder, paced
+from app.services.mxfile_codec import inflate_mxfile, compress_mxfile, is_compressed
+from app.services.layout_repair import LayoutRepairConfig, repair_overlaps
+from app.services.response_cache import ResponseCache, RecordingEncoder, cache_key, replay_events
+from app.services.semantic_cache import SemanticCache
+from app.services.single_flight import SingleFlight
+from app.services.compact_diagram import (
+    CompactDiagram,
+    encode_diagram,
+    decode_diagram,
+    parse_compact_patch,
+    FORMAT_HELP,
+)
+from app.services.stream_parser import (
+    DiagramStreamScanner,
+    MxCellStreamParser,
+    scan_response,
+    scan_patch_response,
+    scan_code_response,
+    ANALYSIS,
+    CODE,
+    PATCH,
+    MXFILE,
+    MXFILE_CHUNK,
+    MXFILE_OPEN,
+)
 
 class AIDiagramService:
     """AI图表生成服务"""
     
-    def __init__(self, draw_service: DrawService, llm: DeepseekLLM):
+    def __init__(
+        self,
+        draw_service: DrawService,
+        llm: BaseLLM,
+        layout_repair: Optional[LayoutRepairConfig] = None,
+        response_cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        single_flight: Optional[SingleFlight] = None
+    ):
         self.draw_service = draw_service
         self.llm = llm
+        # 相同请求（模型、需求、当前图表一致）直接返回缓存的结果，为None时不缓存
+        self.response_cache = response_cache
+        # 新建图表时含义相同的需求（换一种说法）也返回缓存的结果，为None时不使用
+        self.semantic_cache = semantic_cache
+        # 进行中的相同请求共用一次上游调用，为None时不合并
+        self.single_flight = single_flight
+        # 生成结果的重叠修复，在服务端完成，不需要再让模型调整一轮
+        self.layout_repair = layout_repair or LayoutRepairConfig()
         self.prompt_template = """
 你是一个专业的图表生成助手，请根据以下需求生成或修改drawio图表：
 
@@ -26,190 +71,823 @@ class AIDiagramService:
 生成的drawio代码
 </mxfile>
         """
+        # 编辑模式：只让模型输出需要变更的单元，输出长度与改动量而不是图表大小相关
+        self.patch_prompt_template = """
+你是一个专业的图表生成助手，请根据以下需求修改drawio图表：
+
+用户需求：
+{user_prompt}
+
+当前图表内容：
+{current_drawio}
+
+请不要输出完整的图表，只输出对mxCell的修改操作（JSON数组），按以下格式响应：
+【分析说明】
+你的分析说明
+
+【drawio补丁】
+[
+  {{"op": "add", "cell": "<mxCell id='新id' value='...' style='...' vertex='1' parent='1'><mxGeometry x='0' y='0' width='120' height='60' as='geometry'/></mxCell>"}},
+  {{"op": "update", "id": "已有id", "attrs": {{"value": "新文字", "style": "..."}}, "geometry": {{"x": 100, "y": 200}}}},
+  {{"op": "delete", "id": "已有id"}}
+]
+
+说明：
+1. update只需给出变化的属性，删除节点时其子节点和相连的连线会一并删除
+2. 新增单元的id不能与已有id重复，连线通过source/target引用单元id
+3. cell中的XML属性请使用单引号，保证JSON合法
+        """
+        # 紧凑模式：当前图表以紧凑表示给出，省去重复的样式、默认属性和冗长的id
+        self.compact_prompt_template = """
+你是一个专业的图表生成助手，请根据以下需求修改drawio图表：
+
+用户需求：
+{user_prompt}
+
+当前图表（紧凑表示）：
+{current_drawio}
+
+紧凑表示格式：
+{format_help}
+
+请按以下格式响应，【drawio代码】中用相同的紧凑表示输出修改后的完整图表：
+【分析说明】
+你的分析说明
+
+【drawio代码】
+S1 样式
+V 2 s=S1 v="文字" g=0,0,120,60
+E 3 src=2 tgt=4
+        """
+        # 根据相似需求生成过的图表作为参考，模型可以沿用其结构和样式
+        self.reference_template = """
+参考图表（根据相似的需求生成过，可以沿用其结构和样式，但请以本次需求为准）：
+{reference}
+        """
+        self.compact_patch_prompt_template = """
+你是一个专业的图表生成助手，请根据以下需求修改drawio图表：
+
+用户需求：
+{user_prompt}
+
+当前图表（紧凑表示）：
+{current_drawio}
+
+紧凑表示格式：
+{format_help}
+
+请不要输出完整的图表，只输出修改操作（每行一个），按以下格式响应：
+【分析说明】
+你的分析说明
+
+【drawio补丁】
++ V 新id s=S1 v="文字" g=0,0,120,60 after=已有id
+~ 已有id v="新文字" g=100,200,120,60
+- 已有id
+
+说明：
+1. +新增单元，~只需给出变化的字段，-删除单元（其子节点和相连的连线会一并删除）
+2. 新增单元的id不能与已有id重复，连线用src/tgt引用单元id
+3. 样式可以引用样式表中的S编号，也可以用s="..."给出新样式
+        """
 
     async def generate_diagram(
         self,
         diagram_type: str,
         user_prompt: str,
-        current_drawio: Optional[str] = None
+        current_drawio: Optional[str] = None,
+        edit_mode: str = "patch",
+        compress_output: Optional[bool] = None,
+        compact: bool = True,
+        reuse_similar: bool = True,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """生成图表，相同或含义相同的请求直接返回缓存的结果（use_cache为False时重新生成并更新缓存）"""
+        key = self._request_key(diagram_type, user_prompt, current_drawio, edit_mode, compress_output, compact, reuse_similar)
+        cached = await self._lookup(key, diagram_type, user_prompt, current_drawio, compress_output) if use_cache else None
+        if cached is not None:
+            return self._cached_result(cached)
+
+        async def generate() -> Dict[str, Any]:
+            result = await self._generate(
+                diagram_type, user_prompt, current_drawio, edit_mode, compress_output, compact, reuse_similar, use_cache
+            )
+            await self._store(key, diagram_type, user_prompt, current_drawio, compress_output, result, None)
+            return result
+
+        if self.single_flight is None:
+            return await generate()
+        # 同时到达的相同请求共享同一个结果
+        return await self.single_flight.call(f"call:{use_cache}:{key}", generate)
+
+    async def _generate(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        edit_mode: str,
+        compress_output: Optional[bool],
+        compact: bool,
+        reuse_similar: bool,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
-        """生成图表核心逻辑"""
+        """生成图表核心逻辑，use_cache为False时相似图表只作为参考，不直接复用"""
+        compress = self._should_compress(current_drawio, compress_output)
+        current_drawio = await self._inflate(current_drawio)
+        compact_diagram = await self._encode_current(current_drawio, compact)
+
+        # 新建图表时先查找由相似需求生成过的图表：足够相似时直接复用，否则作为参考
+        similar = await self._find_similar(diagram_type, user_prompt, current_drawio, reuse_similar)
+        if self._reusable(similar, use_cache):
+            return await self._compress_result(self._reuse_result(similar), compress)
+        reference = similar["content"] if similar is not None else None
+
+        # 编辑已有图表时优先使用补丁模式，补丁无法应用时回退到完整生成
+        if await self._use_patch_mode(current_drawio, edit_mode):
+            result = await self._generate_by_patch(diagram_type, user_prompt, current_drawio, compact_diagram)
+            if result is not None:
+                return await self._compress_result(result, compress)
+
+        # 构造提示词
+        prompt = self._full_prompt(user_prompt, current_drawio, compact_diagram, reference)
+        
+        # 调用大模型生成
+        response = await self.llm.chat(prompt)
+        # 解析响应内容
+        analysis, drawio_content = await self._parse_response(
+            response.answer_content,
+            current_drawio,
+            compact_diagram
+        )
+        if not drawio_content:
+            raise ValueError("模型响应中未找到完整的<mxfile>代码")
+        drawio_content = await self._repair_layout(drawio_content, current_drawio)
+
+        # 存储生成的图表
+        diagram = None
+        if drawio_content:
+            diagram = await self.draw_service.create_diagram(
+                diagram_type=diagram_type,
+                content=drawio_content
+            )
+            await self._remember_prompt(diagram, user_prompt, current_drawio)
+        
+        return await self._compress_result({
+            "analysis": analysis,
+            "content": drawio_content,
+            "diagram_info": diagram,
+            "success": True,
+            "edit_mode": "full",
+            "patch": await self._diff(current_drawio, drawio_content)
+        }, compress)
+
+    def _request_key(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        edit_mode: str,
+        compress_output: Optional[bool],
+        compact: bool,
+        reuse_similar: bool
+    ) -> Optional[str]:
+        """请求的键（结果缓存和合并相同请求共用），两者都未启用时返回None"""
+        if (self.response_cache is None or not self.response_cache.config.enabled) and self.single_flight is None:
+            return None
+        return cache_key(
+            getattr(self.llm, "model_name", ""),
+            diagram_type,
+            user_prompt,
+            current_drawio,
+            edit_mode=edit_mode if current_drawio else "full",
+            compress=self._should_compress(current_drawio, compress_output),
+            compact=compact,
+            reuse_similar=reuse_similar
+        )
+
+    async def _cached(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取缓存项；结果引用的图表已被删除时作废"""
+        if key is None or self.response_cache is None:
+            return None
+        cached = await self.response_cache.get(key)
+        if cached is None:
+            return None
+        diagram = cached["result"].get("diagram_info")
+        if diagram and await self.draw_service.get_diagram(diagram["id"]) is None:
+            await self.response_cache.invalidate(key)
+            return None
+        return cached
+
+    async def _lookup(
+        self,
+        key: Optional[str],
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        compress_output: Optional[bool]
+    ) -> Optional[Dict[str, Any]]:
+        """先查精确缓存，新建图表时再查语义缓存"""
+        cached = await self._cached(key)
+        if cached is not None or self.semantic_cache is None or current_drawio:
+            return cached
+        hit = await self.semantic_cache.lookup(
+            getattr(self.llm, "model_name", ""), diagram_type, user_prompt, self._should_compress(None, compress_output)
+        )
+        if hit is None:
+            return None
+        entry_id, score, result = hit
+        diagram = result.get("diagram_info")
+        if diagram and await self.draw_service.get_diagram(diagram["id"]) is None:
+            self.semantic_cache.remove(entry_id)
+            return None
+        # 前端可用entry_id报告误命中
+        result["cache"] = {"type": "semantic", "entry_id": entry_id, "similarity": score}
+        return {"result": result, "events": None}
+
+    async def _store(
+        self,
+        key: Optional[str],
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        compress_output: Optional[bool],
+        result: Dict[str, Any],
+        events: Optional[List[Dict[str, Any]]]
+    ) -> None:
+        """缓存成功的生成结果（复用的已有图表不写入语义缓存）"""
+        if not result.get("success"):
+            return
+        if key is not None and self.response_cache is not None:
+            await self.response_cache.put(key, {"result": result, "events": events})
+        if self.semantic_cache is not None and not current_drawio and result.get("edit_mode") != "reuse":
+            await self.semantic_cache.add(
+                getattr(self.llm, "model_name", ""),
+                diagram_type,
+                user_prompt,
+                self._should_compress(None, compress_output),
+                self._cached_result({"result": dict(result)})
+            )
+
+    def _cached_result(self, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """缓存项中的非流式结果（由流式请求写入时去掉流式专用字段）"""
+        result = cached["result"]
+        result.pop("is_final", None)
+        result.pop("compressed", None)
+        result.setdefault("patch", None)
+        return result
+
+    def _cached_events(self, cached: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """缓存项中的流式事件，由非流式请求写入时按结果构造"""
+        if cached["events"] is not None:
+            return cached["events"]
+        result = cached["result"]
+        event = {
+            "type": "diagram",
+            "diagram_info": {k: v for k, v in (result.get("diagram_info") or {}).items() if k != "content"}
+        }
+        if result.get("patch") is not None:
+            event["patch"] = result["patch"]
+        else:
+            event["content"] = result["content"]
+        return [
+            {"type": "analysis", "content": result.get("analysis") or "", "delta": True},
+            {"data": event},
+            {"data": {"type": "final", "response": {**result, "is_final": True}}}
+        ]
+
+    def _should_compress(self, current_drawio: Optional[str], compress_output: Optional[bool]) -> bool:
+        """是否压缩返回的图表：未指定时与传入的图表保持一致"""
+        if compress_output is not None:
+            return compress_output
+        return is_compressed(current_drawio)
+
+    async def _inflate(self, current_drawio: Optional[str]) -> Optional[str]:
+        """展开压缩页面，模型才能看到并编辑具体的单元；无法解压时原样使用"""
+        if not current_drawio:
+            return current_drawio
+        try:
+            return await asyncio.to_thread(inflate_mxfile, current_drawio)
+        except ValueError:
+            return current_drawio
+
+    async def _compress_result(self, result: Dict[str, Any], compress: bool) -> Dict[str, Any]:
+        """按需将返回的图表压缩为drawio格式，存储的图表保持明文"""
+        if compress and result.get("content"):
+            result["content"] = await asyncio.to_thread(compress_mxfile, result["content"])
+        return result
+
+    async def _encode_current(self, current_drawio: Optional[str], compact: bool) -> Optional[CompactDiagram]:
+        """将当前图表编码为紧凑表示，无法编码时返回None（退回原始XML）"""
+        if not compact or not current_drawio:
+            return None
         try:
-            # 构造提示词
-            prompt = self.prompt_template.format(
+            return await asyncio.to_thread(encode_diagram, current_drawio)
+        except ValueError:
+            return None
+
+    def _full_prompt(
+        self,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        compact_diagram: Optional[CompactDiagram],
+        reference: Optional[str] = None
+    ) -> str:
+        """构造完整生成模式的提示词"""
+        if compact_diagram is not None:
+            return self.compact_prompt_template.format(
                 user_prompt=user_prompt,
-                current_drawio=current_drawio or "无"
+                current_drawio=compact_diagram.text,
+                format_help=FORMAT_HELP
             )
-            
-            # 调用大模型生成
-            response = self.llm.chat(prompt)
-            print("response:",response)
-            # 解析响应内容
-            analysis, drawio_content = self._parse_response(
-                response.answer_content,
-                current_drawio
+        prompt = self.prompt_template.format(
+            user_prompt=user_prompt,
+            current_drawio=current_drawio or "无"
+        )
+        if reference:
+            prompt += self.reference_template.format(reference=reference)
+        return prompt
+
+    async def _find_similar(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        reuse_similar: bool
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找由相似需求生成的同类型图表（只用于新建图表）
+
+        Returns:
+            Optional[Dict[str, Any]]: 相似度达到参考阈值的图表（含content和similarity），没有时返回None
+        """
+        if current_drawio or not reuse_similar:
+            return None
+        config = self.draw_service.similarity
+        try:
+            hits = await self.draw_service.find_by_prompt(user_prompt, limit=5, threshold=config.seed_threshold)
+        except Exception:
+            return None
+        for hit in hits:
+            if hit["type"] == diagram_type:
+                diagram = await self.draw_service.get_diagram(hit["id"])
+                if diagram is not None:
+                    return {**diagram, "similarity": hit["similarity"]}
+        return None
+
+    def _reusable(self, similar: Optional[Dict[str, Any]], use_cache: bool) -> bool:
+        """相似图表是否可以直接复用：要求重新生成（use_cache为False）时总是调用模型"""
+        return use_cache and similar is not None and similar["similarity"] >= self.draw_service.similarity.reuse_threshold
+
+    def _reuse_result(self, similar: Dict[str, Any]) -> Dict[str, Any]:
+        """直接复用已有图表的结果，不调用模型"""
+        diagram = {k: v for k, v in similar.items() if k != "similarity"}
+        return {
+            "analysis": f"找到由相似需求生成的图表（相似度{similar['similarity']:.0%}），直接复用",
+            "content": similar["content"],
+            "diagram_info": diagram,
+            "success": True,
+            "edit_mode": "reuse",
+            "patch": None
+        }
+
+    async def _remember_prompt(
+        self,
+        diagram: Optional[Dict[str, Any]],
+        user_prompt: str,
+        current_drawio: Optional[str]
+    ) -> None:
+        """记录新建图表的需求，之后相似的需求可以复用或参考该图表"""
+        if diagram is None or current_drawio:
+            return
+        try:
+            await self.draw_service.index_prompt(diagram["id"], user_prompt)
+        except Exception:
+            # 只影响之后的复用，不影响本次结果
+            pass
+
+    def _patch_prompt(
+        self,
+        user_prompt: str,
+        current_drawio: str,
+        compact_diagram: Optional[CompactDiagram]
+    ) -> str:
+        """构造补丁模式的提示词"""
+        if compact_diagram is not None:
+            return self.compact_patch_prompt_template.format(
+                user_prompt=user_prompt,
+                current_drawio=compact_diagram.text,
+                format_help=FORMAT_HELP
             )
-            
-            print("drawio_content:",drawio_content)
+        return self.patch_prompt_template.format(
+            user_prompt=user_prompt,
+            current_drawio=current_drawio
+        )
 
-            # 进一步过滤，如果开始出现```xml 结尾出现``` 则去掉
-            # if drawio_content.startswith("```xml"):
-            #     drawio_content = drawio_content.split("```xml")[1].split("```")[0].strip()
+    async def _apply_patch_text(
+        self,
+        current_drawio: str,
+        patch_text: str,
+        compact_diagram: Optional[CompactDiagram]
+    ) -> str:
+        """
+        解析并应用模型输出的补丁（在线程中执行）
 
-            #  直接截取开头的<mxfile..., 结尾的</mxfile>
-            drawio_content = drawio_content.split("<mxfile")[1].split("</mxfile>")[0].strip()
-            # 补全<mxfile>...</mxfile>
-            drawio_content = "<mxfile " + drawio_content + "</mxfile>"
+        Raises:
+            PatchError: 补丁无法解析或应用
+        """
+        def apply() -> str:
+            if compact_diagram is not None:
+                try:
+                    operations = parse_compact_patch(patch_text, compact_diagram)
+                except ValueError as e:
+                    raise PatchError(str(e))
+            else:
+                operations = parse_patch(patch_text)
+            return apply_patch(current_drawio, operations)
+        return await asyncio.to_thread(apply)
 
-            # 存储生成的图表
-            diagram = None
-            if drawio_content:
-                diagram = await self.draw_service.create_diagram(
-                    diagram_type=diagram_type,
-                    content=drawio_content
-                )
-            
-            return {
-                "analysis": analysis,
-                "content": drawio_content,
-                "diagram_info": diagram,
-                "success": True
-            }
-            
-        except Exception as e:
-            raise e
-            # return {
-            #     "analysis": str(e),
-            #     "content": current_drawio or "",
-            #     "diagram_info": None,
-            #     "success": False
-            # }
+    async def _use_patch_mode(self, current_drawio: Optional[str], edit_mode: str) -> bool:
+        """是否使用补丁模式：需要有可解析的图表（压缩页面已事先展开）"""
+        return edit_mode == "patch" and await asyncio.to_thread(can_patch, current_drawio)
+
+    async def _generate_by_patch(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: str,
+        compact_diagram: Optional[CompactDiagram] = None
+    ) -> Optional[Dict[str, Any]]:
+        """补丁模式生成，补丁无法应用时返回None"""
+        prompt = self._patch_prompt(user_prompt, current_drawio, compact_diagram)
+        response = await self.llm.chat(prompt)
+        analysis, patch_text = scan_patch_response(response.answer_content)
+        try:
+            drawio_content = await self._apply_patch_text(current_drawio, patch_text, compact_diagram)
+        except PatchError:
+            return None
+        drawio_content = await self._repair_layout(drawio_content, current_drawio)
 
-    def _parse_response(
+        diagram = await self.draw_service.create_diagram(
+            diagram_type=diagram_type,
+            content=drawio_content
+        )
+        return {
+            "analysis": analysis,
+            "content": drawio_content,
+            "diagram_info": diagram,
+            "success": True,
+            "edit_mode": "patch",
+            "patch": await self._diff(current_drawio, drawio_content)
+        }
+
+    async def _parse_response(
         self,
         response: str,
-        current_drawio: Optional[str]
+        current_drawio: Optional[str],
+        compact_diagram: Optional[CompactDiagram] = None
     ) -> tuple[str, str]:
-        """解析大模型响应"""
-        analysis = ""
-        drawio_content = current_drawio or ""
-        print("response:",response)
-        if "【分析说明】" in response:
-            parts = response.split("【drawio代码】")
-            analysis_part = parts[0].replace("【分析说明】", "").strip()
-            
-            analysis = analysis_part
-            if len(parts) > 1:
-                code_part = parts[1].strip()
-                drawio_content = code_part 
-                # if "<mxfile>" in code_part:
-                #     drawio_content = code_part.split("<mxfile>")[1].split("</mxfile>")[0].strip()
-        
-        return analysis, drawio_content 
+        """解析大模型响应，返回分析说明和完整的<mxfile>代码"""
+        if compact_diagram is None:
+            analysis, mxfile = scan_response(response)
+            return analysis, mxfile or ""
+        analysis, code, mxfile = scan_code_response(response)
+        return analysis, mxfile or await self._decode_compact(code, compact_diagram)
+
+    async def _decode_compact(self, code: str, compact_diagram: CompactDiagram) -> str:
+        """将模型输出的紧凑表示还原为drawio XML，失败时返回空字符串"""
+        if not code.strip():
+            return ""
+        try:
+            return await asyncio.to_thread(decode_diagram, code, compact_diagram)
+        except ValueError:
+            return ""
 
     async def stream_generate_diagram(
         self,
         diagram_type: str,
         user_prompt: str,
-        current_drawio: Optional[str] = None
+        current_drawio: Optional[str] = None,
+        edit_mode: str = "patch",
+        compress_output: Optional[bool] = None,
+        compact: bool = True,
+        reuse_similar: bool = True,
+        use_cache: bool = True
+    ):
+        """流式生成图表，相同或含义相同的请求直接重放缓存的事件（use_cache为False时重新生成并更新缓存）"""
+        key = self._request_key(diagram_type, user_prompt, current_drawio, edit_mode, compress_output, compact, reuse_similar)
+        cached = await self._lookup(key, diagram_type, user_prompt, current_drawio, compress_output) if use_cache else None
+        if cached is not None:
+            for frame in replay_events(self._cached_events(cached), SSEEncoder()):
+                yield frame
+            return
+
+        args = (diagram_type, user_prompt, current_drawio, edit_mode, compress_output, compact, reuse_similar, use_cache, key)
+        if self.single_flight is None:
+            frames = self._stream_and_store(*args)
+        else:
+            # 同时到达的相同请求订阅同一个上游流，晚加入的请求先收到已缓冲的事件
+            frames = self.single_flight.stream(f"stream:{use_cache}:{key}", lambda: self._stream_and_store(*args))
+        async for frame in frames:
+            yield frame
+
+    async def _stream_and_store(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        edit_mode: str,
+        compress_output: Optional[bool],
+        compact: bool,
+        reuse_similar: bool,
+        use_cache: bool,
+        key: Optional[str]
+    ):
+        """流式生成并缓存结果"""
+        # 每个请求一个编码器：事件id递增，思考过程和分析说明只发送增量并合并成帧
+        sse = SSEEncoder() if self.response_cache is None else RecordingEncoder()
+        partial_response: Dict[str, Any] = {}
+        async for frame in self._stream_generate(
+            diagram_type, user_prompt, current_drawio, edit_mode, compress_output, compact, reuse_similar, use_cache, sse, partial_response
+        ):
+            yield frame
+        if partial_response.get("is_final"):
+            events = sse.events if isinstance(sse, RecordingEncoder) else None
+            await self._store(key, diagram_type, user_prompt, current_drawio, compress_output, partial_response, events)
+
+    async def _stream_generate(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        edit_mode: str,
+        compress_output: Optional[bool],
+        compact: bool,
+        reuse_similar: bool,
+        use_cache: bool,
+        sse: SSEEncoder,
+        partial_response: Dict[str, Any]
     ):
-        """流式生成图表的核心逻辑"""
+        """流式生成图表的核心逻辑，最终结果写入partial_response"""
         try:
             # 初始化状态对象
-            partial_response = {
+            partial_response.update({
                 "analysis": "",
                 "content": current_drawio or "",
                 "diagram_info": None,
                 "success": False,
-                "is_final": False
-            }
-            
-            # 构造提示词
-            prompt = self.prompt_template.format(
-                user_prompt=user_prompt,
-                current_drawio=current_drawio or "无"
-            )
-            
-            # 用于累积内容的缓冲区
-            analysis_buffer = ""
-            drawio_buffer = ""
-            is_in_analysis = False
-            is_in_drawio = False
-            
-            # 调用大模型流式生成
-            async for chunk in self.llm.stream_chat(prompt):
-                # 处理思考过程
-                if chunk.reasoning_content:
-                    yield self._format_sse({
-                        "type": "reasoning",
-                        "content": chunk.reasoning_content
-                    })
-                    continue
-                
-                if chunk.answer_content:
-                    content = chunk.answer_content
-                    
-                    # 检测分隔符
-                    if "【分析说明】" in content:
-                        is_in_analysis = True
-                        is_in_drawio = False
-                        content = content.split("【分析说明】")[1]
-                    elif "【drawio代码】" in content:
-                        is_in_analysis = False
-                        is_in_drawio = True
-                        content = content.split("【drawio代码】")[1]
-                    
-                    # 根据当前状态累积内容
-                    if is_in_analysis:
-                        analysis_buffer += content
-                        partial_response["analysis"] = analysis_buffer.strip()
-                        yield self._format_sse({
-                            "type": "analysis",
-                            "content": partial_response["analysis"]
-                        })
-                    
-                    if is_in_drawio:
-                        drawio_buffer += content
-                        if "<mxfile" in drawio_buffer and "</mxfile>" in drawio_buffer:
-                            # 提取完整的drawio内容
-                            drawio_content = drawio_buffer.split("<mxfile")[1].split("</mxfile>")[0].strip()
-                            drawio_content = "<mxfile " + drawio_content + "</mxfile>"
-                            
-                            if self._validate_drawio(drawio_content):
-                                partial_response["content"] = drawio_content
-                                # 创建图表
-                                diagram = await self.draw_service.create_diagram(
-                                    diagram_type=diagram_type,
-                                    content=drawio_content
-                                )
-                                partial_response["diagram_info"] = diagram
-                                partial_response["success"] = True
-                                
-                                yield self._format_sse({
-                                    "type": "diagram",
-                                    "content": partial_response["content"],
-                                    "diagram_info": diagram
-                                })
-                
-                # 处理使用量信息
-                if chunk.usage:
-                    yield self._format_sse({
-                        "type": "usage",
-                        "content": chunk.usage
-                    })
-            
+                "is_final": False,
+                "edit_mode": "full",
+                "compressed": self._should_compress(current_drawio, compress_output)
+            })
+            current_drawio = await self._inflate(current_drawio)
+            compact_diagram = await self._encode_current(current_drawio, compact)
+
+            # 新建图表时先查找由相似需求生成过的图表：足够相似时直接复用，否则作为参考
+            similar = await self._find_similar(diagram_type, user_prompt, current_drawio, reuse_similar)
+            reference = similar["content"] if similar is not None else None
+            if self._reusable(similar, use_cache):
+                partial_response.update(self._reuse_result(similar))
+                for frame in sse.event(await self._diagram_event(
+                    similar["content"], partial_response["diagram_info"], None, partial_response["compressed"]
+                )):
+                    yield frame
+
+            # 编辑已有图表时优先使用补丁模式，补丁无法应用时回退到完整生成
+            if await self._use_patch_mode(current_drawio, edit_mode):
+                async for event in self._stream_patch(diagram_type, user_prompt, current_drawio, partial_response, sse, compact_diagram):
+                    yield event
+
+            if not partial_response["success"]:
+                async for event in self._stream_full(diagram_type, user_prompt, current_drawio, partial_response, sse, compact_diagram, reference):
+                    yield event
+
             # 标记最终结果
+            if partial_response["success"]:
+                await self._compress_result(partial_response, partial_response["compressed"])
             partial_response["is_final"] = True
-            yield self._format_sse({
-                "type": "final",
-                "response": partial_response
-            })
+            for frame in sse.event({"type": "final", "response": partial_response}):
+                yield frame
                     
         except Exception as e:
-            yield self._format_sse({
-                "type": "error",
-                "content": str(e)
-            })
+            for frame in sse.event({"type": "error", "content": str(e)}):
+                yield frame
+
+    async def _stream_full(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: Optional[str],
+        partial_response: Dict[str, Any],
+        sse: SSEEncoder,
+        compact_diagram: Optional[CompactDiagram] = None,
+        reference: Optional[str] = None
+    ):
+        """完整生成模式：模型输出整个<mxfile>（紧凑模式下输出紧凑表示）"""
+        # 构造提示词
+        prompt = self._full_prompt(user_prompt, current_drawio, compact_diagram, reference)
+        
+        # 增量扫描器在chunk之间保留状态，分段标记或<mxfile>边界跨chunk也能识别
+        scanner = DiagramStreamScanner()
+        cell_parser = None
+        analysis_buffer = ""
+        code_parts = []
+        partial_response["edit_mode"] = "full"
+        
+        # 调用大模型流式生成（增量模式，每个chunk只包含新增内容）
+        async for frames, chunk in paced(self.llm.stream_deltas(prompt, include_usage=True), sse):
+            # 上游停顿时定时输出缓冲中的增量
+            for frame in frames:
+                yield frame
+            if chunk is None:
+                continue
+            # 等待提供方限流配额时告知前端排队位置
+            if chunk.queue_position is not None:
+                for frame in sse.event({"type": "queue_position", "content": chunk.queue_position}):
+                    yield frame
+                continue
+            # 处理思考过程，仅发送本次新增的思考内容
+            if chunk.reasoning_content:
+                for frame in sse.delta("reasoning", chunk.reasoning_content):
+                    yield frame
+                continue
+            
+            for kind, text in scanner.feed(chunk.answer_content):
+                if kind == ANALYSIS:
+                    analysis_buffer += text
+                    partial_response["analysis"] = analysis_buffer.strip()
+                    # 只发送新增文本，由前端拼接
+                    for frame in sse.delta("analysis", text):
+                        yield frame
+                elif kind == CODE:
+                    code_parts.append(text)
+                elif kind == MXFILE_CHUNK:
+                    # 每个mxCell闭合后立即推送，前端可以边生成边绘制
+                    if text == MXFILE_OPEN:
+                        cell_parser = MxCellStreamParser()
+                    cells = cell_parser.feed(text)
+                    first_index = cell_parser.count - len(cells)
+                    for offset, cell in enumerate(cells):
+                        for frame in sse.event({
+                            "type": "cell",
+                            "index": first_index + offset,
+                            "content": cell
+                        }):
+                            yield frame
+                elif kind == MXFILE and self._validate_drawio(text):
+                    text = await self._repair_layout(text, current_drawio)
+                    partial_response["content"] = text
+                    # 创建图表
+                    diagram = await self.draw_service.create_diagram(
+                        diagram_type=diagram_type,
+                        content=text
+                    )
+                    partial_response["diagram_info"] = diagram
+                    partial_response["success"] = True
+                    await self._remember_prompt(diagram, user_prompt, current_drawio)
+                    
+                    for frame in sse.event(await self._diagram_event(text, diagram, current_drawio, partial_response["compressed"])):
+                        yield frame
+            
+            # 处理使用量信息
+            if chunk.usage:
+                for frame in sse.event({"type": "usage", "content": chunk.usage}):
+                    yield frame
+        
+        # 输出扫描器中暂存的尾部文本
+        for kind, text in scanner.close():
+            if kind == ANALYSIS:
+                analysis_buffer += text
+                partial_response["analysis"] = analysis_buffer.strip()
+            elif kind == CODE:
+                code_parts.append(text)
+
+        # 紧凑模式：代码段结束后整体还原为drawio XML
+        if compact_diagram is not None and not partial_response["success"]:
+            drawio_content = await self._decode_compact("".join(code_parts), compact_diagram)
+            if drawio_content:
+                drawio_content = await self._repair_layout(drawio_content, current_drawio)
+                diagram = await self.draw_service.create_diagram(
+                    diagram_type=diagram_type,
+                    content=drawio_content
+                )
+                partial_response["content"] = drawio_content
+                partial_response["diagram_info"] = diagram
+                partial_response["success"] = True
+                for frame in sse.event(await self._diagram_event(drawio_content, diagram, current_drawio, partial_response["compressed"])):
+                    yield frame
+
+    async def _stream_patch(
+        self,
+        diagram_type: str,
+        user_prompt: str,
+        current_drawio: str,
+        partial_response: Dict[str, Any],
+        sse: SSEEncoder,
+        compact_diagram: Optional[CompactDiagram] = None
+    ):
+        """补丁模式：模型只输出单元操作，服务端应用后得到新图表"""
+        prompt = self._patch_prompt(user_prompt, current_drawio, compact_diagram)
+
+        scanner = DiagramStreamScanner()
+        analysis_buffer = ""
+        patch_parts = []
+        partial_response["edit_mode"] = "patch"
+
+        async for frames, chunk in paced(self.llm.stream_deltas(prompt, include_usage=True), sse):
+            # 上游停顿时定时输出缓冲中的增量
+            for frame in frames:
+                yield frame
+            if chunk is None:
+                continue
+            # 等待提供方限流配额时告知前端排队位置
+            if chunk.queue_position is not None:
+                for frame in sse.event({"type": "queue_position", "content": chunk.queue_position}):
+                    yield frame
+                continue
+            if chunk.reasoning_content:
+                for frame in sse.delta("reasoning", chunk.reasoning_content):
+                    yield frame
+                continue
+
+            for kind, text in scanner.feed(chunk.answer_content):
+                if kind == ANALYSIS:
+                    analysis_buffer += text
+                    partial_response["analysis"] = analysis_buffer.strip()
+                    # 只发送新增文本，由前端拼接
+                    for frame in sse.delta("analysis", text):
+                        yield frame
+                elif kind == PATCH:
+                    patch_parts.append(text)
+
+            if chunk.usage:
+                for frame in sse.event({"type": "usage", "content": chunk.usage}):
+                    yield frame
+
+        for kind, text in scanner.close():
+            if kind == ANALYSIS:
+                analysis_buffer += text
+                partial_response["analysis"] = analysis_buffer.strip()
+            elif kind == PATCH:
+                patch_parts.append(text)
+
+        try:
+            drawio_content = await self._apply_patch_text(current_drawio, "".join(patch_parts), compact_diagram)
+        except PatchError as e:
+            # 通知前端本轮补丁作废，随后开始完整生成
+            for frame in sse.event({"type": "fallback", "content": str(e)}):
+                yield frame
+            return
+        drawio_content = await self._repair_layout(drawio_content, current_drawio)
+
+        diagram = await self.draw_service.create_diagram(
+            diagram_type=diagram_type,
+            content=drawio_content
+        )
+        partial_response["content"] = drawio_content
+        partial_response["diagram_info"] = diagram
+        partial_response["success"] = True
+        for frame in sse.event(await self._diagram_event(drawio_content, diagram, current_drawio, partial_response["compressed"])):
+            yield frame
+
+    async def _repair_layout(self, content: str, current_drawio: Optional[str]) -> str:
+        """消除生成结果中形状的重叠，编辑前已有且未改动的形状不移动；无法处理时原样返回"""
+        if not self.layout_repair.enabled:
+            return content
+        try:
+            repaired, _ = await asyncio.to_thread(repair_overlaps, content, current_drawio, self.layout_repair)
+        except ValueError:
+            return content
+        return repaired
+
+    async def _diff(self, current_drawio: Optional[str], content: str) -> Optional[Dict[str, Any]]:
+        """计算旧图表到新图表的DiffSync补丁，无法计算时返回None"""
+        if not current_drawio:
+            return None
+        return await asyncio.to_thread(diff_pages, current_drawio, content)
+
+    async def _diagram_event(
+        self,
+        content: str,
+        diagram: Optional[Dict[str, Any]],
+        current_drawio: Optional[str],
+        compress: bool = False
+    ) -> Dict[str, Any]:
+        """
+        构造diagram事件
+
+        有旧图表且能计算补丁时只发送补丁，前端用DrawioFile.patch增量应用；
+        否则发送完整内容。diagram_info中不再重复携带content。
+        """
+        event = {
+            "type": "diagram",
+            "diagram_info": {k: v for k, v in (diagram or {}).items() if k != "content"}
+        }
+        patch = await self._diff(current_drawio, content)
+        if patch is not None:
+            event["patch"] = patch
+        else:
+            event["content"] = await asyncio.to_thread(compress_mxfile, content) if compress else content
+        return event
 
     def _validate_drawio(self, content: str) -> bool:
         """验证drawio内容是否有效"""
@@ -219,8 +897,3 @@ class AIDiagramService:
             and content.endswith("</mxfile>")
             and len(content) > 20  # 简单的长度检查
         )
-
-    def _format_sse(self, data: dict) -> str:
-        """格式化Server-Sent Events (SSE)数据"""
-        import json
-        return f"data: {json.dumps(data)}\n\n" 
\ No newline at end of file
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+# zstandard为可选依赖（pip install zstandard），未安装时使用zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zstd帧的魔数，解压时据此区分两种格式，无需额外的格式标记
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+def blob_key(content: str) -> str:
+    """图表内容的SHA-256，作为blob的键"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def default_codec() -> str:
+    """DIAGRAM_BLOB_CODEC指定压缩格式（zstd/zlib），默认安装了zstandard时使用zstd"""
+    codec = os.getenv("DIAGRAM_BLOB_CODEC") or ("zstd" if zstandard is not None else "zlib")
+    if codec not in ("zstd", "zlib"):
+        raise ValueError(f"不支持的压缩格式: {codec}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("使用zstd压缩需要安装zstandard")
+    return codec
+
+def pack_blob(content: str, codec: str = "zlib") -> bytes:
+    """压缩图表内容"""
+    raw = content.encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return zlib.compress(raw, ZLIB_LEVEL)
+
+def unpack_blob(data: bytes) -> str:
+    """
+    解压图表内容，自动识别zstd和zlib格式
+
+    Raises:
+        ValueError: 数据损坏，或是zstd格式但未安装zstandard
+    """
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("该图表使用zstd压缩，需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    try:
+        return zlib.decompress(data).decode("utf-8")
+    except zlib.error as e:
+        raise ValueError(f"图表数据损坏: {e}")
+
+class MemoryBlobStore:
+    """
+    进程内的内容寻址blob存储
+
+    相同内容只保存一份压缩数据，按引用计数管理，引用归零时立即释放。
+    """
+
+    def __init__(self, codec: Optional[str] = None):
+        self.codec = codec or default_codec()
+        self.blobs: Dict[str, bytes] = {}
+        self.refcounts: Dict[str, int] = {}
+
+    def acquire(self, content: str, key: Optional[str] = None) -> str:
+        """保存内容（已存在时只增加引用），返回键"""
+        key = key or blob_key(content)
+        if key in self.refcounts:
+            self.refcounts[key] += 1
+        else:
+            self.blobs[key] = pack_blob(content, self.codec)
+            self.refcounts[key] = 1
+        return key
+
+    def release(self, key: str) -> None:
+        """减少引用，归零时删除blob"""
+        count = self.refcounts.get(key, 0) - 1
+        if count > 0:
+            self.refcounts[key] = count
+        else:
+            self.refcounts.pop(key, None)
+            self.blobs.pop(key, None)
+
+    def get(self, key: str) -> str:
+        return unpack_blob(self.blobs[key])
+
+    def collect_garbage(self, references: Iterable[str]) -> int:
+        """
+        按实际引用重新计算引用计数并删除无引用的blob
+
+        Args:
+            references: 所有引用（同一个键出现几次就算几个引用）
+
+        Returns:
+            int: 删除的blob数量
+        """
+        counts: Dict[str, int] = {}
+        for key in references:
+            counts[key] = counts.get(key, 0) + 1
+        orphans: List[str] = [key for key in self.blobs if key not in counts]
+        for key in orphans:
+            del self.blobs[key]
+        self.refcounts = {key: count for key, count in counts.items() if key in self.blobs}
+        return len(orphans)
@@ -0,0 +1,521 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import xml.etree.ElementTree as ET
+from app.services.drawio_xml import parse_xml, get_cells_root, inner_cell, to_xml, strip_whitespace
+
+# 紧凑表示的行类型
+STYLE = "S"    # S1 样式：共享样式表
+PAGE = "P"     # P 页面id name="..."
+VERTEX = "V"   # V 短id 字段...
+EDGE = "E"
+CELL = "C"     # 既不是节点也不是连线的单元（如图层）
+RAW = "R"      # R 短id "原始XML"：无法用字段表示的单元，原样保留
+DROP_PAGE = "X"  # X 页面id：删除该页面（多页图表中没有输出的页面保持不变）
+
+# 补丁行的操作符
+PATCH_ADD = "+"
+PATCH_UPDATE = "~"
+PATCH_DELETE = "-"
+
+# 以字段表示的mxCell属性，其余属性放入x={...}
+FIELD_ATTRS = {"id", "value", "style", "vertex", "edge", "parent", "source", "target"}
+# 默认的根节点和图层的短id
+ROOT_ID = "0"
+LAYER_ID = "1"
+# 可以写成g=x,y,w,h的几何属性
+GEOMETRY_ATTRS = ("x", "y", "width", "height")
+
+FORMAT_HELP = """每行一个单元：类型 短id 字段...
+  类型：V=节点 E=连线 C=其他单元(如图层) R=原样保留的XML
+  字段：v="文字" s=S1（引用样式表）或s="样式" p=父节点(默认1) src=起点 tgt=终点
+        g=x,y,宽,高（连线默认无需几何） x={其他属性}
+  S开头的行为共享样式表；P开头的行表示页面
+  多页图表只需输出有修改的页面，没有输出的页面保持不变；X 页面id 表示删除该页面"""
+
+@dataclass
+class CompactDiagram:
+    """drawio图表的紧凑表示及还原所需的上下文"""
+    text: str
+    source: str
+    styles: Dict[str, str] = field(default_factory=dict)
+    # 页面id -> {短id: 原id}
+    ids: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    pages: List[str] = field(default_factory=list)
+
+def _quote(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+def _default_layers(cells: List[ET.Element]) -> Tuple[Optional[str], Optional[str]]:
+    """识别drawio默认的根节点和图层（只有id/parent属性的前两个单元）"""
+    if len(cells) < 2:
+        return None, None
+    root, layer = cells[0], cells[1]
+    if (root.tag == "mxCell" and set(root.attrib) == {"id"} and len(root) == 0
+            and layer.tag == "mxCell" and set(layer.attrib) == {"id", "parent"}
+            and layer.get("parent") == root.get("id") and len(layer) == 0):
+        return root.get("id"), layer.get("id")
+    return None, None
+
+def _encode_geometry(geo: Optional[ET.Element], kind: str) -> Optional[str]:
+    """几何信息编码为字段，默认值（连线的相对几何）返回None"""
+    if geo is None:
+        return 'geo=""' if kind == EDGE else None
+    attrs = {k: v for k, v in geo.attrib.items() if k != "as"}
+    if len(geo) == 0 and geo.get("as") == "geometry":
+        if kind == EDGE and attrs == {"relative": "1"}:
+            return None
+        if kind != EDGE and set(attrs) <= set(GEOMETRY_ATTRS):
+            return "g=" + ",".join(attrs.get(k, "") for k in GEOMETRY_ATTRS)
+    clone = strip_whitespace(ET.fromstring(to_xml(geo)))
+    return "geo=" + _quote(to_xml(clone))
+
+def _is_plain(elem: ET.Element) -> bool:
+    """能否用字段表示：未被包裹，且子节点最多一个mxGeometry"""
+    if elem.tag != "mxCell":
+        return False
+    return all(child.tag == "mxGeometry" for child in elem) and len(elem) <= 1
+
+def encode_diagram(content: str) -> CompactDiagram:
+    """
+    将drawio文件编码为紧凑表示
+
+    共享样式提取到样式表，默认根节点/图层和连线的相对几何省略，id替换为短id。
+
+    Args:
+        content: 明文<mxfile>或<mxGraphModel>（压缩页面需先用mxfile_codec展开）
+
+    Returns:
+        CompactDiagram: 紧凑文本及还原上下文
+
+    Raises:
+        ValueError: XML不合法或页面为压缩格式
+    """
+    root = parse_xml(content)
+    if root.tag == "mxGraphModel":
+        pages = [("", root)]
+    else:
+        pages = []
+        for page in root.findall("diagram"):
+            model = page.find("mxGraphModel")
+            if model is None:
+                raise ValueError("页面为压缩格式，请先展开")
+            pages.append((page.get("id") or "", model))
+
+    all_cells = {page_id: list(get_cells_root(model)) for page_id, model in pages}
+    usage = Counter(
+        inner_cell(elem).get("style")
+        for cells in all_cells.values() for elem in cells
+        if _is_plain(elem) and inner_cell(elem).get("style")
+    )
+    # 出现两次以上的样式进入样式表，按使用次数排序
+    styles = {f"S{i + 1}": style for i, (style, count) in enumerate(
+        item for item in usage.most_common() if item[1] > 1)}
+    style_refs = {style: ref for ref, style in styles.items()}
+
+    lines = [f"{STYLE}{ref[1:]} {style}" for ref, style in styles.items()]
+    ids: Dict[str, Dict[str, str]] = {}
+    page_names = {page.get("id") or "": page.get("name") for page in root.findall("diagram")}
+
+    for page_id, model in pages:
+        cells = all_cells[page_id]
+        root_id, layer_id = _default_layers(cells)
+        short: Dict[str, str] = {}
+        if root_id is not None:
+            short[root_id] = ROOT_ID
+            short[layer_id] = LAYER_ID
+        next_id = 2
+        for elem in cells:
+            cell_id = elem.get("id")
+            if cell_id is not None and cell_id not in short:
+                short[cell_id] = str(next_id)
+                next_id += 1
+        ids[page_id] = {v: k for k, v in short.items()}
+
+        if root.tag == "mxfile":
+            name = page_names.get(page_id)
+            lines.append(f"{PAGE} {page_id}" + (f" name={_quote(name)}" if name is not None else ""))
+
+        for elem in cells:
+            cell_id = elem.get("id")
+            if root_id is not None and cell_id in (root_id, layer_id):
+                continue
+            sid = short.get(cell_id, cell_id or "")
+            if not _is_plain(elem):
+                lines.append(f"{RAW} {sid} {_quote(_encode_raw(elem, short))}")
+                continue
+            lines.append(_encode_cell(elem, sid, short, style_refs, layer_id))
+
+    return CompactDiagram(
+        text="\n".join(lines),
+        source=content,
+        styles=styles,
+        ids=ids,
+        pages=[page_id for page_id, _ in pages]
+    )
+
+def _encode_cell(
+    cell: ET.Element,
+    sid: str,
+    short: Dict[str, str],
+    style_refs: Dict[str, str],
+    layer_id: Optional[str]
+) -> str:
+    kind = VERTEX if cell.get("vertex") == "1" else EDGE if cell.get("edge") == "1" else CELL
+    parts = [kind, sid]
+    parent = cell.get("parent")
+    if parent is not None and (layer_id is None or parent != layer_id):
+        parts.append(f"p={short.get(parent, parent)}")
+    style = cell.get("style")
+    if style is not None:
+        parts.append(f"s={style_refs[style]}" if style in style_refs else f"s={_quote(style)}")
+    value = cell.get("value")
+    if value:
+        parts.append(f"v={_quote(value)}")
+    for key, name in (("source", "src"), ("target", "tgt")):
+        if cell.get(key) is not None:
+            parts.append(f"{name}={short.get(cell.get(key), cell.get(key))}")
+    geometry = _encode_geometry(cell.find("mxGeometry"), kind)
+    if geometry:
+        parts.append(geometry)
+
+    extra: Dict[str, Any] = {k: v for k, v in cell.attrib.items() if k not in FIELD_ATTRS}
+    if kind == CELL and cell.get("vertex") is not None:
+        extra["vertex"] = cell.get("vertex")
+    if kind == CELL and cell.get("edge") is not None:
+        extra["edge"] = cell.get("edge")
+    if value is None and kind != CELL:
+        # 节点和连线默认value=""，没有value属性时需要显式记录
+        extra["value"] = None
+    elif value == "" and kind == CELL:
+        extra["value"] = ""
+    if extra:
+        parts.append("x=" + json.dumps(extra, ensure_ascii=False, separators=(",", ":")))
+    return " ".join(parts)
+
+def _encode_raw(elem: ET.Element, short: Dict[str, str]) -> str:
+    """原样保留的单元：只替换其中的id引用"""
+    clone = strip_whitespace(ET.fromstring(to_xml(elem)))
+    clone.set("id", short.get(elem.get("id"), elem.get("id") or ""))
+    cell = inner_cell(clone)
+    for key in ("parent", "source", "target"):
+        if cell.get(key) is not None:
+            cell.set(key, short.get(cell.get(key), cell.get(key)))
+    return to_xml(clone)
+
+def _parse_fields(text: str) -> Dict[str, Any]:
+    """
+    解析 key=value 字段，value可以是JSON字符串/对象或不含空白的文本
+
+    Returns:
+        Dict[str, Any]: 字段名 -> (值, 是否为JSON引号形式)
+    """
+    decoder = json.JSONDecoder()
+    fields: Dict[str, Any] = {}
+    pos, end = 0, len(text)
+    while pos < end:
+        while pos < end and text[pos].isspace():
+            pos += 1
+        if pos >= end:
+            break
+        eq = text.find("=", pos)
+        if eq == -1:
+            raise ValueError(f"无法解析字段: {text[pos:]}")
+        key = text[pos:eq]
+        pos = eq + 1
+        if pos < end and text[pos] in "\"{":
+            try:
+                value, pos = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"字段{key}的值不合法: {e}")
+            fields[key] = (value, True)
+        else:
+            stop = pos
+            while stop < end and not text[stop].isspace():
+                stop += 1
+            fields[key] = (text[pos:stop], False)
+            pos = stop
+    return fields
+
+def _split_line(line: str) -> Tuple[str, str, str]:
+    """拆分为(类型, 短id, 字段文本)"""
+    head, _, rest = line.partition(" ")
+    sid, _, rest = rest.strip().partition(" ")
+    return head, sid, rest
+
+class _PageDecoder:
+    """还原一个页面中的单元，维护短id到原id的映射"""
+
+    def __init__(self, ids: Dict[str, str], styles: Dict[str, str]):
+        self.ids = dict(ids)
+        self.styles = styles
+        # 模型新增的id如果与已有的原id冲突，改名避免重复
+        self._taken = set(ids.values())
+
+    def resolve(self, sid: str) -> str:
+        if sid in self.ids:
+            return self.ids[sid]
+        new_id = sid
+        while new_id in self._taken:
+            new_id = f"{new_id}-n"
+        self.ids[sid] = new_id
+        self._taken.add(new_id)
+        return new_id
+
+    def style(self, value: str, quoted: bool) -> str:
+        if not quoted and value in self.styles:
+            return self.styles[value]
+        if not quoted and value.startswith(STYLE) and value[1:].isdigit():
+            raise ValueError(f"引用了不存在的样式: {value}")
+        return value
+
+    def cell_attrs(self, fields: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """将字段转换为mxCell属性"""
+        attrs: Dict[str, Optional[str]] = {}
+        if "p" in fields:
+            attrs["parent"] = self.resolve(fields["p"][0])
+        if "s" in fields:
+            attrs["style"] = self.style(*fields["s"])
+        if "v" in fields:
+            attrs["value"] = str(fields["v"][0])
+        for name, key in (("src", "source"), ("tgt", "target")):
+            if name in fields:
+                attrs[key] = self.resolve(fields[name][0])
+        extra = fields.get("x", ({}, True))[0]
+        if not isinstance(extra, dict):
+            raise ValueError("x字段应为JSON对象")
+        for key, value in extra.items():
+            attrs[key] = None if value is None else str(value)
+        return attrs
+
+    def geometry(self, fields: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """解析g=x,y,w,h字段"""
+        if "g" not in fields:
+            return None
+        parts = str(fields["g"][0]).split(",")
+        if len(parts) != len(GEOMETRY_ATTRS):
+            raise ValueError(f"几何字段应为x,y,宽,高: {fields['g'][0]}")
+        return {k: v for k, v in zip(GEOMETRY_ATTRS, parts) if v != ""}
+
+    def build(self, kind: str, sid: str, rest: str, default_parent: Optional[str]) -> ET.Element:
+        """由一行紧凑表示构造单元元素"""
+        if kind == RAW:
+            return self.build_raw(sid, rest)
+        return self.build_cell(kind, sid, _parse_fields(rest), default_parent)
+
+    def build_raw(self, sid: str, rest: str) -> ET.Element:
+        """还原R行：解析原样保留的XML并映射其中的id"""
+        xml = json.loads(rest) if rest.startswith('"') else rest
+        try:
+            elem = ET.fromstring(xml)
+        except ET.ParseError as e:
+            raise ValueError(f"单元{sid}的XML不合法: {e}")
+        elem.set("id", self.resolve(sid))
+        cell = inner_cell(elem)
+        for key in ("parent", "source", "target"):
+            if cell.get(key) is not None:
+                cell.set(key, self.resolve(cell.get(key)))
+        return elem
+
+    def build_cell(
+        self,
+        kind: str,
+        sid: str,
+        fields: Dict[str, Any],
+        default_parent: Optional[str]
+    ) -> ET.Element:
+        """由字段构造mxCell"""
+        elem = ET.Element("mxCell", {"id": self.resolve(sid)})
+        if kind in (VERTEX, EDGE):
+            elem.set("value", "")
+        attrs = self.cell_attrs(fields)
+        if "parent" not in attrs and default_parent is not None:
+            attrs["parent"] = default_parent
+        if kind == VERTEX:
+            attrs.setdefault("vertex", "1")
+        elif kind == EDGE:
+            attrs.setdefault("edge", "1")
+        for key, value in attrs.items():
+            if value is None:
+                elem.attrib.pop(key, None)
+            else:
+                elem.set(key, value)
+
+        geometry = self.geometry(fields)
+        if geometry is not None:
+            ET.SubElement(elem, "mxGeometry", {**geometry, "as": "geometry"})
+        elif "geo" in fields:
+            if fields["geo"][0]:
+                try:
+                    geo = ET.fromstring(fields["geo"][0])
+                except ET.ParseError as e:
+                    raise ValueError(f"单元{sid}的几何XML不合法: {e}")
+                geo.set("as", "geometry")
+                elem.append(geo)
+        elif kind == EDGE:
+            ET.SubElement(elem, "mxGeometry", {"relative": "1", "as": "geometry"})
+        return elem
+
+def _iter_lines(text: str):
+    """跳过空行和```围栏"""
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("```"):
+            yield line
+
+def decode_diagram(text: str, compact: CompactDiagram) -> str:
+    """
+    将模型按紧凑表示输出的图表还原为完整的drawio XML
+
+    页面和mxGraphModel的属性沿用原文件，模型新增的样式引用和id原样保留。
+    输出中没有出现的页面原样保留（保持原顺序），只有X行才删除页面；新页面追加在最后。
+
+    Args:
+        text: 模型输出的紧凑表示
+        compact: encode_diagram返回的上下文
+
+    Returns:
+        str: 完整的<mxfile>（原文件为<mxGraphModel>时返回<mxGraphModel>）
+
+    Raises:
+        ValueError: 紧凑表示无法解析
+    """
+    source = parse_xml(compact.source)
+    styles = dict(compact.styles)
+    page_cells: Dict[str, List[Tuple[str, str, str]]] = {}
+    page_names: Dict[str, Optional[str]] = {}
+    dropped = set()
+    current = compact.pages[0] if compact.pages else ""
+
+    for line in _iter_lines(text):
+        head, sid, rest = _split_line(line)
+        if head == PAGE:
+            current = sid
+            name = _parse_fields(rest).get("name")
+            page_names[current] = name[0] if name else None
+            page_cells.setdefault(current, [])
+        elif head == DROP_PAGE:
+            if not sid:
+                raise ValueError(f"缺少页面id: {line}")
+            dropped.add(sid)
+        elif head.startswith(STYLE) and head[1:].isdigit():
+            styles[head] = line.partition(" ")[2].strip()
+        elif head in (VERTEX, EDGE, CELL, RAW):
+            page_cells.setdefault(current, []).append((head, sid, rest))
+        else:
+            raise ValueError(f"无法识别的行: {line}")
+
+    if source.tag == "mxGraphModel":
+        _fill_model(source, page_cells.get("", []), compact.ids.get("", {}), styles)
+        return to_xml(source)
+
+    existing = {page.get("id") or "" for page in source.findall("diagram")}
+    for page in list(source.findall("diagram")):
+        page_id = page.get("id") or ""
+        if page_id in dropped:
+            source.remove(page)
+        elif page_id in page_cells:
+            _fill_page(page, page_id, page_cells[page_id], page_names, compact, styles)
+    for page_id, cells in page_cells.items():
+        if page_id not in existing and page_id not in dropped:
+            page = ET.SubElement(source, "diagram", {"id": page_id})
+            ET.SubElement(page, "mxGraphModel")
+            _fill_page(page, page_id, cells, page_names, compact, styles)
+    return to_xml(source)
+
+def _fill_page(
+    page: ET.Element,
+    page_id: str,
+    cells: List[Tuple[str, str, str]],
+    page_names: Dict[str, Optional[str]],
+    compact: CompactDiagram,
+    styles: Dict[str, str]
+) -> None:
+    if page_names.get(page_id) is not None:
+        page.set("name", page_names[page_id])
+    model = page.find("mxGraphModel")
+    if model is None:
+        raise ValueError(f"页面为压缩格式: {page_id}")
+    _fill_model(model, cells, compact.ids.get(page_id, {}), styles)
+
+def _fill_model(
+    model: ET.Element,
+    lines: List[Tuple[str, str, str]],
+    ids: Dict[str, str],
+    styles: Dict[str, str]
+) -> None:
+    """用还原出的单元替换mxGraphModel的<root>"""
+    decoder = _PageDecoder(ids, styles)
+    cells_root = model.find("root")
+    if cells_root is not None:
+        model.remove(cells_root)
+    cells_root = ET.SubElement(model, "root")
+
+    # 没有显式给出根节点时补上默认的根节点和图层
+    explicit = {sid for _, sid, _ in lines}
+    default_parent = None
+    if ROOT_ID not in explicit:
+        root_id = decoder.resolve(ROOT_ID)
+        layer_id = decoder.resolve(LAYER_ID)
+        ET.SubElement(cells_root, "mxCell", {"id": root_id})
+        ET.SubElement(cells_root, "mxCell", {"id": layer_id, "parent": root_id})
+        default_parent = layer_id
+    for kind, sid, rest in lines:
+        cells_root.append(decoder.build(kind, sid, rest, default_parent))
+
+def parse_compact_patch(text: str, compact: CompactDiagram, page: int = 0) -> List[Dict[str, Any]]:
+    """
+    将紧凑表示的补丁行转换为apply_patch使用的操作列表
+
+    补丁行格式：
+        + V 短id 字段...      新增单元，可带after=短id指定位置
+        ~ 短id 字段...        修改单元，只需给出变化的字段
+        - 短id                删除单元
+
+    Raises:
+        ValueError: 补丁行无法解析
+    """
+    page_id = compact.pages[page] if page < len(compact.pages) else ""
+    ids = compact.ids.get(page_id, {})
+    decoder = _PageDecoder(ids, dict(compact.styles))
+    default_parent = ids.get(LAYER_ID)
+    operations: List[Dict[str, Any]] = []
+
+    for line in _iter_lines(text):
+        op, _, rest = line.partition(" ")
+        rest = rest.strip()
+        if op == PATCH_ADD:
+            kind, sid, fields_text = _split_line(rest)
+            if kind not in (VERTEX, EDGE, CELL, RAW):
+                raise ValueError(f"无法识别的单元类型: {line}")
+            after = None
+            if kind == RAW:
+                elem = decoder.build_raw(sid, fields_text)
+            else:
+                fields = _parse_fields(fields_text)
+                if "after" in fields:
+                    after = decoder.resolve(fields.pop("after")[0])
+                elem = decoder.build_cell(kind, sid, fields, default_parent)
+            operation = {"op": "add", "cell": to_xml(elem)}
+            if after is not None:
+                operation["after"] = after
+            operations.append(operation)
+        elif op == PATCH_UPDATE:
+            sid, _, fields_text = rest.partition(" ")
+            if not sid:
+                raise ValueError(f"补丁行缺少单元id: {line}")
+            fields = _parse_fields(fields_text)
+            operation = {"op": "update", "id": decoder.resolve(sid), "attrs": decoder.cell_attrs(fields)}
+            geometry = decoder.geometry(fields)
+            if geometry:
+                operation["geometry"] = geometry
+            operations.append(operation)
+        elif op == PATCH_DELETE:
+            tokens = rest.split()
+            if len(tokens) != 1:
+                raise ValueError(f"删除行应只包含一个单元id: {line}")
+            operations.append({"op": "delete", "id": decoder.resolve(tokens[0])})
+        else:
+            raise ValueError(f"无法识别的补丁行: {line}")
+    return operations
@@ -0,0 +1,198 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import json
+import xml.etree.ElementTree as ET
+import xml.parsers.expat as expat
+from app.services.drawio_xml import parse_xml
+from app.services.mxfile_codec import inflate_mxfile
+
+@dataclass
+class CellState:
+    """
+    按单元拆分后的图表
+
+    skeleton为去掉所有单元后的文件原文（页面、mxGraphModel属性等），
+    pages为 页面标识 -> {单元id: 单元的原始XML文本}（字典按文档顺序）。
+    """
+    skeleton: str
+    pages: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+def _page_models(root: ET.Element) -> Optional[List[tuple]]:
+    """返回[(页面标识, mxGraphModel)]，页面缺少模型时返回None"""
+    if root.tag == "mxGraphModel":
+        return [("", root)]
+    result = []
+    for index, page in enumerate(root.findall("diagram")):
+        model = page.find("mxGraphModel")
+        if model is None:
+            return None
+        result.append((page.get("id") or f"#{index}", model))
+    return result
+
+def _scan_cells(data: bytes) -> List[Optional[Dict[str, Any]]]:
+    """
+    扫描各页面<root>中单元的原始位置（UTF-8字节偏移），顺序与_page_models一致
+
+    每个页面对应{"end": </root>的位置, "cells": 各单元的开始位置}，页面没有<root>时为None。
+    """
+    parser = expat.ParserCreate()
+    stack: List[Dict[str, Any]] = []
+    pages: List[Optional[Dict[str, Any]]] = []
+
+    def start(tag, attrs):
+        index = parser.CurrentByteIndex
+        parent = stack[-1] if stack else None
+        kind = None
+        if parent is None:
+            kind = "model" if tag == "mxGraphModel" else "file" if tag == "mxfile" else None
+        elif parent["kind"] == "file" and tag == "diagram":
+            kind = "page"
+        elif parent["kind"] == "page" and tag == "mxGraphModel" and not parent["seen"]:
+            kind = "model"
+        elif parent["kind"] == "model" and tag == "root" and not parent["seen"]:
+            kind = "cells"
+            pages[-1] = {"end": index, "cells": []}
+        elif parent["kind"] == "cells":
+            pages[-1]["cells"].append(index)
+        if kind == "page" or (kind == "model" and parent is None):
+            pages.append(None)
+        if parent is not None and kind is not None:
+            parent["seen"] = True
+        stack.append({"kind": kind, "seen": False})
+
+    def end(tag):
+        element = stack.pop()
+        if element["kind"] == "cells":
+            pages[-1]["end"] = parser.CurrentByteIndex
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.Parse(data, True)
+    return pages
+
+def _spans(data: bytes) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """_scan_cells的结果，偏移相对于data（parse_xml会忽略首尾空白），XML不合法时返回None"""
+    offset = len(data) - len(data.lstrip())
+    try:
+        pages = _scan_cells(data.strip())
+    except expat.ExpatError:
+        return None
+    for page in pages:
+        if page is not None:
+            page["end"] += offset
+            page["cells"] = [index + offset for index in page["cells"]]
+    return pages
+
+def split_cells(content: str) -> Optional[CellState]:
+    """
+    将图表拆分为骨架和单元
+
+    单元保存原始文本（包括其后到下一个单元之前的空白），骨架为去掉单元后的原文，
+    因此render_cells(split_cells(content))与明文content逐字节相同。
+
+    Returns:
+        Optional[CellState]: 无法按单元拆分（XML不合法、单元缺少id或id重复）时返回None
+    """
+    try:
+        text = inflate_mxfile(content)
+        root = parse_xml(text)
+    except ValueError:
+        return None
+    models = _page_models(root)
+    data = text.encode("utf-8")
+    spans = _spans(data)
+    if models is None or spans is None or len(spans) != len(models):
+        return None
+
+    state = CellState(skeleton="")
+    skeleton = []
+    position = 0
+    for (page_key, model), span in zip(models, spans):
+        elems = list(model.find("root")) if model.find("root") is not None else []
+        offsets = span["cells"] if span is not None else []
+        if len(offsets) != len(elems):
+            return None
+        cells: Dict[str, str] = {}
+        for i, elem in enumerate(elems):
+            cell_id = elem.get("id")
+            if cell_id is None or cell_id in cells:
+                return None
+            stop = offsets[i + 1] if i + 1 < len(offsets) else span["end"]
+            cells[cell_id] = data[offsets[i]:stop].decode("utf-8")
+        if offsets:
+            skeleton.append(data[position:offsets[0]])
+            position = span["end"]
+        state.pages[page_key] = cells
+    skeleton.append(data[position:])
+    state.skeleton = b"".join(skeleton).decode("utf-8")
+    return state
+
+def render_cells(state: CellState) -> str:
+    """由骨架和单元重新组装完整XML（单元插入到各页面</root>之前）"""
+    models = _page_models(parse_xml(state.skeleton)) or []
+    data = state.skeleton.encode("utf-8")
+    spans = _spans(data) or []
+    parts = []
+    position = 0
+    for (page_key, _), span in zip(models, spans):
+        cells = "".join(state.pages.get(page_key, {}).values()).encode("utf-8")
+        if span is None or not cells:
+            continue
+        parts += [data[position:span["end"]], cells]
+        position = span["end"]
+    parts.append(data[position:])
+    return b"".join(parts).decode("utf-8")
+
+def make_delta(old: CellState, new: CellState) -> Dict[str, Any]:
+    """
+    计算两个版本之间的单元级增量
+
+    每个页面记录新增/修改的单元（set）和删除的单元（del）；只有当单元顺序无法由
+    "删除旧单元、在末尾追加新单元"推出时才记录完整的顺序（order）。
+    """
+    delta: Dict[str, Any] = {}
+    if old.skeleton != new.skeleton:
+        delta["skeleton"] = new.skeleton
+    pages: Dict[str, Any] = {}
+    for page_key, new_cells in new.pages.items():
+        old_cells = old.pages.get(page_key, {})
+        changed = {cell_id: xml for cell_id, xml in new_cells.items() if old_cells.get(cell_id) != xml}
+        removed = [cell_id for cell_id in old_cells if cell_id not in new_cells]
+        page: Dict[str, Any] = {}
+        if changed:
+            page["set"] = changed
+        if removed:
+            page["del"] = removed
+        expected = [cell_id for cell_id in old_cells if cell_id in new_cells]
+        expected += [cell_id for cell_id in new_cells if cell_id not in old_cells]
+        if expected != list(new_cells):
+            page["order"] = list(new_cells)
+        if page:
+            pages[page_key] = page
+    dropped = [page_key for page_key in old.pages if page_key not in new.pages]
+    if dropped:
+        delta["drop"] = dropped
+    if pages:
+        delta["pages"] = pages
+    return delta
+
+def apply_delta(state: CellState, delta: Dict[str, Any]) -> CellState:
+    """在state上应用增量（原地修改并返回）"""
+    if "skeleton" in delta:
+        state.skeleton = delta["skeleton"]
+    for page_key in delta.get("drop", []):
+        state.pages.pop(page_key, None)
+    for page_key, page in delta.get("pages", {}).items():
+        cells = state.pages.setdefault(page_key, {})
+        for cell_id in page.get("del", []):
+            cells.pop(cell_id, None)
+        cells.update(page.get("set", {}))
+        if "order" in page:
+            state.pages[page_key] = {cell_id: cells[cell_id] for cell_id in page["order"]}
+    return state
+
+def encode_delta(delta: Dict[str, Any]) -> str:
+    return json.dumps(delta, ensure_ascii=False, separators=(",", ":"))
+
+def decode_delta(data: str) -> Dict[str, Any]:
+    return json.loads(data)
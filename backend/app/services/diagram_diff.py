@@ -0,0 +1,285 @@
+from typing import Any, Dict, List, Optional
+import copy
+import json
+import xml.etree.ElementTree as ET
+from app.services.drawio_xml import parse_xml, inner_cell, to_xml, strip_whitespace, WRAPPER_TAGS
+
+# 与前端js/diagramly/DiffSync.js保持一致的补丁格式
+DIFF_INSERT = "i"
+DIFF_REMOVE = "r"
+DIFF_UPDATE = "u"
+
+# mxCell上有专门处理的属性，其余属性作为自定义字段原样比较
+KNOWN_CELL_ATTRS = {"id", "value", "style", "vertex", "edge", "connectable",
+                    "parent", "source", "target", "collapsed", "visible"}
+
+class _Cell:
+    """用于比较的单元快照，字段含义与mxCell一致"""
+
+    __slots__ = ("id", "parent", "source", "target", "style", "vertex", "edge",
+                 "connectable", "collapsed", "visible", "value", "xml_value",
+                 "geometry", "extra", "children")
+
+    def __init__(self, elem: ET.Element):
+        cell = inner_cell(elem)
+        self.id = elem.get("id")
+        self.parent = cell.get("parent")
+        self.source = cell.get("source")
+        self.target = cell.get("target")
+        self.style = cell.get("style")
+        self.vertex = cell.get("vertex") == "1"
+        self.edge = cell.get("edge") == "1"
+        self.connectable = cell.get("connectable") != "0"
+        self.collapsed = cell.get("collapsed") == "1"
+        self.visible = cell.get("visible") != "0"
+        self.value = None
+        self.xml_value = None
+        if elem.tag in WRAPPER_TAGS:
+            # 与mxCellCodec一致：包裹节点去掉内部mxCell和id后作为value
+            wrapper = ET.Element(elem.tag, {k: v for k, v in elem.attrib.items() if k != "id"})
+            wrapper.extend(copy.deepcopy(child) for child in elem if child is not cell)
+            self.xml_value = to_xml(strip_whitespace(wrapper))
+        else:
+            self.value = cell.get("value")
+        self.geometry = _geometry_xml(cell.find("mxGeometry"))
+        self.extra = {k: v for k, v in cell.attrib.items() if k not in KNOWN_CELL_ATTRS}
+        self.children: List[str] = []
+
+def _geometry_xml(geo: Optional[ET.Element]) -> Optional[str]:
+    """序列化几何信息（去掉as属性，与mxCodec.encode的结果一致）"""
+    if geo is None:
+        return None
+    clone = ET.Element(geo.tag, {k: v for k, v in geo.attrib.items() if k != "as"})
+    clone.extend(copy.deepcopy(child) for child in geo)
+    return to_xml(strip_whitespace(clone))
+
+def _build_tree(model: ET.Element) -> Dict[str, _Cell]:
+    """按文档顺序建立单元字典和父子关系"""
+    cells: Dict[str, _Cell] = {}
+    cells_root = model.find("root")
+    for elem in (list(cells_root) if cells_root is not None else []):
+        if elem.get("id") is not None:
+            cells[elem.get("id")] = _Cell(elem)
+    for cell in cells.values():
+        if cell.parent is not None and cell.parent in cells:
+            cells[cell.parent].children.append(cell.id)
+    return cells
+
+def _preorder(cells: Dict[str, _Cell]) -> List[tuple]:
+    """深度优先遍历，返回(单元, 前一个兄弟id)列表"""
+    result = []
+    roots = [c.id for c in cells.values() if c.parent is None or c.parent not in cells]
+    stack = [(cell_id, roots[i - 1] if i > 0 else None) for i, cell_id in enumerate(roots)]
+    stack.reverse()
+    while stack:
+        cell_id, prev = stack.pop()
+        cell = cells[cell_id]
+        result.append((cell, prev))
+        children = cell.children
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], children[i - 1] if i > 0 else None))
+    return result
+
+def _json_for_cell(cell: _Cell, previous: Optional[str]) -> Dict[str, Any]:
+    """对应EditorUi.getJsonForCell"""
+    result: Dict[str, Any] = {"id": cell.id}
+    if cell.vertex:
+        result["vertex"] = 1
+    if cell.edge:
+        result["edge"] = 1
+    if not cell.connectable:
+        result["connectable"] = 0
+    if cell.parent is not None:
+        result["parent"] = cell.parent
+    if previous is not None:
+        result["previous"] = previous
+    if cell.source is not None:
+        result["source"] = cell.source
+    if cell.target is not None:
+        result["target"] = cell.target
+    if cell.style is not None:
+        result["style"] = cell.style
+    if cell.geometry is not None:
+        result["geometry"] = cell.geometry
+    if cell.collapsed:
+        result["collapsed"] = 1
+    if not cell.visible:
+        result["visible"] = 0
+    if cell.xml_value is not None:
+        result["xmlValue"] = cell.xml_value
+    elif cell.value is not None:
+        result["value"] = cell.value
+    result.update(cell.extra)
+    return result
+
+def _diff_cell(old: _Cell, new: _Cell) -> Dict[str, Any]:
+    """对应EditorUi.diffCell"""
+    diff: Dict[str, Any] = {}
+    for key in ("vertex", "edge", "connectable"):
+        if getattr(old, key) != getattr(new, key):
+            diff[key] = 1 if getattr(new, key) else 0
+    for key in ("parent", "source", "target"):
+        if getattr(old, key) != getattr(new, key):
+            diff[key] = getattr(new, key) or ""
+
+    if old.xml_value != new.xml_value or old.value != new.value:
+        if new.xml_value is not None:
+            diff["xmlValue"] = new.xml_value
+        else:
+            diff["value"] = new.value
+    if old.style != new.style:
+        diff["style"] = new.style
+    if old.visible != new.visible:
+        diff["visible"] = 1 if new.visible else 0
+    if old.collapsed != new.collapsed:
+        diff["collapsed"] = 1 if new.collapsed else 0
+    if old.geometry != new.geometry and new.geometry is not None:
+        diff["geometry"] = new.geometry
+
+    for key in old.extra.keys() | new.extra.keys():
+        if old.extra.get(key) != new.extra.get(key):
+            diff[key] = new.extra.get(key)
+    return diff
+
+def diff_cells(old_model: ET.Element, new_model: ET.Element) -> Dict[str, Any]:
+    """对应EditorUi.diffPage：比较两个mxGraphModel的单元"""
+    old_cells = _build_tree(old_model)
+    new_cells = _build_tree(new_model)
+
+    lookup = {cell.id: (cell, prev) for cell, prev in _preorder(new_cells)}
+    updated: Dict[str, Any] = {}
+    removed: List[str] = []
+
+    for cell, prev in _preorder(old_cells):
+        entry = lookup.pop(cell.id, None)
+        if entry is None:
+            removed.append(cell.id)
+            continue
+        new_cell, new_prev = entry
+        diff = _diff_cell(cell, new_cell)
+        if "parent" in diff or prev != new_prev:
+            diff["previous"] = new_prev or ""
+        if diff:
+            updated[cell.id] = diff
+
+    inserted = [_json_for_cell(cell, prev) for cell, prev in lookup.values()]
+
+    result: Dict[str, Any] = {}
+    if updated:
+        result[DIFF_UPDATE] = updated
+    if removed:
+        result[DIFF_REMOVE] = removed
+    if inserted:
+        result[DIFF_INSERT] = inserted
+    return result
+
+def _number(value: str) -> float:
+    """与JavaScript数字的JSON输出一致：整数不带小数点"""
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+def _view_state(model: ET.Element) -> Dict[str, str]:
+    """从mxGraphModel属性推导DiffSync比较的视图状态（值为JSON字符串）"""
+    state = {}
+    if model.get("background") is not None:
+        state["background"] = json.dumps(model.get("background"))
+    if model.get("shadow") is not None:
+        state["shadowVisible"] = json.dumps(model.get("shadow") == "1")
+    if model.get("fold") is not None:
+        state["foldingEnabled"] = json.dumps(model.get("fold") != "0")
+    if model.get("math") is not None:
+        state["mathEnabled"] = json.dumps(model.get("math") == "1")
+    if model.get("pageScale") is not None:
+        state["pageScale"] = json.dumps(_number(model.get("pageScale")))
+    if model.get("pageWidth") is not None and model.get("pageHeight") is not None:
+        state["pageFormat"] = json.dumps({
+            "x": 0,
+            "y": 0,
+            "width": _number(model.get("pageWidth")),
+            "height": _number(model.get("pageHeight"))
+        }, separators=(",", ":"))
+    return state
+
+def _pages(content: str) -> Optional[List[ET.Element]]:
+    """返回<diagram>列表；无法在单元级比较（非mxfile或页面压缩）时返回None"""
+    root = parse_xml(content)
+    if root.tag != "mxfile":
+        return None
+    pages = root.findall("diagram")
+    if any(page.find("mxGraphModel") is None or page.get("id") is None for page in pages):
+        return None
+    return pages
+
+def diff_pages(old_content: str, new_content: str) -> Optional[Dict[str, Any]]:
+    """
+    计算两个drawio文件之间的DiffSync补丁（对应EditorUi.diffPages）
+
+    前端可直接用DrawioFile.patch([patch])增量应用，无需整体重新加载文件。
+
+    Returns:
+        Optional[Dict[str, Any]]: 补丁，无变化时为空字典；
+            任一文件无法解析或页面为压缩格式时返回None，调用方应退回整体替换
+    """
+    try:
+        old_pages = _pages(old_content)
+        new_pages = _pages(new_content)
+    except ValueError:
+        return None
+    if old_pages is None or new_pages is None:
+        return None
+
+    lookup: Dict[str, tuple] = {}
+    prev = None
+    for page in new_pages:
+        lookup[page.get("id")] = (page, prev)
+        prev = page
+
+    updated: Dict[str, Any] = {}
+    removed: List[str] = []
+    prev = None
+    for old_page in old_pages:
+        page_id = old_page.get("id")
+        entry = lookup.pop(page_id, None)
+        if entry is None:
+            removed.append(page_id)
+        else:
+            new_page, new_prev = entry
+            old_model = old_page.find("mxGraphModel")
+            new_model = new_page.find("mxGraphModel")
+            page_diff: Dict[str, Any] = {}
+
+            cells = diff_cells(old_model, new_model)
+            if cells:
+                page_diff["cells"] = cells
+
+            old_view, new_view = _view_state(old_model), _view_state(new_model)
+            view = {k: v for k, v in new_view.items() if old_view.get(k) != v}
+            if view:
+                page_diff["view"] = view
+
+            old_prev_id = prev.get("id") if prev is not None else None
+            new_prev_id = new_prev.get("id") if new_prev is not None else None
+            if old_prev_id != new_prev_id:
+                page_diff["previous"] = new_prev_id or ""
+
+            if new_page.get("name") is not None and old_page.get("name") != new_page.get("name"):
+                page_diff["name"] = new_page.get("name")
+
+            if page_diff:
+                updated[page_id] = page_diff
+        prev = old_page
+
+    inserted = [{
+        "id": page.get("id"),
+        "data": to_xml(page),
+        "previous": new_prev.get("id") if new_prev is not None else ""
+    } for page, new_prev in lookup.values()]
+
+    result: Dict[str, Any] = {}
+    if updated:
+        result[DIFF_UPDATE] = updated
+    if removed:
+        result[DIFF_REMOVE] = removed
+    if inserted:
+        result[DIFF_INSERT] = inserted
+    return result
@@ -0,0 +1,183 @@
+from typing import Any, Dict, List, Optional, Set
+import json
+import xml.etree.ElementTree as ET
+from app.services.drawio_xml import (
+    parse_xml,
+    get_graph_model,
+    get_cells_root,
+    inner_cell,
+    cell_index,
+    validate_model,
+    to_xml,
+    WRAPPER_TAGS,
+)
+
+# mxCell上的结构性属性，包裹节点存在时也写在内部的mxCell上
+CELL_ATTRS = ("parent", "source", "target", "style", "vertex", "edge", "connectable", "collapsed", "visible")
+
+PATCH_OPS = ("add", "update", "delete")
+
+class PatchError(ValueError):
+    """补丁无法解析或应用"""
+
+def parse_patch(text: str) -> List[Dict[str, Any]]:
+    """
+    解析模型输出的补丁操作列表
+
+    支持```json代码围栏，以及{"operations": [...]}或直接的数组两种形式。
+
+    Raises:
+        PatchError: 补丁不是合法的JSON或操作格式不正确
+    """
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.split("\n", 1)[1] if "\n" in body else ""
+        body = body.rsplit("```", 1)[0]
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise PatchError(f"补丁不是合法的JSON: {e}")
+
+    if isinstance(data, dict):
+        data = data.get("operations")
+    if not isinstance(data, list):
+        raise PatchError("补丁应为操作数组")
+
+    for op in data:
+        if not isinstance(op, dict) or op.get("op") not in PATCH_OPS:
+            raise PatchError(f"不支持的补丁操作: {op}")
+        if op["op"] == "add" and not isinstance(op.get("cell"), str):
+            raise PatchError("add操作缺少cell字段")
+        if op["op"] in ("update", "delete") and op.get("id") is None:
+            raise PatchError(f"{op['op']}操作缺少id字段")
+        for field in ("attrs", "geometry"):
+            if not _is_attr_map(op.get(field)):
+                raise PatchError(f"{field}应为属性名到字符串或数字的映射: {op.get(field)}")
+    return data
+
+def _is_attr_map(value: Any) -> bool:
+    """属性映射：值为字符串、数字或None（删除属性），不存在时也视为合法"""
+    if value is None:
+        return True
+    return isinstance(value, dict) and all(
+        v is None or (isinstance(v, (str, int, float)) and not isinstance(v, bool)) for v in value.values()
+    )
+
+def _set_attr(elem: ET.Element, key: str, value: Any) -> None:
+    """设置属性，值为None时删除"""
+    if value is None:
+        elem.attrib.pop(key, None)
+    else:
+        elem.set(key, str(value))
+
+def _add_cell(cells_root: ET.Element, index: Dict[str, ET.Element], op: Dict[str, Any]) -> None:
+    try:
+        elem = ET.fromstring(op["cell"])
+    except ET.ParseError as e:
+        raise PatchError(f"新增单元XML不合法: {e}")
+    cell_id = elem.get("id")
+    if cell_id is None:
+        raise PatchError("新增单元缺少id")
+    if cell_id in index:
+        raise PatchError(f"新增单元id已存在: {cell_id}")
+
+    after = op.get("after")
+    if after is not None and after in index:
+        position = list(cells_root).index(index[after]) + 1
+        cells_root.insert(position, elem)
+    else:
+        cells_root.append(elem)
+    index[cell_id] = elem
+
+def _update_cell(index: Dict[str, ET.Element], op: Dict[str, Any]) -> None:
+    elem = index.get(str(op["id"]))
+    if elem is None:
+        raise PatchError(f"要修改的单元不存在: {op['id']}")
+    cell = inner_cell(elem)
+    wrapped = elem.tag in WRAPPER_TAGS
+
+    for key, value in (op.get("attrs") or {}).items():
+        if key == "id":
+            raise PatchError("不允许修改单元id")
+        if not wrapped or key in CELL_ATTRS:
+            _set_attr(cell, key, value)
+        else:
+            # 包裹节点的文字保存在label属性上
+            _set_attr(elem, "label" if key == "value" else key, value)
+
+    geometry = op.get("geometry")
+    if geometry:
+        geo = cell.find("mxGeometry")
+        if geo is None:
+            geo = ET.SubElement(cell, "mxGeometry", {"as": "geometry"})
+        for key, value in geometry.items():
+            _set_attr(geo, key, value)
+
+def _delete_cells(cells_root: ET.Element, index: Dict[str, ET.Element], cell_id: str) -> None:
+    if cell_id not in index:
+        raise PatchError(f"要删除的单元不存在: {cell_id}")
+
+    # 与drawio一致：删除节点时一并删除其子节点和相连的连线
+    doomed: Set[str] = {cell_id}
+    changed = True
+    while changed:
+        changed = False
+        for other_id, elem in index.items():
+            if other_id in doomed:
+                continue
+            cell = inner_cell(elem)
+            if (cell.get("parent") in doomed
+                    or cell.get("source") in doomed
+                    or cell.get("target") in doomed):
+                doomed.add(other_id)
+                changed = True
+
+    for doomed_id in doomed:
+        cells_root.remove(index.pop(doomed_id))
+
+def apply_patch(content: str, operations: List[Dict[str, Any]], page: int = 0) -> str:
+    """
+    将补丁操作应用到drawio文件上
+
+    Args:
+        content: 当前的drawio内容（<mxfile>或<mxGraphModel>，页面不能是压缩格式）
+        operations: parse_patch返回的操作列表
+        page: 要修改的页面序号
+
+    Returns:
+        str: 应用补丁后的完整XML
+
+    Raises:
+        PatchError: 补丁无法应用或应用后的图结构不完整
+    """
+    try:
+        root = parse_xml(content)
+    except ValueError as e:
+        raise PatchError(str(e))
+    model = get_graph_model(root, page)
+    if model is None:
+        raise PatchError("页面内容为压缩格式或不存在，无法应用补丁")
+
+    cells_root = get_cells_root(model)
+    index = cell_index(model)
+    for op in operations:
+        if op["op"] == "add":
+            _add_cell(cells_root, index, op)
+        elif op["op"] == "update":
+            _update_cell(index, op)
+        else:
+            _delete_cells(cells_root, index, str(op["id"]))
+
+    errors = validate_model(model)
+    if errors:
+        raise PatchError("补丁应用后图结构无效: " + "; ".join(errors[:5]))
+    return to_xml(root)
+
+def can_patch(content: Optional[str], page: int = 0) -> bool:
+    """判断当前图表能否使用补丁模式编辑"""
+    if not content:
+        return False
+    try:
+        return get_graph_model(parse_xml(content), page) is not None
+    except ValueError:
+        return False
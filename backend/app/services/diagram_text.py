@@ -0,0 +1,168 @@
+import html
+import io
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Set, Tuple
+from app.services.drawio_xml import WRAPPER_TAGS
+from app.services.mxfile_codec import inflate_mxfile
+
+# 建立全文索引的字段，按权重从高到低
+SEARCH_FIELDS = ("title", "labels", "tooltips")
+SEARCH_WEIGHTS = (10.0, 1.0, 0.5)
+
+# 摘要中命中部分的标记，转义后替换为<mark>
+MARK_OPEN = "\x02"
+MARK_CLOSE = "\x03"
+
+_BREAK = re.compile(r"<br\s*/?>|</(?:div|p|li)>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+_DEFAULT_PAGE_NAME = re.compile(r"^Page-\d+$")
+
+def plain_text(value: str) -> str:
+    """去掉html=1标签中的HTML标记，换行类标签替换为空格"""
+    if "<" in value or "&" in value:
+        value = html.unescape(_TAG.sub("", _BREAK.sub(" ", value)))
+    return _SPACE.sub(" ", value).strip()
+
+def extract_text(content: str) -> Dict[str, str]:
+    """
+    提取图表中可搜索的文字
+
+    流式扫描所有页面：页面名（drawio默认的Page-N除外）作为标题，单元文字作为labels，
+    tooltip属性作为tooltips。相同文字只保留一次，每段文字占一行。
+
+    Returns:
+        Dict[str, str]: title、labels、tooltips三个字段
+
+    Raises:
+        ValueError: XML不合法
+    """
+    fields: Dict[str, Dict[str, None]] = {field: {} for field in SEARCH_FIELDS}
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(inflate_mxfile(content).encode("utf-8")), events=("start",)):
+            tag = elem.tag
+            if tag == "diagram":
+                name = elem.get("name")
+                if name and not _DEFAULT_PAGE_NAME.match(name):
+                    fields["title"][plain_text(name)] = None
+                continue
+            if tag in WRAPPER_TAGS:
+                label = elem.get("label")
+            elif tag == "mxCell":
+                label = elem.get("value")
+            else:
+                continue
+            if label:
+                fields["labels"][plain_text(label)] = None
+            tooltip = elem.get("tooltip")
+            if tooltip:
+                fields["tooltips"][plain_text(tooltip)] = None
+    except ET.ParseError as e:
+        raise ValueError(f"drawio XML解析失败: {e}")
+    return {field: "\n".join(text for text in values if text) for field, values in fields.items()}
+
+def search_terms(query: str) -> List[str]:
+    """把查询拆成检索词（按空白分隔，去掉引号，忽略大小写）"""
+    return [term.lower() for term in query.replace('"', " ").split() if term]
+
+def make_snippet(text: str, terms: List[str], width: int = 32) -> str:
+    """在文字中截取第一个命中词附近的片段，命中部分用MARK_OPEN/MARK_CLOSE包围"""
+    lower = text.lower()
+    spans = []
+    for term in terms:
+        i = lower.find(term)
+        while term and i >= 0:
+            spans.append((i, i + len(term)))
+            i = lower.find(term, i + len(term))
+    if not spans:
+        return text[:width * 2]
+    spans.sort()
+    start = max(0, spans[0][0] - width)
+    end = min(len(text), spans[0][0] + width)
+    parts = ["…" if start > 0 else ""]
+    position = start
+    for a, b in spans:
+        # 重叠的命中合并为一段
+        a, b = max(a, position), min(b, end)
+        if a >= b:
+            continue
+        parts.extend((text[position:a], MARK_OPEN, text[a:b], MARK_CLOSE))
+        position = b
+    parts.append(text[position:end])
+    parts.append("…" if end < len(text) else "")
+    return "".join(parts)
+
+def render_snippet(snippet: str) -> str:
+    """转义摘要中的HTML，再把命中标记替换为<mark>"""
+    return html.escape(snippet.replace("\n", " ")).replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    """
+    进程内的三元组倒排索引（MemoryStorage使用，检索行为与SQLite FTS5的trigram分词一致）
+
+    不少于3个字的检索词先用三元组倒排表求交集得到候选，再逐个确认子串命中；
+    全部检索词都短于3个字时扫描所有文档。
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, str]] = {}
+        self._lower: Dict[str, Tuple[str, ...]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.docs
+
+    def add(self, doc_id: str, fields: Dict[str, str]) -> None:
+        """添加或替换文档"""
+        self.remove(doc_id)
+        self.docs[doc_id] = {field: fields.get(field) or "" for field in SEARCH_FIELDS}
+        lower = tuple(self.docs[doc_id][field].lower() for field in SEARCH_FIELDS)
+        self._lower[doc_id] = lower
+        for gram in set().union(*(_trigrams(text) for text in lower)):
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id: str) -> None:
+        lower = self._lower.pop(doc_id, None)
+        if lower is None:
+            return
+        del self.docs[doc_id]
+        for gram in set().union(*(_trigrams(text) for text in lower)):
+            postings = self._postings[gram]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[gram]
+
+    def search(self, terms: List[str]) -> List[Tuple[str, float, str]]:
+        """
+        检索同时包含所有检索词的文档
+
+        Returns:
+            List[Tuple[str, float, str]]: (文档id, 得分, 摘要)，按得分从高到低排序
+        """
+        candidates: Optional[Set[str]] = None
+        for term in terms:
+            if len(term) >= 3:
+                for gram in _trigrams(term):
+                    postings = self._postings.get(gram, set())
+                    candidates = set(postings) if candidates is None else candidates & postings
+        if candidates is None:
+            candidates = set(self.docs)
+
+        results = []
+        for doc_id in candidates:
+            lower = self._lower[doc_id]
+            score = 0.0
+            for term in terms:
+                term_score = sum(text.count(term) * weight for text, weight in zip(lower, SEARCH_WEIGHTS))
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                field = next(f for f, text in zip(SEARCH_FIELDS, lower) if any(term in text for term in terms))
+                results.append((doc_id, score, make_snippet(self.docs[doc_id][field], terms)))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results
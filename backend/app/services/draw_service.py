@@ -1,54 +1,388 @@
-from typing import Dict, Any, Optional
+from typing import Callable, Collection, Dict, Any, List, Optional
+import asyncio
+import os
 import uuid
 from datetime import datetime
+from app.services.storage import DiagramStorage, create_storage
+from app.services.blob_store import blob_key
+from app.services.diagram_delta import (
+    split_cells, render_cells, make_delta, apply_delta, encode_delta, decode_delta
+)
+from app.services.diagram_diff import diff_pages
+from app.services.graph_model import GraphModel, parse_graph
+from app.services.diagram_text import extract_text, search_terms, render_snippet
+from app.services.similarity import (
+    SimilarityConfig, diagram_features, text_features, minhash, lsh_buckets, similarity,
+    pack_signature, unpack_signature
+)
+from app.services.preview_cache import PreviewCache
+from app.services.svg_renderer import render_svg, RENDERER_VERSION
+
+# 图表事件回调：(事件类型, 图表)，事件类型为created/updated/deleted，deleted时图表只有id
+DiagramListener = Callable[[str, Dict[str, Any]], None]
+
+class VersionConflict(Exception):
+    """更新时图表的当前内容与客户端预期的版本不一致"""
+
+    def __init__(self, diagram: Dict[str, Any]):
+        super().__init__("图表已被修改")
+        # 图表的当前状态
+        self.diagram = diagram
 
 class DrawService:
-    def __init__(self):
-        # 这里可以添加数据库连接等初始化代码
-        self.diagrams = {}  # 临时存储，实际应该使用数据库
+    def __init__(
+        self,
+        storage: Optional[DiagramStorage] = None,
+        snapshot_interval: Optional[int] = None,
+        previews: Optional[PreviewCache] = None,
+        similarity: Optional[SimilarityConfig] = None
+    ):
+        # 未指定时按环境变量创建存储后端（默认SQLite）
+        self.storage = storage or create_storage()
+        # 预览图按内容哈希缓存（内存LRU + 磁盘）
+        self.previews = previews or PreviewCache()
+        # 相似图表检索的阈值
+        self.similarity = similarity or SimilarityConfig()
+        # 每隔多少个版本保存一次完整快照，重建任意版本最多应用snapshot_interval-1个增量
+        self.snapshot_interval = max(1, snapshot_interval or int(os.getenv("DIAGRAM_SNAPSHOT_INTERVAL", "20")))
+        self._listeners: List[DiagramListener] = []
+        # 首次检索时为还没有全文索引或相似度签名的图表（如升级前保存的）补建索引
+        self._indexes_ready = False
+
+    def add_listener(self, listener: DiagramListener) -> None:
+        """
+        订阅图表的创建、内容更新和删除事件
+
+        回调在请求处理过程中同步调用，只应做入队等非阻塞操作。
+        """
+        self._listeners.append(listener)
+
+    def _emit(self, event: str, diagram: Dict[str, Any]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event, diagram)
+            except Exception as e:
+                # 订阅方的错误不影响图表的保存
+                print(f"图表事件{event}处理失败:", e)
     
     async def create_diagram(self, diagram_type: str, content: str) -> Dict[str, Any]:
         """创建新的图表"""
         diagram_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
         diagram = {
             "id": diagram_id,
             "type": diagram_type,
             "content": content,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "content_hash": blob_key(content),
+            "created_at": now,
+            "updated_at": now
         }
-        self.diagrams[diagram_id] = diagram
+        await self.storage.insert(diagram)
+        await self._record_version(diagram_id, 1, None, content, now)
+        await self._index(diagram_id, content)
+        self._emit("created", diagram)
         return diagram
     
     async def get_diagram(self, diagram_id: str) -> Optional[Dict[str, Any]]:
         """获取图表"""
-        return self.diagrams.get(diagram_id)
+        return await self.storage.get(diagram_id)
     
-    async def update_diagram(self, diagram_id: str, content: str) -> Optional[Dict[str, Any]]:
-        """更新图表"""
-        if diagram_id in self.diagrams:
-            self.diagrams[diagram_id]["content"] = content
-            self.diagrams[diagram_id]["updated_at"] = datetime.now().isoformat()
-            return self.diagrams[diagram_id]
-        return None
+    async def update_diagram(
+        self,
+        diagram_id: str,
+        content: str,
+        expected_hashes: Optional[Collection[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        更新图表，内容有变化时记录新版本
+
+        Args:
+            expected_hashes: 客户端读取时的内容哈希（If-Match），当前内容不在其中时拒绝更新，
+                检查、写入和版本号分配在存储的同一事务中完成（多个worker进程之间同样有效）
+
+        Returns:
+            Optional[Dict[str, Any]]: 更新后的图表，图表不存在时返回None
+
+        Raises:
+            VersionConflict: 图表已被其他人修改
+        """
+        result = await self.storage.update_content(
+            diagram_id,
+            content,
+            datetime.now().isoformat(),
+            # 没有历史记录的旧图表从快照开始
+            lambda previous, version: self._version_record(version, previous, content),
+            expected_hashes
+        )
+        if result.precondition_failed:
+            raise VersionConflict(result.diagram)
+        if result.changed:
+            await self._index(diagram_id, content)
+            self._emit("updated", result.diagram)
+        return result.diagram
     
     async def delete_diagram(self, diagram_id: str) -> bool:
         """删除图表"""
-        if diagram_id in self.diagrams:
-            del self.diagrams[diagram_id]
-            return True
-        return False
+        deleted = await self.storage.delete(diagram_id)
+        if deleted:
+            self._emit("deleted", {"id": diagram_id})
+        return deleted
+
+    async def list_diagrams(
+        self,
+        diagram_type: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """按更新时间倒序列出图表（不含内容）"""
+        return await self.storage.list(diagram_type, limit, offset)
+
+    async def search_diagrams(
+        self,
+        query: str,
+        diagram_type: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        按页面名、单元文字和tooltip全文检索图表
+
+        Args:
+            query: 检索词，空格分隔的多个词需同时命中
+
+        Returns:
+            List[Dict[str, Any]]: 按相关度排序的图表元数据（不含内容），附加score和snippet
+                （已转义的HTML片段，命中部分用<mark>标记）
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        if not self._indexes_ready:
+            await self.rebuild_indexes()
+        hits = await self.storage.search(terms, diagram_type, limit, offset)
+        for hit in hits:
+            hit["snippet"] = render_snippet(hit["snippet"])
+        return hits
+
+    async def find_similar(
+        self,
+        content: Optional[str] = None,
+        diagram_id: Optional[str] = None,
+        limit: int = 10,
+        threshold: Optional[float] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        查找结构相似的图表
+
+        用MinHash签名的LSH分段桶取候选，只比较至少一段相同的图表，不扫描全部图表。
+
+        Args:
+            content: 要比较的图表内容
+            diagram_id: 要比较的已保存图表（结果中不包含它自己），与content二选一
+            threshold: 最低相似度，默认使用配置
+
+        Returns:
+            List[Dict[str, Any]]: 按相似度从高到低排序的图表元数据（不含内容），附加similarity；
+                diagram_id不存在时返回None
+
+        Raises:
+            ValueError: 图表内容无法解析
+        """
+        if diagram_id is not None:
+            diagram = await self.storage.get(diagram_id)
+            if diagram is None:
+                return None
+            content = diagram["content"]
+        signature = await asyncio.to_thread(lambda: minhash(diagram_features(content or "")))
+        if not self._indexes_ready:
+            await self.rebuild_indexes()
+        return await self._similar("diagram", signature, limit, threshold, diagram_id)
+
+    async def find_by_prompt(self, prompt: str, limit: int = 1, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """查找由相似需求生成的图表（需求签名由index_prompt记录）"""
+        features = text_features(prompt)
+        if not features:
+            return []
+        return await self._similar("prompt", minhash(features), limit, threshold)
+
+    async def index_prompt(self, diagram_id: str, prompt: str) -> None:
+        """记录生成图表时的需求文字，之后相似的需求可以直接找到该图表"""
+        features = text_features(prompt)
+        if not features:
+            return
+        signature = minhash(features)
+        await self.storage.index_signature(diagram_id, "prompt", pack_signature(signature), lsh_buckets(signature))
+
+    async def _similar(
+        self,
+        kind: str,
+        signature,
+        limit: int,
+        threshold: Optional[float],
+        exclude: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        threshold = self.similarity.threshold if threshold is None else threshold
+        hits = []
+        for candidate in await self.storage.similar_candidates(kind, lsh_buckets(signature)):
+            score = similarity(signature, unpack_signature(candidate.pop("signature")))
+            if candidate["id"] != exclude and score >= threshold:
+                candidate["similarity"] = score
+                hits.append(candidate)
+        hits.sort(key=lambda hit: hit["similarity"], reverse=True)
+        return hits[:limit]
+
+    async def rebuild_indexes(self) -> int:
+        """为还没有全文索引或相似度签名的图表建立索引，返回处理的图表数"""
+        count = 0
+        while True:
+            diagram_ids = list(dict.fromkeys(
+                await self.storage.unindexed(100) + await self.storage.unsigned("diagram", 100)
+            ))
+            for diagram_id in diagram_ids:
+                diagram = await self.storage.get(diagram_id)
+                # 内容无法解析时也写入空索引，避免每次都重试
+                await self._index(diagram_id, diagram["content"] if diagram else "")
+            count += len(diagram_ids)
+            if not diagram_ids:
+                break
+        self._indexes_ready = True
+        return count
+
+    def _analyze(self, content: str):
+        """提取全文索引字段和结构签名（在线程池中执行）"""
+        try:
+            fields = extract_text(content) if content else {}
+            features = diagram_features(content) if content else set()
+        except ValueError as e:
+            print("图表内容解析失败，不建立索引:", e)
+            fields, features = {}, set()
+        signature = minhash(features)
+        # 没有特征的图表只保存签名，不放入LSH桶，避免所有空图表互相成为候选
+        return fields, pack_signature(signature), lsh_buckets(signature) if features else []
+
+    async def _index(self, diagram_id: str, content: str) -> None:
+        """更新图表的全文索引和相似度签名"""
+        fields, signature, buckets = await asyncio.to_thread(self._analyze, content)
+        await self.storage.index_text(diagram_id, fields)
+        await self.storage.index_signature(diagram_id, "diagram", signature, buckets)
+
+    async def list_versions(self, diagram_id: str) -> List[Dict[str, Any]]:
+        """按版本号升序列出图表的历史版本（不含内容）"""
+        return await self.storage.list_versions(diagram_id)
+
+    async def get_version(self, diagram_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """
+        获取图表的历史版本
+
+        从最近的快照开始依次应用增量，最多应用snapshot_interval-1个。
+
+        Returns:
+            Optional[Dict[str, Any]]: 包含diagram_id、version、content和created_at，版本不存在时返回None
+        """
+        chain = await self.storage.version_chain(diagram_id, version)
+        if not chain:
+            return None
+        content = await asyncio.to_thread(self._rebuild, chain)
+        return {
+            "diagram_id": diagram_id,
+            "version": version,
+            "content": content,
+            "created_at": chain[-1]["created_at"]
+        }
+
+    async def diff_versions(self, diagram_id: str, from_version: int, to_version: int) -> Optional[Dict[str, Any]]:
+        """
+        比较两个版本
+
+        Returns:
+            Optional[Dict[str, Any]]: patch为从from_version到to_version的DiffSync补丁，
+                无法按页面比较时为None；任一版本不存在时返回None
+        """
+        old = await self.get_version(diagram_id, from_version)
+        new = await self.get_version(diagram_id, to_version)
+        if old is None or new is None:
+            return None
+        patch = await asyncio.to_thread(diff_pages, old["content"], new["content"])
+        return {"diagram_id": diagram_id, "from": from_version, "to": to_version, "patch": patch}
+
+    async def _record_version(
+        self,
+        diagram_id: str,
+        version: int,
+        previous: Optional[str],
+        content: str,
+        now: str
+    ) -> None:
+        """保存版本（用于新建图表的第一个版本）"""
+        record = await asyncio.to_thread(self._version_record, version, previous, content)
+        await self.storage.add_version(diagram_id, {**record, "version": version, "created_at": now})
+
+    def _version_record(self, version: int, previous: Optional[str], content: str) -> Dict[str, Any]:
+        """固定间隔或无法计算增量时保存快照，否则保存相对上一版本的单元级增量"""
+        data = None
+        if previous is not None and (version - 1) % self.snapshot_interval:
+            data = self._delta(previous, content)
+        return {"kind": "snapshot" if data is None else "delta", "data": content if data is None else data}
+
+    @staticmethod
+    def _delta(previous: str, content: str) -> Optional[str]:
+        """计算增量，无法拆分单元、无法逐字节重建（如压缩页面）或增量不比快照小时返回None"""
+        old = split_cells(previous)
+        new = split_cells(content)
+        if old is None or new is None or render_cells(new) != content:
+            return None
+        data = encode_delta(make_delta(old, new))
+        return data if len(data) < len(content) else None
+
+    @staticmethod
+    def _rebuild(chain: List[Dict[str, Any]]) -> str:
+        """由快照和其后的增量重建版本内容"""
+        if len(chain) == 1:
+            return chain[0]["data"]
+        state = split_cells(chain[0]["data"])
+        for record in chain[1:]:
+            apply_delta(state, decode_delta(record["data"]))
+        return render_cells(state)
+
+    async def collect_garbage(self) -> int:
+        """清理没有图表或历史快照引用的内容blob，返回清理数量"""
+        return await self.storage.collect_garbage()
+
+    async def aclose(self) -> None:
+        """关闭存储后端"""
+        await self.storage.aclose()
     
-    async def generate_preview(self, content: str) -> str:
-        """生成预览图片"""
-        # TODO: 实现图片生成逻辑
-        return "data:image/png;base64,..."  # 返回base64编码的图片数据
+    async def generate_preview(self, content: str, page: int = 0, content_hash: Optional[str] = None) -> str:
+        """
+        生成SVG预览图
+
+        Args:
+            content: drawio内容
+            page: 页面序号
+            content_hash: 内容哈希（已知时传入，避免重复计算）
+
+        Returns:
+            str: SVG文本
+
+        Raises:
+            ValueError: 内容无法解析或页面不存在
+        """
+        key = f"{content_hash or blob_key(content)}-p{page}-v{RENDERER_VERSION}.svg"
+        data = await self.previews.get_or_create(key, lambda: render_svg(content, page).encode("utf-8"))
+        return data.decode("utf-8")
+
+    async def get_preview(self, diagram_id: str, page: int = 0) -> Optional[str]:
+        """获取已保存图表的SVG预览，图表不存在时返回None"""
+        diagram = await self.get_diagram(diagram_id)
+        if diagram is None:
+            return None
+        return await self.generate_preview(diagram["content"], page, diagram["content_hash"])
     
-    def _parse_drawio_content(self, content: str) -> Dict[str, Any]:
-        """解析drawio内容"""
-        # TODO: 实现解析逻辑
-        return {
-            "nodes": [],
-            "edges": [],
-            "style": {}
-        } 
\ No newline at end of file
+    def _parse_drawio_content(self, content: str, page: int = 0) -> GraphModel:
+        """
+        解析drawio内容为紧凑图模型
+
+        Raises:
+            ValueError: XML不合法或页面不存在
+        """
+        return parse_graph(content, page) 
\ No newline at end of file
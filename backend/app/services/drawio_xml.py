@@ -0,0 +1,108 @@
+from typing import Dict, Iterator, List, Optional
+import xml.etree.ElementTree as ET
+
+# 包裹mxCell的自定义数据节点
+WRAPPER_TAGS = ("UserObject", "object")
+
+def parse_xml(content: str) -> ET.Element:
+    """
+    解析drawio XML（<mxfile>或<mxGraphModel>）
+
+    Raises:
+        ValueError: XML格式不合法
+    """
+    try:
+        return ET.fromstring(content.strip())
+    except ET.ParseError as e:
+        raise ValueError(f"drawio XML解析失败: {e}")
+
+def get_graph_model(root: ET.Element, page: int = 0) -> Optional[ET.Element]:
+    """
+    获取指定页面的<mxGraphModel>
+
+    页面内容被压缩（<diagram>中只有文本）时返回None。
+    """
+    if root.tag == "mxGraphModel":
+        return root
+    diagrams = root.findall("diagram")
+    if page >= len(diagrams):
+        return None
+    return diagrams[page].find("mxGraphModel")
+
+def get_cells_root(model: ET.Element) -> ET.Element:
+    """获取<mxGraphModel>下的<root>，不存在时创建"""
+    cells_root = model.find("root")
+    if cells_root is None:
+        cells_root = ET.SubElement(model, "root")
+    return cells_root
+
+def inner_cell(elem: ET.Element) -> ET.Element:
+    """返回真正的mxCell（UserObject/object包裹时取其子节点）"""
+    if elem.tag in WRAPPER_TAGS:
+        cell = elem.find("mxCell")
+        if cell is not None:
+            return cell
+    return elem
+
+def iter_cells(model: ET.Element) -> Iterator[ET.Element]:
+    """按文档顺序遍历<root>下的所有单元"""
+    cells_root = model.find("root")
+    if cells_root is None:
+        return iter(())
+    return iter(list(cells_root))
+
+def cell_index(model: ET.Element) -> Dict[str, ET.Element]:
+    """按id建立单元索引"""
+    return {elem.get("id"): elem for elem in iter_cells(model) if elem.get("id") is not None}
+
+def validate_model(model: ET.Element) -> List[str]:
+    """
+    检查图模型的结构完整性
+
+    Returns:
+        List[str]: 发现的问题列表，为空表示通过
+    """
+    errors = []
+    seen = set()
+    cells = list(iter_cells(model))
+    for elem in cells:
+        cell_id = elem.get("id")
+        if cell_id is None:
+            errors.append(f"存在缺少id的单元: {elem.tag}")
+            continue
+        if cell_id in seen:
+            errors.append(f"单元id重复: {cell_id}")
+        seen.add(cell_id)
+
+    roots = 0
+    for elem in cells:
+        cell = inner_cell(elem)
+        parent = cell.get("parent")
+        if parent is None:
+            roots += 1
+        elif parent not in seen:
+            errors.append(f"单元{elem.get('id')}的父节点{parent}不存在")
+        for terminal in ("source", "target"):
+            ref = cell.get(terminal)
+            if ref is not None and ref not in seen:
+                errors.append(f"连线{elem.get('id')}的{terminal}节点{ref}不存在")
+    if cells and roots != 1:
+        errors.append(f"根节点数量应为1，实际为{roots}")
+    return errors
+
+def to_xml(root: ET.Element) -> str:
+    """序列化为字符串（不包含元素自身的tail文本）"""
+    tail, root.tail = root.tail, None
+    try:
+        return ET.tostring(root, encoding="unicode")
+    finally:
+        root.tail = tail
+
+def strip_whitespace(elem: ET.Element) -> ET.Element:
+    """原地去掉缩进等纯空白的text/tail，便于比较和紧凑输出"""
+    for node in elem.iter():
+        if node.text is not None and not node.text.strip():
+            node.text = None
+        if node.tail is not None and not node.tail.strip():
+            node.tail = None
+    return elem
@@ -0,0 +1,404 @@
+import io
+import re
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from app.services.drawio_xml import WRAPPER_TAGS, to_xml
+from app.services.mxfile_codec import inflate_mxfile
+
+# 单元类型
+KIND_OTHER = 0  # 根节点、图层
+KIND_VERTEX = 1
+KIND_EDGE = 2
+
+# 几何信息标记
+GEO_NONE = 0
+GEO_ABSOLUTE = 1
+GEO_RELATIVE = 2
+
+# 由数组保存的mxCell/mxGeometry属性，其余属性原样保存在稀疏字典中
+_CELL_FIELDS = {"id", "value", "style", "parent", "source", "target"}
+_GEOMETRY_FIELDS = ("x", "y", "width", "height")
+# 属性都在以下范围内时不需要检查稀疏属性（常见情况）
+_CELL_KEYS = _CELL_FIELDS | {"vertex", "edge"}
+_GEOMETRY_KEYS = {"x", "y", "width", "height", "relative", "as"}
+_NO_GEOMETRY = (0.0, 0.0, 0.0, 0.0)
+_KIND_KEYS = (None, "vertex", "edge")
+_ATTR_ESCAPES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+_NEEDS_ESCAPE = re.compile(r'[&<>"\n\r\t]')
+
+def _number(value: Optional[str]) -> float:
+    try:
+        return float(value) if value is not None else 0.0
+    except ValueError:
+        return 0.0
+
+def _format(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _escape(value: str) -> str:
+    if _NEEDS_ESCAPE.search(value) is None:
+        return value
+    return escape(value, _ATTR_ESCAPES)
+
+def _attrs(items) -> str:
+    return "".join(f' {key}="{_escape(value)}"' for key, value in items)
+
+class _CellExtra:
+    """数组之外的少见信息，只有需要时才创建"""
+
+    __slots__ = ("attrs", "geo_attrs", "geo_children", "wrapper")
+
+    def __init__(self):
+        # mxCell上的其他属性（含无法解析的parent/source/target引用）
+        self.attrs: Dict[str, str] = {}
+        # mxGeometry上的其他属性
+        self.geo_attrs: Dict[str, str] = {}
+        # mxGeometry下除拐点外的子节点XML（sourcePoint、targetPoint、offset等）
+        self.geo_children: str = ""
+        # UserObject/object包裹：(标签, 属性, 除mxCell外的子节点XML)
+        self.wrapper: Optional[Tuple[str, Dict[str, str], str]] = None
+
+class GraphModel:
+    """
+    紧凑的mxGraphModel表示
+
+    每个单元用下标表示，属性保存在按下标排列的数组中：父节点、连线两端为下标（-1表示无），
+    几何信息按(x, y, width, height)连续存放在一个double数组中，样式字符串去重后用编号引用。
+    不需要逐个单元创建Python对象，适合对大图做结构分析；to_xml()可还原等价的XML。
+    """
+
+    __slots__ = ("ids", "index", "kinds", "parents", "sources", "targets", "styles", "style_table",
+                 "values", "geometry", "geo_flags", "points", "extras",
+                 "model_attrs", "page_attrs", "file_attrs", "_style_ids", "_children")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.kinds = array("b")
+        self.parents = array("i")
+        self.sources = array("i")
+        self.targets = array("i")
+        self.styles = array("i")
+        self.style_table: List[str] = []
+        self.values: List[Optional[str]] = []
+        self.geometry = array("d")
+        self.geo_flags = array("b")
+        # 连线拐点：下标 -> [x0, y0, x1, y1, ...]
+        self.points: Dict[int, array] = {}
+        self.extras: Dict[int, _CellExtra] = {}
+        self.model_attrs: Dict[str, str] = {}
+        self.page_attrs: Optional[Dict[str, str]] = None
+        self.file_attrs: Optional[Dict[str, str]] = None
+        self._style_ids: Dict[str, int] = {}
+        self._children: Optional[List[List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def intern_style(self, style: Optional[str]) -> int:
+        """返回样式编号，相同样式只保存一份"""
+        if style is None:
+            return -1
+        style_id = self._style_ids.get(style)
+        if style_id is None:
+            style_id = len(self.style_table)
+            self.style_table.append(sys.intern(style))
+            self._style_ids[style] = style_id
+        return style_id
+
+    def style(self, i: int) -> Optional[str]:
+        style_id = self.styles[i]
+        return self.style_table[style_id] if style_id >= 0 else None
+
+    def label(self, i: int) -> Optional[str]:
+        """单元文字，UserObject/object包裹的单元取包裹节点的label属性"""
+        extra = self.extras.get(i)
+        if extra is not None and extra.wrapper is not None:
+            return extra.wrapper[1].get("label")
+        return self.values[i]
+
+    def bounds(self, i: int) -> Tuple[float, float, float, float]:
+        """单元自身的几何信息（相对父节点）"""
+        return tuple(self.geometry[4 * i:4 * i + 4])
+
+    def vertices(self) -> List[int]:
+        return [i for i, kind in enumerate(self.kinds) if kind == KIND_VERTEX]
+
+    def edges(self) -> List[int]:
+        return [i for i, kind in enumerate(self.kinds) if kind == KIND_EDGE]
+
+    def children(self, i: int) -> List[int]:
+        """按文档顺序返回子节点下标（首次调用时建立索引）"""
+        if self._children is None:
+            self._children = [[] for _ in self.ids]
+            for child, parent in enumerate(self.parents):
+                if parent >= 0:
+                    self._children[parent].append(child)
+        return self._children[i]
+
+    def absolute_geometry(self) -> array:
+        """
+        计算所有单元的绝对坐标
+
+        顶点的坐标相对父顶点（分组、容器）；相对几何的顶点（如端口）按父节点宽高的比例定位。
+
+        Returns:
+            array: 与geometry布局相同的double数组
+        """
+        n = len(self.ids)
+        result = array("d", self.geometry)
+        done = bytearray(n)
+        for start in range(n):
+            # 沿父链向上找到已计算的祖先，再自上而下计算，避免递归
+            chain = []
+            i = start
+            while i >= 0 and not done[i] and len(chain) <= n:
+                chain.append(i)
+                i = self.parents[i]
+            for i in reversed(chain):
+                parent = self.parents[i]
+                done[i] = 1
+                if self.kinds[i] != KIND_VERTEX or parent < 0 or self.kinds[parent] != KIND_VERTEX:
+                    continue
+                px, py = result[4 * parent], result[4 * parent + 1]
+                if self.geo_flags[i] == GEO_RELATIVE:
+                    result[4 * i] = px + self.geometry[4 * i] * self.geometry[4 * parent + 2]
+                    result[4 * i + 1] = py + self.geometry[4 * i + 1] * self.geometry[4 * parent + 3]
+                else:
+                    result[4 * i] += px
+                    result[4 * i + 1] += py
+        return result
+
+    def _extra(self, i: int) -> _CellExtra:
+        extra = self.extras.get(i)
+        if extra is None:
+            extra = self.extras[i] = _CellExtra()
+        return extra
+
+    def _cell_xml(self, i: int, ids: List[str], styles: List[str], parts: List[str]) -> None:
+        # ids/styles为已转义的id和样式，每次to_xml只转义一次
+        extra = self.extras.get(i)
+        wrapper = extra.wrapper if extra is not None else None
+        if wrapper is not None:
+            parts.append(f"<{wrapper[0]}{_attrs(wrapper[1].items())}>{wrapper[2]}<mxCell")
+        else:
+            parts.append(f'<mxCell id="{ids[i]}"')
+        value = self.values[i]
+        if value is not None:
+            parts.append(f' value="{_escape(value)}"')
+        style_id = self.styles[i]
+        if style_id >= 0:
+            parts.append(f' style="{styles[style_id]}"')
+        if extra is not None and extra.attrs:
+            parts.append(_attrs(extra.attrs.items()))
+        kind = self.kinds[i]
+        if kind == KIND_VERTEX:
+            parts.append(' vertex="1"')
+        elif kind == KIND_EDGE:
+            parts.append(' edge="1"')
+        ref = self.parents[i]
+        if ref >= 0:
+            parts.append(f' parent="{ids[ref]}"')
+        ref = self.sources[i]
+        if ref >= 0:
+            parts.append(f' source="{ids[ref]}"')
+        ref = self.targets[i]
+        if ref >= 0:
+            parts.append(f' target="{ids[ref]}"')
+
+        flag = self.geo_flags[i]
+        if flag == GEO_NONE:
+            parts.append("/>")
+        else:
+            parts.append("><mxGeometry")
+            geometry = self.geometry
+            for k, key in enumerate(_GEOMETRY_FIELDS):
+                value = geometry[4 * i + k]
+                if value != 0:
+                    parts.append(f' {key}="{_format(value)}"')
+            if flag == GEO_RELATIVE:
+                parts.append(' relative="1"')
+            children = ""
+            if extra is not None:
+                if extra.geo_attrs:
+                    parts.append(_attrs(extra.geo_attrs.items()))
+                children = extra.geo_children
+            points = self.points.get(i)
+            if points is not None:
+                children = '<Array as="points">' + "".join(
+                    f'<mxPoint x="{_format(points[k])}" y="{_format(points[k + 1])}"/>'
+                    for k in range(0, len(points), 2)
+                ) + "</Array>" + children
+            if children:
+                parts.append(f' as="geometry">{children}</mxGeometry></mxCell>')
+            else:
+                parts.append(' as="geometry"/></mxCell>')
+        if wrapper is not None:
+            parts.append(f"</{wrapper[0]}>")
+
+    def to_xml(self) -> str:
+        """还原为<mxGraphModel> XML"""
+        ids = [_escape(cell_id) for cell_id in self.ids]
+        styles = [_escape(style) for style in self.style_table]
+        parts = [f"<mxGraphModel{_attrs(self.model_attrs.items())}><root>"]
+        for i in range(len(ids)):
+            self._cell_xml(i, ids, styles, parts)
+        parts.append("</root></mxGraphModel>")
+        return "".join(parts)
+
+    def to_mxfile(self) -> str:
+        """还原为只有当前页面的<mxfile>"""
+        file_attrs = self.file_attrs or {}
+        page_attrs = self.page_attrs or {"id": "page-1", "name": "Page-1"}
+        return f"<mxfile{_attrs(file_attrs.items())}><diagram{_attrs(page_attrs.items())}>{self.to_xml()}</diagram></mxfile>"
+
+class _GraphBuilder:
+    """逐个接收单元，结束时把id引用解析为下标"""
+
+    def __init__(self):
+        self.model = GraphModel()
+        self.refs: List[Tuple[Optional[str], Optional[str], Optional[str]]] = []
+
+    def add(self, elem: ET.Element) -> None:
+        model = self.model
+        cell = elem
+        if elem.tag in WRAPPER_TAGS:
+            cell = elem.find("mxCell")
+            if cell is None:
+                cell = ET.Element("mxCell")
+        i = len(model.ids)
+        cell_id = elem.get("id")
+        if cell_id is None or cell_id in model.index:
+            raise ValueError(f"单元id缺失或重复: {cell_id}")
+        model.ids.append(cell_id)
+        model.index[cell_id] = i
+        attrs = cell.attrib
+        model.values.append(attrs.get("value"))
+        model.styles.append(model.intern_style(attrs.get("style")))
+        if attrs.get("vertex") == "1":
+            kind = KIND_VERTEX
+        elif attrs.get("edge") == "1":
+            kind = KIND_EDGE
+        else:
+            kind = KIND_OTHER
+        model.kinds.append(kind)
+        self.refs.append((attrs.get("parent"), attrs.get("source"), attrs.get("target")))
+
+        # vertex="1"/edge="1"已由kinds表示，其余属性保存在稀疏字典中
+        kind_key = _KIND_KEYS[kind]
+        if not _CELL_KEYS.issuperset(attrs) or ("vertex" in attrs) + ("edge" in attrs) != (kind != KIND_OTHER):
+            other = [(k, v) for k, v in attrs.items() if k not in _CELL_FIELDS and k != kind_key]
+            if other:
+                model._extra(i).attrs.update(other)
+        if elem is not cell:
+            children = "".join(to_xml(child) for child in elem if child is not cell)
+            model._extra(i).wrapper = (elem.tag, dict(elem.attrib), children)
+
+        geo = cell.find("mxGeometry")
+        if geo is None:
+            model.geometry.extend(_NO_GEOMETRY)
+            model.geo_flags.append(GEO_NONE)
+            return
+        get = geo.get
+        model.geometry.extend((_number(get("x")), _number(get("y")), _number(get("width")), _number(get("height"))))
+        relative = get("relative")
+        model.geo_flags.append(GEO_RELATIVE if relative == "1" else GEO_ABSOLUTE)
+        if not _GEOMETRY_KEYS.issuperset(geo.attrib) or get("as") != "geometry" or relative not in (None, "1"):
+            geo_other = {k: v for k, v in geo.attrib.items()
+                         if k not in _GEOMETRY_FIELDS and k != "relative" and not (k == "as" and v == "geometry")}
+            if relative not in (None, "1"):
+                geo_other["relative"] = relative
+            if geo_other:
+                model._extra(i).geo_attrs.update(geo_other)
+        if not len(geo):
+            return
+        children = []
+        for child in geo:
+            if child.tag == "Array" and child.get("as") == "points" and i not in model.points:
+                model.points[i] = array("d", (
+                    v for p in child.findall("mxPoint") for v in (_number(p.get("x")), _number(p.get("y")))
+                ))
+            else:
+                children.append(to_xml(child))
+        if children:
+            model._extra(i).geo_children = "".join(children)
+
+    def finish(self) -> GraphModel:
+        model = self.model
+        index = model.index
+        for i, refs in enumerate(self.refs):
+            for key, target, ref in zip(("parent", "source", "target"),
+                                        (model.parents, model.sources, model.targets), refs):
+                resolved = index.get(ref, -1) if ref is not None else -1
+                target.append(resolved)
+                if ref is not None and resolved < 0:
+                    # 引用不存在的单元时原样保留，保证还原后的XML不丢信息
+                    model._extra(i).attrs[key] = ref
+        self.refs = []
+        return model
+
+def parse_graph(content: str, page: int = 0) -> GraphModel:
+    """
+    流式解析drawio XML为GraphModel
+
+    使用iterparse逐个处理<root>下的单元，处理后立即释放对应的元素，
+    内存占用与GraphModel本身相当，而不是整棵ElementTree。
+
+    Args:
+        content: <mxfile>或<mxGraphModel> XML（支持压缩页面）
+        page: <mxfile>中的页面序号
+
+    Returns:
+        GraphModel: 指定页面的图模型
+
+    Raises:
+        ValueError: XML不合法、页面不存在或单元id缺失/重复
+    """
+    content = inflate_mxfile(content)
+    builder = _GraphBuilder()
+    model = builder.model
+    depth = 0
+    # <root>下单元的深度（未进入<root>时为0），以及是否属于选中的页面
+    cell_depth = 0
+    collect = False
+    page_index = -1
+    found = False
+    cells_root: Optional[ET.Element] = None
+    try:
+        for event, elem in ET.iterparse(io.BytesIO(content.encode("utf-8")), events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth > cell_depth > 0:
+                    continue
+                tag = elem.tag
+                if tag == "mxfile" and depth == 1:
+                    model.file_attrs = dict(elem.attrib)
+                elif tag == "diagram" and depth == 2:
+                    page_index += 1
+                    if page_index == page:
+                        model.page_attrs = dict(elem.attrib)
+                elif tag == "mxGraphModel" and (depth == 1 or (depth == 3 and page_index == page)):
+                    model.model_attrs = dict(elem.attrib)
+                    found = collect = True
+                elif tag == "root" and depth in (2, 4):
+                    cells_root = elem
+                    cell_depth = depth + 1
+                continue
+
+            if depth == cell_depth:
+                if collect and (elem.tag == "mxCell" or elem.tag in WRAPPER_TAGS):
+                    builder.add(elem)
+                # 已处理的单元不再保留在树中
+                cells_root.clear()
+            elif depth == cell_depth - 1:
+                cell_depth = 0
+                collect = False
+            depth -= 1
+    except ET.ParseError as e:
+        raise ValueError(f"drawio XML解析失败: {e}")
+    if not found:
+        raise ValueError(f"页面{page}不存在或不包含mxGraphModel")
+    return builder.finish()
@@ -0,0 +1,177 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from app.services.diagram_patch import apply_patch
+from app.services.drawio_xml import parse_xml
+from app.services.graph_model import GraphModel, parse_graph, GEO_ABSOLUTE, KIND_EDGE
+from app.services.spatial_index import Box, GridIndex, contains, intersects
+
+@dataclass
+class LayoutRepairConfig:
+    """生成结果的重叠修复配置，默认值可通过环境变量覆盖"""
+    enabled: bool = os.getenv("LAYOUT_REPAIR", "1") != "0"
+    # 推开后与障碍形状之间保留的间距
+    gap: float = float(os.getenv("LAYOUT_REPAIR_GAP", "20"))
+    # 单个形状最多推开的次数，超过后直接放到同级形状的最下方
+    max_steps: int = 50
+
+def _sibling_groups(model: GraphModel) -> Dict[int, List[int]]:
+    """按父节点分组可移动的顶点（绝对几何、有面积、不是连线标签）"""
+    groups: Dict[int, List[int]] = {}
+    geometry = model.geometry
+    for i in model.vertices():
+        if model.geo_flags[i] != GEO_ABSOLUTE or geometry[4 * i + 2] <= 0 or geometry[4 * i + 3] <= 0:
+            continue
+        parent = model.parents[i]
+        if parent >= 0 and model.kinds[parent] == KIND_EDGE:
+            continue
+        groups.setdefault(parent, []).append(i)
+    return groups
+
+def _grid_size(model: GraphModel, items: List[int]) -> float:
+    """网格边长取形状长边中位数的2倍"""
+    sizes = sorted(max(model.geometry[4 * i + 2], model.geometry[4 * i + 3]) for i in items)
+    return max(sizes[len(sizes) // 2] * 2, 10.0)
+
+def _conflicts(a: Box, b: Box) -> bool:
+    # 完全包含视为有意为之（如作为背景的分区框），不算重叠
+    return intersects(a, b) and not contains(a, b) and not contains(b, a)
+
+def find_overlaps(model: GraphModel) -> List[Tuple[int, int]]:
+    """
+    查找同一父节点下互相重叠的顶点
+
+    Returns:
+        List[Tuple[int, int]]: 重叠的单元下标对
+    """
+    result = []
+    for items in _sibling_groups(model).values():
+        index = GridIndex(_grid_size(model, items))
+        for i in items:
+            index.insert(i, model.bounds(i))
+        result.extend((a, b) for a, b in index.pairs() if _conflicts(index.box(a), index.box(b)))
+    return sorted(result)
+
+def plan_moves(
+    model: GraphModel,
+    fixed: Optional[Set[int]] = None,
+    config: Optional[LayoutRepairConfig] = None
+) -> Dict[int, Tuple[float, float]]:
+    """
+    计算消除重叠需要的位移
+
+    固定单元先放入索引，其余单元按(y, x, 文档顺序)依次放置：与已放置的形状重叠时，
+    沿穿透较浅的方向（向右或向下，相同时向下）推到障碍之外再留出gap，直到不再重叠。
+    只向右下移动保证过程收敛，相同输入总是得到相同结果。
+
+    Args:
+        model: 图模型
+        fixed: 不移动的单元下标（如编辑前已存在且未改动的单元）
+        config: 修复配置
+
+    Returns:
+        Dict[int, Tuple[float, float]]: 单元下标 -> 新的(x, y)
+    """
+    config = config or LayoutRepairConfig()
+    fixed = fixed or set()
+    gap = config.gap
+    moves = {}
+    for items in _sibling_groups(model).values():
+        if len(items) < 2:
+            continue
+        index = GridIndex(_grid_size(model, items))
+        movable = []
+        # 已放置形状的最低边，推开失败时放到它下方
+        lowest = float("-inf")
+        for i in items:
+            if i in fixed:
+                index.insert(i, model.bounds(i))
+                lowest = max(lowest, model.geometry[4 * i + 1] + model.geometry[4 * i + 3])
+            else:
+                movable.append(i)
+        movable.sort(key=lambda i: (model.geometry[4 * i + 1], model.geometry[4 * i], i))
+
+        for i in movable:
+            x, y, w, h = model.bounds(i)
+            for _ in range(config.max_steps):
+                hits = [j for j in index.query((x, y, w, h)) if _conflicts((x, y, w, h), index.box(j))]
+                if not hits:
+                    break
+                # 先处理重叠面积最大的障碍
+                ox, oy, ow, oh = max((index.box(j) for j in hits), key=lambda b: (
+                    (min(x + w, b[0] + b[2]) - max(x, b[0])) * (min(y + h, b[1] + b[3]) - max(y, b[1]))
+                ))
+                dx = ox + ow + gap - x
+                dy = oy + oh + gap - y
+                if dx < dy:
+                    x += dx
+                else:
+                    y += dy
+            else:
+                y = max(y, lowest + gap)
+            index.insert(i, (x, y, w, h))
+            lowest = max(lowest, y + h)
+            if (x, y) != model.bounds(i)[:2]:
+                moves[i] = (x, y)
+    return moves
+
+def _unchanged(model: GraphModel, previous: Optional[GraphModel]) -> Set[int]:
+    """与编辑前id、父节点和几何都相同的单元"""
+    if previous is None:
+        return set()
+    fixed = set()
+    for i, cell_id in enumerate(model.ids):
+        j = previous.index.get(cell_id)
+        if j is None or model.bounds(i) != previous.bounds(j):
+            continue
+        parent, previous_parent = model.parents[i], previous.parents[j]
+        if (parent < 0) == (previous_parent < 0) and (parent < 0 or model.ids[parent] == previous.ids[previous_parent]):
+            fixed.add(i)
+    return fixed
+
+def _number(value: float) -> str:
+    value = round(value, 2)
+    return str(int(value)) if value == int(value) else str(value)
+
+def repair_overlaps(
+    content: str,
+    previous: Optional[str] = None,
+    config: Optional[LayoutRepairConfig] = None
+) -> Tuple[str, int]:
+    """
+    消除drawio图表中同级形状的重叠
+
+    编辑已有图表时，编辑前就存在且没有改动的形状保持不动，只移动新增或改动过的形状。
+
+    Args:
+        content: drawio内容（<mxfile>或<mxGraphModel>，页面不能是压缩格式）
+        previous: 编辑前的图表内容（可选）
+        config: 修复配置
+
+    Returns:
+        Tuple[str, int]: 修复后的内容和移动的形状数，没有重叠时原样返回内容
+
+    Raises:
+        ValueError: 图表内容无法解析
+    """
+    config = config or LayoutRepairConfig()
+    pages = len(parse_xml(content).findall("diagram")) or 1
+    moved = 0
+    for page in range(pages):
+        model = parse_graph(content, page)
+        old = None
+        if previous:
+            try:
+                old = parse_graph(previous, page)
+            except ValueError:
+                old = None
+        moves = plan_moves(model, _unchanged(model, old), config)
+        if not moves:
+            continue
+        operations = [
+            {"op": "update", "id": model.ids[i], "geometry": {"x": _number(x), "y": _number(y)}}
+            for i, (x, y) in sorted(moves.items())
+        ]
+        content = apply_patch(content, operations, page)
+        moved += len(moves)
+    return content, moved
@@ -0,0 +1,150 @@
+import binascii
+import re
+import zlib
+from typing import Iterable, Iterator, Optional
+from app.services.drawio_xml import parse_xml, to_xml
+
+# 与drawio的Graph.compress/Graph.decompress一致：
+# encodeURIComponent -> deflateRaw -> base64，解码时按相反顺序
+CHUNK_SIZE = 64 * 1024
+# 解压后的最大字节数，防止恶意构造的压缩数据耗尽内存
+MAX_INFLATED_SIZE = 64 * 1024 * 1024
+# encodeURIComponent不转义的字符（字母数字之外）
+URI_SAFE = "-_.!~*'()"
+
+# <diagram>的内容以base64字符开头，说明页面是压缩格式
+_COMPRESSED_PAGE = re.compile(r"<diagram\b[^>]*>\s*[A-Za-z0-9+/=]")
+
+def _iter_inflate(raw: memoryview, chunk_size: int, max_size: int) -> Iterator[bytes]:
+    """按块解压原始deflate数据（wbits=-15），切片使用memoryview避免复制"""
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    total = 0
+    for start in range(0, len(raw), chunk_size):
+        out = inflater.decompress(raw[start:start + chunk_size])
+        total += len(out)
+        if total > max_size:
+            raise ValueError(f"解压后的图表超过{max_size}字节")
+        if out:
+            yield out
+    tail = inflater.flush()
+    if tail:
+        yield tail
+    if not inflater.eof:
+        raise ValueError("压缩的图表数据不完整")
+
+# encodeURIComponent的输出中除%XX外只有不需转义的字符，不会出现"="、空格和换行，
+# 因此把"%"换成"="后可以直接用C实现的quoted-printable解码完成URI解码
+_PERCENT_TO_QP = bytes.maketrans(b"%", b"=")
+# 按字节查表完成URI编码，比urllib.parse.quote逐字符查字典更快
+_QUOTE_TABLE = [
+    chr(i) if chr(i).isascii() and (chr(i).isalnum() or chr(i) in URI_SAFE) else f"%{i:02X}"
+    for i in range(256)
+]
+
+def _iter_unquote(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """按块进行URI解码，被块边界截断的%XX转义留到下一块"""
+    carry = b""
+    for chunk in chunks:
+        if carry:
+            chunk = carry + chunk
+            carry = b""
+        cut = chunk.find(b"%", len(chunk) - 2)
+        if cut != -1:
+            carry = chunk[cut:]
+            chunk = chunk[:cut]
+        yield binascii.a2b_qp(chunk.translate(_PERCENT_TO_QP))
+    if carry:
+        yield binascii.a2b_qp(carry.translate(_PERCENT_TO_QP))
+
+def decompress_diagram(
+    data: str,
+    chunk_size: int = CHUNK_SIZE,
+    max_size: int = MAX_INFLATED_SIZE
+) -> str:
+    """
+    解压drawio压缩格式的页面内容
+
+    Args:
+        data: <diagram>中的base64文本
+        chunk_size: 每次解压的输入块大小
+        max_size: 解压后允许的最大字节数
+
+    Returns:
+        str: 页面的<mxGraphModel> XML
+
+    Raises:
+        ValueError: 数据不是合法的压缩格式
+    """
+    try:
+        raw = binascii.a2b_base64(data.encode("ascii"))
+        out = bytearray()
+        for chunk in _iter_unquote(_iter_inflate(memoryview(raw), chunk_size, max_size)):
+            out += chunk
+        return out.decode("utf-8")
+    except (binascii.Error, zlib.error, UnicodeError) as e:
+        raise ValueError(f"图表解压失败: {e}")
+
+def compress_diagram(xml: str, level: int = 6, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    将<mxGraphModel> XML压缩为drawio的页面格式
+
+    Args:
+        xml: 页面XML
+        level: zlib压缩级别
+        chunk_size: 每次压缩的输入块大小
+
+    Returns:
+        str: base64文本，可直接写入<diagram>
+    """
+    view = memoryview(xml.encode("utf-8"))
+    deflater = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    parts = []
+    for start in range(0, len(view), chunk_size):
+        # 逐块URI编码后送入压缩器，不生成完整的编码中间结果
+        quoted = "".join(map(_QUOTE_TABLE.__getitem__, view[start:start + chunk_size]))
+        parts.append(deflater.compress(quoted.encode("ascii")))
+    parts.append(deflater.flush())
+    return binascii.b2a_base64(b"".join(parts), newline=False).decode("ascii")
+
+def is_compressed(content: Optional[str]) -> bool:
+    """判断drawio文件中是否有压缩格式的页面"""
+    return bool(content) and _COMPRESSED_PAGE.search(content) is not None
+
+def inflate_mxfile(content: str) -> str:
+    """
+    将<mxfile>中所有压缩页面展开为明文<mxGraphModel>
+
+    没有压缩页面时原样返回，不做解析。
+
+    Raises:
+        ValueError: XML或压缩数据不合法
+    """
+    if not is_compressed(content):
+        return content
+    root = parse_xml(content)
+    for page in root.findall("diagram"):
+        if page.find("mxGraphModel") is not None or not (page.text or "").strip():
+            continue
+        model = parse_xml(decompress_diagram(page.text.strip()))
+        page.text = None
+        page.append(model)
+    root.attrib.pop("compressed", None)
+    return to_xml(root)
+
+def compress_mxfile(content: str, level: int = 6) -> str:
+    """
+    将<mxfile>中的明文页面压缩为drawio的压缩格式
+
+    Raises:
+        ValueError: XML不合法
+    """
+    root = parse_xml(content)
+    if root.tag != "mxfile":
+        return content
+    for page in root.findall("diagram"):
+        model = page.find("mxGraphModel")
+        if model is None:
+            continue
+        page.remove(model)
+        page.text = compress_diagram(to_xml(model), level)
+    return to_xml(root)
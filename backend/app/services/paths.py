@@ -0,0 +1,13 @@
+import os
+
+# backend目录：配置中的相对路径都以它为基准，与进程的工作目录无关
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def resolve_path(path: str) -> str:
+    """解析配置中的文件路径：空字符串原样返回（表示不使用），相对路径相对于backend目录"""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(BACKEND_DIR, path)
+
+# 数据库、预览缓存等数据文件的默认目录
+DATA_DIR = resolve_path(os.getenv("DATA_DIR", "data"))
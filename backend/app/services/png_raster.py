@@ -0,0 +1,284 @@
+import math
+import re
+import struct
+import zlib
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Tuple
+from app.services.svg_renderer import text_width, DEFAULT_FONT_SIZE
+
+# cairosvg为可选依赖（pip install cairosvg），未安装时使用内置的简易光栅化器
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+# 曲线（椭圆、圆角、弧线）折线化时每段的最大像素长度
+CURVE_STEP = 4.0
+
+Color = Tuple[int, int, int]
+Point = Tuple[float, float]
+
+NAMED_COLORS = {
+    "white": (255, 255, 255), "black": (0, 0, 0), "red": (255, 0, 0), "green": (0, 128, 0),
+    "blue": (0, 0, 255), "yellow": (255, 255, 0), "gray": (128, 128, 128), "grey": (128, 128, 128),
+    "orange": (255, 165, 0), "purple": (128, 0, 128),
+}
+
+def parse_color(value: Optional[str]) -> Optional[Color]:
+    """解析#rgb/#rrggbb和常用颜色名，none或无法识别的值返回None"""
+    if not value or value == "none":
+        return None
+    value = value.strip().lower()
+    if value.startswith("#"):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = "".join(ch * 2 for ch in digits)
+        if len(digits) == 6:
+            try:
+                return (int(digits[0:2], 16), int(digits[2:4], 16), int(digits[4:6], 16))
+            except ValueError:
+                return None
+        return None
+    return NAMED_COLORS.get(value)
+
+def encode_png(width: int, height: int, pixels: bytes, level: int = 6) -> bytes:
+    """将RGB像素编码为PNG（每行过滤类型为0）"""
+    stride = width * 3
+    raw = b"".join(b"\x00" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, level))
+            + chunk(b"IEND", b""))
+
+class Canvas:
+    """RGB画布，按扫描线填充多边形（无抗锯齿）"""
+
+    def __init__(self, width: int, height: int, background: Color):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    def fill_polygon(self, points: List[Point], color: Color) -> None:
+        """奇偶规则填充，每条扫描线以切片赋值写入整段像素"""
+        if len(points) < 3:
+            return
+        edges = []
+        for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+            if y0 != y1:
+                if y0 > y1:
+                    x0, y0, x1, y1 = x1, y1, x0, y0
+                edges.append((y0, y1, x0, (x1 - x0) / (y1 - y0)))
+        if not edges:
+            return
+        top = max(int(math.floor(min(e[0] for e in edges))), 0)
+        bottom = min(int(math.ceil(max(e[1] for e in edges))), self.height)
+        pixel = bytes(color)
+        for row in range(top, bottom):
+            y = row + 0.5
+            xs = sorted(x0 + (y - y0) * slope for y0, y1, x0, slope in edges if y0 <= y < y1)
+            offset = row * self.width
+            for i in range(0, len(xs) - 1, 2):
+                start = max(int(math.ceil(xs[i] - 0.5)), 0)
+                end = min(int(math.floor(xs[i + 1] - 0.5)) + 1, self.width)
+                if end > start:
+                    self.pixels[(offset + start) * 3:(offset + end) * 3] = pixel * (end - start)
+
+    def stroke(self, points: List[Point], color: Color, width: float, closed: bool = False) -> None:
+        """沿折线逐段绘制宽度为width的四边形"""
+        if closed and points:
+            points = points + points[:1]
+        half = max(width, 1.0) / 2
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            length = math.hypot(x1 - x0, y1 - y0)
+            if length == 0:
+                continue
+            # 两端各延长半个线宽，使折线拐角处没有缺口
+            ux, uy = (x1 - x0) / length * half, (y1 - y0) / length * half
+            nx, ny = -uy, ux
+            self.fill_polygon([(x0 - ux + nx, y0 - uy + ny), (x1 + ux + nx, y1 + uy + ny),
+                               (x1 + ux - nx, y1 + uy - ny), (x0 - ux - nx, y0 - uy - ny)], color)
+
+    def png(self) -> bytes:
+        return encode_png(self.width, self.height, bytes(self.pixels))
+
+def _ellipse_points(cx: float, cy: float, rx: float, ry: float) -> List[Point]:
+    steps = max(12, int(2 * math.pi * max(rx, ry) / CURVE_STEP))
+    return [(cx + rx * math.cos(2 * math.pi * i / steps), cy + ry * math.sin(2 * math.pi * i / steps))
+            for i in range(steps)]
+
+def _rounded_rect_points(x: float, y: float, w: float, h: float, r: float) -> List[Point]:
+    r = min(r, w / 2, h / 2)
+    if r <= 0:
+        return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+    steps = max(2, int(math.pi * r / 2 / CURVE_STEP))
+    points = []
+    for cx, cy, start in ((x + w - r, y + r, -90), (x + w - r, y + h - r, 0),
+                          (x + r, y + h - r, 90), (x + r, y + r, 180)):
+        for i in range(steps + 1):
+            angle = math.radians(start + 90 * i / steps)
+            points.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+    return points
+
+def _arc_points(start: Point, rx: float, ry: float, large: bool, sweep: bool, end: Point) -> List[Point]:
+    """
+    SVG椭圆弧（不含旋转）折线化，按SVG规范由端点参数换算圆心参数
+
+    Returns:
+        List[Point]: 不含起点的折线点
+    """
+    (x1, y1), (x2, y2) = start, end
+    if rx == 0 or ry == 0:
+        return [end]
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    scale = (dx / rx) ** 2 + (dy / ry) ** 2
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    num = rx * rx * ry * ry - rx * rx * dy * dy - ry * ry * dx * dx
+    den = rx * rx * dy * dy + ry * ry * dx * dx
+    coef = math.sqrt(max(num, 0) / den) if den else 0.0
+    if large == sweep:
+        coef = -coef
+    cx = coef * rx * dy / ry + (x1 + x2) / 2
+    cy = -coef * ry * dx / rx + (y1 + y2) / 2
+    theta = math.atan2((y1 - cy) / ry, (x1 - cx) / rx)
+    delta = math.atan2((y2 - cy) / ry, (x2 - cx) / rx) - theta
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+    steps = max(2, int(abs(delta) * max(rx, ry) / CURVE_STEP))
+    return [(cx + rx * math.cos(theta + delta * i / steps), cy + ry * math.sin(theta + delta * i / steps))
+            for i in range(1, steps + 1)]
+
+_PATH_TOKEN = re.compile(r"[MLAZmlaz]|-?\d*\.?\d+(?:e-?\d+)?")
+
+def _path_subpaths(d: str) -> List[Tuple[List[Point], bool]]:
+    """解析svg_renderer输出的路径（M/L/A/Z绝对坐标），返回[(点列表, 是否闭合)]"""
+    tokens = _PATH_TOKEN.findall(d)
+    subpaths: List[Tuple[List[Point], bool]] = []
+    points: List[Point] = []
+    i = 0
+    command = "M"
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i].upper()
+            i += 1
+            if command == "Z":
+                if points:
+                    subpaths.append((points, True))
+                points = []
+                continue
+        try:
+            if command == "M":
+                if points:
+                    subpaths.append((points, False))
+                points = [(float(tokens[i]), float(tokens[i + 1]))]
+                i += 2
+                command = "L"
+            elif command == "L":
+                points.append((float(tokens[i]), float(tokens[i + 1])))
+                i += 2
+            elif command == "A":
+                rx, ry, _, large, sweep, x, y = (float(t) for t in tokens[i:i + 7])
+                points.extend(_arc_points(points[-1], rx, ry, bool(large), bool(sweep), (x, y)))
+                i += 7
+            else:
+                i += 1
+        except (IndexError, ValueError):
+            break
+    if points:
+        subpaths.append((points, False))
+    return subpaths
+
+def _numbers(text: str) -> List[float]:
+    return [float(v) for v in re.findall(r"-?\d*\.?\d+(?:e-?\d+)?", text or "")]
+
+class _Rasterizer:
+    """把svg_renderer生成的SVG子集绘制到画布上，文字以色块示意"""
+
+    def __init__(self, svg: ET.Element, width: int, height: int):
+        view = _numbers(svg.get("viewBox")) or [0, 0, _numbers(svg.get("width"))[0], _numbers(svg.get("height"))[0]]
+        self.min_x, self.min_y, view_w, view_h = view
+        self.scale = min(width / view_w, height / view_h) if view_w and view_h else 1.0
+        self.canvas = Canvas(width, height, (255, 255, 255))
+        self.svg = svg
+
+    def _map(self, points: List[Point]) -> List[Point]:
+        s = self.scale
+        return [((x - self.min_x) * s, (y - self.min_y) * s) for x, y in points]
+
+    def _paint(self, elem: ET.Element, points: List[Point], closed: bool) -> None:
+        points = self._map(points)
+        fill = parse_color(elem.get("fill"))
+        opacity = _numbers(elem.get("opacity") or elem.get("fill-opacity") or "1")[0]
+        if closed and fill is not None and opacity > 0.05:
+            if opacity < 1:
+                # 只与页面背景混合，不处理与下层形状的叠加
+                bg = self.canvas.background
+                fill = tuple(int(bg[i] + (fill[i] - bg[i]) * opacity) for i in range(3))
+            self.canvas.fill_polygon(points, fill)
+        stroke = parse_color(elem.get("stroke"))
+        if stroke is not None:
+            width = _numbers(elem.get("stroke-width") or "1")[0] * self.scale
+            self.canvas.stroke(points, stroke, width, closed)
+
+    def _text(self, elem: ET.Element) -> None:
+        """每行文字画成一条与字色相近的浅色横条"""
+        color = parse_color(elem.get("fill")) or (0, 0, 0)
+        bg = self.canvas.background
+        color = tuple(int(bg[i] + (color[i] - bg[i]) * 0.55) for i in range(3))
+        font_size = (_numbers(elem.get("font-size") or "") or [DEFAULT_FONT_SIZE])[0]
+        anchor = elem.get("text-anchor", "start")
+        for tspan in elem.iter(f"{SVG_NS}tspan"):
+            text = tspan.text or ""
+            if not text.strip():
+                continue
+            x, y = float(tspan.get("x", 0)), float(tspan.get("y", 0))
+            width = text_width(text, font_size)
+            left = {"middle": x - width / 2, "end": x - width}.get(anchor, x)
+            h = font_size * 0.3
+            self.canvas.fill_polygon(self._map([(left, y - h), (left + width, y - h),
+                                                (left + width, y + h), (left, y + h)]), color)
+
+    def run(self) -> bytes:
+        for elem in self.svg:
+            tag = elem.tag.replace(SVG_NS, "")
+            n = lambda key: float(elem.get(key, 0))
+            if tag == "rect":
+                self._paint(elem, _rounded_rect_points(n("x"), n("y"), n("width"), n("height"), n("rx")), True)
+            elif tag == "ellipse":
+                self._paint(elem, _ellipse_points(n("cx"), n("cy"), n("rx"), n("ry")), True)
+            elif tag == "circle":
+                self._paint(elem, _ellipse_points(n("cx"), n("cy"), n("r"), n("r")), True)
+            elif tag in ("polygon", "polyline"):
+                values = _numbers(elem.get("points"))
+                self._paint(elem, list(zip(values[0::2], values[1::2])), tag == "polygon")
+            elif tag == "line":
+                self._paint(elem, [(n("x1"), n("y1")), (n("x2"), n("y2"))], False)
+            elif tag == "path":
+                for points, closed in _path_subpaths(elem.get("d", "")):
+                    self._paint(elem, points, closed)
+            elif tag == "text":
+                self._text(elem)
+        return self.canvas.png()
+
+def svg_size(svg: str) -> Tuple[float, float]:
+    root = ET.fromstring(svg)
+    return _numbers(root.get("width"))[0], _numbers(root.get("height"))[0]
+
+def rasterize_svg(svg: str, width: int, height: int) -> bytes:
+    """
+    将SVG光栅化为指定尺寸的PNG
+
+    安装了cairosvg时使用其完整渲染（含文字），否则使用内置光栅化器，
+    只支持svg_renderer输出的元素，文字以色块示意。
+    """
+    if cairosvg is not None:
+        return cairosvg.svg2png(bytestring=svg.encode("utf-8"), output_width=width, output_height=height)
+    return _Rasterizer(ET.fromstring(svg), width, height).run()
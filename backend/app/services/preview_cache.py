@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+from app.services.paths import DATA_DIR, resolve_path
+
+@dataclass
+class PreviewCacheConfig:
+    """预览缓存配置，默认值可通过环境变量覆盖"""
+    memory_entries: int = int(os.getenv("DIAGRAM_PREVIEW_CACHE_SIZE", "256"))
+    # 为空时不使用磁盘缓存
+    cache_dir: str = resolve_path(os.getenv("DIAGRAM_PREVIEW_DIR", os.path.join(DATA_DIR, "previews")))
+
+class PreviewCache:
+    """
+    预览图两级缓存：进程内LRU + 磁盘文件
+
+    键由调用方按内容哈希生成（内容不变则键不变），因此缓存项不需要失效处理。
+    磁盘文件先写临时文件再原子替换，多个worker进程可以共享同一个缓存目录。
+    """
+
+    def __init__(self, config: Optional[PreviewCacheConfig] = None):
+        self.config = config or PreviewCacheConfig()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.config.cache_dir:
+            return None
+        return os.path.join(self.config.cache_dir, key[:2], key)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(self.config.memory_entries, 0):
+            self._entries.popitem(last=False)
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        """只查内存缓存"""
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """依次查内存和磁盘缓存，磁盘命中时放入内存"""
+        data = self.lookup(key)
+        if data is not None:
+            self.stats["hits"] += 1
+            return data
+        path = self._path(key)
+        if path is not None:
+            data = await asyncio.to_thread(self._read, path)
+            if data is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, data)
+                return data
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        """写入两级缓存"""
+        path = self._path(key)
+        if path is not None:
+            await asyncio.to_thread(self._write, path, data)
+        self._remember(key, data)
+
+    async def get_or_create(self, key: str, create: Callable[[], bytes]) -> bytes:
+        """
+        读取缓存，未命中时在线程池中调用create生成并写入两级缓存
+
+        Args:
+            key: 缓存键（可作为文件名，包含扩展名）
+            create: 生成预览的同步函数
+        """
+        data = await self.get(key)
+        if data is None:
+            data = await asyncio.to_thread(create)
+            await self.put(key, data)
+        return data
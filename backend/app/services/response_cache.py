@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from app.services.drawio_xml import parse_xml
+from app.services.mxfile_codec import inflate_mxfile
+from app.services.paths import resolve_path
+from app.services.sse import SSEConfig, SSEEncoder, TRANSIENT_EVENTS, dumps
+
+# <mxfile>上每次保存都会变化的属性（修改时间、etag、客户端信息等）以及<mxGraphModel>上的视口位置，
+# 与图表内容无关，计算哈希时去掉
+_VOLATILE_MODEL_ATTRS = ("dx", "dy")
+_SPACE = re.compile(r"\s+")
+
+@dataclass
+class ResponseCacheConfig:
+    """生成结果缓存配置，默认值可通过环境变量覆盖"""
+    enabled: bool = os.getenv("RESPONSE_CACHE", "1") == "1"
+    # 内存中缓存的结果数
+    max_entries: int = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+    # 缓存有效期（秒）
+    ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    # SQLite二级缓存文件，为空时只缓存在内存中
+    db_path: str = resolve_path(os.getenv("RESPONSE_CACHE_DB", ""))
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化需求文字：全角/半角统一（NFKC），合并空白"""
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", prompt or "")).strip()
+
+def diagram_hash(current_drawio: Optional[str]) -> str:
+    """
+    当前图表的规范化哈希
+
+    展开压缩页面，去掉<mxfile>上的属性和视口位置，再按C14N规范化（属性排序、去掉空白文本），
+    同一图表无论是否压缩、属性顺序和缩进如何，哈希都相同。无法解析时按原文计算。
+    """
+    if not current_drawio:
+        return ""
+    try:
+        root = parse_xml(inflate_mxfile(current_drawio))
+        if root.tag == "mxfile":
+            root.attrib.clear()
+        for model in root.iter("mxGraphModel"):
+            for attr in _VOLATILE_MODEL_ATTRS:
+                model.attrib.pop(attr, None)
+        canonical = ET.canonicalize(ET.tostring(root, encoding="unicode"), strip_text=True)
+    except ValueError:
+        canonical = current_drawio
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def cache_key(model_name: str, diagram_type: str, user_prompt: str, current_drawio: Optional[str], **options: Any) -> str:
+    """
+    生成请求的缓存键
+
+    Args:
+        options: 其他影响结果的请求参数（编辑方式、是否压缩等）
+    """
+    parts = [model_name, diagram_type, normalize_prompt(user_prompt), diagram_hash(current_drawio), sorted(options.items())]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class RecordingEncoder(SSEEncoder):
+    """记录发送过的事件（同类型的连续增量合并为一条），生成成功后连同结果写入缓存，命中时重放"""
+
+    def __init__(self, config: Optional[SSEConfig] = None, clock: Callable[[], float] = time.monotonic):
+        super().__init__(config, clock)
+        self.events: List[Dict[str, Any]] = []
+
+    def delta(self, kind: str, text: str) -> List[str]:
+        if text:
+            last = self.events[-1] if self.events else None
+            if last is not None and last.get("delta") and last["type"] == kind:
+                last["content"] += text
+            else:
+                self.events.append({"type": kind, "content": text, "delta": True})
+        return super().delta(kind, text)
+
+    def event(self, data: Dict[str, Any]) -> List[str]:
+        # 序列化一次保存快照，之后对data的修改不影响记录
+        if data.get("type") not in TRANSIENT_EVENTS:
+            self.events.append({"data": json.loads(dumps(data))})
+        return super().event(data)
+
+def replay_events(events: List[Dict[str, Any]], sse: SSEEncoder) -> List[str]:
+    """用新的编码器重放记录的事件，帧格式与实时生成时一致"""
+    frames = []
+    for event in events:
+        if event.get("delta"):
+            frames.extend(sse.delta(event["type"], event["content"]))
+            frames.extend(sse.flush())
+        else:
+            frames.extend(sse.event(event["data"]))
+    return frames
+
+class ResponseCache:
+    """
+    生成结果的精确匹配缓存：进程内LRU + 可选的SQLite二级缓存，均按TTL过期
+
+    键由cache_key生成；缓存项为{"result": 结果, "events": 流式事件或None}，以序列化后的形式保存，
+    调用方拿到的总是独立的副本。SQLite文件可以被多个worker进程共享。
+    """
+
+    def __init__(self, config: Optional[ResponseCacheConfig] = None, clock: Callable[[], float] = time.time):
+        self.config = config or ResponseCacheConfig()
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if self.config.enabled and self.config.db_path:
+            self._open()
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.config.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.config.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)")
+        self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (self._clock(),))
+
+    def _remember(self, key: str, expires_at: float, data: bytes) -> None:
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(self.config.max_entries, 0):
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT expires_at, data FROM response_cache WHERE key = ? AND expires_at >= ?", (key, self._clock())
+            ).fetchone()
+        return (row[0], zlib.decompress(row[1])) if row is not None else None
+
+    def _db_put(self, key: str, expires_at: float, data: bytes) -> None:
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, expires_at, data) VALUES (?, ?, ?)",
+                (key, expires_at, zlib.compress(data))
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (self._clock(),))
+
+    def _db_delete(self, key: str) -> None:
+        with self._db_lock:
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """依次查内存和SQLite，SQLite命中时放入内存；过期或不存在时返回None"""
+        if not self.config.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < self._clock():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        elif self._conn is not None:
+            entry = await asyncio.to_thread(self._db_get, key)
+            if entry is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, *entry)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        return json.loads(entry[1])
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        """写入缓存（立即序列化，之后对value的修改不影响缓存）"""
+        if not self.config.enabled:
+            return
+        data = dumps(value).encode("utf-8")
+        expires_at = self._clock() + self.config.ttl
+        self._remember(key, expires_at, data)
+        self.stats["stores"] += 1
+        if self._conn is not None:
+            try:
+                await asyncio.to_thread(self._db_put, key, expires_at, data)
+            except sqlite3.Error as e:
+                print("生成结果写入缓存失败:", e)
+
+    async def invalidate(self, key: str) -> None:
+        """删除缓存项（如结果引用的图表已被删除）"""
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            await asyncio.to_thread(self._db_delete, key)
+
+    async def aclose(self) -> None:
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
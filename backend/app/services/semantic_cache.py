@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# sentence-transformers为可选依赖（pip install sentence-transformers），配置了SEMANTIC_CACHE_MODEL且已安装时
+# 使用本地嵌入模型（可匹配跨语言的同义需求），否则使用哈希向量
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# 哈希向量的维数（2^20，稀疏保存）
+HASH_BITS = 20
+
+# 对需求含义没有区分度的常见词，不参与向量
+STOP_WORDS = {
+    "画", "一个", "一张", "个", "张", "图", "的", "请", "帮我", "帮忙", "生成", "绘制", "我", "想要", "需要", "关于",
+    "a", "an", "the", "of", "for", "to", "please", "draw", "create", "make", "generate", "me", "diagram", "chart",
+}
+
+_CJK = re.compile(r"[㐀-鿿]+")
+_WORD = re.compile(r"[a-z][a-z0-9_\-]*")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_CJK_STOP_WORDS = sorted((word for word in STOP_WORDS if len(word) > 1 and _CJK.fullmatch(word)), key=len, reverse=True)
+
+def _parse_thresholds(text: str) -> Dict[str, float]:
+    """解析"模型=阈值,模型=阈值"格式的配置"""
+    thresholds = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            thresholds[name.strip()] = float(value)
+    return thresholds
+
+@dataclass
+class SemanticCacheConfig:
+    """语义缓存配置，默认值可通过环境变量覆盖"""
+    enabled: bool = os.getenv("SEMANTIC_CACHE", "1") == "1"
+    # 缓存的结果数，超出时淘汰最久未命中的
+    max_entries: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    # 余弦相似度达到该值视为同一需求
+    threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+    # 按模型覆盖阈值，如"deepseek-reasoner=0.85,glm-4-plus=0.75"
+    thresholds: Dict[str, float] = field(
+        default_factory=lambda: _parse_thresholds(os.getenv("SEMANTIC_CACHE_THRESHOLDS", ""))
+    )
+    # 本地嵌入模型名称（sentence-transformers），为空时使用哈希向量
+    model_name: str = os.getenv("SEMANTIC_CACHE_MODEL", "")
+
+    def threshold_for(self, model: str) -> float:
+        return self.thresholds.get(model, self.threshold)
+
+def _tokens(text: str) -> List[str]:
+    """中文按单字和相邻两字切分，英文按单词和相邻两词切分，去掉停用词"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _CJK.findall(text):
+        for word in _CJK_STOP_WORDS:
+            run = run.replace(word, " ")
+        for part in run.split():
+            chars = [c for c in part if c not in STOP_WORDS]
+            tokens.extend(chars)
+            tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    words = [word for word in _WORD.findall(text) if word not in STOP_WORDS]
+    tokens.extend(words)
+    tokens.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+def hash_vector(text: str) -> Dict[int, float]:
+    """
+    需求文字的哈希向量（带符号的特征哈希，L2归一化）
+
+    Returns:
+        Dict[int, float]: 稀疏向量，维度 -> 值
+    """
+    vector: Dict[int, float] = {}
+    for token in _tokens(text):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        dim = h & ((1 << HASH_BITS) - 1)
+        vector[dim] = vector.get(dim, 0.0) + (1.0 if h >> 63 else -1.0)
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {dim: v / norm for dim, v in vector.items() if v} if norm else {}
+
+def numbers(text: str) -> Tuple[str, ...]:
+    """需求中出现的数字（"3个步骤"与"5个步骤"的图表不同，数字不一致时不命中）"""
+    return tuple(sorted(_NUMBER.findall(unicodedata.normalize("NFKC", text))))
+
+class _Entry:
+    __slots__ = ("model", "diagram_type", "compress", "numbers", "vector", "result")
+
+    def __init__(self, model, diagram_type, compress, numbers, vector, result):
+        self.model = model
+        self.diagram_type = diagram_type
+        self.compress = compress
+        self.numbers = numbers
+        self.vector = vector
+        self.result = result
+
+class SemanticCache:
+    """
+    新建图表请求的语义缓存
+
+    需求文字转为向量（哈希向量或本地嵌入模型），按维度建立倒排表，查找时只累加与请求向量有共同维度的条目，
+    余弦相似度达到模型对应的阈值、且图表类型和需求中的数字一致时命中。
+    命中结果附带entry_id，前端发现结果不符合需求时可以报告误命中，条目随即删除并计入统计。
+    """
+
+    def __init__(self, config: Optional[SemanticCacheConfig] = None):
+        self.config = config or SemanticCacheConfig()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[int, Dict[str, float]] = {}
+        self._model = None
+        if self.config.enabled and self.config.model_name:
+            if SentenceTransformer is None:
+                print("未安装sentence-transformers，语义缓存使用哈希向量")
+            else:
+                self._model = SentenceTransformer(self.config.model_name)
+        # 按模型统计：查找次数、命中次数、报告的误命中次数
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _embed(self, text: str) -> Dict[int, float]:
+        if self._model is None:
+            return hash_vector(text)
+        values = self._model.encode(text, normalize_embeddings=True)
+        return {dim: float(v) for dim, v in enumerate(values) if v}
+
+    async def embed(self, text: str) -> Dict[int, float]:
+        """计算需求向量，使用嵌入模型时在线程池中执行"""
+        if self._model is None:
+            return hash_vector(text)
+        return await asyncio.to_thread(self._embed, text)
+
+    def _count(self, model: str, name: str) -> None:
+        stats = self._stats.setdefault(model, {"lookups": 0, "hits": 0, "false_hits": 0})
+        stats[name] += 1
+
+    async def lookup(
+        self,
+        model: str,
+        diagram_type: str,
+        prompt: str,
+        compress: bool
+    ) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        """
+        查找相同含义的需求
+
+        Returns:
+            Optional[Tuple[str, float, Dict[str, Any]]]: (entry_id, 相似度, 结果副本)，未命中时返回None
+        """
+        if not self.config.enabled:
+            return None
+        self._count(model, "lookups")
+        vector = await self.embed(prompt)
+        scores: Dict[str, float] = {}
+        for dim, value in vector.items():
+            for entry_id, weight in self._postings.get(dim, {}).items():
+                scores[entry_id] = scores.get(entry_id, 0.0) + value * weight
+        threshold = self.config.threshold_for(model)
+        prompt_numbers = numbers(prompt)
+        best = None
+        for entry_id, score in scores.items():
+            entry = self._entries[entry_id]
+            if (score >= threshold and (best is None or score > best[1]) and entry.model == model
+                    and entry.diagram_type == diagram_type and entry.compress == compress
+                    and entry.numbers == prompt_numbers):
+                best = (entry_id, score)
+        if best is None:
+            return None
+        self._count(model, "hits")
+        self._entries.move_to_end(best[0])
+        return best[0], min(best[1], 1.0), dict(self._entries[best[0]].result)
+
+    async def add(self, model: str, diagram_type: str, prompt: str, compress: bool, result: Dict[str, Any]) -> Optional[str]:
+        """缓存生成结果，返回entry_id；需求没有可用的特征时不缓存"""
+        if not self.config.enabled:
+            return None
+        vector = await self.embed(prompt)
+        if not vector:
+            return None
+        entry_id = uuid.uuid4().hex
+        self._entries[entry_id] = _Entry(model, diagram_type, compress, numbers(prompt), vector, dict(result))
+        for dim, value in vector.items():
+            self._postings.setdefault(dim, {})[entry_id] = value
+        while len(self._entries) > max(self.config.max_entries, 0):
+            self.remove(next(iter(self._entries)))
+        return entry_id
+
+    def remove(self, entry_id: str) -> bool:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return False
+        for dim in entry.vector:
+            postings = self._postings[dim]
+            postings.pop(entry_id, None)
+            if not postings:
+                del self._postings[dim]
+        return True
+
+    def report_false_hit(self, entry_id: str) -> bool:
+        """报告误命中：删除条目并计入该模型的误命中数，条目不存在时返回False"""
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return False
+        self._count(entry.model, "false_hits")
+        return self.remove(entry_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        """按模型统计的命中率和误命中率（误命中数/命中数）"""
+        models = {}
+        for model, stats in self._stats.items():
+            models[model] = {
+                **stats,
+                "threshold": self.config.threshold_for(model),
+                "hit_rate": stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0,
+                "false_hit_rate": stats["false_hits"] / stats["hits"] if stats["hits"] else 0.0
+            }
+        return {"entries": len(self._entries), "embedding": self.config.model_name or "hashing", "models": models}
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import random
+import re
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Set
+from app.services.diagram_text import plain_text
+from app.services.drawio_xml import parse_xml
+from app.services.graph_model import GraphModel, parse_graph, KIND_VERTEX
+from app.services.svg_renderer import parse_style
+
+# MinHash签名长度，分为BANDS段做LSH，每段ROWS个值
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+# 置换参数固定，签名可以持久化并跨进程比较
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SPACE = re.compile(r"\s+")
+
+@dataclass
+class SimilarityConfig:
+    """相似图表检索配置，默认值可通过环境变量覆盖"""
+    # 返回结果的最低相似度（估计的Jaccard系数）
+    threshold: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
+    # 新图表的需求与已生成图表的需求相似度达到该值时直接复用，不调用模型；默认大于1，即关闭复用
+    # （重复的需求由语义缓存处理，它有TTL、命中统计和误命中反馈），需要时配置为如0.9
+    reuse_threshold: float = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "1.1"))
+    # 达到该值时把相似图表作为参考放入提示词
+    seed_threshold: float = float(os.getenv("SIMILARITY_SEED_THRESHOLD", "0.5"))
+
+def _shingles(prefix: str, text: str) -> Iterable[str]:
+    """文字的3字符切片，不足3个字符时取整段"""
+    text = _SPACE.sub("", plain_text(text)).lower()
+    if len(text) < 3:
+        if text:
+            yield prefix + text
+        return
+    for i in range(len(text) - 2):
+        yield prefix + text[i:i + 3]
+
+def _shape(model: GraphModel, i: int) -> str:
+    """顶点的形状类别"""
+    style = parse_style(model.style(i))
+    shape = style.get("shape", "rect")
+    if shape == "rect" and style.get("rounded") == "1":
+        return "rounded"
+    return shape
+
+def _model_features(model: GraphModel, features: Counter) -> None:
+    for i in model.vertices():
+        label = model.label(i)
+        if label:
+            features.update(_shingles("l:", label))
+        features["v:" + _shape(model, i)] += 1
+    for i in model.edges():
+        source, target = model.sources[i], model.targets[i]
+        style = parse_style(model.style(i))
+        kind = style.get("endArrow", "classic") + (":dashed" if style.get("dashed") == "1" else "")
+        ends = (_shape(model, source) if source >= 0 and model.kinds[source] == KIND_VERTEX else "_",
+                _shape(model, target) if target >= 0 and model.kinds[target] == KIND_VERTEX else "_")
+        features[f"e:{ends[0]}>{ends[1]}:{kind}"] += 1
+        label = model.label(i)
+        if label:
+            features.update(_shingles("l:", label))
+
+def diagram_features(content: str) -> Set[str]:
+    """
+    提取图表的结构特征
+
+    包括所有页面中单元文字的3字符切片、顶点形状，以及连线的"起点形状>终点形状:箭头"模式。
+    重复出现的特征按出现次数编号（如"v:rhombus#2"），相当于按多重集合计算Jaccard系数。
+
+    Raises:
+        ValueError: 图表内容无法解析
+    """
+    pages = len(parse_xml(content).findall("diagram")) or 1
+    features: Counter = Counter()
+    for page in range(pages):
+        try:
+            model = parse_graph(content, page)
+        except ValueError:
+            if page == 0:
+                raise
+            continue
+        _model_features(model, features)
+    return {f"{feature}#{n}" for feature, count in features.items() for n in range(count)}
+
+def text_features(text: str) -> Set[str]:
+    """需求文字的3字符切片"""
+    return set(_shingles("t:", text))
+
+def _hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+def minhash(features: Iterable[str]) -> array:
+    """
+    计算MinHash签名
+
+    每个特征只做一次64位哈希，再用NUM_PERM个(a*x+b) mod p的置换取最小值。
+
+    Returns:
+        array: NUM_PERM个无符号64位整数，没有特征时全为最大值
+    """
+    hashes = [_hash(feature) for feature in features]
+    if not hashes:
+        return array("Q", [_MAX_HASH] * NUM_PERM)
+    return array("Q", [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS])
+
+def lsh_buckets(signature: array) -> List[int]:
+    """
+    签名的LSH分段桶号
+
+    两个签名在任一段上完全相同即成为候选。Jaccard系数为s时成为候选的概率为1-(1-s^ROWS)^BANDS，
+    ROWS=4、BANDS=32时s=0.5约为0.87，s=0.3约为0.23。
+
+    Returns:
+        List[int]: 每段一个有符号64位整数（可直接存入SQLite INTEGER）
+    """
+    buckets = []
+    for band in range(BANDS):
+        data = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        buckets.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True))
+    return buckets
+
+def similarity(a: array, b: array) -> float:
+    """由签名估计Jaccard系数"""
+    if a[0] == _MAX_HASH and b[0] == _MAX_HASH:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+def pack_signature(signature: array) -> bytes:
+    return signature.tobytes()
+
+def unpack_signature(data: bytes) -> array:
+    signature = array("Q")
+    signature.frombytes(data)
+    return signature
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from app.services.sse import TransientFrame
+
+logger = logging.getLogger(__name__)
+
+class Flight:
+    """
+    一次进行中的流式生成
+
+    生成在后台任务中执行，产生的SSE帧全部缓冲；每个订阅者从第一帧开始读取，
+    晚加入的请求先收到已缓冲的帧（排队位置等TransientFrame除外），再与其他订阅者同步接收后续帧。
+    发起请求的客户端断开时生成继续进行，不影响其他订阅者。
+    """
+
+    def __init__(self):
+        self.frames: List[str] = []
+        # 只发给当时在线的订阅者的帧的下标
+        self._transient: Set[int] = set()
+        self.done = False
+        self.subscribers = 0
+        # 后台生成任务（保留引用，避免被垃圾回收）
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, frame: str) -> None:
+        if isinstance(frame, TransientFrame):
+            self._transient.add(len(self.frames))
+        self.frames.append(frame)
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        # 唤醒当前的等待者，之后的等待者使用新的Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def subscribe(self) -> AsyncIterator[str]:
+        """从第一帧开始读取；订阅时已缓冲的TransientFrame跳过"""
+        return self._follow(len(self.frames))
+
+    async def _follow(self, joined: int) -> AsyncIterator[str]:
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self.frames):
+                    # 加入前已过时的排队位置不再重放
+                    if position >= joined or position not in self._transient:
+                        yield self.frames[position]
+                    position += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+
+class SingleFlight:
+    """
+    合并进行中的相同请求（进程内共享）
+
+    同一个键同时只有一个上游调用：流式请求共享一个Flight的帧缓冲，非流式请求共享同一个任务的结果。
+    调用结束后立即移除，之后的相同请求由结果缓存处理。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {"upstream": 0, "joined": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights) + len(self._calls)
+
+    def stream(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        订阅键对应的流，没有进行中的流时用producer启动一个
+
+        Args:
+            producer: 返回SSE帧异步迭代器的函数，只在需要启动新流时调用
+
+        Returns:
+            AsyncIterator[str]: 从第一帧开始的SSE帧
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight()
+            self.stats["upstream"] += 1
+            flight.task = asyncio.create_task(self._run(key, flight, producer))
+        else:
+            self.stats["joined"] += 1
+        return flight.subscribe()
+
+    async def _run(self, key: str, flight: Flight, producer: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for frame in producer():
+                flight.publish(frame)
+        except Exception:
+            # 生成过程中的错误已作为error事件发送，这里是最后一帧之后（写入存储、缓存）的失败
+            logger.exception("合并的流式生成失败: %s", key)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.finish()
+
+    async def call(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或等待键对应的调用，所有等待者得到同一个结果（或异常）
+
+        调用在独立任务中执行，某个等待者被取消不会中断调用。
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            self.stats["upstream"] += 1
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is task else None)
+        else:
+            self.stats["joined"] += 1
+        return await asyncio.shield(task)
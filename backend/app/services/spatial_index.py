@@ -0,0 +1,87 @@
+from typing import Dict, Iterator, List, Tuple
+
+Box = Tuple[float, float, float, float]
+
+def intersects(a: Box, b: Box) -> bool:
+    """两个矩形(x, y, w, h)是否有面积大于0的重叠（只接触边界不算）"""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+def contains(outer: Box, inner: Box) -> bool:
+    """outer是否完整包含inner"""
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+class GridIndex:
+    """
+    均匀网格空间索引
+
+    每个矩形登记在它覆盖的所有网格中，查询时只检查查询范围覆盖的网格。
+    图表中的形状大小相近，网格边长取形状平均尺寸的1~2倍时每次查询只涉及少量候选，
+    插入、删除、查询都与图表总单元数无关。
+    """
+
+    __slots__ = ("cell_size", "_buckets", "_boxes")
+
+    def __init__(self, cell_size: float = 200.0):
+        if cell_size <= 0:
+            raise ValueError("网格边长必须大于0")
+        self.cell_size = float(cell_size)
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self._boxes: Dict[int, Box] = {}
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._boxes
+
+    def _keys(self, box: Box) -> Iterator[Tuple[int, int]]:
+        size = self.cell_size
+        x0, y0 = int(box[0] // size), int(box[1] // size)
+        x1, y1 = int((box[0] + box[2]) // size), int((box[1] + box[3]) // size)
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                yield gx, gy
+
+    def insert(self, item: int, box: Box) -> None:
+        """登记矩形，item已存在时先删除旧位置"""
+        if item in self._boxes:
+            self.remove(item)
+        self._boxes[item] = box
+        for key in self._keys(box):
+            self._buckets.setdefault(key, []).append(item)
+
+    def remove(self, item: int) -> None:
+        box = self._boxes.pop(item, None)
+        if box is None:
+            return
+        for key in self._keys(box):
+            bucket = self._buckets[key]
+            bucket.remove(item)
+            if not bucket:
+                del self._buckets[key]
+
+    def box(self, item: int) -> Box:
+        return self._boxes[item]
+
+    def query(self, box: Box) -> List[int]:
+        """返回与box重叠的所有item（按编号排序，结果确定）"""
+        found = set()
+        boxes = self._boxes
+        for key in self._keys(box):
+            for item in self._buckets.get(key, ()):
+                if item not in found and intersects(box, boxes[item]):
+                    found.add(item)
+        return sorted(found)
+
+    def pairs(self) -> List[Tuple[int, int]]:
+        """返回所有重叠的(a, b)对，a < b"""
+        result = set()
+        boxes = self._boxes
+        for bucket in self._buckets.values():
+            for k, a in enumerate(bucket):
+                for b in bucket[k + 1:]:
+                    pair = (a, b) if a < b else (b, a)
+                    if pair not in result and intersects(boxes[a], boxes[b]):
+                        result.add(pair)
+        return sorted(result)
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar
+
+# orjson为可选依赖（pip install orjson），未安装时使用标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 只发送增量文本、需要合并的事件类型
+DELTA_EVENTS = ("reasoning", "analysis")
+# 只与当次请求有关的事件（排队位置），不记录、不重放
+TRANSIENT_EVENTS = ("queue_position",)
+
+T = TypeVar("T")
+
+class TransientFrame(str):
+    """TRANSIENT_EVENTS事件的帧，合并请求时不缓冲给晚加入的订阅者"""
+
+def dumps(data: Dict[str, Any]) -> str:
+    """序列化事件数据，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+@dataclass
+class SSEConfig:
+    """SSE合并发送配置，默认值可通过环境变量覆盖"""
+    flush_interval: float = float(os.getenv("SSE_FLUSH_INTERVAL", "0.05"))
+    flush_bytes: int = int(os.getenv("SSE_FLUSH_BYTES", "1024"))
+
+class SSEEncoder:
+    """
+    Server-Sent Events编码器
+
+    每个事件带递增的id；reasoning/analysis事件只携带新增文本，并在本地缓冲，
+    距上次发送超过flush_interval秒或缓冲超过flush_bytes字节时才合并成一帧发送。
+    其他事件发送前会先输出缓冲中的增量，保证事件顺序不变。
+    这样线路上的总字节数与文本长度成线性关系，而不是每帧都重发累计内容。
+    上游停顿时由paced按flush_delay定时输出缓冲，增量不会一直留到下一段内容到达。
+    """
+
+    def __init__(
+        self,
+        config: Optional[SSEConfig] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.config = config or SSEConfig()
+        self._clock = clock
+        self.last_id = 0
+        self._kind: Optional[str] = None
+        self._parts: List[str] = []
+        self._size = 0
+        # 首个增量立即发送，不影响首字延迟
+        self._last_flush = float("-inf")
+
+    def _frame(self, data: Dict[str, Any]) -> str:
+        self.last_id += 1
+        return f"id: {self.last_id}\ndata: {dumps(data)}\n\n"
+
+    def delta(self, kind: str, text: str) -> List[str]:
+        """
+        追加一段增量文本
+
+        Args:
+            kind: 事件类型（DELTA_EVENTS之一）
+            text: 新增文本
+
+        Returns:
+            List[str]: 达到发送条件时输出的SSE帧，否则为空
+
+        Raises:
+            ValueError: kind不是增量事件类型
+        """
+        if kind not in DELTA_EVENTS:
+            raise ValueError(f"不是增量事件类型: {kind}")
+        if not text:
+            return []
+        frames = []
+        if self._kind is not None and self._kind != kind:
+            frames.extend(self.flush())
+        self._kind = kind
+        self._parts.append(text)
+        self._size += len(text.encode("utf-8"))
+        if (self._size >= self.config.flush_bytes
+                or self._clock() - self._last_flush >= self.config.flush_interval):
+            frames.extend(self.flush())
+        return frames
+
+    def event(self, data: Dict[str, Any]) -> List[str]:
+        """编码一个完整事件，先输出缓冲中的增量"""
+        frames = self.flush()
+        frame = self._frame(data)
+        frames.append(TransientFrame(frame) if data.get("type") in TRANSIENT_EVENTS else frame)
+        return frames
+
+    def flush_delay(self) -> Optional[float]:
+        """缓冲中的增量还要多少秒到期发送，没有缓冲时返回None"""
+        if not self._parts:
+            return None
+        return max(0.0, self._last_flush + self.config.flush_interval - self._clock())
+
+    def flush(self) -> List[str]:
+        """立即输出缓冲中的增量文本"""
+        self._last_flush = self._clock()
+        if not self._parts:
+            return []
+        frame = self._frame({"type": self._kind, "content": "".join(self._parts)})
+        self._kind = None
+        self._parts = []
+        self._size = 0
+        return [frame]
+
+async def paced(chunks: AsyncIterator[T], sse: SSEEncoder) -> AsyncIterator[Tuple[List[str], Optional[T]]]:
+    """
+    遍历上游chunk，缓冲中有增量时最多等到flush_interval到期，仍没有新chunk就先输出缓冲
+
+    等待的是同一个__anext__任务，超时不会取消它，上游生成器不受影响。
+
+    Yields:
+        Tuple[List[str], Optional[T]]: 到期输出的SSE帧和None，或空列表和下一个chunk
+    """
+    iterator = chunks.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            delay = sse.flush_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({pending}, timeout=delay)
+                if not done:
+                    yield sse.flush(), None
+                    continue
+            try:
+                chunk = await pending
+            except StopAsyncIteration:
+                return
+            pending = None
+            yield [], chunk
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
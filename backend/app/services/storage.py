@@ -0,0 +1,901 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, List, Optional
+from app.services.blob_store import MemoryBlobStore, blob_key, default_codec, pack_blob, unpack_blob
+from app.services.diagram_text import SEARCH_FIELDS, SEARCH_WEIGHTS, MARK_OPEN, MARK_CLOSE, TrigramIndex, make_snippet
+from app.services.paths import DATA_DIR, resolve_path
+
+# 图表表中的字段，顺序与建表语句一致。内容按哈希保存在blob存储中，表中只有元数据
+DIAGRAM_COLUMNS = ("id", "type", "content_hash", "created_at", "updated_at")
+
+# 生成版本记录：(上一版本内容，没有历史版本时为None, 版本号) -> {"kind": ..., "data": ...}
+VersionBuilder = Callable[[Optional[str], int], Dict[str, Any]]
+
+@dataclass
+class ContentUpdate:
+    """update_content的结果"""
+    # 更新后的图表；前置条件不满足时为当前图表（未修改）；图表不存在时为None
+    diagram: Optional[Dict[str, Any]]
+    # 内容有变化并记录了新版本
+    changed: bool = False
+    # 当前内容哈希不在expected_hashes中，未修改
+    precondition_failed: bool = False
+
+class DiagramStorage(ABC):
+    """
+    图表存储后端接口，方法均为异步，实现不能阻塞事件循环
+
+    图表内容和历史快照按内容哈希去重、压缩保存，读取时返回的图表包含content和content_hash。
+    """
+
+    @abstractmethod
+    async def insert(self, diagram: Dict[str, Any]) -> None:
+        """保存新图表（content_hash可省略，由存储计算）"""
+
+    @abstractmethod
+    async def get(self, diagram_id: str) -> Optional[Dict[str, Any]]:
+        """按id获取图表，不存在时返回None"""
+
+    @abstractmethod
+    async def update(self, diagram_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新指定字段，返回更新后的图表，不存在时返回None"""
+
+    @abstractmethod
+    async def update_content(
+        self,
+        diagram_id: str,
+        content: str,
+        updated_at: str,
+        make_version: VersionBuilder,
+        expected_hashes: Optional[Collection[str]] = None
+    ) -> ContentUpdate:
+        """
+        原子地更新图表内容并记录新版本
+
+        前置条件检查、内容写入、版本号分配（最新版本+1）和版本记录的保存在同一个事务中完成，
+        多个进程同时更新同一图表时既不会丢失更新，也不会分配到相同的版本号。
+
+        Args:
+            make_version: 内容有变化时在事务中调用，生成新版本的kind和data
+            expected_hashes: 当前内容哈希不在其中时不做修改（If-Match），为None时不检查
+        """
+
+    @abstractmethod
+    async def delete(self, diagram_id: str) -> bool:
+        """删除图表及其历史版本，返回是否存在"""
+
+    @abstractmethod
+    async def list(
+        self,
+        diagram_type: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """按更新时间倒序列出图表（不含content）"""
+
+    @abstractmethod
+    async def add_version(self, diagram_id: str, version: Dict[str, Any]) -> None:
+        """
+        保存图表的一个历史版本
+
+        Args:
+            diagram_id: 图表id
+            version: 包含version（从1递增）、kind（snapshot/delta）、data和created_at
+        """
+
+    @abstractmethod
+    async def latest_version(self, diagram_id: str) -> int:
+        """返回图表最新的版本号，没有历史版本时返回0"""
+
+    @abstractmethod
+    async def list_versions(self, diagram_id: str) -> List[Dict[str, Any]]:
+        """按版本号升序列出历史版本（不含data，size为实际占用的字节数）"""
+
+    @abstractmethod
+    async def version_chain(self, diagram_id: str, version: int) -> List[Dict[str, Any]]:
+        """
+        返回重建指定版本所需的记录
+
+        从不晚于该版本的最近一个快照开始，到该版本为止，按版本号升序排列；
+        版本不存在时返回空列表。
+        """
+
+    @abstractmethod
+    async def index_text(self, diagram_id: str, fields: Dict[str, str]) -> None:
+        """保存图表的全文索引字段（title/labels/tooltips），图表不存在时忽略"""
+
+    @abstractmethod
+    async def unindexed(self, limit: int = 100) -> List[str]:
+        """返回还没有建立全文索引的图表id（用于补建索引）"""
+
+    @abstractmethod
+    async def search(
+        self,
+        terms: List[str],
+        diagram_type: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        全文检索同时包含所有检索词的图表
+
+        Args:
+            terms: 小写的检索词
+
+        Returns:
+            List[Dict[str, Any]]: 按相关度排序的图表元数据，附加score和snippet（未转义，命中部分带MARK标记）
+        """
+
+    @abstractmethod
+    async def index_signature(self, diagram_id: str, kind: str, signature: bytes, buckets: List[int]) -> None:
+        """
+        保存图表的MinHash签名及其LSH桶号，图表不存在时忽略
+
+        Args:
+            kind: 签名类别，diagram为图表结构，prompt为生成该图表的需求文字
+            buckets: 每段一个桶号，为空时只保存签名（不参与检索）
+        """
+
+    @abstractmethod
+    async def unsigned(self, kind: str, limit: int = 100) -> List[str]:
+        """返回还没有指定类别签名的图表id（用于补建索引）"""
+
+    @abstractmethod
+    async def similar_candidates(self, kind: str, buckets: List[int], limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        返回与给定桶号至少有一段相同的图表
+
+        Returns:
+            List[Dict[str, Any]]: 图表元数据（不含content）附加signature，按相同段数从多到少最多limit个
+        """
+
+    @abstractmethod
+    async def collect_garbage(self) -> int:
+        """按实际引用重新计算blob的引用计数，删除无引用的blob，返回删除数量"""
+
+    async def aclose(self) -> None:
+        """释放连接等资源"""
+
+class MemoryStorage(DiagramStorage):
+    """进程内存储，重启后数据丢失，适用于测试"""
+
+    def __init__(self, codec: Optional[str] = None):
+        self.diagrams: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, List[Dict[str, Any]]] = {}
+        self.blobs = MemoryBlobStore(codec)
+        self.texts = TrigramIndex()
+        # (图表id, 类别) -> (签名, 桶号)；(类别, 段, 桶号) -> 图表id集合
+        self.signatures: Dict[tuple, tuple] = {}
+        self.lsh: Dict[tuple, set] = {}
+
+    def _with_content(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {**row, "content": self.blobs.get(row["content_hash"])}
+
+    async def insert(self, diagram: Dict[str, Any]) -> None:
+        row = {column: diagram.get(column) for column in DIAGRAM_COLUMNS}
+        row["content_hash"] = self.blobs.acquire(diagram["content"], diagram.get("content_hash"))
+        self.diagrams[diagram["id"]] = row
+
+    async def get(self, diagram_id: str) -> Optional[Dict[str, Any]]:
+        row = self.diagrams.get(diagram_id)
+        return self._with_content(row) if row is not None else None
+
+    async def update(self, diagram_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = self.diagrams.get(diagram_id)
+        if row is None:
+            return None
+        fields = dict(fields)
+        if "content" in fields:
+            key = self.blobs.acquire(fields.pop("content"), fields.get("content_hash"))
+            self.blobs.release(row["content_hash"])
+            fields["content_hash"] = key
+        row.update((k, v) for k, v in fields.items() if k in DIAGRAM_COLUMNS and k != "id")
+        return self._with_content(row)
+
+    async def update_content(
+        self,
+        diagram_id: str,
+        content: str,
+        updated_at: str,
+        make_version: VersionBuilder,
+        expected_hashes: Optional[Collection[str]] = None
+    ) -> ContentUpdate:
+        # 中间没有await，在事件循环中即为原子操作
+        row = self.diagrams.get(diagram_id)
+        if row is None:
+            return ContentUpdate(None)
+        if expected_hashes is not None and row["content_hash"] not in expected_hashes:
+            return ContentUpdate(self._with_content(row), precondition_failed=True)
+        key = blob_key(content)
+        changed = key != row["content_hash"]
+        if changed:
+            versions = self.versions.setdefault(diagram_id, [])
+            number = versions[-1]["version"] + 1 if versions else 1
+            previous = self.blobs.get(row["content_hash"]) if versions else None
+            record = {**make_version(previous, number), "version": number, "created_at": updated_at}
+            if record["kind"] == "snapshot":
+                record["data"] = self.blobs.acquire(record["data"])
+            self.blobs.acquire(content, key)
+            self.blobs.release(row["content_hash"])
+            row["content_hash"] = key
+            versions.append(record)
+        row["updated_at"] = updated_at
+        return ContentUpdate(self._with_content(row), changed=changed)
+
+    async def delete(self, diagram_id: str) -> bool:
+        for version in self.versions.pop(diagram_id, []):
+            if version["kind"] == "snapshot":
+                self.blobs.release(version["data"])
+        self.texts.remove(diagram_id)
+        for kind in [kind for key, kind in self.signatures if key == diagram_id]:
+            self._remove_signature(diagram_id, kind)
+        row = self.diagrams.pop(diagram_id, None)
+        if row is None:
+            return False
+        self.blobs.release(row["content_hash"])
+        return True
+
+    async def list(
+        self,
+        diagram_type: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        rows = [d for d in self.diagrams.values() if diagram_type is None or d["type"] == diagram_type]
+        rows.sort(key=lambda d: d["updated_at"], reverse=True)
+        return [dict(d) for d in rows[offset:offset + limit]]
+
+    async def add_version(self, diagram_id: str, version: Dict[str, Any]) -> None:
+        versions = self.versions.setdefault(diagram_id, [])
+        if versions and versions[-1]["version"] >= version["version"]:
+            raise ValueError(f"版本号重复: {diagram_id}@{version['version']}")
+        version = dict(version)
+        if version["kind"] == "snapshot":
+            version["data"] = self.blobs.acquire(version["data"])
+        versions.append(version)
+
+    async def latest_version(self, diagram_id: str) -> int:
+        versions = self.versions.get(diagram_id)
+        return versions[-1]["version"] if versions else 0
+
+    async def list_versions(self, diagram_id: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "version": v["version"],
+                "kind": v["kind"],
+                "size": len(self.blobs.blobs[v["data"]]) if v["kind"] == "snapshot"
+                    else len(v["data"].encode("utf-8")),
+                "created_at": v["created_at"]
+            }
+            for v in self.versions.get(diagram_id, [])
+        ]
+
+    async def version_chain(self, diagram_id: str, version: int) -> List[Dict[str, Any]]:
+        versions = self.versions.get(diagram_id, [])
+        # 版本号从1连续递增，直接按下标定位
+        if not 1 <= version <= len(versions):
+            return []
+        start = version - 1
+        while versions[start]["kind"] != "snapshot":
+            start -= 1
+        chain = [dict(v) for v in versions[start:version]]
+        chain[0]["data"] = self.blobs.get(chain[0]["data"])
+        return chain
+
+    async def index_text(self, diagram_id: str, fields: Dict[str, str]) -> None:
+        if diagram_id in self.diagrams:
+            self.texts.add(diagram_id, fields)
+
+    async def unindexed(self, limit: int = 100) -> List[str]:
+        return [diagram_id for diagram_id in self.diagrams if diagram_id not in self.texts][:limit]
+
+    async def search(
+        self,
+        terms: List[str],
+        diagram_type: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        hits = []
+        for diagram_id, score, snippet in self.texts.search(terms):
+            row = self.diagrams[diagram_id]
+            if diagram_type is None or row["type"] == diagram_type:
+                hits.append({**row, "score": score, "snippet": snippet})
+        # 得分相同时新修改的在前
+        hits.sort(key=lambda hit: hit["updated_at"], reverse=True)
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return hits[offset:offset + limit]
+
+    def _remove_signature(self, diagram_id: str, kind: str) -> None:
+        entry = self.signatures.pop((diagram_id, kind), None)
+        if entry is None:
+            return
+        for band, bucket in enumerate(entry[1]):
+            members = self.lsh[(kind, band, bucket)]
+            members.discard(diagram_id)
+            if not members:
+                del self.lsh[(kind, band, bucket)]
+
+    async def index_signature(self, diagram_id: str, kind: str, signature: bytes, buckets: List[int]) -> None:
+        if diagram_id not in self.diagrams:
+            return
+        self._remove_signature(diagram_id, kind)
+        self.signatures[(diagram_id, kind)] = (signature, list(buckets))
+        for band, bucket in enumerate(buckets):
+            self.lsh.setdefault((kind, band, bucket), set()).add(diagram_id)
+
+    async def unsigned(self, kind: str, limit: int = 100) -> List[str]:
+        return [diagram_id for diagram_id in self.diagrams if (diagram_id, kind) not in self.signatures][:limit]
+
+    async def similar_candidates(self, kind: str, buckets: List[int], limit: int = 500) -> List[Dict[str, Any]]:
+        hits: Dict[str, int] = {}
+        for band, bucket in enumerate(buckets):
+            for diagram_id in self.lsh.get((kind, band, bucket), ()):
+                hits[diagram_id] = hits.get(diagram_id, 0) + 1
+        ranked = sorted(hits, key=lambda diagram_id: (-hits[diagram_id], diagram_id))[:limit]
+        return [{**self.diagrams[d], "signature": self.signatures[(d, kind)][0]} for d in ranked]
+
+    async def collect_garbage(self) -> int:
+        references = [row["content_hash"] for row in self.diagrams.values()]
+        references += [
+            v["data"] for versions in self.versions.values() for v in versions if v["kind"] == "snapshot"
+        ]
+        return self.blobs.collect_garbage(references)
+
+class SQLiteStorage(DiagramStorage):
+    """
+    SQLite存储（WAL模式）
+
+    所有数据库操作通过asyncio.to_thread在线程池中执行。每个线程持有自己的连接，
+    WAL模式下读操作互不阻塞，多个uvicorn worker进程也可以共享同一个数据库文件。
+    图表内容和历史快照压缩后保存在blobs表中，相同内容只保存一份，引用计数在同一事务中维护。
+    """
+
+    BLOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL
+    )
+    """
+    DIAGRAMS_TABLE = """
+    CREATE TABLE IF NOT EXISTS diagrams (
+        id TEXT PRIMARY KEY,
+        type TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """
+    SCHEMA = f"""
+    {BLOBS_TABLE};
+    {DIAGRAMS_TABLE};
+    CREATE INDEX IF NOT EXISTS idx_diagrams_type ON diagrams(type);
+    CREATE INDEX IF NOT EXISTS idx_diagrams_created_at ON diagrams(created_at);
+    CREATE INDEX IF NOT EXISTS idx_diagrams_updated_at ON diagrams(updated_at);
+    CREATE INDEX IF NOT EXISTS idx_diagrams_content_hash ON diagrams(content_hash);
+    CREATE TABLE IF NOT EXISTS diagram_versions (
+        diagram_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (diagram_id, version)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_diagram_versions_snapshot ON diagram_versions(data) WHERE kind = 'snapshot';
+    CREATE TABLE IF NOT EXISTS search_docs (
+        doc INTEGER PRIMARY KEY,
+        diagram_id TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS diagram_signatures (
+        diagram_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        signature BLOB NOT NULL,
+        PRIMARY KEY (diagram_id, kind)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS diagram_lsh (
+        kind TEXT NOT NULL,
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        diagram_id TEXT NOT NULL,
+        PRIMARY KEY (kind, band, bucket, diagram_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_diagram_lsh_diagram ON diagram_lsh(diagram_id);
+    """
+    # 全文索引，rowid为search_docs.doc（diagrams表没有整数主键，其rowid在VACUUM后可能变化）
+    # trigram分词按字符切分，中文不需要分词也能检索任意不少于3个字的子串
+    SEARCH_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS diagram_search USING fts5(title, labels, tooltips, tokenize = 'trigram')
+    """
+    # SQLite不支持FTS5或trigram分词（3.34以下）时使用普通表，检索退化为LIKE扫描
+    SEARCH_FALLBACK_TABLE = """
+    CREATE TABLE IF NOT EXISTS diagram_search (
+        doc INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        tooltips TEXT NOT NULL
+    )
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0, codec: Optional[str] = None):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.codec = codec or default_codec()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 建表在构造时同步完成，之后的操作都在线程池中执行
+        self._migrate()
+        self._connect().executescript(self.SCHEMA)
+        self.fts = self._create_search_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的连接，首次使用时创建"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """写事务，开始时即获取写锁，避免读后写升级时的SQLITE_BUSY"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _migrate(self) -> None:
+        """将内容直接保存在diagrams.content中的旧数据库迁移到blobs表"""
+        columns = [row["name"] for row in self._connect().execute("PRAGMA table_info(diagrams)")]
+        if "content" not in columns:
+            return
+        with self._transaction() as conn:
+            # 旧表的索引随表改名，删除旧表后由SCHEMA在新表上重建
+            conn.execute("ALTER TABLE diagrams RENAME TO diagrams_old")
+            conn.execute(self.BLOBS_TABLE)
+            conn.execute(self.DIAGRAMS_TABLE)
+            for row in conn.execute("SELECT * FROM diagrams_old").fetchall():
+                conn.execute(
+                    f"INSERT INTO diagrams ({', '.join(DIAGRAM_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                    (row["id"], row["type"], self._acquire(conn, row["content"]), row["created_at"], row["updated_at"])
+                )
+            conn.execute("DROP TABLE diagrams_old")
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'diagram_versions'").fetchone():
+                snapshots = conn.execute(
+                    "SELECT diagram_id, version, data FROM diagram_versions WHERE kind = 'snapshot'"
+                ).fetchall()
+                for row in snapshots:
+                    conn.execute(
+                        "UPDATE diagram_versions SET data = ? WHERE diagram_id = ? AND version = ?",
+                        (self._acquire(conn, row["data"]), row["diagram_id"], row["version"])
+                    )
+
+    def _create_search_table(self) -> bool:
+        """创建全文索引表，返回是否为FTS5表"""
+        conn = self._connect()
+        try:
+            conn.execute(self.SEARCH_TABLE)
+        except sqlite3.OperationalError as e:
+            print("SQLite不支持FTS5 trigram，全文检索使用LIKE查询:", e)
+            conn.execute(self.SEARCH_FALLBACK_TABLE)
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'diagram_search'").fetchone()
+        return "fts5" in row["sql"].lower()
+
+    async def _run(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    def _acquire(self, conn: sqlite3.Connection, content: str, key: Optional[str] = None) -> str:
+        """增加blob的引用，内容不存在时压缩后写入，返回键（需在事务中调用）"""
+        key = key or blob_key(content)
+        cursor = conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (key,))
+        if not cursor.rowcount:
+            conn.execute(
+                "INSERT INTO blobs (hash, data, size, refcount) VALUES (?, ?, ?, 1)",
+                (key, pack_blob(content, self.codec), len(content.encode("utf-8")))
+            )
+        return key
+
+    def _release(self, conn: sqlite3.Connection, key: str) -> None:
+        """减少blob的引用，归零时删除（需在事务中调用）"""
+        conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (key,))
+        conn.execute("DELETE FROM blobs WHERE hash = ? AND refcount <= 0", (key,))
+
+    def _load(self, conn: sqlite3.Connection, key: str) -> str:
+        row = conn.execute("SELECT data FROM blobs WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            raise ValueError(f"图表数据缺失: {key}")
+        return unpack_blob(row["data"])
+
+    def _row(self, conn: sqlite3.Connection, diagram_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT d.*, b.data AS blob FROM diagrams d JOIN blobs b ON b.hash = d.content_hash WHERE d.id = ?",
+            (diagram_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        diagram = {column: row[column] for column in DIAGRAM_COLUMNS}
+        diagram["content"] = unpack_blob(row["blob"])
+        return diagram
+
+    def _insert(self, diagram: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            key = self._acquire(conn, diagram["content"], diagram.get("content_hash"))
+            conn.execute(
+                f"INSERT INTO diagrams ({', '.join(DIAGRAM_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                tuple(key if column == "content_hash" else diagram[column] for column in DIAGRAM_COLUMNS)
+            )
+
+    def _get(self, diagram_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(self._connect(), diagram_id)
+
+    def _update(self, diagram_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # 兼容3.35以下的SQLite不使用RETURNING，用事务保证更新和读取的一致性
+        with self._transaction() as conn:
+            row = conn.execute("SELECT content_hash FROM diagrams WHERE id = ?", (diagram_id,)).fetchone()
+            if row is None:
+                return None
+            fields = dict(fields)
+            if "content" in fields:
+                key = self._acquire(conn, fields.pop("content"), fields.get("content_hash"))
+                self._release(conn, row["content_hash"])
+                fields["content_hash"] = key
+            columns = [column for column in fields if column in DIAGRAM_COLUMNS and column != "id"]
+            if columns:
+                conn.execute(
+                    f"UPDATE diagrams SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                    tuple(fields[c] for c in columns) + (diagram_id,)
+                )
+            return self._row(conn, diagram_id)
+
+    def _update_content(
+        self,
+        diagram_id: str,
+        content: str,
+        updated_at: str,
+        make_version: VersionBuilder,
+        expected_hashes: Optional[Collection[str]]
+    ) -> ContentUpdate:
+        key = blob_key(content)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT content_hash FROM diagrams WHERE id = ?", (diagram_id,)).fetchone()
+            if row is None:
+                return ContentUpdate(None)
+            sql = "UPDATE diagrams SET content_hash = ?, updated_at = ? WHERE id = ?"
+            params = (key, updated_at, diagram_id)
+            if expected_hashes is not None:
+                hashes = tuple(expected_hashes)
+                sql += f" AND content_hash IN ({', '.join('?' * len(hashes))})"
+                params += hashes
+            if not conn.execute(sql, params).rowcount:
+                return ContentUpdate(self._row(conn, diagram_id), precondition_failed=True)
+            changed = key != row["content_hash"]
+            if changed:
+                number = self._latest_version(conn, diagram_id) + 1
+                previous = self._load(conn, row["content_hash"]) if number > 1 else None
+                record = {**make_version(previous, number), "version": number, "created_at": updated_at}
+                self._acquire(conn, content, key)
+                self._release(conn, row["content_hash"])
+                self._insert_version(conn, diagram_id, record)
+            return ContentUpdate(self._row(conn, diagram_id), changed=changed)
+
+    def _delete(self, diagram_id: str) -> bool:
+        with self._transaction() as conn:
+            snapshots = conn.execute(
+                "SELECT data FROM diagram_versions WHERE diagram_id = ? AND kind = 'snapshot'", (diagram_id,)
+            ).fetchall()
+            for snapshot in snapshots:
+                self._release(conn, snapshot["data"])
+            conn.execute("DELETE FROM diagram_versions WHERE diagram_id = ?", (diagram_id,))
+            doc = conn.execute("SELECT doc FROM search_docs WHERE diagram_id = ?", (diagram_id,)).fetchone()
+            if doc is not None:
+                conn.execute("DELETE FROM diagram_search WHERE rowid = ?", (doc["doc"],))
+                conn.execute("DELETE FROM search_docs WHERE doc = ?", (doc["doc"],))
+            conn.execute("DELETE FROM diagram_lsh WHERE diagram_id = ?", (diagram_id,))
+            conn.execute("DELETE FROM diagram_signatures WHERE diagram_id = ?", (diagram_id,))
+            row = conn.execute("SELECT content_hash FROM diagrams WHERE id = ?", (diagram_id,)).fetchone()
+            if row is None:
+                return False
+            self._release(conn, row["content_hash"])
+            conn.execute("DELETE FROM diagrams WHERE id = ?", (diagram_id,))
+            return True
+
+    def _list(self, diagram_type: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+        columns = ", ".join(DIAGRAM_COLUMNS)
+        if diagram_type is None:
+            rows = self._connect().execute(
+                f"SELECT {columns} FROM diagrams ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            )
+        else:
+            rows = self._connect().execute(
+                f"SELECT {columns} FROM diagrams WHERE type = ? ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (diagram_type, limit, offset)
+            )
+        return [dict(row) for row in rows.fetchall()]
+
+    def _insert_version(self, conn: sqlite3.Connection, diagram_id: str, version: Dict[str, Any]) -> None:
+        """保存版本记录，快照内容放入blobs表（需在事务中调用）"""
+        data = version["data"]
+        if version["kind"] == "snapshot":
+            data = self._acquire(conn, data)
+        try:
+            conn.execute(
+                "INSERT INTO diagram_versions (diagram_id, version, kind, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                (diagram_id, version["version"], version["kind"], data, version["created_at"])
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"版本号重复: {diagram_id}@{version['version']}")
+
+    def _add_version(self, diagram_id: str, version: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            self._insert_version(conn, diagram_id, version)
+
+    def _latest_version(self, conn: sqlite3.Connection, diagram_id: str) -> int:
+        row = conn.execute(
+            "SELECT MAX(version) FROM diagram_versions WHERE diagram_id = ?", (diagram_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    def _list_versions(self, diagram_id: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            """
+            SELECT v.version, v.kind, v.created_at,
+                   COALESCE(length(b.data), length(CAST(v.data AS BLOB))) AS size
+            FROM diagram_versions v LEFT JOIN blobs b ON v.kind = 'snapshot' AND b.hash = v.data
+            WHERE v.diagram_id = ? ORDER BY v.version
+            """,
+            (diagram_id,)
+        )
+        return [dict(row) for row in rows.fetchall()]
+
+    def _version_chain(self, diagram_id: str, version: int) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        # 主键(diagram_id, version)上的范围扫描，读取量不超过一个快照间隔
+        rows = conn.execute(
+            """
+            SELECT version, kind, data, created_at FROM diagram_versions
+            WHERE diagram_id = ?1 AND version <= ?2 AND version >= (
+                SELECT MAX(version) FROM diagram_versions
+                WHERE diagram_id = ?1 AND version <= ?2 AND kind = 'snapshot'
+            )
+            ORDER BY version
+            """,
+            (diagram_id, version)
+        ).fetchall()
+        if not rows or rows[-1]["version"] != version:
+            return []
+        chain = [dict(row) for row in rows]
+        chain[0]["data"] = self._load(conn, chain[0]["data"])
+        return chain
+
+    def _index_text(self, diagram_id: str, fields: Dict[str, str]) -> None:
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM diagrams WHERE id = ?", (diagram_id,)).fetchone() is None:
+                return
+            conn.execute("INSERT OR IGNORE INTO search_docs (diagram_id) VALUES (?)", (diagram_id,))
+            doc = conn.execute("SELECT doc FROM search_docs WHERE diagram_id = ?", (diagram_id,)).fetchone()["doc"]
+            conn.execute("DELETE FROM diagram_search WHERE rowid = ?", (doc,))
+            conn.execute(
+                "INSERT INTO diagram_search (rowid, title, labels, tooltips) VALUES (?, ?, ?, ?)",
+                (doc,) + tuple(fields.get(field) or "" for field in SEARCH_FIELDS)
+            )
+
+    def _unindexed(self, limit: int) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT d.id FROM diagrams d LEFT JOIN search_docs k ON k.diagram_id = d.id "
+            "WHERE k.doc IS NULL LIMIT ?", (limit,)
+        )
+        return [row["id"] for row in rows.fetchall()]
+
+    def _search(self, terms: List[str], diagram_type: Optional[str], limit: int, offset: int) -> List[Dict[str, Any]]:
+        # 不少于3个字的检索词走FTS5索引并按bm25排序，更短的词（如两个字的中文词）用LIKE过滤
+        indexed = [term for term in terms if len(term) >= 3] if self.fts else []
+        conditions, params = [], []
+        for term in terms:
+            if term in indexed:
+                continue
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append(
+                "(" + " OR ".join(f"diagram_search.{field} LIKE ? ESCAPE '\\'" for field in SEARCH_FIELDS) + ")"
+            )
+            params.extend([pattern] * len(SEARCH_FIELDS))
+        if diagram_type is not None:
+            conditions.append("d.type = ?")
+            params.append(diagram_type)
+        columns = ", ".join(f"d.{column}" for column in DIAGRAM_COLUMNS)
+        joins = "JOIN search_docs k ON k.doc = diagram_search.rowid JOIN diagrams d ON d.id = k.diagram_id"
+
+        if indexed:
+            match = " AND ".join('"' + term.replace('"', '""') + '"' for term in indexed)
+            weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+            rows = self._connect().execute(
+                f"SELECT {columns}, -bm25(diagram_search, {weights}) AS score, "
+                f"snippet(diagram_search, -1, ?, ?, '…', 16) AS snippet FROM diagram_search {joins} "
+                f"WHERE diagram_search MATCH ? {''.join(' AND ' + c for c in conditions)} "
+                f"ORDER BY score DESC, d.updated_at DESC LIMIT ? OFFSET ?",
+                [MARK_OPEN, MARK_CLOSE, match] + params + [limit, offset]
+            ).fetchall()
+            hits = [dict(row) for row in rows]
+            for hit in hits:
+                # snippet只标记FTS命中的词，短词再补充标记
+                if len(indexed) < len(terms):
+                    hit["snippet"] = make_snippet(hit["snippet"].replace(MARK_OPEN, "").replace(MARK_CLOSE, ""), terms)
+            return hits
+
+        # 没有可走索引的词时按命中字段的权重打分
+        score = " + ".join(
+            f"(instr(lower(diagram_search.{field}), ?) > 0) * {weight}"
+            for _ in terms for field, weight in zip(SEARCH_FIELDS, SEARCH_WEIGHTS)
+        ) or "0"
+        score_params = [term for term in terms for _ in SEARCH_FIELDS]
+        rows = self._connect().execute(
+            f"SELECT {columns}, {score} AS score, diagram_search.title, diagram_search.labels, diagram_search.tooltips "
+            f"FROM diagram_search {joins} {'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+            f"ORDER BY score DESC, d.updated_at DESC LIMIT ? OFFSET ?",
+            score_params + params + [limit, offset]
+        ).fetchall()
+        hits = []
+        for row in rows:
+            hit = {column: row[column] for column in DIAGRAM_COLUMNS}
+            hit["score"] = float(row["score"])
+            text = next((row[field] for field in SEARCH_FIELDS if any(t in row[field].lower() for t in terms)), "")
+            hit["snippet"] = make_snippet(text, terms)
+            hits.append(hit)
+        return hits
+
+    def _index_signature(self, diagram_id: str, kind: str, signature: bytes, buckets: List[int]) -> None:
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM diagrams WHERE id = ?", (diagram_id,)).fetchone() is None:
+                return
+            conn.execute("DELETE FROM diagram_lsh WHERE diagram_id = ? AND kind = ?", (diagram_id, kind))
+            conn.execute(
+                "INSERT OR REPLACE INTO diagram_signatures (diagram_id, kind, signature) VALUES (?, ?, ?)",
+                (diagram_id, kind, signature)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO diagram_lsh (kind, band, bucket, diagram_id) VALUES (?, ?, ?, ?)",
+                [(kind, band, bucket, diagram_id) for band, bucket in enumerate(buckets)]
+            )
+
+    def _unsigned(self, kind: str, limit: int) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT d.id FROM diagrams d LEFT JOIN diagram_signatures s ON s.diagram_id = d.id AND s.kind = ? "
+            "WHERE s.diagram_id IS NULL LIMIT ?", (kind, limit)
+        )
+        return [row["id"] for row in rows.fetchall()]
+
+    def _similar_candidates(self, kind: str, buckets: List[int], limit: int) -> List[Dict[str, Any]]:
+        if not buckets:
+            return []
+        # 每段一个OR条件，SQLite对每个条件分别走主键查找（MULTI-INDEX OR）
+        condition = " OR ".join(["(kind = ? AND band = ? AND bucket = ?)"] * len(buckets))
+        params = [value for band, bucket in enumerate(buckets) for value in (kind, band, bucket)]
+        columns = ", ".join(f"d.{column}" for column in DIAGRAM_COLUMNS)
+        rows = self._connect().execute(
+            f"SELECT {columns}, s.signature FROM ("
+            f"SELECT diagram_id, COUNT(*) AS hits FROM diagram_lsh WHERE {condition} "
+            f"GROUP BY diagram_id ORDER BY hits DESC, diagram_id LIMIT ?"
+            f") c JOIN diagram_signatures s ON s.diagram_id = c.diagram_id AND s.kind = ? "
+            f"JOIN diagrams d ON d.id = c.diagram_id ORDER BY c.hits DESC, d.id",
+            params + [limit, kind]
+        )
+        return [dict(row) for row in rows.fetchall()]
+
+    def _collect_garbage(self) -> int:
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE blobs SET refcount =
+                    (SELECT COUNT(*) FROM diagrams WHERE content_hash = blobs.hash) +
+                    (SELECT COUNT(*) FROM diagram_versions WHERE kind = 'snapshot' AND data = blobs.hash)
+                """
+            )
+            return conn.execute("DELETE FROM blobs WHERE refcount <= 0").rowcount
+
+    async def insert(self, diagram: Dict[str, Any]) -> None:
+        await self._run(self._insert, diagram)
+
+    async def get(self, diagram_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get, diagram_id)
+
+    async def update(self, diagram_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self._run(self._update, diagram_id, fields)
+
+    async def update_content(
+        self,
+        diagram_id: str,
+        content: str,
+        updated_at: str,
+        make_version: VersionBuilder,
+        expected_hashes: Optional[Collection[str]] = None
+    ) -> ContentUpdate:
+        return await self._run(self._update_content, diagram_id, content, updated_at, make_version, expected_hashes)
+
+    async def delete(self, diagram_id: str) -> bool:
+        return await self._run(self._delete, diagram_id)
+
+    async def list(
+        self,
+        diagram_type: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        return await self._run(self._list, diagram_type, limit, offset)
+
+    async def add_version(self, diagram_id: str, version: Dict[str, Any]) -> None:
+        await self._run(self._add_version, diagram_id, version)
+
+    async def latest_version(self, diagram_id: str) -> int:
+        return await self._run(lambda: self._latest_version(self._connect(), diagram_id))
+
+    async def list_versions(self, diagram_id: str) -> List[Dict[str, Any]]:
+        return await self._run(self._list_versions, diagram_id)
+
+    async def version_chain(self, diagram_id: str, version: int) -> List[Dict[str, Any]]:
+        return await self._run(self._version_chain, diagram_id, version)
+
+    async def index_text(self, diagram_id: str, fields: Dict[str, str]) -> None:
+        await self._run(self._index_text, diagram_id, fields)
+
+    async def unindexed(self, limit: int = 100) -> List[str]:
+        return await self._run(self._unindexed, limit)
+
+    async def search(
+        self,
+        terms: List[str],
+        diagram_type: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        return await self._run(self._search, terms, diagram_type, limit, offset)
+
+    async def index_signature(self, diagram_id: str, kind: str, signature: bytes, buckets: List[int]) -> None:
+        await self._run(self._index_signature, diagram_id, kind, signature, buckets)
+
+    async def unsigned(self, kind: str, limit: int = 100) -> List[str]:
+        return await self._run(self._unsigned, kind, limit)
+
+    async def similar_candidates(self, kind: str, buckets: List[int], limit: int = 500) -> List[Dict[str, Any]]:
+        return await self._run(self._similar_candidates, kind, buckets, limit)
+
+    async def collect_garbage(self) -> int:
+        return await self._run(self._collect_garbage)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+def create_storage() -> DiagramStorage:
+    """
+    根据环境变量创建存储后端
+
+    DIAGRAM_STORAGE=sqlite（默认）使用DIAGRAM_DB_PATH指定的数据库文件，memory为进程内存储。
+    """
+    backend = os.getenv("DIAGRAM_STORAGE", "sqlite")
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(resolve_path(os.getenv("DIAGRAM_DB_PATH", os.path.join(DATA_DIR, "flowgen.db"))))
+    raise ValueError(f"不支持的图表存储后端: {backend}")
@@ -0,0 +1,219 @@
+from typing import List, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+# 扫描事件类型
+ANALYSIS = "analysis"          # 分析说明的新增文本
+CODE = "code"                  # 代码段中位于<mxfile>之外的文本（如```xml围栏）
+PATCH = "patch"                # 补丁段（编辑模式下的单元操作JSON）的新增文本
+MXFILE_CHUNK = "mxfile_chunk"  # <mxfile ...>...</mxfile>内部的新增文本（含标签本身）
+MXFILE = "mxfile"              # 一个完整的<mxfile>...</mxfile>
+
+ScanEvent = Tuple[str, str]
+
+ANALYSIS_MARKER = "【分析说明】"
+CODE_MARKER = "【drawio代码】"
+PATCH_MARKER = "【drawio补丁】"
+SECTION_MARKERS = (ANALYSIS_MARKER, CODE_MARKER, PATCH_MARKER)
+MXFILE_OPEN = "<mxfile"
+MXFILE_CLOSE = "</mxfile>"
+
+class DiagramStreamScanner:
+    """
+    图表流式响应的增量扫描器
+
+    在多个chunk之间保留状态，单次遍历识别【分析说明】/【drawio代码】/【drawio补丁】分段标记
+    以及<mxfile>/</mxfile>边界。可能被chunk截断的标记前缀会暂存到下一次feed，
+    因此标记跨chunk也能被识别，总开销与输入字节数成线性关系。
+    """
+
+    def __init__(self):
+        self.section: Optional[str] = None  # None / ANALYSIS / CODE / PATCH
+        self.in_mxfile = False
+        self._pending = ""
+        self._mxfile_parts: List[str] = []
+
+    def _needles(self) -> Tuple[str, ...]:
+        """当前状态下需要识别的标记"""
+        if self.in_mxfile:
+            return (MXFILE_CLOSE,)
+        if self.section in (ANALYSIS, PATCH):
+            return SECTION_MARKERS
+        return SECTION_MARKERS + (MXFILE_OPEN,)
+
+    def _emit(self, text: str, events: List[ScanEvent]) -> None:
+        """将普通文本按当前状态输出"""
+        if not text:
+            return
+        if self.in_mxfile:
+            self._mxfile_parts.append(text)
+            events.append((MXFILE_CHUNK, text))
+        elif self.section == ANALYSIS:
+            events.append((ANALYSIS, text))
+        elif self.section == CODE:
+            events.append((CODE, text))
+        elif self.section == PATCH:
+            events.append((PATCH, text))
+
+    def _on_needle(self, needle: str, events: List[ScanEvent]) -> None:
+        """处理识别到的标记"""
+        if needle == ANALYSIS_MARKER:
+            self.section = ANALYSIS
+        elif needle == CODE_MARKER:
+            self.section = CODE
+        elif needle == PATCH_MARKER:
+            self.section = PATCH
+        elif needle == MXFILE_OPEN:
+            self.in_mxfile = True
+            self._mxfile_parts = []
+            self._emit(needle, events)
+        elif needle == MXFILE_CLOSE:
+            self._emit(needle, events)
+            self.in_mxfile = False
+            events.append((MXFILE, "".join(self._mxfile_parts)))
+            self._mxfile_parts = []
+
+    @staticmethod
+    def _holdback(buf: str, needles: Tuple[str, ...]) -> int:
+        """返回buf末尾可能是某个标记前缀的最长长度"""
+        longest = max(len(n) for n in needles) - 1
+        for k in range(min(longest, len(buf)), 0, -1):
+            tail = buf[-k:]
+            if any(n.startswith(tail) for n in needles):
+                return k
+        return 0
+
+    def feed(self, text: str) -> List[ScanEvent]:
+        """
+        输入一段新的流式文本
+
+        Args:
+            text: 本次收到的增量文本
+
+        Returns:
+            List[ScanEvent]: 按顺序排列的(事件类型, 文本)列表
+        """
+        events: List[ScanEvent] = []
+        buf = self._pending + text
+        pos = 0
+
+        while True:
+            needles = self._needles()
+            best, best_idx = None, -1
+            for needle in needles:
+                idx = buf.find(needle, pos)
+                if idx != -1 and (best_idx == -1 or idx < best_idx):
+                    best, best_idx = needle, idx
+            if best is None:
+                break
+            self._emit(buf[pos:best_idx], events)
+            self._on_needle(best, events)
+            pos = best_idx + len(best)
+
+        keep = self._holdback(buf[pos:], self._needles())
+        end = len(buf) - keep
+        self._emit(buf[pos:end], events)
+        self._pending = buf[end:]
+        return events
+
+    def close(self) -> List[ScanEvent]:
+        """流结束时输出暂存的文本"""
+        events: List[ScanEvent] = []
+        self._emit(self._pending, events)
+        self._pending = ""
+        return events
+
+def scan_response(response: str) -> Tuple[str, Optional[str]]:
+    """
+    一次性解析完整响应
+
+    Returns:
+        Tuple[str, Optional[str]]: (分析说明, 第一个完整的mxfile，没有则为None)
+    """
+    scanner = DiagramStreamScanner()
+    analysis: List[str] = []
+    mxfile = None
+    for kind, text in scanner.feed(response) + scanner.close():
+        if kind == ANALYSIS:
+            analysis.append(text)
+        elif kind == MXFILE and mxfile is None:
+            mxfile = text
+    return "".join(analysis).strip(), mxfile
+
+def scan_patch_response(response: str) -> Tuple[str, str]:
+    """
+    一次性解析补丁模式的完整响应
+
+    Returns:
+        Tuple[str, str]: (分析说明, 补丁段原文)
+    """
+    scanner = DiagramStreamScanner()
+    analysis: List[str] = []
+    patch: List[str] = []
+    for kind, text in scanner.feed(response) + scanner.close():
+        if kind == ANALYSIS:
+            analysis.append(text)
+        elif kind == PATCH:
+            patch.append(text)
+    return "".join(analysis).strip(), "".join(patch)
+
+def scan_code_response(response: str) -> Tuple[str, str, Optional[str]]:
+    """
+    一次性解析代码段为非XML格式（如紧凑表示）的完整响应
+
+    Returns:
+        Tuple[str, str, Optional[str]]: (分析说明, 代码段中<mxfile>之外的文本, 第一个完整的mxfile)
+    """
+    scanner = DiagramStreamScanner()
+    analysis: List[str] = []
+    code: List[str] = []
+    mxfile = None
+    for kind, text in scanner.feed(response) + scanner.close():
+        if kind == ANALYSIS:
+            analysis.append(text)
+        elif kind == CODE:
+            code.append(text)
+        elif kind == MXFILE and mxfile is None:
+            mxfile = text
+    return "".join(analysis).strip(), "".join(code), mxfile
+
+class MxCellStreamParser:
+    """
+    mxCell增量拉取解析器
+
+    接收<mxfile>内部的流式文本（即MXFILE_CHUNK事件），每当<root>下的一个单元
+    （mxCell，或包裹mxCell的UserObject/object）闭合时立即返回其XML，
+    供前端逐个绘制。解析出错（如模型输出了非法XML）后停止产出，不影响最终的完整图表。
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._stack: List[str] = []
+        self.failed = False
+        self.count = 0
+
+    def feed(self, text: str) -> List[str]:
+        """
+        输入一段<mxfile>内的文本
+
+        Returns:
+            List[str]: 本次新闭合的单元XML
+        """
+        if self.failed or not text:
+            return []
+        cells: List[str] = []
+        try:
+            self._parser.feed(text)
+            for event, elem in self._parser.read_events():
+                if event == "start":
+                    self._stack.append(elem.tag)
+                    continue
+                self._stack.pop()
+                # 只输出<root>的直接子元素，嵌套的mxGeometry等随父元素一起输出
+                if self._stack and self._stack[-1] == "root":
+                    elem.tail = None
+                    cells.append(ET.tostring(elem, encoding="unicode"))
+                    elem.clear()
+                    self.count += 1
+        except ET.ParseError:
+            self.failed = True
+        return cells
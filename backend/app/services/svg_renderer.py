@@ -0,0 +1,609 @@
+import html
+import math
+import re
+import unicodedata
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+from app.services.drawio_xml import parse_xml, get_graph_model, inner_cell, iter_cells
+from app.services.mxfile_codec import inflate_mxfile
+
+# 渲染结果变化时递增，使磁盘缓存中的旧预览失效
+RENDERER_VERSION = 1
+
+PADDING = 10
+DEFAULT_FONT_SIZE = 11
+DEFAULT_FONT_FAMILY = "Helvetica"
+# 与mxConstants一致的默认值
+DEFAULT_ARC_SIZE = 15
+DEFAULT_MARKER_SIZE = 6
+DEFAULT_SWIMLANE_SIZE = 23
+
+Point = Tuple[float, float]
+
+class _Shape:
+    """渲染用的单元信息，坐标已换算为绝对坐标"""
+
+    __slots__ = ("id", "parent", "style", "label", "vertex", "edge", "source", "target",
+                 "x", "y", "width", "height", "relative", "offset", "points",
+                 "source_point", "target_point", "visible")
+
+    def __init__(self, elem: ET.Element):
+        cell = inner_cell(elem)
+        self.id = elem.get("id")
+        self.parent = cell.get("parent")
+        self.style = parse_style(cell.get("style"))
+        # UserObject/object包裹时标签在包裹节点的label属性中
+        value = elem.get("label") if elem is not cell else cell.get("value")
+        self.label = _label_text(value, self.style.get("html") == "1")
+        self.vertex = cell.get("vertex") == "1"
+        self.edge = cell.get("edge") == "1"
+        self.source = cell.get("source")
+        self.target = cell.get("target")
+        self.visible = cell.get("visible") != "0"
+        self.x = self.y = self.width = self.height = 0.0
+        self.relative = False
+        self.offset: Optional[Point] = None
+        self.points: List[Point] = []
+        self.source_point: Optional[Point] = None
+        self.target_point: Optional[Point] = None
+        geo = cell.find("mxGeometry")
+        if geo is not None:
+            self.x = _number(geo.get("x"))
+            self.y = _number(geo.get("y"))
+            self.width = _number(geo.get("width"))
+            self.height = _number(geo.get("height"))
+            self.relative = geo.get("relative") == "1"
+            for child in geo:
+                role = child.get("as")
+                if child.tag == "mxPoint":
+                    point = (_number(child.get("x")), _number(child.get("y")))
+                    if role == "sourcePoint":
+                        self.source_point = point
+                    elif role == "targetPoint":
+                        self.target_point = point
+                    elif role == "offset":
+                        self.offset = point
+                elif child.tag == "Array" and role == "points":
+                    self.points = [(_number(p.get("x")), _number(p.get("y"))) for p in child.findall("mxPoint")]
+
+    @property
+    def shape(self) -> str:
+        return self.style.get("shape", "rect")
+
+def _number(value: Optional[str], default: float = 0.0) -> float:
+    try:
+        return float(value) if value is not None else default
+    except ValueError:
+        return default
+
+def parse_style(style: Optional[str]) -> Dict[str, str]:
+    """
+    解析mxGraph样式字符串
+
+    不带"="的项是命名样式（如"ellipse"、"text"、"edgeLabel"），首项作为shape。
+    """
+    result: Dict[str, str] = {}
+    for index, item in enumerate((style or "").split(";")):
+        if not item:
+            continue
+        key, sep, value = item.partition("=")
+        if sep:
+            result[key] = value
+        elif index == 0:
+            result.setdefault("shape", key)
+    return result
+
+_BREAK = re.compile(r"<br\s*/?>|</div>|</p>|</li>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+
+def _label_text(value: Optional[str], is_html: bool) -> str:
+    """把标签转换为纯文本，HTML标签中的换行保留为\\n"""
+    if not value:
+        return ""
+    if is_html:
+        value = html.unescape(_TAG.sub("", _BREAK.sub("\n", value)))
+        value = value.replace("\xa0", " ")
+    return value.strip("\n")
+
+def _char_width(ch: str, font_size: float) -> float:
+    """估算字符宽度：全角字符为一个字号，其余约为0.55个字号"""
+    return font_size if unicodedata.east_asian_width(ch) in "WF" else font_size * 0.55
+
+def text_width(text: str, font_size: float) -> float:
+    return sum(_char_width(ch, font_size) for ch in text)
+
+def _wrap(text: str, width: float, font_size: float) -> List[str]:
+    """按估算宽度折行（whiteSpace=wrap）"""
+    lines = []
+    for paragraph in text.split("\n"):
+        line, line_width = "", 0.0
+        for ch in paragraph:
+            w = _char_width(ch, font_size)
+            if line and line_width + w > width:
+                # 英文尽量在空格处断开
+                cut = line.rfind(" ")
+                if cut > 0 and not ch.isspace():
+                    lines.append(line[:cut])
+                    line = line[cut + 1:]
+                    line_width = text_width(line, font_size)
+                else:
+                    lines.append(line.rstrip())
+                    line, line_width = "", 0.0
+                    if ch.isspace():
+                        continue
+            line += ch
+            line_width += w
+        lines.append(line)
+    return lines
+
+def _color(style: Dict[str, str], key: str, default: str) -> str:
+    value = style.get(key, default)
+    if value in ("", "default"):
+        return default
+    return value
+
+def _fmt(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+def _points_attr(points: List[Point]) -> str:
+    return " ".join(f"{_fmt(x)},{_fmt(y)}" for x, y in points)
+
+class SvgRenderer:
+    """
+    将一个页面的mxGraphModel渲染为SVG
+
+    支持矩形、圆角矩形、椭圆、菱形、三角形、六边形、圆柱、平行四边形、泳道、文本，
+    直线/折线/正交连线及箭头，以及单元和连线的标签。未知形状按矩形绘制。
+    """
+
+    def __init__(self, model: ET.Element):
+        self.background = model.get("background")
+        self.shapes: Dict[str, _Shape] = {}
+        for elem in iter_cells(model):
+            if elem.get("id") is not None:
+                self.shapes[elem.get("id")] = _Shape(elem)
+        self._origins: Dict[str, Point] = {}
+        self._edge_routes: Dict[str, List[Point]] = {}
+        self.bounds = [math.inf, math.inf, -math.inf, -math.inf]
+
+    def _origin(self, cell_id: Optional[str]) -> Point:
+        """单元子节点的坐标原点（父节点为顶点时坐标相对父节点）"""
+        if cell_id is None or cell_id not in self.shapes:
+            return (0.0, 0.0)
+        if cell_id not in self._origins:
+            self._origins[cell_id] = (0.0, 0.0)  # 防止循环引用
+            shape = self.shapes[cell_id]
+            parent = self.shapes.get(shape.parent)
+            if shape.vertex and shape.relative and parent is not None and parent.vertex:
+                # 相对几何（如端口）：x/y为父节点宽高的比例，再加上offset
+                px, py = self._origin(shape.parent)
+                dx, dy = shape.offset or (0.0, 0.0)
+                self._origins[cell_id] = (px + shape.x * parent.width + dx, py + shape.y * parent.height + dy)
+            elif shape.vertex:
+                px, py = self._origin(shape.parent)
+                self._origins[cell_id] = (px + shape.x, py + shape.y)
+        return self._origins[cell_id]
+
+    def _box(self, shape: _Shape) -> Tuple[float, float, float, float]:
+        x, y = self._origin(shape.id)
+        return x, y, shape.width, shape.height
+
+    def _extend(self, x: float, y: float, w: float = 0.0, h: float = 0.0) -> None:
+        bounds = self.bounds
+        bounds[0] = min(bounds[0], x)
+        bounds[1] = min(bounds[1], y)
+        bounds[2] = max(bounds[2], x + w)
+        bounds[3] = max(bounds[3], y + h)
+
+    def render(self, max_width: Optional[float] = None, max_height: Optional[float] = None) -> str:
+        """
+        生成SVG文本
+
+        Args:
+            max_width: 输出宽度上限，超过时等比缩小（viewBox不变）
+            max_height: 输出高度上限
+        """
+        body: List[str] = []
+        for shape in self.shapes.values():
+            if not shape.visible or not self._layer_visible(shape):
+                continue
+            if shape.vertex and shape.relative and shape.parent in self.shapes and self.shapes[shape.parent].edge:
+                body.extend(self._edge_child_label(shape))
+            elif shape.vertex:
+                body.extend(self._vertex(shape))
+            elif shape.edge:
+                body.extend(self._edge(shape))
+
+        if math.isinf(self.bounds[0]):
+            self.bounds = [0.0, 0.0, 0.0, 0.0]
+        min_x, min_y = self.bounds[0] - PADDING, self.bounds[1] - PADDING
+        width = self.bounds[2] - self.bounds[0] + 2 * PADDING
+        height = self.bounds[3] - self.bounds[1] + 2 * PADDING
+        scale = 1.0
+        if max_width:
+            scale = min(scale, max_width / width)
+        if max_height:
+            scale = min(scale, max_height / height)
+        background = self.background if self.background and self.background != "none" else "#ffffff"
+        head = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{_fmt(width * scale)}" height="{_fmt(height * scale)}" '
+            f'viewBox="{_fmt(min_x)} {_fmt(min_y)} {_fmt(width)} {_fmt(height)}" '
+            f'font-family="{DEFAULT_FONT_FAMILY}, Arial, sans-serif">',
+            f'<rect x="{_fmt(min_x)}" y="{_fmt(min_y)}" width="{_fmt(width)}" height="{_fmt(height)}" '
+            f'fill={quoteattr(background)}/>'
+        ]
+        return "".join(head + body + ["</svg>"])
+
+    def _layer_visible(self, shape: _Shape) -> bool:
+        """祖先（图层、分组）隐藏时不绘制"""
+        seen = set()
+        parent = shape.parent
+        while parent in self.shapes and parent not in seen:
+            seen.add(parent)
+            if not self.shapes[parent].visible:
+                return False
+            parent = self.shapes[parent].parent
+        return True
+
+    # ---- 顶点 ----
+
+    def _paint(self, style: Dict[str, str], fill_default: str = "#ffffff") -> str:
+        """填充、描边、透明度和虚线属性"""
+        fill = _color(style, "fillColor", fill_default)
+        stroke = _color(style, "strokeColor", "#000000")
+        stroke_width = _number(style.get("strokeWidth"), 1.0)
+        attrs = [f"fill={quoteattr(fill)}", f"stroke={quoteattr(stroke)}"]
+        if stroke_width != 1:
+            attrs.append(f'stroke-width="{_fmt(stroke_width)}"')
+        if style.get("dashed") == "1":
+            pattern = style.get("dashPattern", "3 3").split()
+            attrs.append(f'stroke-dasharray="{" ".join(_fmt(_number(p) * stroke_width) for p in pattern)}"')
+        for key, attr in (("opacity", "opacity"), ("fillOpacity", "fill-opacity"), ("strokeOpacity", "stroke-opacity")):
+            if key in style:
+                attrs.append(f'{attr}="{_fmt(_number(style[key], 100) / 100)}"')
+        return " ".join(attrs)
+
+    def _vertex(self, shape: _Shape) -> List[str]:
+        x, y, w, h = self._box(shape)
+        self._extend(x, y, w, h)
+        style = shape.style
+        kind = shape.shape
+        out: List[str] = []
+        if kind in ("text", "edgeLabel", "group") and "fillColor" not in style and "strokeColor" not in style:
+            # 文本和分组默认不绘制边框
+            pass
+        elif kind in ("ellipse", "doubleEllipse", "cloud"):
+            out.append(f'<ellipse cx="{_fmt(x + w / 2)}" cy="{_fmt(y + h / 2)}" rx="{_fmt(w / 2)}" '
+                       f'ry="{_fmt(h / 2)}" {self._paint(style)}/>')
+        elif kind == "rhombus":
+            out.append(f'<polygon points="{_points_attr([(x + w / 2, y), (x + w, y + h / 2), (x + w / 2, y + h), (x, y + h / 2)])}" '
+                       f'{self._paint(style)}/>')
+        elif kind == "triangle":
+            out.append(f'<polygon points="{_points_attr([(x, y), (x + w, y + h / 2), (x, y + h)])}" {self._paint(style)}/>')
+        elif kind == "hexagon":
+            d = w * _number(style.get("size"), 0.25) if style.get("fixedSize") != "1" else _number(style.get("size"), 20)
+            out.append(f'<polygon points="{_points_attr([(x + d, y), (x + w - d, y), (x + w, y + h / 2), (x + w - d, y + h), (x + d, y + h), (x, y + h / 2)])}" '
+                       f'{self._paint(style)}/>')
+        elif kind == "parallelogram":
+            d = w * _number(style.get("size"), 0.2) if style.get("fixedSize") != "1" else _number(style.get("size"), 20)
+            out.append(f'<polygon points="{_points_attr([(x + d, y), (x + w, y), (x + w - d, y + h), (x, y + h)])}" '
+                       f'{self._paint(style)}/>')
+        elif kind in ("cylinder", "cylinder3", "datastore"):
+            ry = min(h / 2, _number(style.get("size"), 15) / 2 if kind != "cylinder" else h * 0.1)
+            path = (f"M{_fmt(x)},{_fmt(y + ry)} A{_fmt(w / 2)},{_fmt(ry)} 0 0 1 {_fmt(x + w)},{_fmt(y + ry)} "
+                    f"L{_fmt(x + w)},{_fmt(y + h - ry)} A{_fmt(w / 2)},{_fmt(ry)} 0 0 1 {_fmt(x)},{_fmt(y + h - ry)} Z "
+                    f"M{_fmt(x)},{_fmt(y + ry)} A{_fmt(w / 2)},{_fmt(ry)} 0 0 0 {_fmt(x + w)},{_fmt(y + ry)}")
+            out.append(f'<path d="{path}" {self._paint(style)}/>')
+        elif kind == "line":
+            out.append(f'<line x1="{_fmt(x)}" y1="{_fmt(y + h / 2)}" x2="{_fmt(x + w)}" y2="{_fmt(y + h / 2)}" '
+                       f'{self._paint(style, "none")}/>')
+        else:
+            out.append(self._rect(x, y, w, h, style))
+            if kind == "swimlane":
+                size = _number(style.get("startSize"), DEFAULT_SWIMLANE_SIZE)
+                if style.get("horizontal") == "0":
+                    out.append(f'<line x1="{_fmt(x + size)}" y1="{_fmt(y)}" x2="{_fmt(x + size)}" y2="{_fmt(y + h)}" '
+                               f'{self._paint(style, "none")}/>')
+                    w = size
+                else:
+                    out.append(f'<line x1="{_fmt(x)}" y1="{_fmt(y + size)}" x2="{_fmt(x + w)}" y2="{_fmt(y + size)}" '
+                               f'{self._paint(style, "none")}/>')
+                    h = size
+        out.extend(self._vertex_label(shape, x, y, w, h))
+        return out
+
+    def _rect(self, x: float, y: float, w: float, h: float, style: Dict[str, str]) -> str:
+        rounded = ""
+        if style.get("rounded") == "1":
+            arc = _number(style.get("arcSize"), DEFAULT_ARC_SIZE)
+            r = arc / 2 if style.get("absoluteArcSize") == "1" else min(w, h) * arc / 100
+            rounded = f' rx="{_fmt(r)}" ry="{_fmt(r)}"'
+        return f'<rect x="{_fmt(x)}" y="{_fmt(y)}" width="{_fmt(w)}" height="{_fmt(h)}"{rounded} {self._paint(style)}/>'
+
+    def _vertex_label(self, shape: _Shape, x: float, y: float, w: float, h: float) -> List[str]:
+        style = shape.style
+        if not shape.label or style.get("noLabel") == "1":
+            return []
+        # labelPosition/verticalLabelPosition把标签放在形状外侧
+        x += {"left": -w, "right": w}.get(style.get("labelPosition"), 0)
+        y += {"top": -h, "bottom": h}.get(style.get("verticalLabelPosition"), 0)
+        return self._text(shape.label, style, x, y, w, h)
+
+    def _text(self, text: str, style: Dict[str, str], x: float, y: float, w: float, h: float,
+              background: Optional[str] = None) -> List[str]:
+        """在(x, y, w, h)框内按align/verticalAlign绘制多行文本"""
+        font_size = _number(style.get("fontSize"), DEFAULT_FONT_SIZE)
+        spacing = _number(style.get("spacing"), 2)
+        lines = text.split("\n")
+        if style.get("whiteSpace") == "wrap" and w > 2 * spacing:
+            lines = _wrap(text, w - 2 * spacing, font_size)
+        line_height = font_size * 1.2
+        align = style.get("align", "center")
+        anchor, tx = {"left": ("start", x + spacing), "right": ("end", x + w - spacing)}.get(
+            align, ("middle", x + w / 2))
+        valign = style.get("verticalAlign", "middle")
+        total = line_height * len(lines)
+        if valign == "top":
+            top = y + spacing
+        elif valign == "bottom":
+            top = y + h - spacing - total
+        else:
+            top = y + (h - total) / 2
+        self._extend(x, top, w, total)
+
+        out: List[str] = []
+        if background and background != "none":
+            label_width = max(text_width(line, font_size) for line in lines)
+            left = {"start": tx, "end": tx - label_width}.get(anchor, tx - label_width / 2)
+            out.append(f'<rect x="{_fmt(left - 1)}" y="{_fmt(top)}" width="{_fmt(label_width + 2)}" '
+                       f'height="{_fmt(total)}" fill={quoteattr(background)}/>')
+        font_style = int(_number(style.get("fontStyle"), 0))
+        attrs = [f'text-anchor="{anchor}"', f'font-size="{_fmt(font_size)}"',
+                 f"fill={quoteattr(_color(style, 'fontColor', '#000000'))}"]
+        if font_style & 1:
+            attrs.append('font-weight="bold"')
+        if font_style & 2:
+            attrs.append('font-style="italic"')
+        if font_style & 4:
+            attrs.append('text-decoration="underline"')
+        if "fontFamily" in style:
+            attrs.append(f"font-family={quoteattr(style['fontFamily'])}")
+        tspans = "".join(
+            f'<tspan x="{_fmt(tx)}" y="{_fmt(top + line_height * (i + 0.5))}" dominant-baseline="central">'
+            f'{escape(line)}</tspan>'
+            for i, line in enumerate(lines)
+        )
+        out.append(f'<text {" ".join(attrs)}>{tspans}</text>')
+        return out
+
+    # ---- 连线 ----
+
+    def _terminal(self, cell_id: Optional[str]) -> Optional[_Shape]:
+        shape = self.shapes.get(cell_id) if cell_id is not None else None
+        return shape if shape is not None and shape.vertex else None
+
+    def _fixed_point(self, shape: _Shape, style: Dict[str, str], prefix: str) -> Optional[Point]:
+        """exitX/exitY或entryX/entryY指定的连接点"""
+        if f"{prefix}X" not in style or f"{prefix}Y" not in style:
+            return None
+        x, y, w, h = self._box(shape)
+        return (x + w * _number(style[f"{prefix}X"]) + _number(style.get(f"{prefix}Dx")),
+                y + h * _number(style[f"{prefix}Y"]) + _number(style.get(f"{prefix}Dy")))
+
+    def _perimeter(self, shape: _Shape, toward: Point) -> Point:
+        """从形状中心指向toward的射线与边界的交点"""
+        x, y, w, h = self._box(shape)
+        cx, cy = x + w / 2, y + h / 2
+        dx, dy = toward[0] - cx, toward[1] - cy
+        if (dx == 0 and dy == 0) or w == 0 or h == 0:
+            return (cx, cy)
+        kind = shape.shape
+        if kind in ("ellipse", "doubleEllipse", "cloud"):
+            t = 1 / math.hypot(dx / (w / 2), dy / (h / 2))
+        elif kind == "rhombus":
+            t = 1 / (abs(dx) / (w / 2) + abs(dy) / (h / 2))
+        else:
+            t = min((w / 2) / abs(dx) if dx else math.inf, (h / 2) / abs(dy) if dy else math.inf)
+        return (cx + dx * t, cy + dy * t)
+
+    def _center(self, shape: _Shape) -> Point:
+        x, y, w, h = self._box(shape)
+        return (x + w / 2, y + h / 2)
+
+    def _route(self, edge: _Shape) -> List[Point]:
+        """计算连线的绝对坐标折线"""
+        if edge.id in self._edge_routes:
+            return self._edge_routes[edge.id]
+        self._edge_routes[edge.id] = []  # 防止连线互相引用时无限递归
+        ox, oy = self._origin(edge.parent)
+        waypoints = [(px + ox, py + oy) for px, py in edge.points]
+        source = self._terminal(edge.source)
+        target = self._terminal(edge.target)
+        style = edge.style
+
+        start = self._fixed_point(source, style, "exit") if source else None
+        end = self._fixed_point(target, style, "entry") if target else None
+        if source is None and edge.source_point is not None:
+            start = (edge.source_point[0] + ox, edge.source_point[1] + oy)
+        if target is None and edge.target_point is not None:
+            end = (edge.target_point[0] + ox, edge.target_point[1] + oy)
+        if (source is None and start is None) or (target is None and end is None):
+            return []
+
+        orthogonal = any(key in style.get("edgeStyle", "") for key in ("orthogonal", "elbow", "entityRelation"))
+        if orthogonal and not waypoints and source is not None and target is not None:
+            route = self._orthogonal(source, target, start, end)
+        else:
+            first = waypoints[0] if waypoints else (end or self._center(target))
+            last = waypoints[-1] if waypoints else (start or self._center(source))
+            start = start or self._perimeter(source, first)
+            end = end or self._perimeter(target, last)
+            route = [start] + waypoints + [end]
+        self._edge_routes[edge.id] = route
+        return route
+
+    def _orthogonal(self, source: _Shape, target: _Shape, start: Optional[Point], end: Optional[Point]) -> List[Point]:
+        """没有拐点时的正交路由：对齐时画直线，否则在中间拐两次弯"""
+        sx, sy, sw, sh = self._box(source)
+        tx, ty, tw, th = self._box(target)
+        low, high = max(sx, tx), min(sx + sw, tx + tw)
+        if start is None and end is None and low <= high:
+            mid = (low + high) / 2
+            top, bottom = (sy + sh, ty) if sy + sh <= ty else (sy, ty + th)
+            return [(mid, top), (mid, bottom)]
+        low, high = max(sy, ty), min(sy + sh, ty + th)
+        if start is None and end is None and low <= high:
+            mid = (low + high) / 2
+            left, right = (sx + sw, tx) if sx + sw <= tx else (sx, tx + tw)
+            return [(left, mid), (right, mid)]
+
+        scx, scy = sx + sw / 2, sy + sh / 2
+        tcx, tcy = tx + tw / 2, ty + th / 2
+        vertical = abs(tcy - scy) >= abs(tcx - scx)
+        if start is not None:
+            vertical = start[1] in (sy, sy + sh)
+        if vertical:
+            start = start or (scx, sy + sh if tcy > scy else sy)
+            end = end or (tcx, ty if tcy > scy else ty + th)
+            if abs(start[0] - end[0]) < 0.5:
+                return [start, end]
+            my = (start[1] + end[1]) / 2
+            return [start, (start[0], my), (end[0], my), end]
+        start = start or (sx + sw if tcx > scx else sx, scy)
+        end = end or (tx if tcx > scx else tx + tw, tcy)
+        if abs(start[1] - end[1]) < 0.5:
+            return [start, end]
+        mx = (start[0] + end[0]) / 2
+        return [start, (mx, start[1]), (mx, end[1]), end]
+
+    def _edge(self, edge: _Shape) -> List[str]:
+        route = self._route(edge)
+        if len(route) < 2:
+            return []
+        style = edge.style
+        stroke = _color(style, "strokeColor", "#000000")
+        stroke_width = _number(style.get("strokeWidth"), 1.0)
+        points = list(route)
+        markers: List[str] = []
+        for index, key, fill_key, size_key, default in ((-1, "endArrow", "endFill", "endSize", "classic"),
+                                                        (0, "startArrow", "startFill", "startSize", "none")):
+            kind = style.get(key, default)
+            if kind in ("none", ""):
+                continue
+            tip = points[index]
+            previous = points[index - 1] if index == -1 else points[1]
+            marker, back = _marker(kind, tip, previous, _number(style.get(size_key), DEFAULT_MARKER_SIZE),
+                                   stroke_width, stroke, style.get(fill_key) != "0")
+            if marker:
+                markers.append(marker)
+                points[index] = back
+        for x, y in route:
+            self._extend(x, y)
+        paint = [f"stroke={quoteattr(stroke)}", 'fill="none"']
+        if stroke_width != 1:
+            paint.append(f'stroke-width="{_fmt(stroke_width)}"')
+        if style.get("dashed") == "1":
+            paint.append(f'stroke-dasharray="{_fmt(3 * stroke_width)} {_fmt(3 * stroke_width)}"')
+        if style.get("rounded") == "1":
+            paint.append('stroke-linejoin="round"')
+        out = [f'<polyline points="{_points_attr(points)}" {" ".join(paint)}/>'] + markers
+        if edge.label:
+            (lx, ly) = _along(route, 0.5)
+            out.extend(self._edge_label(edge.label, style, lx, ly))
+        return out
+
+    def _edge_label(self, text: str, style: Dict[str, str], x: float, y: float) -> List[str]:
+        font_size = _number(style.get("fontSize"), DEFAULT_FONT_SIZE)
+        lines = text.split("\n")
+        w = max(text_width(line, font_size) for line in lines) + 4
+        h = font_size * 1.2 * len(lines)
+        label_style = {k: v for k, v in style.items() if k not in ("whiteSpace", "align", "verticalAlign")}
+        return self._text(text, label_style, x - w / 2, y - h / 2, w, h,
+                          background=_color(style, "labelBackgroundColor", "#ffffff"))
+
+    def _edge_child_label(self, shape: _Shape) -> List[str]:
+        """连线上的标签单元（relative几何，x为-1到1的位置，offset为偏移）"""
+        route = self._route(self.shapes[shape.parent])
+        if len(route) < 2 or not shape.label:
+            return []
+        x, y = _along(route, (shape.x + 1) / 2)
+        if shape.offset is not None:
+            x, y = x + shape.offset[0], y + shape.offset[1]
+        return self._edge_label(shape.label, shape.style, x, y)
+
+def _along(route: List[Point], fraction: float) -> Point:
+    """折线上按长度比例取点"""
+    lengths = [math.dist(a, b) for a, b in zip(route, route[1:])]
+    remaining = sum(lengths) * min(max(fraction, 0.0), 1.0)
+    for (a, b), length in zip(zip(route, route[1:]), lengths):
+        if remaining <= length and length > 0:
+            t = remaining / length
+            return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+        remaining -= length
+    return route[-1]
+
+def _marker(kind: str, tip: Point, previous: Point, size: float, stroke_width: float,
+            color: str, filled: bool) -> Tuple[Optional[str], Point]:
+    """
+    绘制箭头
+
+    Returns:
+        Tuple[Optional[str], Point]: 箭头的SVG元素和线段应缩短到的端点
+    """
+    dx, dy = tip[0] - previous[0], tip[1] - previous[1]
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return None, tip
+    ux, uy = dx / length, dy / length
+    # 与mxMarker一致：长度为size+线宽，宽度与长度相同
+    depth = size + stroke_width
+    half = depth / 2
+
+    def at(back: float, side: float) -> Point:
+        return (tip[0] - ux * back - uy * side, tip[1] - uy * back + ux * side)
+
+    fill = quoteattr(color) if filled else '"none"'
+    stroke = f"stroke={quoteattr(color)}"
+    if kind in ("open", "openThin"):
+        points = [at(depth, half), tip, at(depth, -half)]
+        return f'<polyline points="{_points_attr(points)}" fill="none" {stroke}/>', at(stroke_width / 2, 0)
+    if kind in ("diamond", "diamondThin"):
+        points = [tip, at(depth / 2, half), at(depth, 0), at(depth / 2, -half)]
+        return f'<polygon points="{_points_attr(points)}" fill={fill} {stroke}/>', at(depth, 0)
+    if kind == "oval":
+        cx, cy = at(size / 2, 0)
+        return (f'<circle cx="{_fmt(cx)}" cy="{_fmt(cy)}" r="{_fmt(size / 2)}" fill={fill} {stroke}/>',
+                at(size, 0))
+    if kind in ("block", "blockThin"):
+        points = [tip, at(depth, half), at(depth, -half)]
+        return f'<polygon points="{_points_attr(points)}" fill={fill} {stroke}/>', at(depth, 0)
+    # classic / classicThin及未知类型
+    points = [tip, at(depth, half), at(depth * 0.75, 0), at(depth, -half)]
+    return f'<polygon points="{_points_attr(points)}" fill={fill} {stroke}/>', at(depth * 0.75, 0)
+
+def render_svg(
+    content: str,
+    page: int = 0,
+    max_width: Optional[float] = None,
+    max_height: Optional[float] = None
+) -> str:
+    """
+    将drawio图表的指定页面渲染为SVG
+
+    Args:
+        content: drawio XML（<mxfile>或<mxGraphModel>，支持压缩页面）
+        page: 页面序号
+        max_width: 输出宽度上限
+        max_height: 输出高度上限
+
+    Returns:
+        str: SVG文本
+
+    Raises:
+        ValueError: XML不合法或页面不存在
+    """
+    model = get_graph_model(parse_xml(inflate_mxfile(content)), page)
+    if model is None:
+        raise ValueError(f"页面{page}不存在")
+    return SvgRenderer(model).render(max_width, max_height)
@@ -0,0 +1,181 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.png_raster import rasterize_svg, svg_size
+from app.services.preview_cache import PreviewCache
+from app.services.svg_renderer import render_svg, RENDERER_VERSION
+
+def _sizes_from_env() -> Tuple[int, ...]:
+    return tuple(sorted({int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(",") if size.strip()}))
+
+@dataclass
+class ThumbnailConfig:
+    """缩略图配置，默认值可通过环境变量覆盖"""
+    # 缩略图长边的像素数
+    sizes: Tuple[int, ...] = field(default_factory=_sizes_from_env)
+    # 光栅化进程数，为0时在线程池中执行（适用于测试）
+    workers: int = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+    # 后台队列长度，队列满时丢弃任务，请求时再按需生成
+    queue_size: int = int(os.getenv("THUMBNAIL_QUEUE_SIZE", "64"))
+
+def thumbnail_key(content_hash: str, size: int) -> str:
+    """缩略图的缓存键"""
+    return f"{content_hash}-w{size}-v{RENDERER_VERSION}.png"
+
+def render_thumbnails(content: str, sizes: Tuple[int, ...]) -> Dict[int, bytes]:
+    """
+    生成各尺寸的PNG缩略图（在子进程中执行，SVG只渲染一次）
+
+    Raises:
+        ValueError: 图表内容无法解析
+    """
+    svg = render_svg(content)
+    width, height = svg_size(svg)
+    images = {}
+    for size in sizes:
+        scale = size / max(width, height, 1)
+        images[size] = rasterize_svg(svg, max(1, round(width * scale)), max(1, round(height * scale)))
+    return images
+
+class ThumbnailPipeline:
+    """
+    后台缩略图流水线
+
+    订阅DrawService的创建/更新事件，把任务放入有界队列，由workers个消费者提交到进程池光栅化，
+    结果按内容哈希写入预览缓存。同一内容同时只生成一次，请求时如果正在生成则等待同一个结果。
+    """
+
+    def __init__(
+        self,
+        cache: PreviewCache,
+        config: Optional[ThumbnailConfig] = None,
+        executor: Optional[Executor] = None
+    ):
+        self.cache = cache
+        self.config = config or ThumbnailConfig()
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: List[asyncio.Task] = []
+        self._tasks: set = set()
+        # 内容哈希 -> 正在进行的生成任务
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"queued": 0, "dropped": 0, "deduped": 0, "rendered": 0, "errors": 0}
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self._executor is None and self.config.workers > 0:
+            # 使用spawn启动子进程，避免在有线程的进程中fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.config.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.config.queue_size)
+            self._consumers = [
+                asyncio.create_task(self._consume()) for _ in range(max(self.config.workers, 1))
+            ]
+
+    def on_diagram_event(self, event: str, diagram: Dict[str, Any]) -> None:
+        """DrawService事件回调"""
+        if event in ("created", "updated"):
+            self.submit(diagram["content_hash"], diagram["content"])
+
+    def submit(self, content_hash: str, content: str) -> bool:
+        """
+        提交后台生成任务（不阻塞）
+
+        Returns:
+            bool: 是否入队；已缓存、正在生成或队列已满时返回False
+        """
+        if content_hash in self._pending or all(
+            self.cache.lookup(thumbnail_key(content_hash, size)) is not None for size in self.config.sizes
+        ):
+            self.stats["deduped"] += 1
+            return False
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((content_hash, content, future))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self._pending[content_hash] = future
+        self.stats["queued"] += 1
+        return True
+
+    async def _consume(self) -> None:
+        while True:
+            content_hash, content, future = await self._queue.get()
+            try:
+                await self._run(content_hash, content, future)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, content_hash: str, content: str, future: asyncio.Future) -> None:
+        try:
+            if await self._all_cached(content_hash):
+                self.stats["deduped"] += 1
+            else:
+                images = await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), render_thumbnails, content, self.config.sizes
+                )
+                for size, data in images.items():
+                    await self.cache.put(thumbnail_key(content_hash, size), data)
+                self.stats["rendered"] += 1
+            future.set_result(None)
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # 后台任务没有等待方时避免"exception was never retrieved"警告
+            future.exception()
+        finally:
+            self._pending.pop(content_hash, None)
+
+    async def _all_cached(self, content_hash: str) -> bool:
+        """磁盘上已有全部尺寸时（如其他worker进程生成过）不再生成"""
+        for size in self.config.sizes:
+            if await self.cache.get(thumbnail_key(content_hash, size)) is None:
+                return False
+        return True
+
+    async def get(self, content_hash: str, content: str, size: int) -> bytes:
+        """
+        获取缩略图，未生成时立即生成（不经过后台队列）
+
+        Raises:
+            ValueError: 尺寸不受支持或图表内容无法解析
+        """
+        if size not in self.config.sizes:
+            raise ValueError(f"不支持的缩略图尺寸: {size}")
+        key = thumbnail_key(content_hash, size)
+        data = await self.cache.get(key)
+        if data is not None:
+            return data
+        future = self._pending.get(content_hash)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[content_hash] = future
+            task = asyncio.create_task(self._run(content_hash, content, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        await asyncio.shield(future)
+        data = await self.cache.get(key)
+        if data is None:
+            # 缓存容量过小时内存中的结果可能已被挤出且未启用磁盘缓存
+            data = (await asyncio.to_thread(render_thumbnails, content, (size,)))[size]
+        return data
+
+    async def aclose(self) -> None:
+        """停止消费者并关闭进程池"""
+        for task in self._consumers + list(self._tasks):
+            task.cancel()
+        self._consumers = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
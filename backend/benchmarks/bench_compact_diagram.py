@@ -0,0 +1,76 @@
+"""
+紧凑表示的输入体积基准测试
+
+对比原始XML与紧凑表示的字符数、字节数和token数（安装tiktoken时使用cl100k_base统计，
+否则只输出字节数），以及编码/还原耗时。
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_compact_diagram [单元数 ...]
+"""
+import random
+import string
+import sys
+import time
+from app.services.compact_diagram import encode_diagram, decode_diagram
+
+try:
+    import tiktoken
+    ENCODING = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    ENCODING = None
+
+STYLES = [
+    "rounded=1;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;",
+    "rhombus;whiteSpace=wrap;html=1;fillColor=#fff2cc;strokeColor=#d6b656;",
+    "ellipse;whiteSpace=wrap;html=1;fillColor=#d5e8d4;strokeColor=#82b366;",
+]
+EDGE_STYLE = "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;"
+
+def build_file(cells: int, seed: int = 0) -> str:
+    """生成drawio风格（随机前缀id、重复样式）的<mxfile>"""
+    rng = random.Random(seed)
+    prefix = "".join(rng.choices(string.ascii_letters + string.digits, k=20))
+    parts = [
+        '<mxfile host="app.diagrams.net"><diagram id="page-1" name="Page-1">'
+        '<mxGraphModel dx="1426" dy="794" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+        'arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">'
+        '<root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+    ]
+    for i in range(cells):
+        parts.append(
+            f'<mxCell id="{prefix}-{2 * i}" value="步骤{i}" style="{rng.choice(STYLES)}" vertex="1" parent="1">'
+            f'<mxGeometry x="{(i % 20) * 160}" y="{(i // 20) * 100}" width="120" height="60" as="geometry"/></mxCell>'
+        )
+        if i:
+            parts.append(
+                f'<mxCell id="{prefix}-{2 * i + 1}" value="" style="{EDGE_STYLE}" edge="1" parent="1" '
+                f'source="{prefix}-{2 * i - 2}" target="{prefix}-{2 * i}">'
+                f'<mxGeometry relative="1" as="geometry"/></mxCell>'
+            )
+    parts.append("</root></mxGraphModel></diagram></mxfile>")
+    return "".join(parts)
+
+def measure(text: str) -> str:
+    size = f"{len(text):>9} chars {len(text.encode('utf-8')):>9} bytes"
+    if ENCODING is not None:
+        size += f" {len(ENCODING.encode(text)):>8} tokens"
+    return size
+
+def main(sizes):
+    for cells in sizes:
+        content = build_file(cells)
+        start = time.perf_counter()
+        compact = encode_diagram(content)
+        encoded = time.perf_counter() - start
+        start = time.perf_counter()
+        decode_diagram(compact.text, compact)
+        decoded = time.perf_counter() - start
+
+        ratio = len(content.encode("utf-8")) / len(compact.text.encode("utf-8"))
+        print(f"{cells} cells")
+        print(f"  xml     {measure(content)}")
+        print(f"  compact {measure(compact.text)}  ({ratio:.1f}x smaller)")
+        print(f"  encode {encoded * 1000:.1f}ms  decode {decoded * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
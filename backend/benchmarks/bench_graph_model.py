@@ -0,0 +1,44 @@
+"""
+图模型解析基准测试
+
+对比流式解析为GraphModel与ET.fromstring构建整棵ElementTree的耗时和解析后常驻内存
+（tracemalloc统计，不含输入字符串），以及还原为XML的耗时。
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_graph_model [单元数 ...]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from app.services.graph_model import parse_graph
+from benchmarks.bench_compact_diagram import build_file
+
+def measure(parse, content):
+    """返回(结果, 耗时, 常驻内存, 峰值内存)"""
+    gc.collect()
+    start = time.perf_counter()
+    parse(content)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = parse(content)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+def main(sizes):
+    for cells in sizes:
+        content = build_file(cells)
+        print(f"{cells} cells ({len(content.encode('utf-8')) / 1024:.0f} KB)")
+        for name, parse in (("etree", ET.fromstring), ("graph", parse_graph)):
+            _, elapsed, current, peak = measure(parse, content)
+            print(f"  {name:<6} parse {elapsed * 1000:7.1f}ms  resident {current / 1024:8.0f} KB  peak {peak / 1024:8.0f} KB")
+        model = parse_graph(content)
+        start = time.perf_counter()
+        model.to_mxfile()
+        print(f"  graph  to_mxfile {(time.perf_counter() - start) * 1000:.1f}ms  styles {len(model.style_table)}")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
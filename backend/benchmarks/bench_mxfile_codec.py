@@ -0,0 +1,65 @@
+"""
+mxfile压缩格式编解码基准测试
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_mxfile_codec [单元数 ...]
+"""
+import base64
+import sys
+import time
+import zlib
+from urllib.parse import quote, unquote
+from app.services.mxfile_codec import compress_diagram, decompress_diagram, URI_SAFE
+
+def build_model(cells: int) -> str:
+    """生成包含指定数量节点和连线的<mxGraphModel>"""
+    parts = ['<mxGraphModel dx="1000" dy="800"><root><mxCell id="0"/><mxCell id="1" parent="0"/>']
+    for i in range(cells):
+        parts.append(
+            f'<mxCell id="v{i}" value="步骤{i} &amp; 处理" style="rounded=1;whiteSpace=wrap;html=1;fillColor=#dae8fc;" '
+            f'vertex="1" parent="1"><mxGeometry x="{(i % 50) * 160}" y="{(i // 50) * 100}" '
+            f'width="120" height="60" as="geometry"/></mxCell>'
+        )
+        if i:
+            parts.append(
+                f'<mxCell id="e{i}" style="edgeStyle=orthogonalEdgeStyle;" edge="1" parent="1" '
+                f'source="v{i - 1}" target="v{i}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+            )
+    parts.append("</root></mxGraphModel>")
+    return "".join(parts)
+
+def naive_decompress(data: str) -> str:
+    """一次性解码的参考实现"""
+    return unquote(zlib.decompress(base64.b64decode(data), -zlib.MAX_WBITS).decode("ascii"))
+
+def naive_compress(xml: str) -> str:
+    deflater = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    raw = deflater.compress(quote(xml, safe=URI_SAFE).encode("ascii")) + deflater.flush()
+    return base64.b64encode(raw).decode("ascii")
+
+def timeit(func, *args, repeat: int = 5) -> float:
+    """返回多次运行中的最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(sizes):
+    print(f"{'cells':>8} {'xml MB':>8} {'b64 MB':>8} {'decode':>10} {'naive':>10} {'encode':>10} {'naive':>10}")
+    for cells in sizes:
+        xml = build_model(cells)
+        data = compress_diagram(xml)
+        assert decompress_diagram(data) == xml == naive_decompress(data)
+        mb = len(xml.encode("utf-8")) / 1e6
+        print(
+            f"{cells:>8} {mb:>8.2f} {len(data) / 1e6:>8.2f}"
+            f" {timeit(decompress_diagram, data) * 1000:>8.1f}ms"
+            f" {timeit(naive_decompress, data) * 1000:>8.1f}ms"
+            f" {timeit(compress_diagram, xml) * 1000:>8.1f}ms"
+            f" {timeit(naive_compress, xml) * 1000:>8.1f}ms"
+        )
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 40000])
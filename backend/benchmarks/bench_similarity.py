@@ -0,0 +1,86 @@
+"""
+相似图表检索基准测试
+
+生成由少量"模板"流程随机改写而来的图表，统计签名计算、写入索引，以及LSH检索与逐个比较签名的
+全量扫描的耗时，并给出LSH检索相对全量扫描的召回率。
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_similarity [图表数 ...]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.similarity import diagram_features, minhash, similarity, unpack_signature
+from app.services.storage import SQLiteStorage
+
+WORDS = ["读取", "校验", "清洗", "训练", "评估", "部署", "监控", "告警", "归档", "审批", "通知", "汇总"]
+SHAPES = ["rounded=1;", "rhombus;", "ellipse;", "shape=cylinder3;"]
+
+def build_file(rng: random.Random, template: int) -> str:
+    """在模板流程的基础上随机替换约1/4的步骤"""
+    base = random.Random(template)
+    steps = [(base.choice(WORDS) + base.choice(WORDS) + str(template), base.choice(SHAPES)) for _ in range(12)]
+    for i in rng.sample(range(len(steps)), 3):
+        steps[i] = (rng.choice(WORDS) + rng.choice(WORDS), rng.choice(SHAPES))
+    cells = "".join(
+        f'<mxCell id="v{i}" value="{label}" style="{shape}" vertex="1" parent="1">'
+        f'<mxGeometry x="{i * 200}" y="0" width="120" height="60" as="geometry"/></mxCell>'
+        for i, (label, shape) in enumerate(steps)
+    )
+    cells += "".join(
+        f'<mxCell id="e{i}" edge="1" parent="1" source="v{i}" target="v{i + 1}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+        for i in range(len(steps) - 1)
+    )
+    return ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+            f'{cells}</root></mxGraphModel></diagram></mxfile>')
+
+async def run(count: int, directory: str) -> None:
+    rng = random.Random(0)
+    contents = [build_file(rng, rng.randrange(max(count // 20, 1))) for _ in range(count)]
+    start = time.perf_counter()
+    signatures = [minhash(diagram_features(content)) for content in contents]
+    signing = (time.perf_counter() - start) * 1000
+
+    storage = SQLiteStorage(os.path.join(directory, f"bench-{count}.db"))
+    service = DrawService(storage, previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+    start = time.perf_counter()
+    for content in contents:
+        await service.create_diagram("drawio", content)
+    insert = (time.perf_counter() - start) * 1000
+    await service.rebuild_indexes()
+
+    probes = contents[:50]
+    start = time.perf_counter()
+    lsh_hits = [await service.find_similar(content=content, limit=1000) for content in probes]
+    lsh = (time.perf_counter() - start) * 1000 / len(probes)
+
+    start = time.perf_counter()
+    rows = storage._connect().execute("SELECT diagram_id, signature FROM diagram_signatures WHERE kind = 'diagram'").fetchall()
+    stored = [(row["diagram_id"], unpack_signature(row["signature"])) for row in rows]
+    scan_hits = []
+    for content in probes:
+        probe = minhash(diagram_features(content))
+        scan_hits.append({
+            diagram_id for diagram_id, signature in stored if similarity(probe, signature) >= service.similarity.threshold
+        })
+    scan = (time.perf_counter() - start) * 1000 / len(probes)
+    found = sum(len({hit["id"] for hit in hits} & expected) for hits, expected in zip(lsh_hits, scan_hits))
+    recall = found / max(sum(len(expected) for expected in scan_hits), 1)
+
+    print(f"{count} diagrams")
+    print(f"  signature {signing / count:.2f}ms/diagram  create + index {insert / count:.2f}ms/diagram")
+    print(f"  find_similar (LSH) {lsh:.1f}ms/query  full scan {scan:.1f}ms/query  recall {recall:.1%}")
+    await service.aclose()
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as directory:
+        for count in sizes:
+            asyncio.run(run(count, directory))
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 5000])
@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from app.llm.base import LLMDelta, LLMResponse
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.storage import MemoryStorage, SQLiteStorage
+# 各测试共用的fixture和模拟模型
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    """内存和SQLite两种存储后端各运行一次"""
+    storage = MemoryStorage() if request.param == "memory" else SQLiteStorage(str(tmp_path / "test.db"))
+    yield storage
+    asyncio.run(storage.aclose())
+
+@pytest.fixture
+def service(storage):
+    """基于storage的DrawService，不写预览图缓存"""
+    return DrawService(storage, previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+
+class FakeLLM:
+    """固定返回answer的模型，记录调用次数和提示词；流式输出先给一段思考过程，再按50字切分回答"""
+    model_name = "fake"
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = 0
+        self.prompts = []
+
+    async def chat(self, prompt):
+        self.calls += 1
+        self.prompts.append(prompt)
+        return LLMResponse(answer_content=self.answer)
+
+    async def stream_deltas(self, prompt, include_usage=False):
+        self.calls += 1
+        self.prompts.append(prompt)
+        yield LLMDelta(reasoning_content="先想一想")
+        for i in range(0, len(self.answer), 50):
+            yield LLMDelta(answer_content=self.answer[i:i + 50])
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import pytest
+from app.services.blob_store import MemoryBlobStore, blob_key, pack_blob, unpack_blob
+from app.services.draw_service import DrawService
+from app.services.storage import MemoryStorage, SQLiteStorage
+# python -m pytest backend/tests/test_blob_store.py
+
+DIAGRAM = "<mxfile><diagram id=\"p1\"><mxGraphModel><root>" + "".join(
+    f'<mxCell id="n{i}" value="节点{i}" style="rounded=1;whiteSpace=wrap;html=1;" vertex="1" parent="1">'
+    f'<mxGeometry x="{i * 10}" y="40" width="120" height="60" as="geometry"/></mxCell>'
+    for i in range(50)
+) + "</root></mxGraphModel></diagram></mxfile>"
+
+def blob_count(storage):
+    if isinstance(storage, MemoryStorage):
+        return len(storage.blobs.blobs)
+    return storage._connect().execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+def test_pack_roundtrip():
+    data = pack_blob(DIAGRAM)
+    assert unpack_blob(data) == DIAGRAM
+    assert len(data) * 5 < len(DIAGRAM.encode("utf-8"))
+    with pytest.raises(ValueError):
+        unpack_blob(b"not compressed")
+
+def test_memory_blob_refcount():
+    store = MemoryBlobStore("zlib")
+    key = store.acquire("a")
+    assert store.acquire("a") == key == blob_key("a")
+    store.release(key)
+    assert store.get(key) == "a"
+    store.release(key)
+    assert key not in store.blobs
+
+def test_duplicates_share_blob(storage):
+    async def run():
+        service = DrawService(storage)
+        first = await service.create_diagram("drawio", DIAGRAM)
+        second = await service.create_diagram("drawio", DIAGRAM)
+        assert first["content_hash"] == second["content_hash"]
+        # 两个图表和各自的首个快照共用一个blob
+        assert blob_count(storage) == 1
+        assert (await service.get_diagram(second["id"]))["content"] == DIAGRAM
+
+        await service.update_diagram(first["id"], DIAGRAM.replace("节点1", "改"))
+        assert blob_count(storage) == 2
+        await service.delete_diagram(first["id"])
+        assert blob_count(storage) == 1
+        await service.delete_diagram(second["id"])
+        assert blob_count(storage) == 0
+    asyncio.run(run())
+
+def test_collect_garbage_repairs_refcounts(storage):
+    async def run():
+        service = DrawService(storage)
+        created = await service.create_diagram("drawio", DIAGRAM)
+        assert await service.collect_garbage() == 0
+        if isinstance(storage, MemoryStorage):
+            storage.blobs.acquire("orphan")
+        else:
+            with storage._transaction() as conn:
+                storage._acquire(conn, "orphan")
+        assert await service.collect_garbage() == 1
+        assert (await service.get_diagram(created["id"]))["content"] == DIAGRAM
+    asyncio.run(run())
+
+def test_sqlite_migrates_inline_content(tmp_path):
+    """旧版本把内容直接存在diagrams.content中，打开时迁移到blobs表"""
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE diagrams (id TEXT PRIMARY KEY, type TEXT NOT NULL, content TEXT NOT NULL,
+                               created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+        CREATE INDEX idx_diagrams_type ON diagrams(type);
+        CREATE TABLE diagram_versions (diagram_id TEXT NOT NULL, version INTEGER NOT NULL, kind TEXT NOT NULL,
+                                       data TEXT NOT NULL, created_at TEXT NOT NULL,
+                                       PRIMARY KEY (diagram_id, version)) WITHOUT ROWID;
+    """)
+    conn.execute("INSERT INTO diagrams VALUES ('d1', 'drawio', ?, 't', 't')", (DIAGRAM,))
+    conn.execute("INSERT INTO diagram_versions VALUES ('d1', 1, 'snapshot', ?, 't')", (DIAGRAM,))
+    conn.commit()
+    conn.close()
+
+    async def run():
+        service = DrawService(SQLiteStorage(path))
+        diagram = await service.get_diagram("d1")
+        version = await service.get_version("d1", 1)
+        count = blob_count(service.storage)
+        await service.aclose()
+        return diagram, version, count
+    diagram, version, count = asyncio.run(run())
+    assert diagram["content"] == version["content"] == DIAGRAM
+    assert diagram["content_hash"] == blob_key(DIAGRAM)
+    assert count == 1
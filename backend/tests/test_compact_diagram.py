@@ -0,0 +1,92 @@
+import pytest
+from app.services.compact_diagram import encode_diagram, decode_diagram, parse_compact_patch
+from app.services.diagram_diff import diff_pages
+from app.services.diagram_patch import apply_patch
+from app.services.drawio_xml import parse_xml, get_graph_model, cell_index
+# python -m pytest backend/tests/test_compact_diagram.py
+
+CURRENT = """<mxfile host="test"><diagram id="p1" name="Page-1"><mxGraphModel dx="800" dy="600"><root>
+<mxCell id="0"/>
+<mxCell id="1" parent="0"/>
+<mxCell id="aZ3kQ-2" value="数据收集" style="rounded=1;whiteSpace=wrap;html=1;" vertex="1" parent="1"><mxGeometry x="360" y="80" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="aZ3kQ-3" value="数据 分析" style="rounded=1;whiteSpace=wrap;html=1;" vertex="1" parent="1"><mxGeometry x="360" y="200" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="aZ3kQ-4" value="" style="endArrow=classic;" edge="1" parent="1" source="aZ3kQ-2" target="aZ3kQ-3"><mxGeometry relative="1" as="geometry"/></mxCell>
+<mxCell id="aZ3kQ-5" style="endArrow=classic;" edge="1" connectable="0" parent="1" source="aZ3kQ-3" target="aZ3kQ-2"><mxGeometry relative="1" as="geometry"><Array as="points"><mxPoint x="1" y="2"/></Array></mxGeometry></mxCell>
+<UserObject id="u1" label="链接" link="https://example.com"><mxCell style="text;" vertex="1" parent="1"><mxGeometry width="10" height="10" as="geometry"/></mxCell></UserObject>
+</root></mxGraphModel></diagram></mxfile>"""
+
+def cells_of(content):
+    return cell_index(get_graph_model(parse_xml(content)))
+
+def test_encode_factors_styles_and_ids():
+    compact = encode_diagram(CURRENT)
+    lines = compact.text.splitlines()
+    assert lines[0] == "S1 rounded=1;whiteSpace=wrap;html=1;"
+    assert 'V 2 s=S1 v="数据收集" g=360,80,120,60' in lines
+    # 连线的默认几何和默认图层被省略
+    assert "E 4 s=S2 src=2 tgt=3" in lines
+    assert "aZ3kQ" not in compact.text
+    assert compact.ids["p1"]["2"] == "aZ3kQ-2"
+
+def test_round_trip_is_lossless():
+    """还原后与原文件没有任何单元级差异"""
+    compact = encode_diagram(CURRENT)
+    restored = decode_diagram(compact.text, compact)
+    assert diff_pages(CURRENT, restored) == {}
+    assert 'dx="800"' in restored
+
+def test_decode_model_reply():
+    """模型引用样式表和短id输出的新图表可以还原，新增id原样保留"""
+    compact = encode_diagram(CURRENT)
+    reply = '```\nV 2 s=S1 v="收集" g=0,0,120,60\nV 7 s="ellipse;" v="新节点" g=0,100,80,80\nE 8 src=2 tgt=7\n```'
+    cells = cells_of(decode_diagram(reply, compact))
+    assert set(cells) == {"0", "1", "aZ3kQ-2", "7", "8"}
+    assert cells["aZ3kQ-2"].get("style") == "rounded=1;whiteSpace=wrap;html=1;"
+    assert cells["8"].get("source") == "aZ3kQ-2"
+    assert cells["8"].find("mxGeometry").get("relative") == "1"
+
+MULTI_PAGE = """<mxfile><diagram id="p1" name="流程"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="a" value="开始" vertex="1" parent="1"><mxGeometry width="80" height="40" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram><diagram id="p2" name="架构"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="b" value="服务" vertex="1" parent="1"><mxGeometry width="80" height="40" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram><diagram id="p3" name="部署"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="c" value="主机" vertex="1" parent="1"><mxGeometry width="80" height="40" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram></mxfile>"""
+
+def test_multi_page_round_trip():
+    """只输出修改的页面时，其他页面按原顺序保留；删除页面需要显式的X行"""
+    compact = encode_diagram(MULTI_PAGE)
+    assert diff_pages(MULTI_PAGE, decode_diagram(compact.text, compact)) == {}
+
+    restored = parse_xml(decode_diagram('P p2 name="架构"\nV 2 v="网关" g=,,80,40', compact))
+    pages = restored.findall("diagram")
+    assert [page.get("id") for page in pages] == ["p1", "p2", "p3"]
+    assert cell_index(pages[0].find("mxGraphModel"))["a"].get("value") == "开始"
+    assert cell_index(pages[1].find("mxGraphModel"))["b"].get("value") == "网关"
+    assert cell_index(pages[2].find("mxGraphModel"))["c"].get("value") == "主机"
+
+    restored = parse_xml(decode_diagram('X p1\nP p4 name="新页面"\nV 9 v="新节点" g=0,0,80,40', compact))
+    assert [page.get("id") for page in restored.findall("diagram")] == ["p2", "p3", "p4"]
+
+def test_compact_patch():
+    compact = encode_diagram(CURRENT)
+    ops = parse_compact_patch('~ 3 v="统计" g=,260,,\n+ V 9 after=2 s=S1 v="评审" g=0,0,80,40\n- 6', compact)
+    assert ops[0] == {"op": "update", "id": "aZ3kQ-3", "attrs": {"value": "统计"}, "geometry": {"y": "260"}}
+    assert ops[1]["after"] == "aZ3kQ-2"
+    assert ops[2] == {"op": "delete", "id": "u1"}
+
+    cells = cells_of(apply_patch(CURRENT, ops))
+    assert cells["aZ3kQ-3"].get("value") == "统计"
+    assert cells["9"].get("style") == "rounded=1;whiteSpace=wrap;html=1;"
+    assert "u1" not in cells
+
+def test_invalid_lines():
+    compact = encode_diagram(CURRENT)
+    with pytest.raises(ValueError):
+        decode_diagram("Q 2 v=1", compact)
+    with pytest.raises(ValueError):
+        parse_compact_patch("~ 2 s=S99", compact)
+    # 缺少单元id或多出参数的补丁行报ValueError，而不是IndexError
+    for line in ("-", "- 2 3", "~"):
+        with pytest.raises(ValueError):
+            parse_compact_patch(line, compact)
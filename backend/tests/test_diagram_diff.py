@@ -0,0 +1,64 @@
+from app.services.diagram_diff import diff_pages
+from app.services.diagram_patch import apply_patch, parse_patch
+# python -m pytest backend/tests/test_diagram_diff.py
+
+CURRENT = """<mxfile host="test"><diagram id="p1" name="Page-1"><mxGraphModel dx="800" dy="600" pageWidth="827" pageHeight="1169"><root>
+<mxCell id="0"/>
+<mxCell id="1" parent="0"/>
+<mxCell id="2" value="数据收集" style="rounded=1;" vertex="1" parent="1"><mxGeometry x="360" y="80" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="3" value="数据分析" style="rounded=0;" vertex="1" parent="1"><mxGeometry x="360" y="200" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="4" value="" style="endArrow=classic;" edge="1" parent="1" source="2" target="3"><mxGeometry relative="1" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram></mxfile>"""
+
+def test_identical_files_give_empty_patch():
+    assert diff_pages(CURRENT, CURRENT) == {}
+
+def test_cell_update_remove_insert():
+    """修改、删除和新增单元分别出现在u/r/i中"""
+    new = apply_patch(CURRENT, parse_patch("""[
+        {"op": "update", "id": "2", "attrs": {"value": "收集"}, "geometry": {"y": 100}},
+        {"op": "delete", "id": "3"},
+        {"op": "add", "after": "2", "cell": "<mxCell id='5' value='评审' vertex='1' parent='1'><mxGeometry x='0' y='0' width='80' height='40' as='geometry'/></mxCell>"}
+    ]"""))
+    patch = diff_pages(CURRENT, new)
+    cells = patch["u"]["p1"]["cells"]
+
+    assert cells["u"]["2"]["value"] == "收集"
+    assert 'y="100"' in cells["u"]["2"]["geometry"]
+    assert 'as=' not in cells["u"]["2"]["geometry"]
+    assert sorted(cells["r"]) == ["3", "4"]
+    assert cells["i"] == [{
+        "id": "5",
+        "vertex": 1,
+        "parent": "1",
+        "previous": "2",
+        "geometry": '<mxGeometry x="0" y="0" width="80" height="40" />',
+        "value": "评审"
+    }]
+
+def test_wrapped_cell_uses_xml_value():
+    """UserObject包裹的单元以xmlValue传递自定义属性"""
+    new = CURRENT.replace(
+        '<mxCell id="3" value="数据分析" style="rounded=0;" vertex="1" parent="1"><mxGeometry x="360" y="200" width="120" height="60" as="geometry"/></mxCell>',
+        '<UserObject id="3" label="数据分析" link="https://example.com"><mxCell style="rounded=0;" vertex="1" parent="1"><mxGeometry x="360" y="200" width="120" height="60" as="geometry"/></mxCell></UserObject>'
+    )
+    patch = diff_pages(CURRENT, new)
+    diff = patch["u"]["p1"]["cells"]["u"]["3"]
+    assert diff["xmlValue"] == '<UserObject label="数据分析" link="https://example.com" />'
+
+def test_page_changes():
+    """页面重命名、视图属性变化和新增页面"""
+    new = CURRENT.replace('name="Page-1"', 'name="流程"').replace('pageWidth="827"', 'pageWidth="1000"')
+    new = new.replace("</mxfile>", '<diagram id="p2" name="Page-2"><mxGraphModel><root><mxCell id="0"/></root></mxGraphModel></diagram></mxfile>')
+    patch = diff_pages(CURRENT, new)
+
+    assert patch["u"]["p1"]["name"] == "流程"
+    assert patch["u"]["p1"]["view"] == {"pageFormat": '{"x":0,"y":0,"width":1000,"height":1169}'}
+    assert patch["i"][0]["id"] == "p2"
+    assert patch["i"][0]["previous"] == "p1"
+
+def test_unsupported_content_returns_none():
+    """压缩页面或非法XML无法计算补丁"""
+    compressed = '<mxfile><diagram id="p1">7VnbcpswEP0aP5bhZsCPsZ22...</diagram></mxfile>'
+    assert diff_pages(CURRENT, compressed) is None
+    assert diff_pages(CURRENT, "<mxfile>") is None
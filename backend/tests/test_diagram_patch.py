@@ -0,0 +1,69 @@
+import pytest
+from app.services.diagram_patch import PatchError, parse_patch, apply_patch, can_patch
+from app.services.drawio_xml import parse_xml, get_graph_model, cell_index
+# python -m pytest backend/tests/test_diagram_patch.py
+
+CURRENT = """<mxfile host="test"><diagram id="p1" name="Page-1"><mxGraphModel dx="800" dy="600"><root>
+<mxCell id="0"/>
+<mxCell id="1" parent="0"/>
+<mxCell id="2" value="数据收集" style="rounded=1;" vertex="1" parent="1"><mxGeometry x="360" y="80" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="3" value="数据分析" style="rounded=0;" vertex="1" parent="1"><mxGeometry x="360" y="200" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="4" value="" style="endArrow=classic;" edge="1" parent="1" source="2" target="3"><mxGeometry relative="1" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram></mxfile>"""
+
+def cells_of(content):
+    return cell_index(get_graph_model(parse_xml(content)))
+
+def test_parse_patch_with_code_fence():
+    """支持```json围栏和operations包装"""
+    ops = parse_patch('```json\n{"operations": [{"op": "delete", "id": "4"}]}\n```')
+    assert ops == [{"op": "delete", "id": "4"}]
+
+def test_parse_patch_rejects_unknown_op():
+    with pytest.raises(PatchError):
+        parse_patch('[{"op": "move", "id": "2"}]')
+
+@pytest.mark.parametrize("op", [
+    '{"op": "update", "id": "3", "attrs": "x"}',
+    '{"op": "update", "id": "3", "attrs": ["value", "x"]}',
+    '{"op": "update", "id": "3", "attrs": {"value": {"text": "x"}}}',
+    '{"op": "update", "id": "3", "geometry": [0, 0]}',
+    '{"op": "update", "id": "3", "geometry": {"y": [260]}}',
+    '{"op": "update", "id": "3", "geometry": {"y": true}}',
+])
+def test_parse_patch_rejects_malformed_fields(op):
+    """attrs/geometry的类型不对时在解析阶段报错，而不是应用时抛出AttributeError"""
+    with pytest.raises(PatchError):
+        parse_patch(f"[{op}]")
+
+def test_add_update_delete():
+    """新增、修改和删除操作按顺序应用"""
+    ops = parse_patch("""[
+        {"op": "add", "after": "2", "cell": "<mxCell id='5' value='评审' vertex='1' parent='1'><mxGeometry x='360' y='140' width='120' height='40' as='geometry'/></mxCell>"},
+        {"op": "update", "id": "3", "attrs": {"value": "统计分析"}, "geometry": {"y": 260}},
+        {"op": "update", "id": "4", "attrs": {"target": "5"}}
+    ]""")
+    cells = cells_of(apply_patch(CURRENT, ops))
+    assert list(cells) == ["0", "1", "2", "5", "3", "4"]
+    assert cells["3"].get("value") == "统计分析"
+    assert cells["3"].find("mxGeometry").get("y") == "260"
+    assert cells["4"].get("target") == "5"
+
+def test_delete_cascades_to_edges():
+    """删除节点时相连的连线一并删除"""
+    cells = cells_of(apply_patch(CURRENT, [{"op": "delete", "id": "3"}]))
+    assert "3" not in cells and "4" not in cells
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "update", "id": "99", "attrs": {"value": "x"}}],
+    [{"op": "add", "cell": "<mxCell id='2' vertex='1' parent='1'/>"}],
+    [{"op": "add", "cell": "<mxCell id='6' edge='1' parent='1' source='2' target='404'/>"}],
+])
+def test_invalid_patch_raises(ops):
+    """补丁引用不存在的单元或产生无效结构时报错，交由调用方回退"""
+    with pytest.raises(PatchError):
+        apply_patch(CURRENT, ops)
+
+def test_compressed_page_cannot_patch():
+    assert can_patch(CURRENT)
+    assert not can_patch('<mxfile><diagram id="p1">7ZdNb9sgGMc/jY+dbGM77jFJu+6wSZN62HYkNrVRMViYNE4//Z4CdU0b</diagram></mxfile>')
@@ -0,0 +1,68 @@
+import pytest
+from app.services.graph_model import parse_graph, KIND_EDGE, KIND_OTHER, KIND_VERTEX
+from app.services.mxfile_codec import compress_mxfile
+# python -m pytest backend/tests/test_graph_model.py
+
+CONTENT = """<mxfile host="test"><diagram id="p1" name="Page-1"><mxGraphModel dx="800" dy="600"><root>
+<mxCell id="0"/>
+<mxCell id="1" parent="0"/>
+<mxCell id="g" value="" style="group" vertex="1" connectable="0" parent="1"><mxGeometry x="200" y="100" width="200" height="100" as="geometry"/></mxCell>
+<mxCell id="a" value="数据收集" style="rounded=1;html=1;" vertex="1" parent="g"><mxGeometry x="10" y="20" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="p" value="" style="ellipse;" vertex="1" parent="a"><mxGeometry x="1" y="0.5" width="8" height="8" relative="1" as="geometry"><mxPoint x="-4" y="-4" as="offset"/></mxGeometry></mxCell>
+<UserObject id="b" label="链接 &amp; &quot;引号&quot;" link="https://example.com"><mxCell style="rounded=1;html=1;" vertex="1" parent="1"><mxGeometry x="10.5" y="300" width="120" height="60" as="geometry"/></mxCell></UserObject>
+<mxCell id="e" value="a&#10;b" style="endArrow=classic;" edge="1" parent="1" source="a" target="b"><mxGeometry relative="1" as="geometry"><Array as="points"><mxPoint x="70" y="250.5"/></Array></mxGeometry></mxCell>
+<mxCell id="d" style="endArrow=classic;" edge="1" parent="1" source="b" target="missing"><mxGeometry relative="1" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram><diagram id="p2" name="Page-2"><mxGraphModel><root><mxCell id="0"/></root></mxGraphModel></diagram></mxfile>"""
+
+def snapshot(model):
+    """用于比较两个模型是否等价"""
+    return (
+        model.ids, list(model.kinds), list(model.parents), list(model.sources), list(model.targets),
+        [model.style(i) for i in range(len(model))], model.values, list(model.geometry), list(model.geo_flags),
+        {i: list(points) for i, points in model.points.items()},
+        {i: (e.attrs, e.geo_attrs, e.geo_children, e.wrapper) for i, e in model.extras.items()},
+        model.model_attrs
+    )
+
+def test_parse_structure():
+    model = parse_graph(CONTENT)
+    i = model.index
+    assert len(model) == 8
+    assert model.kinds[i["0"]] == KIND_OTHER and model.kinds[i["a"]] == KIND_VERTEX and model.kinds[i["e"]] == KIND_EDGE
+    assert model.parents[i["a"]] == i["g"] and model.parents[i["0"]] == -1
+    assert (model.sources[i["e"]], model.targets[i["e"]]) == (i["a"], i["b"])
+    # 相同样式只保存一份
+    assert model.styles[i["a"]] == model.styles[i["b"]]
+    assert len(model.style_table) == 4
+    assert model.bounds(i["b"]) == (10.5, 300.0, 120.0, 60.0)
+    assert list(model.points[i["e"]]) == [70.0, 250.5]
+    assert model.children(i["g"]) == [i["a"]]
+    assert model.vertices() == [i["g"], i["a"], i["p"], i["b"]] and model.edges() == [i["e"], i["d"]]
+    # 无法解析的引用原样保留
+    assert model.targets[i["d"]] == -1 and model.extras[i["d"]].attrs["target"] == "missing"
+
+def test_absolute_geometry():
+    model = parse_graph(CONTENT)
+    geometry = model.absolute_geometry()
+    a, p = model.index["a"], model.index["p"]
+    assert list(geometry[4 * a:4 * a + 4]) == [210.0, 120.0, 120.0, 60.0]
+    # 相对几何按父节点宽高定位
+    assert list(geometry[4 * p:4 * p + 2]) == [330.0, 150.0]
+
+def test_round_trip():
+    model = parse_graph(CONTENT)
+    xml = model.to_mxfile()
+    assert 'link="https://example.com"' in xml and 'value="a&#10;b"' in xml
+    assert snapshot(parse_graph(xml)) == snapshot(model)
+    assert model.page_attrs == {"id": "p1", "name": "Page-1"}
+    assert snapshot(parse_graph(model.to_xml())) == snapshot(model)
+
+def test_pages_and_errors():
+    assert len(parse_graph(CONTENT, page=1)) == 1
+    assert snapshot(parse_graph(compress_mxfile(CONTENT))) == snapshot(parse_graph(CONTENT))
+    with pytest.raises(ValueError):
+        parse_graph(CONTENT, page=2)
+    with pytest.raises(ValueError):
+        parse_graph("<mxGraphModel><root><mxCell id='0'/><mxCell id='0'/></root></mxGraphModel>")
+    with pytest.raises(ValueError):
+        parse_graph("<mxGraphModel><root>")
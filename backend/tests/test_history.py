@@ -0,0 +1,171 @@
+import asyncio
+import pytest
+from app.services.draw_service import DrawService, VersionConflict
+from app.services.storage import MemoryStorage, SQLiteStorage
+from app.services.diagram_delta import split_cells, render_cells
+# python -m pytest backend/tests/test_history.py
+
+def make_diagram(labels):
+    cells = "".join(
+        f'<mxCell id="n{i}" value="{label}" vertex="1" parent="1">'
+        f'<mxGeometry x="{i * 150}" y="40" width="120" height="60" as="geometry"/></mxCell>'
+        for i, label in enumerate(labels)
+    )
+    return (
+        '<mxfile><diagram id="p1" name="Page-1"><mxGraphModel dx="800" dy="600"><root>'
+        f'<mxCell id="0"/><mxCell id="1" parent="0"/>{cells}</root></mxGraphModel></diagram></mxfile>'
+    )
+
+@pytest.fixture
+def service(service):
+    """快照间隔为4，少量版本即可同时覆盖快照和增量"""
+    service.snapshot_interval = 4
+    return service
+
+def test_split_render_roundtrip():
+    content = make_diagram(["a", "b"])
+    state = split_cells(content)
+    assert list(state.pages["p1"]) == ["0", "1", "n0", "n1"]
+    assert render_cells(state) == content and split_cells(render_cells(state)) == state
+    assert split_cells("not xml") is None
+
+def test_versions_rebuild(service):
+    """快照间隔为4时，版本1、5、9为快照，其余为增量，每个版本都能还原"""
+    async def run():
+        labels = [f"a{i}" for i in range(10)]
+        contents = [make_diagram(labels)]
+        created = await service.create_diagram("drawio", contents[0])
+        for i in range(9):
+            labels = labels[:-1] if i % 3 == 0 else labels + [f"z{i}"]
+            labels[i] = f"x{i}"
+            contents.append(make_diagram(labels))
+            await service.update_diagram(created["id"], contents[-1])
+        # 内容不变时不产生新版本
+        await service.update_diagram(created["id"], contents[-1])
+
+        versions = await service.list_versions(created["id"])
+        assert [v["version"] for v in versions] == list(range(1, 11))
+        assert [v["version"] for v in versions if v["kind"] == "snapshot"] == [1, 5, 9]
+        for number, content in enumerate(contents, 1):
+            result = await service.get_version(created["id"], number)
+            assert result["content"] == content
+        assert await service.get_version(created["id"], 11) is None
+    asyncio.run(run())
+
+def test_versions_are_byte_identical(service):
+    """缩进、属性引号和实体等格式在快照和增量版本中都原样保留"""
+    def formatted(labels):
+        cells = "".join(
+            f"\n        <mxCell id='n{i}' value=\"{label} &amp; &#x4e00;\" vertex=\"1\" parent=\"1\">"
+            f"\n          <mxGeometry x=\"{i}\" y=\"0\" width=\"120\" height=\"60\" as=\"geometry\" />\n        </mxCell>"
+            for i, label in enumerate(labels)
+        )
+        return (
+            '\n<mxfile host="test">\n  <diagram id="p1" name="Page-1">\n    <mxGraphModel>\n      <root>'
+            '\n        <mxCell id="0" />\n        <mxCell id="1" parent="0" />'
+            f'{cells}\n      </root>\n    </mxGraphModel>\n  </diagram>\n</mxfile>\n'
+        )
+    async def run():
+        labels = [f"a{i}" for i in range(10)]
+        contents = [formatted(labels)]
+        created = await service.create_diagram("drawio", contents[0])
+        for i in range(5):
+            labels = labels + [f"b{i}"] if i % 2 else labels[:i] + [f"c{i}"] + labels[i + 1:]
+            contents.append(formatted(labels))
+            await service.update_diagram(created["id"], contents[-1])
+        # 骨架中的空白变化同样保留
+        contents.append(contents[-1].replace("  </diagram>", "</diagram>"))
+        await service.update_diagram(created["id"], contents[-1])
+
+        kinds = [v["kind"] for v in await service.list_versions(created["id"])]
+        assert kinds == ["snapshot", "delta", "delta", "delta", "snapshot", "delta", "delta"]
+        for number, content in enumerate(contents, 1):
+            assert (await service.get_version(created["id"], number))["content"] == content
+    asyncio.run(run())
+
+def test_reordered_and_opaque_content(service):
+    async def run():
+        created = await service.create_diagram("drawio", make_diagram(["a", "b", "c"]))
+        reordered = make_diagram(["a", "b", "c"]).replace(
+            '<mxCell id="n0"', '<mxCell id="n9" value="top" vertex="1" parent="1"/><mxCell id="n0"'
+        )
+        await service.update_diagram(created["id"], reordered)
+        await service.update_diagram(created["id"], "plain text")
+        await service.update_diagram(created["id"], make_diagram(["d"]))
+
+        kinds = [v["kind"] for v in await service.list_versions(created["id"])]
+        assert kinds == ["snapshot", "delta", "snapshot", "snapshot"]
+        second = await service.get_version(created["id"], 2)
+        assert list(split_cells(second["content"]).pages["p1"])[2] == "n9"
+        assert (await service.get_version(created["id"], 3))["content"] == "plain text"
+    asyncio.run(run())
+
+def test_diff_versions(service):
+    async def run():
+        created = await service.create_diagram("drawio", make_diagram(["a", "b"]))
+        await service.update_diagram(created["id"], make_diagram(["a", "changed"]))
+        result = await service.diff_versions(created["id"], 1, 2)
+        assert result["patch"] == {"u": {"p1": {"cells": {"u": {"n1": {"value": "changed"}}}}}}
+        assert await service.diff_versions(created["id"], 1, 3) is None
+        await service.delete_diagram(created["id"])
+        assert await service.list_versions(created["id"]) == []
+    asyncio.run(run())
+
+def test_update_precondition(service):
+    """两个编辑者基于同一版本修改，后提交的一方收到冲突而不是覆盖"""
+    async def run():
+        created = await service.create_diagram("drawio", make_diagram(["a"]))
+        etag = created["content_hash"]
+        first = await service.update_diagram(created["id"], make_diagram(["a", "b"]), [etag])
+        with pytest.raises(VersionConflict) as conflict:
+            await service.update_diagram(created["id"], make_diagram(["a", "c"]), [etag])
+        assert conflict.value.diagram["content_hash"] == first["content_hash"]
+        assert (await service.get_diagram(created["id"]))["content"] == make_diagram(["a", "b"])
+        assert [v["version"] for v in await service.list_versions(created["id"])] == [1, 2]
+        # 基于最新版本的更新照常成功
+        await service.update_diagram(created["id"], make_diagram(["a", "c"]), ["stale", first["content_hash"]])
+        assert await service.update_diagram("missing", make_diagram(["a"]), [etag]) is None
+    asyncio.run(run())
+
+def test_update_precondition_across_workers(tmp_path):
+    """两个worker（各自的存储连接）基于同一版本并发修改，只有一方成功，版本号不重复"""
+    path = str(tmp_path / "shared.db")
+    workers = [DrawService(SQLiteStorage(path), snapshot_interval=4) for _ in range(2)]
+    async def run():
+        created = await workers[0].create_diagram("drawio", make_diagram(["a"]))
+        etag = created["content_hash"]
+        for n in range(5):
+            results = await asyncio.gather(*(
+                worker.update_diagram(created["id"], make_diagram(["a", f"w{i}-{n}"]), [etag])
+                for i, worker in enumerate(workers)
+            ), return_exceptions=True)
+            updated = [r for r in results if isinstance(r, dict)]
+            assert len(updated) == 1 and sum(isinstance(r, VersionConflict) for r in results) == 1
+            etag = updated[0]["content_hash"]
+            assert (await workers[1].get_diagram(created["id"]))["content_hash"] == etag
+        assert [v["version"] for v in await workers[1].list_versions(created["id"])] == list(range(1, 7))
+        for worker in workers:
+            await worker.aclose()
+    asyncio.run(run())
+
+def test_if_match_uses_strong_comparison(monkeypatch):
+    """If-Match使用强比较：弱ETag即使哈希相同也返回412，If-None-Match仍按弱比较返回304"""
+    monkeypatch.setenv("DIAGRAM_STORAGE", "memory")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.router import diagrams
+
+    monkeypatch.setattr(diagrams, "draw_service", DrawService(MemoryStorage()))
+    app = FastAPI()
+    app.include_router(diagrams.router)
+    client = TestClient(app)
+
+    created = client.post("/diagrams", json={"type": "drawio", "content": make_diagram(["a"])})
+    etag = created.headers["etag"]
+    url = f"/diagrams/{created.json()['id']}"
+    assert client.get(url, headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+    weak = client.put(url, json={"type": "drawio", "content": make_diagram(["b"])}, headers={"If-Match": f"W/{etag}"})
+    assert weak.status_code == 412 and weak.headers["etag"] == etag
+    strong = client.put(url, json={"type": "drawio", "content": make_diagram(["b"])}, headers={"If-Match": f"W/{etag}, {etag}"})
+    assert strong.status_code == 200 and strong.headers["etag"] != etag
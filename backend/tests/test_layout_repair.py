@@ -0,0 +1,74 @@
+import asyncio
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.graph_model import parse_graph
+from app.services.layout_repair import LayoutRepairConfig, find_overlaps, repair_overlaps
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.spatial_index import GridIndex
+from app.services.storage import MemoryStorage
+from conftest import FakeLLM
+# python -m pytest backend/tests/test_layout_repair.py
+
+def vertex(cell_id, x, y, w=120, h=60, parent="1"):
+    return (f'<mxCell id="{cell_id}" value="{cell_id}" style="rounded=1;" vertex="1" parent="{parent}">'
+            f'<mxGeometry x="{x}" y="{y}" width="{w}" height="{h}" as="geometry"/></mxCell>')
+
+def diagram(*cells):
+    return ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+            + "".join(cells) + "</root></mxGraphModel></diagram></mxfile>")
+
+def overlapping_ids(content):
+    model = parse_graph(content)
+    return [(model.ids[a], model.ids[b]) for a, b in find_overlaps(model)]
+
+def test_grid_index():
+    index = GridIndex(50)
+    index.insert(1, (0, 0, 100, 100))
+    index.insert(2, (90, 90, 20, 20))
+    index.insert(3, (100, 0, 50, 50))
+    assert index.query((95, 95, 1, 1)) == [1, 2]
+    # 只接触边界不算重叠
+    assert index.pairs() == [(1, 2)]
+    index.insert(2, (300, 300, 10, 10))
+    assert index.pairs() == [] and len(index) == 3
+    index.remove(1)
+    assert index.query((0, 0, 200, 200)) == [3]
+
+def test_repair_separates_siblings():
+    content = diagram(
+        vertex("a", 0, 0), vertex("b", 60, 20), vertex("c", 30, 10),
+        # 完全包含的背景框不算重叠
+        vertex("zone", -20, -20, 600, 400),
+        # 不同父节点的形状互不影响
+        vertex("g", 700, 0, 200, 200), vertex("child", 10, 10, 50, 50, parent="g"),
+    )
+    assert ("a", "b") in overlapping_ids(content)
+    repaired, moved = repair_overlaps(content, config=LayoutRepairConfig(gap=20))
+    assert moved == 2 and overlapping_ids(repaired) == []
+    model = parse_graph(repaired)
+    assert model.bounds(model.index["a"])[:2] == (0.0, 0.0)
+    assert model.bounds(model.index["child"])[:2] == (10.0, 10.0)
+    # 结果确定
+    assert repair_overlaps(content, config=LayoutRepairConfig(gap=20))[0] == repaired
+    assert repair_overlaps(repaired)[1] == 0
+
+def test_repair_keeps_unchanged_cells():
+    previous = diagram(vertex("a", 0, 0), vertex("b", 200, 0))
+    content = diagram(vertex("a", 0, 0), vertex("b", 200, 0), vertex("new", 210, 10))
+    repaired, moved = repair_overlaps(content, previous)
+    model = parse_graph(repaired)
+    assert moved == 1 and model.bounds(model.index["b"])[:2] == (200.0, 0.0)
+    assert overlapping_ids(repaired) == []
+
+def test_repair_thousands_of_cells():
+    cells = [vertex(f"v{i}", (i % 50) * 100, (i // 50) * 50) for i in range(3000)]
+    repaired, moved = repair_overlaps(diagram(*cells))
+    assert moved > 0 and overlapping_ids(repaired) == []
+
+def test_ai_service_repairs_generated_diagram():
+    content = diagram(vertex("a", 0, 0), vertex("b", 10, 10))
+    llm = FakeLLM(f"【分析说明】\n两个步骤\n【drawio代码】\n{content}")
+    service = AIDiagramService(DrawService(MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir=""))), llm)
+    result = asyncio.run(service.generate_diagram("flowchart", "画两个步骤", compact=False))
+    assert overlapping_ids(result["content"]) == []
+    assert overlapping_ids(result["diagram_info"]["content"]) == []
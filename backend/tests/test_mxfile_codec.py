@@ -0,0 +1,53 @@
+import base64
+import zlib
+from urllib.parse import quote
+import pytest
+from app.services.mxfile_codec import (
+    compress_diagram,
+    decompress_diagram,
+    compress_mxfile,
+    inflate_mxfile,
+    is_compressed,
+)
+from app.services.drawio_xml import parse_xml
+# python -m pytest backend/tests/test_mxfile_codec.py
+
+MODEL = '<mxGraphModel><root><mxCell id="0" /><mxCell id="1" value="数据收集 50% &amp; a+b=c~!*()\'" parent="0" /></root></mxGraphModel>'
+
+def drawio_compress(xml):
+    """drawio的Graph.compress：encodeURIComponent -> deflateRaw -> base64"""
+    raw = zlib.compress(quote(xml, safe="-_.!~*'()").encode("ascii"))[2:-4]
+    return base64.b64encode(raw).decode("ascii")
+
+def test_matches_drawio_format():
+    assert compress_diagram(MODEL) == drawio_compress(MODEL)
+    assert decompress_diagram(drawio_compress(MODEL)) == MODEL
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 64])
+def test_chunk_boundaries(chunk_size):
+    """%XX转义和多字节字符被块边界截断时结果不变"""
+    data = compress_diagram(MODEL * 20, chunk_size=chunk_size)
+    assert decompress_diagram(data, chunk_size=chunk_size) == MODEL * 20
+
+def test_invalid_data():
+    with pytest.raises(ValueError):
+        decompress_diagram("not-base64-deflate")
+    with pytest.raises(ValueError):
+        decompress_diagram(compress_diagram(MODEL * 100), max_size=100)
+
+def test_inflate_and_compress_mxfile():
+    compressed = f'<mxfile compressed="true"><diagram id="p1" name="Page-1">{drawio_compress(MODEL)}</diagram></mxfile>'
+    assert is_compressed(compressed)
+
+    plain = inflate_mxfile(compressed)
+    assert not is_compressed(plain)
+    page = parse_xml(plain).find("diagram")
+    assert page.find("mxGraphModel/root/mxCell[@id='1']").get("value").startswith("数据收集")
+
+    again = compress_mxfile(plain)
+    assert is_compressed(again)
+    assert inflate_mxfile(again) == plain
+
+def test_plain_file_is_untouched():
+    plain = f'<mxfile><diagram id="p1">{MODEL}</diagram></mxfile>'
+    assert inflate_mxfile(plain) is plain
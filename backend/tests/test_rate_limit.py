@@ -0,0 +1,148 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.llm.base import LLMDelta, LLMResponse
+from app.llm.deepseek import DeepseekLLM
+from app.llm.rate_limit import ProviderLimiter, RateLimits, TokenBucket, estimate_tokens
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.storage import MemoryStorage
+# python -m pytest backend/tests/test_rate_limit.py
+
+DIAGRAM = ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+           '<mxCell id="a" value="开始" style="rounded=1;" vertex="1" parent="1"><mxGeometry x="0" y="0" width="120" height="60" as="geometry"/></mxCell>'
+           '</root></mxGraphModel></diagram></mxfile>')
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeCompletions:
+    """模拟chat.completions接口，流式请求在release前一直挂起"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        if not stream:
+            message = SimpleNamespace(content="好", reasoning_content=None)
+            usage = SimpleNamespace(model_dump=lambda: {"total_tokens": 10})
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        return self._stream()
+
+    async def _stream(self):
+        await self.release.wait()
+        delta = SimpleNamespace(content="好", reasoning_content=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(model_dump=lambda: {"total_tokens": 10}))
+
+def make_llm(limits, clock=None, sleeps=None):
+    async def sleep(seconds):
+        sleeps.append(seconds)
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    limiter = ProviderLimiter(limits, clock=clock or Clock(), sleep=sleep)
+    return DeepseekLLM(api_key="k", base_url="http://fake", client=client, limiter=limiter), completions
+
+def test_token_bucket_reserves_in_order():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)
+    # 容量内不等待，超出后每个请求依次多等1秒
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    assert bucket.reserve(1) == 1.0 and bucket.reserve(1) == 2.0
+    clock.now += 2
+    assert bucket.reserve(1) == 1.0
+    # 实际用量少于预占时退还
+    bucket.adjust(-3)
+    assert bucket.available == 2
+    assert estimate_tokens("画一个流程图") < estimate_tokens("画一个流程图" * 10)
+
+def test_queue_positions_and_concurrency():
+    sleeps = []
+    async def run():
+        llm, completions = make_llm(RateLimits(rpm=60, max_concurrency=1), sleeps=sleeps)
+
+        async def consume():
+            return [chunk async for chunk in llm.stream_deltas("画一个流程图", include_usage=True)]
+
+        tasks = [asyncio.create_task(consume()) for _ in range(3)]
+        await asyncio.sleep(0)
+        # 同时只有一个请求到达上游，其余在本地排队
+        assert completions.calls == 1 and llm.limiter.snapshot()["waiting"] == 2
+        completions.release.set()
+        first, second, third = await asyncio.gather(*tasks)
+
+        positions = [[c.queue_position for c in chunks if c.queue_position is not None] for chunks in (first, second, third)]
+        # 位置只会前移，轮到后以0结束（间隔很短的变化可能合并）
+        assert positions[0] == [] and positions[1] == [1, 0]
+        assert positions[2][0] == 2 and positions[2][-1] == 0 and positions[2] == sorted(positions[2], reverse=True)
+        assert "".join(c.answer_content for c in third) == "好"
+        snapshot = llm.limiter.snapshot()
+        assert snapshot["active"] == 0 and snapshot["admitted"] == 3 and snapshot["queued"] == 2
+        assert sleeps == []
+    asyncio.run(run())
+
+def test_release_while_waiter_handles_position():
+    """排队的请求正在处理产出的位置时前一个请求结束，唤醒不会丢失"""
+    async def run():
+        limiter = ProviderLimiter(RateLimits(max_concurrency=1))
+        holder = limiter.enqueue(1)
+        waiter = limiter.enqueue(1)
+        positions = []
+        async def consume():
+            async for position in waiter.wait():
+                positions.append(position)
+                # 消费方挂起在位置帧上（如等待SSE写出）时，前一个请求结束
+                holder.release()
+                await asyncio.sleep(0)
+        await asyncio.wait_for(consume(), 1)
+        assert positions == [1] and waiter.admitted and limiter.active == 1
+        waiter.release()
+        assert limiter.active == 0
+    asyncio.run(run())
+
+def test_token_budget_throttles_and_settles():
+    clock = Clock()
+    sleeps = []
+    async def run():
+        llm, _ = make_llm(RateLimits(tpm=1000, output_tokens=600), clock=clock, sleeps=sleeps)
+        assert (await llm.chat("你好")).answer_content == "好"
+        # 预占的600多个token按实际用量10修正，下一次请求无需等待
+        assert llm.limiter.tpm.available > 900
+        await llm.chat("你好")
+        assert sleeps == []
+
+        llm, _ = make_llm(RateLimits(tpm=1000, output_tokens=600), clock=clock, sleeps=sleeps)
+        llm.limiter.tpm.reserve(900)
+        await llm.chat("你好")
+        # 配额不足时按令牌桶等待，而不是直接请求上游
+        assert len(sleeps) == 1 and sleeps[0] > 0 and llm.limiter.stats["throttled"] == 1
+    asyncio.run(run())
+
+class QueuedLLM:
+    model_name = "fake"
+
+    async def chat(self, prompt):
+        return LLMResponse(answer_content="")
+
+    async def stream_deltas(self, prompt, include_usage=False):
+        yield LLMDelta(queue_position=2)
+        yield LLMDelta(queue_position=1)
+        yield LLMDelta(queue_position=0)
+        yield LLMDelta(answer_content=f"【分析说明】\n一个开始节点\n【drawio代码】\n{DIAGRAM}")
+
+def test_stream_reports_queue_position():
+    draw_service = DrawService(MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+    service = AIDiagramService(draw_service, QueuedLLM())
+    async def run():
+        frames = [frame async for frame in service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)]
+        events = [json.loads(frame.split("data: ", 1)[1]) for frame in frames]
+        assert [e["content"] for e in events if e["type"] == "queue_position"] == [2, 1, 0]
+        assert events[-1]["type"] == "final" and events[-1]["response"]["success"]
+    asyncio.run(run())
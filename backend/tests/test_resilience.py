@@ -0,0 +1,142 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from app.llm.deepseek import DeepseekLLM
+from app.llm.glm import GLMLLM
+from app.llm.resilience import CircuitBreaker, CircuitOpenError, LLMTimeout, ResilienceConfig, backoff_delay
+# python -m pytest backend/tests/test_resilience.py
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def api_error(cls, status):
+    response = httpx.Response(status, request=httpx.Request("POST", "http://fake/chat/completions"))
+    return cls("上游错误", response=response, body=None)
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, reasoning_content=None))])
+
+class FakeCompletions:
+    """按顺序执行脚本：异常直接抛出，"hang"表示响应头后不再输出，列表为流式内容（"stall"表示之后停滞）"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        if isinstance(step, Exception):
+            raise step
+        if not stream:
+            message = SimpleNamespace(content="".join(step), reasoning_content=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        return self._stream(step)
+
+    async def _stream(self, step):
+        if step == "hang":
+            await asyncio.sleep(3600)
+        for item in step:
+            if item == "stall":
+                await asyncio.sleep(3600)
+            yield chunk(item)
+
+def make_llm(cls, completions, breaker=None, **options):
+    config = ResilienceConfig(**{"first_token_timeout": 0.05, "idle_timeout": 0.05, "backoff_base": 0, **options})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    llm = cls(api_key="k", base_url="http://fake", client=client, breaker=breaker)
+    llm.resilience = config
+    return llm
+
+async def answer(llm):
+    return "".join([delta.answer_content async for delta in llm.stream_deltas("画一个流程图")])
+
+def test_backoff_and_breaker_states():
+    config = ResilienceConfig(backoff_base=0.5, backoff_max=8, failure_threshold=3, cooldown=30)
+    assert [backoff_delay(config, n, rand=lambda: 1.0) for n in range(6)] == [0.5, 1, 2, 4, 8, 8]
+    assert backoff_delay(config, 3, rand=lambda: 0.25) == 1
+
+    clock = Clock()
+    breaker = CircuitBreaker("deepseek", config, clock)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # 冷却结束后只放行一个试探请求，试探失败则重新熔断
+    clock.now += 30
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.snapshot()["rejected"] == 2
+
+def test_stream_retries_until_first_token():
+    async def run():
+        # 连接失败、5xx和首个token超时都在开始输出前，重试后成功
+        completions = FakeCompletions(
+            openai.APIConnectionError(request=httpx.Request("POST", "http://fake")),
+            api_error(openai.InternalServerError, 503),
+            "hang",
+            ["你", "好"]
+        )
+        llm = make_llm(DeepseekLLM, completions, max_retries=3)
+        assert await answer(llm) == "你好" and completions.calls == 4
+
+        # 重试次数用尽后抛出最后一个错误
+        llm = make_llm(DeepseekLLM, FakeCompletions("hang"), max_retries=1)
+        with pytest.raises(LLMTimeout) as error:
+            await answer(llm)
+        assert error.value.phase == "first_token" and llm.client.chat.completions.calls == 2
+
+        # 参数错误重试也不会成功
+        llm = make_llm(DeepseekLLM, FakeCompletions(api_error(openai.BadRequestError, 400), ["好"]))
+        with pytest.raises(openai.BadRequestError):
+            await answer(llm)
+        assert llm.client.chat.completions.calls == 1
+    asyncio.run(run())
+
+def test_idle_timeout_is_not_retried():
+    async def run():
+        completions = FakeCompletions(["你", "stall"], ["你好"])
+        llm = make_llm(DeepseekLLM, completions)
+        received = []
+        with pytest.raises(LLMTimeout) as error:
+            async for delta in llm.stream_deltas("画一个流程图"):
+                received.append(delta.answer_content)
+        # 已经输出过内容，重试会让前端收到重复的内容
+        assert error.value.phase == "idle" and received == ["你"] and completions.calls == 1
+    asyncio.run(run())
+
+def test_open_circuit_fails_fast_and_reroutes():
+    config = ResilienceConfig(failure_threshold=2, cooldown=30)
+    breaker = CircuitBreaker("deepseek", config)
+    async def run():
+        failing = FakeCompletions(api_error(openai.InternalServerError, 502))
+        llm = make_llm(DeepseekLLM, failing, breaker=breaker, max_retries=1)
+        with pytest.raises(openai.InternalServerError):
+            await answer(llm)
+        assert breaker.state == "open" and failing.calls == 2
+
+        # 熔断期间不再请求上游
+        with pytest.raises(CircuitOpenError):
+            await llm.chat("画一个流程图")
+        assert failing.calls == 2
+
+        llm.fallback = make_llm(GLMLLM, FakeCompletions(["好"]))
+        assert await answer(llm) == "好"
+        assert (await llm.chat("画一个流程图")).answer_content == "好"
+        assert failing.calls == 2 and breaker.snapshot()["rejected"] == 3
+    asyncio.run(run())
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.mxfile_codec import compress_mxfile
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.response_cache import ResponseCache, ResponseCacheConfig, cache_key, diagram_hash
+from app.services.similarity import SimilarityConfig
+from app.services.sse import DELTA_EVENTS
+from app.services.storage import MemoryStorage
+from conftest import FakeLLM
+# python -m pytest backend/tests/test_response_cache.py
+
+DIAGRAM = ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+           '<mxCell id="a" value="开始" style="rounded=1;" vertex="1" parent="1"><mxGeometry x="0" y="0" width="120" height="60" as="geometry"/></mxCell>'
+           '</root></mxGraphModel></diagram></mxfile>')
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_service(cache):
+    llm = FakeLLM(f"【分析说明】\n一个开始节点\n【drawio代码】\n{DIAGRAM}")
+    draw_service = DrawService(MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+    return AIDiagramService(draw_service, llm, response_cache=cache), llm
+
+def events(frames):
+    return [json.loads(frame.split("data: ", 1)[1]) for frame in frames]
+
+def test_diagram_hash_is_canonical():
+    pretty = DIAGRAM.replace('<mxfile>', '<mxfile modified="2025-01-01" etag="x">\n  ').replace(
+        '<mxGraphModel>', '<mxGraphModel dx="800" dy="600">\n    ')
+    reordered = DIAGRAM.replace('vertex="1" parent="1"', 'parent="1" vertex="1"')
+    assert diagram_hash(pretty) == diagram_hash(reordered) == diagram_hash(compress_mxfile(DIAGRAM)) == diagram_hash(DIAGRAM)
+    assert diagram_hash(DIAGRAM.replace("开始", "结束")) != diagram_hash(DIAGRAM)
+    assert cache_key("m", "flowchart", " 画一个　流程图 ", None) == cache_key("m", "flowchart", "画一个 流程图", None)
+    assert cache_key("m", "flowchart", "画一个流程图", None) != cache_key("n", "flowchart", "画一个流程图", None)
+
+def test_lru_ttl_and_sqlite_tier(tmp_path):
+    clock = Clock()
+    config = ResponseCacheConfig(enabled=True, max_entries=2, ttl=60, db_path="")
+    async def run():
+        cache = ResponseCache(config, clock=clock)
+        for key in "abc":
+            await cache.put(key, {"result": {"key": key}, "events": None})
+        assert await cache.get("a") is None and (await cache.get("c"))["result"] == {"key": "c"}
+        clock.now += 61
+        assert await cache.get("c") is None
+
+        # SQLite二级缓存在进程重启后仍然有效，并同样按TTL过期
+        disk = ResponseCacheConfig(enabled=True, max_entries=2, ttl=60, db_path=str(tmp_path / "cache.db"))
+        cache = ResponseCache(disk, clock=clock)
+        await cache.put("a", {"result": {"key": "a"}, "events": None})
+        await cache.aclose()
+        cache = ResponseCache(disk, clock=clock)
+        assert (await cache.get("a"))["result"] == {"key": "a"} and cache.stats["disk_hits"] == 1
+        clock.now += 61
+        await cache.aclose()
+        cache = ResponseCache(disk, clock=clock)
+        assert await cache.get("a") is None
+        await cache.aclose()
+    asyncio.run(run())
+
+def test_generate_uses_cache():
+    service, llm = make_service(ResponseCache(ResponseCacheConfig(enabled=True, max_entries=8, ttl=60, db_path="")))
+    async def run():
+        first = await service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)
+        second = await service.generate_diagram("flowchart", "画一个开始节点 ", reuse_similar=False)
+        assert llm.calls == 1 and second == first
+        # 编辑已有图表时当前图表也是键的一部分
+        await service.generate_diagram("flowchart", "画一个开始节点", DIAGRAM, edit_mode="full", reuse_similar=False)
+        assert llm.calls == 2
+        await service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False, use_cache=False)
+        assert llm.calls == 3
+
+        # 引用的图表被删除后缓存作废
+        latest = await service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)
+        await service.draw_service.delete_diagram(latest["diagram_info"]["id"])
+        await service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)
+        assert llm.calls == 4
+    asyncio.run(run())
+
+def test_stream_replays_cached_events():
+    service, llm = make_service(ResponseCache(ResponseCacheConfig(enabled=True, max_entries=8, ttl=60, db_path="")))
+    async def run():
+        live = events([frame async for frame in service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)])
+        replayed = events([frame async for frame in service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)])
+        assert llm.calls == 1
+        # 增量合并成帧的方式可能不同，完整事件必须一致
+        assert [e for e in replayed if e["type"] not in DELTA_EVENTS] == [e for e in live if e["type"] not in DELTA_EVENTS]
+        assert replayed[0]["type"] == "reasoning" and [e["type"] for e in replayed][-2:] == ["diagram", "final"]
+        assert "".join(e["content"] for e in replayed if e["type"] == "analysis") == \
+            "".join(e["content"] for e in live if e["type"] == "analysis")
+        assert replayed[-1] == live[-1] and replayed[-1]["response"]["success"]
+
+        # 非流式请求写入的结果也能以事件形式重放，反之亦然
+        result = await service.generate_diagram("flowchart", "另一个需求", reuse_similar=False)
+        replayed = events([frame async for frame in service.stream_generate_diagram("flowchart", "另一个需求", reuse_similar=False)])
+        assert [e["type"] for e in replayed] == ["analysis", "diagram", "final"]
+        assert replayed[1]["content"] == result["content"] and replayed[-1]["response"]["is_final"]
+        cached = await service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)
+        assert llm.calls == 2 and "is_final" not in cached and cached["content"] == live[-1]["response"]["content"]
+    asyncio.run(run())
+
+def test_regenerate_skips_similar_reuse():
+    """重新生成（use_cache=False）时不直接复用相似需求生成的图表，总是调用模型"""
+    service, llm = make_service(ResponseCache(ResponseCacheConfig(enabled=True, max_entries=8, ttl=60, db_path="")))
+    service.draw_service.similarity = SimilarityConfig(reuse_threshold=0.9)
+    PROMPT = "画一个订单处理流程：读取订单数据、校验订单、计算运费、生成发货单、通知仓库"
+    async def run():
+        first = await service.generate_diagram("flowchart", PROMPT, reuse_similar=True)
+        assert (await service.generate_diagram("flowchart", PROMPT + "。", reuse_similar=True))["edit_mode"] == "reuse"
+        assert llm.calls == 1
+
+        again = await service.generate_diagram("flowchart", PROMPT, reuse_similar=True, use_cache=False)
+        assert llm.calls == 2 and again["edit_mode"] == "full" and again["diagram_info"]["id"] != first["diagram_info"]["id"]
+        frames = [frame async for frame in service.stream_generate_diagram(
+            "flowchart", PROMPT, reuse_similar=True, use_cache=False
+        )]
+        assert llm.calls == 3 and events(frames)[-1]["response"]["edit_mode"] == "full"
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+from app.services.diagram_text import extract_text
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.storage import SQLiteStorage
+# python -m pytest backend/tests/test_search.py
+
+def drawio(name, *labels, tooltip=None):
+    cells = "".join(
+        f'<mxCell id="{i + 2}" value="{label}" vertex="1" parent="1"><mxGeometry width="120" height="60" as="geometry"/></mxCell>'
+        for i, label in enumerate(labels)
+    )
+    if tooltip:
+        cells += f'<UserObject id="t" label="备注" tooltip="{tooltip}"><mxCell vertex="1" parent="1"/></UserObject>'
+    return (f'<mxfile><diagram id="p1" name="{name}"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+            f'{cells}</root></mxGraphModel></diagram></mxfile>')
+
+def test_extract_text():
+    content = drawio("ETL流程", "数据&lt;br&gt;清洗", "数据&lt;br&gt;清洗", tooltip="去掉&lt;b&gt;空值&lt;/b&gt;")
+    assert extract_text(content) == {"title": "ETL流程", "labels": "数据 清洗\n备注", "tooltips": "去掉空值"}
+    assert extract_text(drawio("Page-1", "A"))["title"] == ""
+
+def test_search_ranks_and_updates(service):
+    async def run():
+        cleaning = await service.create_diagram("drawio", drawio("数据清洗流程", "读取数据", "数据清洗"))
+        model = await service.create_diagram("drawio", drawio("模型训练", "数据清洗", "训练模型"))
+        other = await service.create_diagram("plantuml", drawio("部署", "构建镜像", tooltip="数据清洗后再部署"))
+
+        hits = await service.search_diagrams("数据清洗")
+        # 标题命中的权重最高
+        assert [hit["id"] for hit in hits][:2] == [cleaning["id"], model["id"]]
+        assert {hit["id"] for hit in hits} == {cleaning["id"], model["id"], other["id"]}
+        assert "<mark>数据清洗</mark>" in hits[0]["snippet"] and "content" not in hits[0]
+        assert [hit["id"] for hit in await service.search_diagrams("数据清洗", "plantuml")] == [other["id"]]
+        # 多个词需同时命中，短于3个字的词也能检索
+        assert [hit["id"] for hit in await service.search_diagrams("训练 清洗")] == [model["id"]]
+        assert [hit["id"] for hit in await service.search_diagrams("镜像")] == [other["id"]]
+
+        await service.update_diagram(model["id"], drawio("模型评估", "计算指标"))
+        assert [hit["id"] for hit in await service.search_diagrams("训练")] == []
+        assert [hit["id"] for hit in await service.search_diagrams("模型评估")] == [model["id"]]
+        await service.delete_diagram(cleaning["id"])
+        assert cleaning["id"] not in {hit["id"] for hit in await service.search_diagrams("数据清洗")}
+        assert await service.search_diagrams("  ") == []
+    asyncio.run(run())
+
+def test_snippet_is_escaped(service):
+    async def run():
+        await service.create_diagram("drawio", drawio("示例", "a &amp;lt;script&amp;gt; 数据清洗"))
+        hits = await service.search_diagrams("数据清洗")
+        assert "<script>" not in hits[0]["snippet"] and "&lt;script&gt;" in hits[0]["snippet"]
+    asyncio.run(run())
+
+def test_sqlite_backfills_existing_diagrams(tmp_path):
+    path = str(tmp_path / "test.db")
+    async def run():
+        service = DrawService(SQLiteStorage(path), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+        created = await service.create_diagram("drawio", drawio("旧图表", "数据清洗"))
+        await service.aclose()
+        # 模拟升级前没有全文索引的数据库
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM diagram_search")
+        conn.execute("DELETE FROM search_docs")
+        conn.commit()
+        conn.close()
+
+        service = DrawService(SQLiteStorage(path), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+        assert [hit["id"] for hit in await service.search_diagrams("数据清洗")] == [created["id"]]
+        await service.aclose()
+    asyncio.run(run())
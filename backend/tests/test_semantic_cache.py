@@ -0,0 +1,66 @@
+import asyncio
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.semantic_cache import SemanticCache, SemanticCacheConfig, hash_vector
+from app.services.storage import MemoryStorage
+from conftest import FakeLLM
+# python -m pytest backend/tests/test_semantic_cache.py
+
+DIAGRAM = ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+           '<mxCell id="a" value="训练" vertex="1" parent="1"><mxGeometry width="120" height="60" as="geometry"/></mxCell>'
+           '</root></mxGraphModel></diagram></mxfile>')
+
+def cosine(a, b):
+    a, b = hash_vector(a), hash_vector(b)
+    return sum(value * b.get(dim, 0.0) for dim, value in a.items())
+
+def config(**thresholds):
+    return SemanticCacheConfig(enabled=True, max_entries=100, threshold=0.85, thresholds=thresholds, model_name="")
+
+def test_hash_vector():
+    assert cosine("画一个机器学习训练流程图", "请帮我画一张机器学习训练的流程图") > 0.85
+    assert cosine("machine learning training pipeline flowchart", "draw a flowchart of the machine learning training pipeline") > 0.85
+    assert cosine("画一个机器学习训练流程图", "画一个用户登录流程图") < 0.5
+    assert hash_vector("画一个图") == {}
+
+def test_lookup_thresholds_and_metrics():
+    cache = SemanticCache(config(strict=0.99))
+    async def run():
+        entry = await cache.add("fake", "flowchart", "画一个机器学习训练流程图", False, {"content": "x"})
+        hit = await cache.lookup("fake", "flowchart", "请帮我画一张机器学习训练的流程图", False)
+        assert hit[0] == entry and hit[1] > 0.85 and hit[2] == {"content": "x"}
+        # 模型、图表类型、压缩方式或需求中的数字不一致时不命中
+        assert await cache.lookup("other", "flowchart", "画一个机器学习训练流程图", False) is None
+        assert await cache.lookup("fake", "sequence", "画一个机器学习训练流程图", False) is None
+        assert await cache.lookup("fake", "flowchart", "画一个机器学习训练流程图", True) is None
+        assert await cache.lookup("fake", "flowchart", "画一个3步的机器学习训练流程图", False) is None
+        # 按模型设置的阈值
+        await cache.add("strict", "flowchart", "画一个机器学习训练流程图", False, {})
+        assert await cache.lookup("strict", "flowchart", "请帮我画一张机器学习训练的流程图", False) is None
+
+        assert cache.report_false_hit(entry) and not cache.report_false_hit(entry)
+        assert await cache.lookup("fake", "flowchart", "画一个机器学习训练流程图", False) is None
+        fake = cache.metrics()["models"]["fake"]
+        assert (fake["lookups"], fake["hits"], fake["false_hits"]) == (5, 1, 1)
+        assert fake["hit_rate"] == 1 / 5 and fake["false_hit_rate"] == 1.0
+        assert cache.metrics()["models"]["strict"]["threshold"] == 0.99
+    asyncio.run(run())
+
+def test_ai_service_returns_semantic_hit():
+    llm = FakeLLM(f"【分析说明】\n训练流程\n【drawio代码】\n{DIAGRAM}")
+    draw_service = DrawService(MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+    service = AIDiagramService(draw_service, llm, semantic_cache=SemanticCache(config()))
+    async def run():
+        first = await service.generate_diagram("flowchart", "画一个机器学习训练流程图", reuse_similar=False)
+        hit = await service.generate_diagram("flowchart", "请帮我画一张机器学习训练的流程图", reuse_similar=False)
+        assert llm.calls == 1 and hit["content"] == first["content"]
+        assert hit["diagram_info"]["id"] == first["diagram_info"]["id"] and hit["cache"]["type"] == "semantic"
+        # 编辑已有图表时不使用语义缓存
+        await service.generate_diagram("flowchart", "画一个机器学习训练流程图", DIAGRAM, edit_mode="full")
+        assert llm.calls == 2
+        # 报告误命中后重新生成
+        service.semantic_cache.report_false_hit(hit["cache"]["entry_id"])
+        await service.generate_diagram("flowchart", "请帮我画一张机器学习训练的流程图", reuse_similar=False)
+        assert llm.calls == 3
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.similarity import SimilarityConfig, diagram_features, minhash, similarity, lsh_buckets, NUM_PERM, BANDS
+from app.services.storage import MemoryStorage
+from conftest import FakeLLM
+# python -m pytest backend/tests/test_similarity.py
+
+def flow(*labels, shape="rounded=1;"):
+    """按顺序连接的流程图"""
+    cells = "".join(
+        f'<mxCell id="v{i}" value="{label}" style="{shape}" vertex="1" parent="1">'
+        f'<mxGeometry x="{i * 200}" y="0" width="120" height="60" as="geometry"/></mxCell>'
+        for i, label in enumerate(labels)
+    )
+    cells += "".join(
+        f'<mxCell id="e{i}" edge="1" parent="1" source="v{i}" target="v{i + 1}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+        for i in range(len(labels) - 1)
+    )
+    return (f'<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+            f'{cells}</root></mxGraphModel></diagram></mxfile>')
+
+STEPS = ["读取订单数据", "校验订单", "计算运费", "生成发货单", "通知仓库"]
+
+def test_signature_estimates_jaccard():
+    a = diagram_features(flow(*STEPS))
+    b = diagram_features(flow(*STEPS[:-1], "通知物流"))
+    assert "e:rounded>rounded:classic#3" in a and "v:rounded#4" in a
+    exact = len(a & b) / len(a | b)
+    estimate = similarity(minhash(a), minhash(b))
+    assert abs(estimate - exact) < 0.15
+    assert similarity(minhash(a), minhash(set(a))) == 1.0
+    assert len(minhash(a)) == NUM_PERM and len(lsh_buckets(minhash(a))) == BANDS
+    assert similarity(minhash(()), minhash(())) == 0.0
+
+def test_find_similar(service):
+    async def run():
+        base = await service.create_diagram("drawio", flow(*STEPS))
+        near = await service.create_diagram("drawio", flow(*STEPS[:-1], "通知物流"))
+        far = await service.create_diagram("drawio", flow("用户登录", "鉴权", shape="ellipse;"))
+
+        hits = await service.find_similar(diagram_id=base["id"])
+        assert [hit["id"] for hit in hits] == [near["id"]]
+        assert hits[0]["similarity"] > 0.5 and "content" not in hits[0]
+        hits = await service.find_similar(content=flow(*STEPS))
+        assert [hit["id"] for hit in hits][:2] == [base["id"], near["id"]] and hits[0]["similarity"] == 1.0
+        assert await service.find_similar(diagram_id="missing") is None
+
+        # 内容更新和删除后索引随之变化
+        await service.update_diagram(far["id"], flow(*STEPS))
+        assert far["id"] in {hit["id"] for hit in await service.find_similar(diagram_id=base["id"])}
+        await service.delete_diagram(near["id"])
+        assert near["id"] not in {hit["id"] for hit in await service.find_similar(diagram_id=base["id"])}
+        with pytest.raises(ValueError):
+            await service.find_similar(content="<mxfile>")
+    asyncio.run(run())
+
+def test_similar_prompt_reuses_or_seeds_generation():
+    content = flow(*STEPS)
+    llm = FakeLLM(f"【分析说明】\n订单流程\n【drawio代码】\n{content}")
+    def make_service(config):
+        return AIDiagramService(DrawService(
+            MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir="")), similarity=config
+        ), llm)
+
+    async def run():
+        prompt = "画一个订单处理流程：读取订单数据、校验订单、计算运费、生成发货单、通知仓库"
+        # 默认不直接复用，只把相似图表作为参考
+        service = make_service(SimilarityConfig())
+        await service.generate_diagram("flowchart", prompt, compact=False)
+        assert (await service.generate_diagram("flowchart", prompt + "。", compact=False))["edit_mode"] == "full"
+        assert "参考图表" in llm.prompts[-1] and len(llm.prompts) == 2
+
+        service = make_service(SimilarityConfig(reuse_threshold=0.9))
+        llm.prompts.clear()
+        first = await service.generate_diagram("flowchart", prompt, compact=False)
+        assert first["edit_mode"] == "full" and len(llm.prompts) == 1
+
+        # 相同的需求直接复用已生成的图表，不调用模型
+        reused = await service.generate_diagram("flowchart", prompt + "。", compact=False)
+        assert reused["edit_mode"] == "reuse" and reused["diagram_info"]["id"] == first["diagram_info"]["id"]
+        assert reused["content"] == first["content"] and len(llm.prompts) == 1
+        # 其他类型的图表、关闭复用时照常调用模型
+        await service.generate_diagram("sequence", prompt, compact=False)
+        await service.generate_diagram("flowchart", prompt, compact=False, reuse_similar=False)
+        assert len(llm.prompts) == 3
+
+        # 部分相似的需求把已有图表作为参考放入提示词
+        await service.generate_diagram("flowchart", "画一个订单处理流程：读取订单数据、校验订单、计算运费", compact=False)
+        assert "参考图表" in llm.prompts[-1] and "计算运费" in llm.prompts[-1]
+    asyncio.run(run())
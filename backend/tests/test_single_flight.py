@@ -0,0 +1,150 @@
+import asyncio
+import json
+import pytest
+from app.llm.base import LLMDelta, LLMResponse
+from app.services.ai_diagram_service import AIDiagramService
+from app.services.draw_service import DrawService
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.single_flight import SingleFlight
+from app.services.sse import TransientFrame
+from app.services.storage import MemoryStorage
+# python -m pytest backend/tests/test_single_flight.py
+
+DIAGRAM = ('<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+           '<mxCell id="a" value="开始" vertex="1" parent="1"><mxGeometry width="120" height="60" as="geometry"/></mxCell>'
+           '</root></mxGraphModel></diagram></mxfile>')
+ANSWER = f"【分析说明】\n一个开始节点\n【drawio代码】\n{DIAGRAM}"
+
+class GatedLLM:
+    """在release之前停在第一个增量之后，模拟耗时的上游调用"""
+    model_name = "fake"
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def chat(self, prompt):
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("上游错误")
+        return LLMResponse(answer_content=ANSWER)
+
+    async def stream_deltas(self, prompt, include_usage=False):
+        self.calls += 1
+        yield LLMDelta(reasoning_content="先想一想")
+        await self.release.wait()
+        for i in range(0, len(ANSWER), 40):
+            yield LLMDelta(answer_content=ANSWER[i:i + 40])
+
+def make_service(llm):
+    draw_service = DrawService(MemoryStorage(), previews=PreviewCache(PreviewCacheConfig(cache_dir="")))
+    return AIDiagramService(draw_service, llm, single_flight=SingleFlight())
+
+async def collect(frames, received=None):
+    result = []
+    async for frame in frames:
+        result.append(frame)
+        if received is not None:
+            received.set()
+    return result
+
+def test_flight_replays_buffer_to_late_joiner():
+    async def run():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def producer():
+            yield "a"
+            await gate.wait()
+            yield "b"
+
+        first = asyncio.create_task(collect(flights.stream("k", producer)))
+        await asyncio.sleep(0)
+        late = asyncio.create_task(collect(flights.stream("k", producer)))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await first == await late == ["a", "b"]
+        assert flights.stats == {"upstream": 1, "joined": 1} and flights.in_flight == 0
+    asyncio.run(run())
+
+def test_flight_skips_stale_transient_frames_and_logs_failures(caplog):
+    """晚加入的订阅者收不到加入前的排队位置；最后一帧之后的失败写入日志"""
+    async def run():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def producer():
+            yield TransientFrame("q")
+            yield "a"
+            await gate.wait()
+            yield TransientFrame("q2")
+            yield "b"
+            raise RuntimeError("写入缓存失败")
+
+        first = asyncio.create_task(collect(flights.stream("k", producer)))
+        await asyncio.sleep(0)
+        late = asyncio.create_task(collect(flights.stream("k", producer)))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await first == ["q", "a", "q2", "b"]
+        assert await late == ["a", "q2", "b"]
+    asyncio.run(run())
+    assert "写入缓存失败" in caplog.text and "k" in caplog.text
+
+def test_identical_streams_share_one_upstream_call():
+    async def run():
+        llm = GatedLLM()
+        service = make_service(llm)
+        started = asyncio.Event()
+        leader = asyncio.create_task(collect(service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False), started))
+        await started.wait()
+        # 已收到事件后才加入的请求也从第一个事件开始
+        joiners = [asyncio.create_task(collect(service.stream_generate_diagram("flowchart", " 画一个开始节点", reuse_similar=False)))
+                   for _ in range(2)]
+        other = asyncio.create_task(collect(service.stream_generate_diagram("flowchart", "画一个结束节点", reuse_similar=False)))
+        await asyncio.sleep(0.01)
+        llm.release.set()
+        results = await asyncio.gather(leader, *joiners)
+        await other
+        assert llm.calls == 2
+        assert results[0] == results[1] == results[2]
+        final = json.loads(results[0][-1].split("data: ", 1)[1])
+        assert final["type"] == "final" and final["response"]["success"]
+    asyncio.run(run())
+
+def test_leader_disconnect_does_not_stop_joiners():
+    async def run():
+        llm = GatedLLM()
+        service = make_service(llm)
+        leader = service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)
+        await leader.__anext__()
+        joiner = asyncio.create_task(collect(service.stream_generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)))
+        await asyncio.sleep(0)
+        await leader.aclose()
+        llm.release.set()
+        frames = await joiner
+        assert llm.calls == 1 and '"type":"final"' in frames[-1]
+    asyncio.run(run())
+
+def test_identical_calls_share_result_and_error():
+    async def run():
+        llm = GatedLLM()
+        service = make_service(llm)
+        calls = [asyncio.create_task(service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        llm.release.set()
+        results = await asyncio.gather(*calls)
+        assert llm.calls == 1 and results[0] is results[1] is results[2]
+
+        failing = GatedLLM(fail=True)
+        service = make_service(failing)
+        calls = [asyncio.create_task(service.generate_diagram("flowchart", "画一个开始节点", reuse_similar=False)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        failing.release.set()
+        for call in calls:
+            with pytest.raises(RuntimeError):
+                await call
+        assert failing.calls == 1
+    asyncio.run(run())
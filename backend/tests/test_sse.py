@@ -0,0 +1,90 @@
+import asyncio
+import json
+import pytest
+from app.services.sse import SSEConfig, SSEEncoder, paced
+# python -m pytest backend/tests/test_sse.py
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def parse(frames):
+    """解析SSE帧，返回(id, data)列表"""
+    result = []
+    for frame in frames:
+        assert frame.endswith("\n\n")
+        id_line, data_line = frame.strip().split("\n")
+        result.append((int(id_line[len("id: "):]), json.loads(data_line[len("data: "):])))
+    return result
+
+def test_deltas_coalesce_until_interval():
+    """间隔内的增量合并成一帧"""
+    clock = FakeClock()
+    sse = SSEEncoder(SSEConfig(flush_interval=0.1, flush_bytes=1024), clock=clock)
+    # 首个增量立即发送
+    assert parse(sse.delta("analysis", "添加")) == [(1, {"type": "analysis", "content": "添加"})]
+    assert sse.delta("analysis", "了评审") == []
+    clock.now = 0.2
+    frames = parse(sse.delta("analysis", "环节"))
+    assert frames == [(2, {"type": "analysis", "content": "了评审环节"})]
+
+def test_byte_threshold_flushes():
+    sse = SSEEncoder(SSEConfig(flush_interval=10, flush_bytes=6), clock=FakeClock())
+    sse.flush()
+    assert sse.delta("reasoning", "abc") == []
+    frames = parse(sse.delta("reasoning", "def"))
+    assert frames == [(1, {"type": "reasoning", "content": "abcdef"})]
+
+def test_event_flushes_pending_delta_first():
+    """其他事件发送前先输出缓冲的增量，id连续递增"""
+    sse = SSEEncoder(SSEConfig(flush_interval=10, flush_bytes=1024), clock=FakeClock())
+    sse.flush()
+    sse.delta("analysis", "分析")
+    frames = parse(sse.event({"type": "usage", "content": {"total_tokens": 3}}))
+    assert frames == [
+        (1, {"type": "analysis", "content": "分析"}),
+        (2, {"type": "usage", "content": {"total_tokens": 3}}),
+    ]
+    assert sse.last_id == 2
+
+def test_kind_change_flushes():
+    """增量类型切换时先输出前一种"""
+    sse = SSEEncoder(SSEConfig(flush_interval=10, flush_bytes=1024), clock=FakeClock())
+    sse.flush()
+    sse.delta("reasoning", "思考")
+    frames = parse(sse.delta("analysis", "分析"))
+    assert frames == [(1, {"type": "reasoning", "content": "思考"})]
+    assert parse(sse.flush()) == [(2, {"type": "analysis", "content": "分析"})]
+    assert sse.flush() == []
+
+def test_paced_flushes_when_upstream_stalls():
+    """上游停顿时到期输出缓冲的增量，而不是等到下一段内容到达"""
+    sse = SSEEncoder(SSEConfig(flush_interval=0.05, flush_bytes=1024))
+    produced = []
+
+    async def chunks():
+        for text, pause in (("思考", 0), ("中", 0.01), ("结束", 0.5)):
+            await asyncio.sleep(pause)
+            produced.append(text)
+            yield text
+
+    async def run():
+        received = []
+        async for frames, chunk in paced(chunks(), sse):
+            received += [(data["content"], list(produced)) for _, data in parse(frames)]
+            if chunk is not None:
+                received += [(data["content"], list(produced)) for _, data in parse(sse.delta("reasoning", chunk))]
+        received += [(data["content"], list(produced)) for _, data in parse(sse.flush())]
+        return received
+
+    # "中"在"结束"产生之前由定时器发送，上游生成器没有被超时打断
+    assert asyncio.run(run()) == [
+        ("思考", ["思考"]),
+        ("中", ["思考", "中"]),
+        ("结束", ["思考", "中", "结束"]),
+    ]
+    with pytest.raises(ValueError):
+        sse.delta("usage", "x")
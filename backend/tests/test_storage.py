@@ -0,0 +1,48 @@
+import asyncio
+from app.services.draw_service import DrawService
+from app.services.storage import SQLiteStorage
+# python -m pytest backend/tests/test_storage.py
+
+def test_crud(service):
+    async def run():
+        created = await service.create_diagram("drawio", "<mxfile/>")
+        assert await service.get_diagram(created["id"]) == created
+
+        updated = await service.update_diagram(created["id"], "<mxfile>v2</mxfile>")
+        assert updated["content"] == "<mxfile>v2</mxfile>"
+        assert updated["created_at"] == created["created_at"]
+        assert updated["updated_at"] >= created["updated_at"]
+
+        assert await service.update_diagram("missing", "x") is None
+        assert await service.delete_diagram(created["id"]) is True
+        assert await service.delete_diagram(created["id"]) is False
+        assert await service.get_diagram(created["id"]) is None
+    asyncio.run(run())
+
+def test_list_by_type(service):
+    async def run():
+        first = await service.create_diagram("drawio", "a")
+        await service.create_diagram("plantuml", "b")
+        await service.update_diagram(first["id"], "a2")
+        rows = await service.list_diagrams()
+        assert [row["type"] for row in rows] == ["drawio", "plantuml"]
+        assert "content" not in rows[0]
+        assert [row["id"] for row in await service.list_diagrams("drawio")] == [first["id"]]
+        assert len(await service.list_diagrams(limit=1, offset=1)) == 1
+    asyncio.run(run())
+
+def test_sqlite_persists_across_instances(tmp_path):
+    """重新打开数据库后数据仍在，且使用WAL模式"""
+    path = str(tmp_path / "test.db")
+
+    async def run():
+        first = DrawService(SQLiteStorage(path))
+        created = await first.create_diagram("drawio", "<mxfile/>")
+        await first.aclose()
+
+        second = DrawService(SQLiteStorage(path))
+        assert (await second.get_diagram(created["id"]))["content"] == "<mxfile/>"
+        mode = second.storage._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        await second.aclose()
+        return mode
+    assert asyncio.run(run()) == "wal"
@@ -0,0 +1,80 @@
+import pytest
+from app.services.stream_parser import (
+    DiagramStreamScanner,
+    MxCellStreamParser,
+    scan_response,
+    ANALYSIS,
+    CODE,
+    MXFILE,
+    MXFILE_CHUNK,
+)
+# python -m pytest backend/tests/test_stream_parser.py
+
+MXFILE_TEXT = '<mxfile host="test"><diagram name="Page-1"><mxGraphModel><root><mxCell id="0"/></root></mxGraphModel></diagram></mxfile>'
+RESPONSE = "【分析说明】\n添加了评审环节\n【drawio代码】\n```xml\n" + MXFILE_TEXT + "\n```"
+
+def run_scanner(chunks):
+    """按给定分块喂入扫描器，合并同类事件"""
+    scanner = DiagramStreamScanner()
+    events = []
+    for chunk in chunks:
+        events.extend(scanner.feed(chunk))
+    events.extend(scanner.close())
+    analysis = "".join(text for kind, text in events if kind == ANALYSIS)
+    code = "".join(text for kind, text in events if kind == CODE)
+    mxfile_chunks = "".join(text for kind, text in events if kind == MXFILE_CHUNK)
+    mxfiles = [text for kind, text in events if kind == MXFILE]
+    return analysis, code, mxfile_chunks, mxfiles
+
+def test_single_chunk():
+    """整段输入时能正确切分各部分"""
+    analysis, code, mxfile_chunks, mxfiles = run_scanner([RESPONSE])
+    assert analysis.strip() == "添加了评审环节"
+    assert code == "\n```xml\n\n```"
+    assert mxfile_chunks == MXFILE_TEXT
+    assert mxfiles == [MXFILE_TEXT]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 13])
+def test_markers_split_across_chunks(size):
+    """标记和<mxfile>边界被任意切分时结果不变"""
+    chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    assert run_scanner(chunks) == run_scanner([RESPONSE])
+
+def test_partial_marker_prefix_is_flushed():
+    """不构成标记的前缀在后续chunk中作为普通文本输出"""
+    analysis, _, _, _ = run_scanner(["【分析说明】结论【", "drawio", "还需补充"])
+    assert analysis == "结论【drawio还需补充"
+
+def test_unterminated_mxfile():
+    """没有闭合标签时不产生完整mxfile"""
+    analysis, mxfile = scan_response("【分析说明】说明\n【drawio代码】\n<mxfile><diagram>")
+    assert analysis == "说明"
+    assert mxfile is None
+
+def test_mxfile_without_markers():
+    """模型未输出分段标记时仍能提取mxfile"""
+    analysis, mxfile = scan_response("好的：\n" + MXFILE_TEXT)
+    assert analysis == ""
+    assert mxfile == MXFILE_TEXT
+
+def test_cells_emitted_as_they_close():
+    """每个<root>下的单元闭合后立即输出，嵌套的mxGeometry不单独输出"""
+    parser = MxCellStreamParser()
+    text = (
+        '<mxfile><diagram><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+        '<mxCell id="2" vertex="1" parent="1"><mxGeometry x="10" y="20" as="geometry"/></mxCell>'
+        '</root></mxGraphModel></diagram></mxfile>'
+    )
+    cells = []
+    for i in range(0, len(text), 4):
+        cells.extend(parser.feed(text[i:i + 4]))
+    assert len(cells) == 3
+    assert cells[0] == '<mxCell id="0" />'
+    assert cells[2].startswith('<mxCell id="2"') and "mxGeometry" in cells[2]
+
+def test_cell_parser_stops_on_invalid_xml():
+    """模型输出非法XML时停止逐个输出而不是抛出异常"""
+    parser = MxCellStreamParser()
+    assert parser.feed('<mxfile><root><mxCell id="0"/>') == ['<mxCell id="0" />']
+    assert parser.feed('<mxCell value="a&nbsp;b"/>') == []
+    assert parser.failed
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import xml.etree.ElementTree as ET
+from app.services.draw_service import DrawService
+from app.services.mxfile_codec import compress_mxfile
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.storage import MemoryStorage
+from app.services.svg_renderer import render_svg, parse_style
+# python -m pytest backend/tests/test_svg_renderer.py
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+DIAGRAM = """<mxfile><diagram id="p1" name="Page-1"><mxGraphModel><root>
+<mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="a" value="开始" style="ellipse;whiteSpace=wrap;html=1;fillColor=#dae8fc;" vertex="1" parent="1">
+  <mxGeometry x="40" y="40" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="b" value="判断&lt;br&gt;条件" style="rhombus;whiteSpace=wrap;html=1;" vertex="1" parent="1">
+  <mxGeometry x="40" y="160" width="120" height="80" as="geometry"/></mxCell>
+<mxCell id="g" value="" style="group" vertex="1" parent="1">
+  <mxGeometry x="300" y="160" width="200" height="100" as="geometry"/></mxCell>
+<mxCell id="c" value="Rounded &amp; long label text" style="rounded=1;whiteSpace=wrap;html=1;" vertex="1" parent="g">
+  <mxGeometry x="20" y="20" width="120" height="60" as="geometry"/></mxCell>
+<mxCell id="e1" value="" style="endArrow=classic;html=1;" edge="1" parent="1" source="a" target="b">
+  <mxGeometry relative="1" as="geometry"/></mxCell>
+<mxCell id="e2" value="是" style="edgeStyle=orthogonalEdgeStyle;endArrow=block;" edge="1" parent="1" source="b" target="c">
+  <mxGeometry relative="1" as="geometry"><Array as="points"><mxPoint x="240" y="200"/><mxPoint x="240" y="210"/></Array></mxGeometry></mxCell>
+<mxCell id="h" value="hidden" vertex="1" parent="1" visible="0"><mxGeometry x="900" y="900" width="10" height="10" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram></mxfile>"""
+
+def parse(svg):
+    return ET.fromstring(svg)
+
+def test_parse_style():
+    assert parse_style("ellipse;fillColor=#fff;") == {"shape": "ellipse", "fillColor": "#fff"}
+    assert parse_style("shape=cylinder3;rounded=1") == {"shape": "cylinder3", "rounded": "1"}
+    assert parse_style(None) == {}
+
+def test_render_shapes_edges_and_labels():
+    root = parse(render_svg(DIAGRAM))
+    assert root.find(f"{SVG}ellipse").get("fill") == "#dae8fc"
+    assert root.find(f"{SVG}polygon").get("points") == "100,160 160,200 100,240 40,200"
+    # 分组内的单元使用绝对坐标，圆角半径为短边的15%
+    rounded = [r for r in root.findall(f"{SVG}rect") if r.get("rx")][0]
+    assert (rounded.get("x"), rounded.get("y"), rounded.get("rx")) == ("320", "180", "9")
+    assert not [r for r in root.findall(f"{SVG}rect") if r.get("x") == "300"]
+
+    lines = root.findall(f"{SVG}polyline")
+    # 直线从椭圆底部连到菱形顶部（终点让出箭头的位置）
+    assert lines[0].get("points").startswith("100,100 ")
+    # 有拐点时按拐点连接，起点在菱形右侧边界，终点在矩形左侧边界
+    points = lines[1].get("points").split()
+    assert points[0] == "160,200" and points[1:3] == ["240,200", "240,210"]
+
+    texts = ["".join(t.itertext()) for t in root.iter(f"{SVG}text")]
+    assert "开始" in texts and "判断条件" in texts and "是" in texts
+    assert any(len(list(t)) > 1 for t in root.iter(f"{SVG}text") if "Rounded" in "".join(t.itertext()))
+    assert "hidden" not in texts
+    # 画布大小按内容计算（外加边距）
+    assert root.get("viewBox").startswith("30 30 ")
+
+def test_render_compressed_and_scaled():
+    svg = render_svg(compress_mxfile(DIAGRAM), max_width=100)
+    assert float(parse(svg).get("width")) == 100
+
+def test_preview_cache(tmp_path):
+    async def run():
+        cache = PreviewCache(PreviewCacheConfig(memory_entries=1, cache_dir=str(tmp_path)))
+        service = DrawService(MemoryStorage(), previews=cache)
+        diagram = await service.create_diagram("drawio", DIAGRAM)
+        first = await service.get_preview(diagram["id"])
+        assert await service.get_preview(diagram["id"]) == first
+        assert cache.stats == {"hits": 1, "disk_hits": 0, "misses": 1}
+
+        # 挤出内存后从磁盘读取
+        await service.generate_preview('<mxGraphModel><root><mxCell id="0"/></root></mxGraphModel>')
+        assert await service.get_preview(diagram["id"]) == first
+        assert cache.stats["disk_hits"] == 1
+        assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 2
+        assert await service.get_preview("missing") is None
+    asyncio.run(run())
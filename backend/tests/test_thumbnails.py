@@ -0,0 +1,85 @@
+import asyncio
+import struct
+import zlib
+import pytest
+from app.services.draw_service import DrawService
+from app.services.png_raster import encode_png, parse_color, rasterize_svg
+from app.services.preview_cache import PreviewCache, PreviewCacheConfig
+from app.services.storage import MemoryStorage
+from app.services.thumbnails import ThumbnailConfig, ThumbnailPipeline, render_thumbnails, thumbnail_key
+# python -m pytest backend/tests/test_thumbnails.py
+
+DIAGRAM = """<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="2" value="A" style="rounded=1;fillColor=#ff0000;" vertex="1" parent="1">
+  <mxGeometry x="0" y="0" width="200" height="100" as="geometry"/></mxCell>
+</root></mxGraphModel>"""
+
+def read_png(data):
+    """解析encode_png生成的PNG，返回(宽, 高, 像素)"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    width, height = struct.unpack(">II", data[16:24])
+    length = struct.unpack(">I", data[33:37])[0]
+    raw = zlib.decompress(data[41:41 + length])
+    stride = width * 3 + 1
+    pixels = b"".join(raw[y * stride + 1:(y + 1) * stride] for y in range(height))
+    return width, height, pixels
+
+def pixel(png, x, y):
+    width, _, pixels = read_png(png)
+    offset = (y * width + x) * 3
+    return tuple(pixels[offset:offset + 3])
+
+def test_encode_png():
+    png = encode_png(2, 1, bytes([255, 0, 0, 0, 0, 255]))
+    assert read_png(png) == (2, 1, bytes([255, 0, 0, 0, 0, 255]))
+    assert parse_color("#f00") == (255, 0, 0) and parse_color("none") is None
+
+def test_rasterize_shapes():
+    svg = ('<svg xmlns="http://www.w3.org/2000/svg" width="100" height="50" viewBox="0 0 100 50">'
+           '<rect x="0" y="0" width="100" height="50" fill="#ffffff"/>'
+           '<ellipse cx="25" cy="25" rx="20" ry="20" fill="#00ff00" stroke="#000000"/>'
+           '<path d="M60,10 L90,10 L90,40 Z" fill="#0000ff"/></svg>')
+    png = rasterize_svg(svg, 200, 100)
+    assert read_png(png)[:2] == (200, 100)
+    assert pixel(png, 50, 50) == (0, 255, 0)
+    assert pixel(png, 175, 30) == (0, 0, 255)
+    assert pixel(png, 125, 80) == (255, 255, 255)
+
+def test_render_thumbnails_sizes():
+    images = render_thumbnails(DIAGRAM, (64, 128))
+    assert read_png(images[128])[:2] == (128, 70)
+    assert read_png(images[64])[:2] == (64, 35)
+    # 圆角矩形内部为填充色
+    assert pixel(images[128], 20, 35) == (255, 0, 0)
+
+def test_pipeline_dedupes_by_content_hash(tmp_path):
+    async def run():
+        cache = PreviewCache(PreviewCacheConfig(cache_dir=str(tmp_path)))
+        pipeline = ThumbnailPipeline(cache, ThumbnailConfig(sizes=(64, 128), workers=0, queue_size=4))
+        service = DrawService(MemoryStorage(), previews=cache)
+        service.add_listener(pipeline.on_diagram_event)
+
+        first = await service.create_diagram("drawio", DIAGRAM)
+        await service.create_diagram("drawio", DIAGRAM)
+        await pipeline._queue.join()
+        assert pipeline.stats["rendered"] == 1 and pipeline.stats["deduped"] == 1
+        assert cache.lookup(thumbnail_key(first["content_hash"], 64)) is not None
+
+        # 请求时未生成的内容立即生成，并发请求共享同一个任务
+        other = DIAGRAM.replace("#ff0000", "#00ff00")
+        results = await asyncio.gather(*(pipeline.get("other", other, 128) for _ in range(3)))
+        assert len(set(results)) == 1 and pipeline.stats["rendered"] == 2
+        with pytest.raises(ValueError):
+            await pipeline.get("other", other, 100)
+        await pipeline.aclose()
+    asyncio.run(run())
+
+def test_pipeline_process_pool():
+    async def run():
+        cache = PreviewCache(PreviewCacheConfig(cache_dir=""))
+        pipeline = ThumbnailPipeline(cache, ThumbnailConfig(sizes=(64,), workers=1, queue_size=4))
+        try:
+            return await pipeline.get("hash", DIAGRAM, 64)
+        finally:
+            await pipeline.aclose()
+    assert read_png(asyncio.run(run()))[:2] == (64, 35)
@@ -196,7 +196,8 @@ AIAssistant.prototype = {
               // 处理成功响应
               this.handleAIResponse({
                   analysis: data.analysis,
-                  fileContent: data.content
+                  fileContent: data.content,
+                  patch: data.patch
               });
           } else {
               // 处理错误情况
@@ -218,6 +219,18 @@ AIAssistant.prototype = {
           this.addMessage('assistant', response.analysis);
       }
       
+      // 优先增量应用补丁，失败时回退到整体替换
+      if (response.patch) {
+          try {
+              if (this.applyDiagramPatch(response.patch)) {
+                  this.addMessage('system', '图表已更新');
+                  return;
+              }
+          } catch (error) {
+              console.error('应用补丁失败:', error);
+          }
+      }
+
       // 更新图表内容
       if (response.fileContent) {
           var currentFile = this.editorUi.getCurrentFile();
@@ -249,6 +262,17 @@ AIAssistant.prototype = {
       }
   },
 
+  applyDiagramPatch: function(patch) {
+    var currentFile = this.editorUi.getCurrentFile();
+    if (currentFile == null) {
+        return false;
+    }
+    // 补丁格式与DiffSync一致，由后端diagram_diff计算
+    currentFile.patch([patch], null, true);
+    currentFile.directSave(currentFile.getData());
+    return true;
+  },
+
   addMessage: function(role, content, isTemp) {
       var msgDiv = document.createElement('div');
       msgDiv.className = 'geAIMessage ' + role;
@@ -265,11 +289,63 @@ AIAssistant.prototype = {
              .trim();
   },
 
+  applyStreamedCell: function(xml, index) {
+    var graph = this.editorUi.editor.graph;
+    var model = graph.getModel();
+    var doc = mxUtils.parseXml(xml);
+    var codec = new mxCodec(doc);
+
+    // 父节点和连线端点从当前模型中按id查找
+    codec.lookup = function(id) {
+        return model.getCell(id);
+    };
+
+    var cell = codec.decodeCell(doc.documentElement, false);
+    var parent = cell.parent;
+    var source = cell.source;
+    var target = cell.target;
+    cell.parent = null;
+    cell.source = null;
+    cell.target = null;
+
+    model.beginUpdate();
+    try {
+        if (parent == null) {
+            // 第一个单元是新图表的根节点，替换掉当前画布内容
+            if (index === 0) {
+                model.setRoot(cell);
+            }
+            return;
+        }
+
+        var existing = model.getCell(cell.id);
+        if (existing != null) {
+            model.remove(existing);
+        }
+
+        model.add(parent, cell);
+        if (source != null) {
+            model.setTerminal(cell, source, true);
+        }
+        if (target != null) {
+            model.setTerminal(cell, target, false);
+        }
+    } finally {
+        model.endUpdate();
+    }
+  },
+
   handleDiagramStreamRequest: function(message, fileContent) {
     // 创建带加载状态的临时消息
     var tempMsg = this.addMessage('assistant', '▌', true);
     var analysisBuffer = '';
+    var reasoningBuffer = '';
     var diagramBuffer = '';
+    var sseBuffer = '';
+    var lastEventId = null;
+    // 本轮是否已逐个绘制过单元（此时画布与旧图表不一致，补丁不再适用）
+    var cellsStreamed = false;
+    var diagramApplied = false;
     
     console.log('Starting stream request...');
     
@@ -307,30 +383,54 @@ AIAssistant.prototype = {
                 return;
             }
             
-            const chunkData = decoder.decode(value);
-            console.log('Received chunk:', chunkData);
+            // 一帧可能被拆到多次read中，未结束的部分留到下一次处理
+            sseBuffer += decoder.decode(value, { stream: true });
+            const frames = sseBuffer.split('\n\n');
+            sseBuffer = frames.pop();
             
-            chunkData.split('\n\n').forEach(event => {
-                if (event.startsWith('data: ')) {
+            frames.forEach(frame => {
+                // 每帧包含id:和data:两行
+                var dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+                if (dataLine) {
                     try {
-                        const jsonData = JSON.parse(event.replace('data: ', ''));
-                        console.log('Parsed JSON data:', jsonData);
+                        const jsonData = JSON.parse(dataLine.substring(6));
+                        if (frame.startsWith('id: ')) {
+                            lastEventId = frame.split('\n')[0].substring(4);
+                        }
+                        console.log('Parsed event', lastEventId, jsonData);
                         
                         switch(jsonData.type) {
                             case 'reasoning':
-                                // 显示思考过程
-                                tempMsg.innerHTML = this.parseResponse(jsonData.content + '▌');
+                                // 显示思考过程（服务端只发送增量，需要在本地累积）
+                                reasoningBuffer += jsonData.content;
+                                tempMsg.innerHTML = this.parseResponse(reasoningBuffer + '▌');
                                 break;
                                 
                             case 'analysis':
-                                // 更新分析说明
-                                analysisBuffer = jsonData.content;
+                                // 更新分析说明（服务端只发送增量，需要在本地累积）
+                                analysisBuffer += jsonData.content;
                                 tempMsg.innerHTML = this.parseResponse(analysisBuffer + '▌');
                                 break;
                                 
+                            case 'cell':
+                                // 逐个绘制已生成完毕的单元，完整图表到达后会整体替换
+                                cellsStreamed = true;
+                                try {
+                                    this.applyStreamedCell(jsonData.content, jsonData.index);
+                                } catch (error) {
+                                    console.error('Failed to draw streamed cell:', error);
+                                }
+                                break;
+                                
                             case 'diagram':
-                                // 更新图表内容
-                                if (jsonData.content && jsonData.diagram_info) {
+                                // 有补丁时增量应用，避免整体重新加载文件
+                                if (jsonData.patch && !cellsStreamed) {
+                                    try {
+                                        diagramApplied = this.applyDiagramPatch(jsonData.patch);
+                                    } catch (error) {
+                                        console.error('Failed to apply diagram patch:', error);
+                                    }
+                                } else if (jsonData.content) {
                                     diagramBuffer = jsonData.content;
                                     // 使用正确的方法更新图表
                                     var currentFile = this.editorUi.getCurrentFile();
@@ -341,6 +441,7 @@ AIAssistant.prototype = {
                                             currentFile.open();
                                             // 直接保存更改
                                             currentFile.directSave(diagramBuffer);
+                                            diagramApplied = true;
                                             console.log('Diagram updated successfully');
                                         } catch (error) {
                                             console.error('Failed to update diagram:', error);
@@ -349,6 +450,12 @@ AIAssistant.prototype = {
                                 }
                                 break;
                                 
+                            case 'fallback':
+                                // 补丁无法应用，后端将改为完整生成
+                                console.warn('Patch rejected, regenerating full diagram:', jsonData.content);
+                                analysisBuffer = '';
+                                break;
+                                
                             case 'error':
                                 // 显示错误信息
                                 console.error('Stream error:', jsonData.content);
@@ -360,7 +467,8 @@ AIAssistant.prototype = {
                                 if (jsonData.response) {
                                     const finalResponse = jsonData.response;
                                     tempMsg.innerHTML = this.parseResponse(finalResponse.analysis);
-                                    if (finalResponse.content) {
+                                    // diagram事件已经更新过画布时不再整体重新加载
+                                    if (finalResponse.content && !diagramApplied) {
                                         var currentFile = this.editorUi.getCurrentFile();
                                         if (currentFile) {
                                             try {
@@ -377,6 +485,15 @@ AIAssistant.prototype = {
                                 }
                                 break;
                                 
+                            case 'queue_position':
+                                // 等待模型限流配额时显示排队位置，轮到本请求（0）时恢复加载状态
+                                if (!reasoningBuffer && !analysisBuffer) {
+                                    tempMsg.innerHTML = jsonData.content > 0
+                                        ? this.parseResponse(`排队中（第${jsonData.content}位）▌`)
+                                        : '▌';
+                                }
+                                break;
+
                             case 'usage':
                                 // 可以选择是否显示使用量信息
                                 console.log('Usage info:', jsonData.content);